@@ -0,0 +1,3 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Kernel launch benchmarks run against fake resource managers."""
@@ -0,0 +1,9 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import sys
+
+from .benchmark import main
+
+if __name__ == '__main__':
+    sys.exit(main())
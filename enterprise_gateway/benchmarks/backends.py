@@ -0,0 +1,462 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Fake resource managers against which the process proxies are benchmarked.
+
+Each backend implements the subset of its resource manager's REST API used by the corresponding process
+proxy.  Kernels are submitted by the stand-in launcher (`launcher.py --submit <url>`) to the backend's
+`/benchmark/submit` endpoint, whereupon the backend runs the launcher as a local process and reports it
+as an application (or pod) until it exits or is killed via the API.  Backends are served from their own
+thread and IOLoop (see BackendServer) so that they don't compete with the benchmark's clients.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from threading import Event, Thread
+from tornado import gen, web
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.netutil import bind_sockets
+from tornado.queues import Queue
+
+
+class KernelApplication(object):
+    """A kernel submitted to a fake resource manager - run as a local process."""
+    def __init__(self, app_id, kernel_id, argv, env, log_file):
+        self.app_id = app_id
+        self.kernel_id = kernel_id
+        self.env = env
+        self.started_time = int(time.time() * 1000)
+        self.killed = False
+        self.process = subprocess.Popen(argv, env=env, stdin=subprocess.DEVNULL, stdout=log_file,
+                                        stderr=subprocess.STDOUT, start_new_session=True)
+
+    @property
+    def running(self):
+        return self.process.poll() is None  # also reaps the process once it exits
+
+    def kill(self):
+        if self.running:
+            self.killed = True
+            self.process.terminate()
+
+
+class FakeBackend(object):
+    """Base class of the fake resource managers.
+
+    `process_proxy` names the process proxy benchmarked against the backend, whose kernelspec is built by
+    `kernel_spec()` given the url at which the backend is served.  `gateway_env()` and `gateway_args()`
+    return the environment and options the gateway requires to use the backend.
+    """
+    name = None
+    process_proxy = None
+
+    def __init__(self, log_dir=None):
+        self.log_dir = log_dir
+        self.apps = {}  # app_id -> KernelApplication
+        self.submissions = 0
+
+    def handlers(self):
+        return [(r'/benchmark/submit', SubmitHandler, {'backend': self})]
+
+    def kernel_spec(self, url, kernel_dir):
+        """Returns the kernel.json of the backend's kernelspec.  `kernel_dir` is the kernelspec's directory."""
+        argv = [sys.executable, '-m', 'enterprise_gateway.benchmarks.launcher',
+                '--RemoteProcessProxy.kernel-id', '{kernel_id}',
+                '--RemoteProcessProxy.response-address', '{response_address}',
+                '--RemoteProcessProxy.port-range', '{port_range}']
+        if url:
+            argv.extend(['--submit', url + '/benchmark/submit'])
+        return {'display_name': 'Benchmark ({})'.format(self.name), 'language': 'python', 'argv': argv, 'env': {},
+                'metadata': {'process_proxy': {'class_name': self.process_proxy, 'config': {}}}}
+
+    def gateway_env(self, url):
+        return {}
+
+    def gateway_args(self, url):
+        return []
+
+    def submit(self, kernel_id, argv, env):
+        """Runs the submitted launcher, returning its application."""
+        self.submissions += 1
+        app_id = self.new_app_id(self.submissions)
+        log_file = subprocess.DEVNULL
+        if self.log_dir:
+            log_file = open(os.path.join(self.log_dir, 'kernel-{}.log'.format(kernel_id)), 'w')
+        try:
+            self.apps[app_id] = KernelApplication(app_id, kernel_id, argv, env, log_file)
+        finally:
+            if self.log_dir:
+                log_file.close()  # retained by the process
+        return self.apps[app_id]
+
+    def new_app_id(self, number):
+        return 'app-{:04d}'.format(number)
+
+    def submission_output(self, app):
+        """Returns the output written by the launcher once `app` has been submitted."""
+        return 'Submitted application {}'.format(app.app_id)
+
+    def refresh(self):
+        """Called periodically to detect (and reap) the kernels that have exited."""
+        for app in self.apps.values():
+            app.running
+
+    def shutdown(self):
+        for app in self.apps.values():
+            app.kill()
+        for app in self.apps.values():
+            try:
+                app.process.wait(5)
+            except subprocess.TimeoutExpired:
+                app.process.kill()
+
+
+class SubmitHandler(web.RequestHandler):
+    def initialize(self, backend):
+        self.backend = backend
+
+    def post(self):
+        body = json.loads(self.request.body.decode('utf-8'))
+        app = self.backend.submit(body['kernel_id'], body['argv'], body['env'])
+        self.finish({'output': self.backend.submission_output(app)})
+
+
+class BackendHandler(web.RequestHandler):
+    def initialize(self, backend):
+        self.backend = backend
+
+    def find_app(self, predicate):
+        for app in self.backend.apps.values():
+            if predicate(app):
+                return app
+        raise web.HTTPError(404)
+
+
+class DistributedBackend(FakeBackend):
+    """The DistributedProcessProxy launches kernels (on localhost) itself - so no resource manager is involved."""
+    name = 'distributed'
+    process_proxy = 'enterprise_gateway.services.processproxies.distributed.DistributedProcessProxy'
+
+    def kernel_spec(self, url, kernel_dir):
+        return super(DistributedBackend, self).kernel_spec(None, kernel_dir)
+
+    def gateway_env(self, url):
+        return {'EG_REMOTE_HOSTS': 'localhost'}
+
+
+class YarnBackend(FakeBackend):
+    """A fake YARN resource manager, in which the kernel id is the name of each application."""
+    name = 'yarn'
+    process_proxy = 'enterprise_gateway.services.processproxies.yarn.YarnClusterProcessProxy'
+
+    def __init__(self, log_dir=None):
+        super(YarnBackend, self).__init__(log_dir)
+        self.cluster_timestamp = int(time.time() * 1000)
+
+    def handlers(self):
+        kwargs = {'backend': self}
+        return super(YarnBackend, self).handlers() + [
+            (r'/ws/v1/cluster/apps', YarnApplicationsHandler, kwargs),
+            (r'/ws/v1/cluster/apps/([^/]+)', YarnApplicationHandler, kwargs),
+            (r'/ws/v1/cluster/apps/([^/]+)/state', YarnApplicationStateHandler, kwargs),
+        ]
+
+    def gateway_args(self, url):
+        return ['--EnterpriseGatewayApp.yarn_endpoint={}/ws/v1/cluster'.format(url)]
+
+    def new_app_id(self, number):
+        return 'application_{}_{:04d}'.format(self.cluster_timestamp, number)
+
+    @staticmethod
+    def state(app):
+        if app.running:
+            return 'RUNNING'
+        return 'KILLED' if app.killed else 'FINISHED'
+
+    def to_json(self, app):
+        state = self.state(app)
+        return {'id': app.app_id, 'name': app.kernel_id, 'state': state, 'startedTime': app.started_time,
+                'finalStatus': 'UNDEFINED' if state == 'RUNNING' else 'SUCCEEDED',
+                'amHostHttpAddress': 'localhost:8042'}
+
+
+class YarnApplicationsHandler(BackendHandler):
+    def get(self):
+        started_time_begin = int(self.get_argument('startedTimeBegin', '0'))
+        apps = [self.backend.to_json(app) for app in self.backend.apps.values()
+                if app.started_time >= started_time_begin]
+        self.finish({'apps': {'app': apps} if apps else None})
+
+
+class YarnApplicationHandler(BackendHandler):
+    def get(self, app_id):
+        self.finish({'app': self.backend.to_json(self.find_app(lambda app: app.app_id == app_id))})
+
+
+class YarnApplicationStateHandler(BackendHandler):
+    def get(self, app_id):
+        self.finish({'state': self.backend.state(self.find_app(lambda app: app.app_id == app_id))})
+
+    def put(self, app_id):
+        app = self.find_app(lambda app: app.app_id == app_id)
+        app.kill()
+        self.set_status(202)
+        self.finish({'state': self.backend.state(app)})
+
+
+class ConductorBackend(FakeBackend):
+    """A fake Conductor (Spark) endpoint, in which applications are identified by their driver id."""
+    name = 'conductor'
+    process_proxy = 'enterprise_gateway.services.processproxies.conductor.ConductorClusterProcessProxy'
+
+    def handlers(self):
+        kwargs = {'backend': self}
+        return super(ConductorBackend, self).handlers() + [
+            (r'/v1/applications', ConductorApplicationsHandler, kwargs),
+            (r'/v1/submissions/kill/([^/]+)', ConductorKillHandler, kwargs),
+        ]
+
+    def kernel_spec(self, url, kernel_dir):
+        # The process proxy prefixes the launch command with the kernelspec's bin/run.sh.
+        run_script = os.path.join(kernel_dir, 'bin', 'run.sh')
+        os.makedirs(os.path.dirname(run_script), exist_ok=True)
+        with open(run_script, 'w') as f:
+            f.write('#!/bin/sh\nexec "$@"\n')
+        os.chmod(run_script, 0o755)
+
+        spec = super(ConductorBackend, self).kernel_spec(url, kernel_dir)
+        spec['env'] = {'KERNEL_SPARK_HOME': kernel_dir, 'KERNEL_PYSPARK_PYTHON': 'python',
+                       'SPARK_OPTS': '--master {}'.format(url), 'KERNEL_NOTEBOOK_DATA_DIR': kernel_dir,
+                       'KERNEL_NOTEBOOK_COOKIE_JAR': 'cookies.txt', 'KERNEL_CURL_SECURITY_OPT': ''}
+        return spec
+
+    def gateway_env(self, url):
+        return {'EGO_SERVICE_CREDENTIAL': 'benchmark'}
+
+    def gateway_args(self, url):
+        return ['--EnterpriseGatewayApp.conductor_endpoint={}'.format(url)]
+
+    def new_app_id(self, number):
+        return 'driver-{}-{:04d}'.format(time.strftime('%Y%m%d%H%M%S'), number)
+
+    def submission_output(self, app):
+        return json.dumps({'action': 'CreateSubmissionResponse', 'submissionId': app.app_id, 'success': True},
+                          indent=2, separators=(',', ' : '))
+
+    def to_json(self, app):
+        if app.running:
+            state = 'RUNNING'
+        else:
+            state = 'KILLED' if app.killed else 'FINISHED'
+        return {'applicationid': 'app-' + app.app_id, 'state': state,
+                'driver': {'id': app.app_id, 'host': 'localhost'}}
+
+
+class ConductorApplicationsHandler(BackendHandler):
+    def get(self):
+        driver_id = self.get_argument('driverid', None)
+        application_id = self.get_argument('applicationid', None)
+        apps = [self.backend.to_json(app) for app in self.backend.apps.values()
+                if app.app_id == driver_id or 'app-' + app.app_id == application_id]
+        self.finish({'applist': apps})
+
+
+class ConductorKillHandler(BackendHandler):
+    def post(self, driver_id):
+        self.find_app(lambda app: app.app_id == driver_id).kill()
+        self.finish({'action': 'KillSubmissionResponse', 'submissionId': driver_id, 'success': True})
+
+
+class KubernetesBackend(FakeBackend):
+    """A fake Kubernetes API server, in which each kernel is a pod - whose changes can be watched - along with
+    the secret conveying its launch secret."""
+    name = 'kubernetes'
+    process_proxy = 'enterprise_gateway.services.processproxies.k8s.KubernetesProcessProxy'
+
+    def __init__(self, log_dir=None):
+        super(KubernetesBackend, self).__init__(log_dir)
+        self.resource_version = 0
+        self.watchers = set()  # queues of the watch requests
+        self.phases = {}  # app_id -> last reported phase
+        self.secrets = {}  # (namespace, name) -> secret
+
+    def handlers(self):
+        kwargs = {'backend': self}
+        return super(KubernetesBackend, self).handlers() + [
+            (r'/api/v1/pods', KubernetesPodsHandler, kwargs),
+            (r'/api/v1/namespaces/([^/]+)/pods', KubernetesPodsHandler, kwargs),
+            (r'/api/v1/namespaces/([^/]+)/pods/([^/]+)', KubernetesPodHandler, kwargs),
+            (r'/api/v1/namespaces/([^/]+)/secrets', KubernetesSecretsHandler, kwargs),
+            (r'/api/v1/namespaces/([^/]+)/secrets/([^/]+)', KubernetesSecretHandler, kwargs),
+        ]
+
+    def kernel_spec(self, url, kernel_dir):
+        spec = super(KubernetesBackend, self).kernel_spec(url, kernel_dir)
+        spec['metadata']['process_proxy']['config']['image_name'] = 'elyra/kernel-benchmark:dev'
+        return spec
+
+    def gateway_env(self, url):
+        # The gateway (see gateway.py) points the kubernetes client at the fake API server, rather than
+        # loading the in-cluster configuration.
+        return {'EG_BENCHMARK_KUBERNETES_HOST': url, 'EG_SHARED_NAMESPACE': 'True'}
+
+    def submit(self, kernel_id, argv, env):
+        app = super(KubernetesBackend, self).submit(kernel_id, argv, env)
+        self.phases[app.app_id] = 'Running'
+        self.notify('ADDED', app)
+        return app
+
+    def phase(self, app):
+        if app.running:
+            return 'Running'
+        return 'Failed' if app.killed else 'Succeeded'
+
+    def pod(self, app):
+        return {'apiVersion': 'v1', 'kind': 'Pod',
+                'metadata': {'name': app.env.get('KERNEL_POD_NAME', app.app_id),
+                             'namespace': app.env.get('KERNEL_NAMESPACE', 'default'),
+                             'labels': {'kernel_id': app.kernel_id, 'component': 'kernel',
+                                        'app': 'enterprise-gateway'},
+                             'resourceVersion': str(self.resource_version)},
+                'status': {'phase': self.phases.get(app.app_id, self.phase(app)),
+                           'podIP': '127.0.0.1', 'hostIP': '127.0.0.1'}}
+
+    def matches(self, app, namespace, label_selector):
+        metadata = self.pod(app)['metadata']
+        return (namespace is None or metadata['namespace'] == namespace) and \
+            selector_matches(metadata['labels'], label_selector)
+
+    def notify(self, event_type, app):
+        self.resource_version += 1
+        event = {'type': event_type, 'object': self.pod(app)}
+        for queue in self.watchers:
+            queue.put_nowait(event)
+
+    def delete(self, app):
+        app.kill()
+        del self.apps[app.app_id]
+        self.phases.pop(app.app_id, None)
+        self.notify('DELETED', app)
+
+    def refresh(self):
+        for app in list(self.apps.values()):
+            phase = self.phase(app)
+            if self.phases.get(app.app_id) != phase:
+                self.phases[app.app_id] = phase
+                self.notify('MODIFIED', app)
+
+
+def selector_matches(labels, label_selector):
+    """Returns True if the labels satisfy the (equality-based) label selector."""
+    for requirement in filter(None, (label_selector or '').split(',')):
+        key, _, value = requirement.partition('=')
+        if labels.get(key) != value:
+            return False
+    return True
+
+
+class KubernetesPodsHandler(BackendHandler):
+    @gen.coroutine
+    def get(self, namespace=None):
+        label_selector = self.get_argument('labelSelector', None)
+        if self.get_argument('watch', 'false').lower() != 'true':
+            pods = [self.backend.pod(app) for app in self.backend.apps.values()
+                    if self.backend.matches(app, namespace, label_selector)]
+            self.finish({'apiVersion': 'v1', 'kind': 'PodList', 'items': pods,
+                         'metadata': {'resourceVersion': str(self.backend.resource_version)}})
+            return
+
+        self.queue = Queue()
+        self.backend.watchers.add(self.queue)
+        try:
+            while True:
+                event = yield self.queue.get()
+                if event is None:
+                    break
+                if selector_matches(event['object']['metadata']['labels'], label_selector):
+                    self.write(json.dumps(event) + '\n')
+                    yield self.flush()
+        finally:
+            self.backend.watchers.discard(self.queue)
+
+    def on_connection_close(self):
+        if getattr(self, 'queue', None) is not None:
+            self.queue.put_nowait(None)
+
+
+class KubernetesPodHandler(BackendHandler):
+    def delete(self, namespace, name):
+        app = self.find_app(lambda app: self.backend.matches(app, namespace, None) and
+                            self.backend.pod(app)['metadata']['name'] == name)
+        pod = self.backend.pod(app)
+        self.backend.delete(app)
+        self.finish(pod)
+
+
+class KubernetesSecretsHandler(BackendHandler):
+    def post(self, namespace):
+        secret = json.loads(self.request.body.decode('utf-8'))
+        key = (namespace, secret['metadata']['name'])
+        if key in self.backend.secrets:
+            raise web.HTTPError(409)
+        self.backend.secrets[key] = secret
+        self.set_status(201)
+        self.finish(secret)
+
+
+class KubernetesSecretHandler(BackendHandler):
+    def put(self, namespace, name):
+        if (namespace, name) not in self.backend.secrets:
+            raise web.HTTPError(404)
+        self.backend.secrets[(namespace, name)] = secret = json.loads(self.request.body.decode('utf-8'))
+        self.finish(secret)
+
+    def delete(self, namespace, name):
+        if self.backend.secrets.pop((namespace, name), None) is None:
+            raise web.HTTPError(404)
+        self.finish({'apiVersion': 'v1', 'kind': 'Status', 'status': 'Success'})
+
+
+backends = {backend.name: backend
+            for backend in (DistributedBackend, YarnBackend, ConductorBackend, KubernetesBackend)}
+
+
+class BackendServer(object):
+    """Serves a fake backend on a local port from a dedicated thread and IOLoop."""
+    def __init__(self, backend, refresh_interval=0.25):
+        self.backend = backend
+        self.refresh_interval = refresh_interval
+        self.sockets = bind_sockets(0, '127.0.0.1')
+        self.url = 'http://127.0.0.1:{}'.format(self.sockets[0].getsockname()[1])
+        self.io_loop = None
+        self._started = Event()
+        self._thread = Thread(target=self._run, name='BackendServer')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.io_loop = IOLoop.current()
+        server = HTTPServer(web.Application(self.backend.handlers()))
+        server.add_sockets(self.sockets)
+        refresher = PeriodicCallback(self.backend.refresh, self.refresh_interval * 1000)
+        refresher.start()
+        self._started.set()
+        self.io_loop.start()
+        refresher.stop()
+        server.stop()
+        self.io_loop.close(all_fds=True)
+
+    def stop(self):
+        if self.io_loop is not None:
+            self.io_loop.add_callback(self.io_loop.stop)
+            self._thread.join(10)
+        self.backend.shutdown()
@@ -0,0 +1,293 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Measures the rate at which Enterprise Gateway starts, interrupts and shuts down kernels.
+
+The gateway is run in a subprocess (see gateway.py) against a fake backend (see backends.py) whose kernels
+are stand-ins that acknowledge requests immediately (see launcher.py), so the latencies reported are
+dominated by the gateway and its process proxy.  Clients drive the REST and websocket API concurrently:
+`kernels` kernels are started (and a cell executed over each kernel's websocket), then each is interrupted
+and finally each is shut down - at most `concurrency` operations being in flight at once.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from datetime import datetime
+from tornado import gen
+from tornado.escape import json_decode, json_encode
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+from tornado.locks import Semaphore
+from tornado.websocket import websocket_connect
+
+from .backends import backends, BackendServer
+
+operations = ('start', 'execute', 'interrupt', 'shutdown')
+
+
+def percentile(values, percent):
+    """Returns the (nearest-rank) percentile of the values, None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)]
+
+
+def summarize(values):
+    return {'count': len(values), 'p50': percentile(values, 50), 'p99': percentile(values, 99),
+            'max': max(values) if values else None}
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class GatewayProcess(object):
+    """The gateway under test, run in its own process so that its IOLoop lag and memory are isolated."""
+    def __init__(self, work_dir, env, args):
+        self.work_dir = work_dir
+        self.port = _free_port()
+        self.url = 'http://127.0.0.1:{}'.format(self.port)
+        self.env = env
+        self.args = args
+        self.process = None
+
+    def start(self, timeout=60):
+        argv = [sys.executable, '-m', 'enterprise_gateway.benchmarks.gateway', '--ip=127.0.0.1',
+                '--port={}'.format(self.port), '--port_retries=0'] + self.args
+        self.log = open(os.path.join(self.work_dir, 'gateway.log'), 'w')
+        self.process = subprocess.Popen(argv, env=self.env, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except socket.error:
+                time.sleep(0.1)
+        raise RuntimeError("Enterprise Gateway failed to start - see {}".format(self.log.name))
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+class BenchmarkClient(object):
+    """Drives the gateway's REST and websocket API, recording the latency of each operation."""
+    def __init__(self, url, kernel_name, concurrency, users=1):
+        self.url = url
+        self.kernel_name = kernel_name
+        self.semaphore = Semaphore(concurrency)
+        self.users = users
+        self.http_client = AsyncHTTPClient(force_instance=True, max_clients=max(concurrency, 10))
+        self.latencies = {operation: [] for operation in operations}
+        self.errors = {operation: [] for operation in operations}
+        self.kernels = {}  # kernel_id -> websocket connection
+
+    @gen.coroutine
+    def request(self, method, path, body=None):
+        request = HTTPRequest(self.url + path, method=method, body=body, request_timeout=300,
+                              allow_nonstandard_methods=True)
+        response = yield self.http_client.fetch(request, raise_error=True)
+        raise gen.Return(json_decode(response.body) if response.body else None)
+
+    @gen.coroutine
+    def timed(self, operation, func, *args):
+        with (yield self.semaphore.acquire()):
+            start_time = time.monotonic()
+            try:
+                result = yield func(*args)
+                self.latencies[operation].append(time.monotonic() - start_time)
+                raise gen.Return(result)
+            except gen.Return:
+                raise
+            except Exception as e:
+                self.errors[operation].append(str(e))
+
+    @gen.coroutine
+    def start_kernel(self, index):
+        env = {'KERNEL_USERNAME': 'benchmark-user-{}'.format(index % self.users)}
+        kernel = yield self.request('POST', '/api/kernels', json_encode({'name': self.kernel_name, 'env': env}))
+        self.kernels[kernel['id']] = None
+        raise gen.Return(kernel['id'])
+
+    @gen.coroutine
+    def execute(self, kernel_id):
+        session_id = uuid.uuid4().hex
+        connection = yield websocket_connect(self.url.replace('http', 'ws', 1) +
+                                             '/api/kernels/{}/channels?session_id={}'.format(kernel_id, session_id))
+        self.kernels[kernel_id] = connection
+        msg_id = uuid.uuid4().hex
+        message = {'header': {'msg_id': msg_id, 'msg_type': 'execute_request', 'username': '',
+                              'session': session_id, 'date': datetime.utcnow().isoformat(),
+                              'version': '5.3'},
+                   'parent_header': {}, 'metadata': {}, 'channel': 'shell', 'buffers': [],
+                   'content': {'code': '1 + 1', 'silent': False, 'store_history': False, 'user_expressions': {},
+                               'allow_stdin': False, 'stop_on_error': True}}
+        yield connection.write_message(json_encode(message))
+        while True:
+            reply = yield connection.read_message()
+            if reply is None:
+                raise RuntimeError("Websocket of kernel {} closed awaiting execute_reply.".format(kernel_id))
+            reply = json_decode(reply)
+            if reply.get('msg_type') == 'execute_reply' and reply['parent_header'].get('msg_id') == msg_id:
+                break
+
+    @gen.coroutine
+    def start_and_execute(self, index):
+        kernel_id = yield self.timed('start', self.start_kernel, index)
+        if kernel_id:
+            yield self.timed('execute', self.execute, kernel_id)
+
+    @gen.coroutine
+    def interrupt(self, kernel_id):
+        yield self.request('POST', '/api/kernels/{}/interrupt'.format(kernel_id), body='')
+
+    @gen.coroutine
+    def shutdown(self, kernel_id):
+        connection = self.kernels.pop(kernel_id)
+        if connection is not None:
+            connection.close()
+        yield self.request('DELETE', '/api/kernels/{}'.format(kernel_id))
+
+    @gen.coroutine
+    def get_stats(self):
+        stats = yield self.request('GET', '/api/benchmark/stats')
+        raise gen.Return(stats)
+
+    @gen.coroutine
+    def run(self, kernels):
+        results = {}
+        lag = []
+        baseline = yield self.get_stats()
+        start_time = time.monotonic()
+        yield [self.start_and_execute(index) for index in range(kernels)]
+        results['launch_throughput'] = len(self.latencies['start']) / (time.monotonic() - start_time)
+
+        loaded = yield self.get_stats()
+        lag.extend(loaded['lag'])
+        kernel_ids = list(self.kernels)
+        if kernel_ids:
+            results['rss_per_kernel'] = (loaded['rss'] - baseline['rss']) / len(kernel_ids)
+        results['rss'] = {'baseline': baseline['rss'], 'loaded': loaded['rss']}
+
+        yield [self.timed('interrupt', self.interrupt, kernel_id) for kernel_id in kernel_ids]
+        yield [self.timed('shutdown', self.shutdown, kernel_id) for kernel_id in kernel_ids]
+        final = yield self.get_stats()
+        lag.extend(final['lag'])
+        self.http_client.close()
+
+        results['latency'] = {operation: summarize(self.latencies[operation]) for operation in operations}
+        results['errors'] = {operation: self.errors[operation] for operation in operations if self.errors[operation]}
+        results['ioloop_lag'] = summarize(lag)
+        raise gen.Return(results)
+
+
+def run_benchmark(backend_name, kernels=10, concurrency=5, users=1, work_dir=None, gateway_args=None):
+    """Runs the benchmark against the named backend, returning its results."""
+    backend_dir = work_dir or tempfile.mkdtemp(prefix='eg-benchmark-')
+    backend = backends[backend_name](log_dir=backend_dir)
+    server = BackendServer(backend)
+    gateway = None
+    try:
+        server.start()
+        kernel_name = 'benchmark_{}'.format(backend_name)
+        kernel_dir = os.path.join(backend_dir, 'kernels', kernel_name)
+        os.makedirs(kernel_dir, exist_ok=True)
+        with open(os.path.join(kernel_dir, 'kernel.json'), 'w') as f:
+            json.dump(backend.kernel_spec(server.url, kernel_dir), f, indent=2)
+
+        env = dict(os.environ, JUPYTER_PATH=backend_dir, JUPYTER_DATA_DIR=backend_dir,
+                   JUPYTER_RUNTIME_DIR=os.path.join(backend_dir, 'runtime'), EG_KERNEL_LOG_DIR=backend_dir,
+                   EG_RESPONSE_PORT=str(_free_port()), EG_UNAUTHORIZED_USERS='nobody',
+                   PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(os.path.dirname(
+                       os.path.abspath(__file__)))), os.environ.get('PYTHONPATH')])))
+        env.update(backend.gateway_env(server.url))
+        gateway = GatewayProcess(backend_dir, env, backend.gateway_args(server.url) + list(gateway_args or []))
+        gateway.start()
+
+        client = BenchmarkClient(gateway.url, kernel_name, concurrency, users)
+        results = IOLoop.current().run_sync(lambda: client.run(kernels))
+        results.update(backend=backend_name, process_proxy=backend.process_proxy, kernels=kernels,
+                       concurrency=concurrency)
+        return results
+    finally:
+        if gateway is not None:
+            gateway.stop()
+        server.stop()
+        if work_dir is None:
+            shutil.rmtree(backend_dir, ignore_errors=True)
+
+
+def _ms(value):
+    return '-' if value is None else '{:.1f}'.format(value * 1000)
+
+
+def format_results(results):
+    row = '  {:<10} {:>6} {:>7} {:>10} {:>10} {:>10}'
+    lines = ['{} ({}): {} kernels, concurrency {}'.format(results['backend'], results['process_proxy'],
+                                                          results['kernels'], results['concurrency']),
+             row.format('operation', 'count', 'errors', 'p50 (ms)', 'p99 (ms)', 'max (ms)')]
+    for operation in operations:
+        latency = results['latency'][operation]
+        lines.append(row.format(
+            operation, latency['count'], len(results['errors'].get(operation, [])), _ms(latency['p50']),
+            _ms(latency['p99']), _ms(latency['max'])))
+    lag = results['ioloop_lag']
+    lines.append('  launch throughput: {:.2f} kernels/s'.format(results['launch_throughput']))
+    lines.append('  IOLoop lag (ms): p50 {}, p99 {}, max {}'.format(_ms(lag['p50']), _ms(lag['p99']), _ms(lag['max'])))
+    if results.get('rss_per_kernel') is not None:
+        lines.append('  gateway RSS: {:.1f} MiB baseline, {:.1f} KiB per kernel'.format(
+            results['rss']['baseline'] / 2.0 ** 20, results['rss_per_kernel'] / 1024.0))
+    for operation, errors in results['errors'].items():
+        lines.append('  {} errors: {}'.format(operation, '; '.join(sorted(set(errors)))))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m enterprise_gateway.benchmarks',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', action='append', choices=sorted(backends),
+                        help='The backend(s) to benchmark (default: all)')
+    parser.add_argument('--kernels', type=int, default=10, help='The number of kernels to start (default: 10)')
+    parser.add_argument('--concurrency', type=int, default=5,
+                        help='The maximum number of operations in flight (default: 5)')
+    parser.add_argument('--users', type=int, default=1, help='The number of users starting kernels (default: 1)')
+    parser.add_argument('--work-dir', help='Directory in which the kernelspecs and logs are retained')
+    parser.add_argument('--json', dest='json_file', help='File to which the results are written as JSON')
+    arguments, gateway_args = parser.parse_known_args(argv)
+
+    all_results = []
+    for backend_name in arguments.backend or sorted(backends):
+        work_dir = None
+        if arguments.work_dir:
+            work_dir = os.path.join(arguments.work_dir, backend_name)
+            os.makedirs(work_dir, exist_ok=True)
+        results = run_benchmark(backend_name, arguments.kernels, arguments.concurrency, arguments.users,
+                                work_dir, gateway_args)
+        print(format_results(results))
+        all_results.append(results)
+
+    if arguments.json_file:
+        with open(arguments.json_file, 'w') as f:
+            json.dump(all_results, f, indent=2)
+    return 1 if any(results['errors'] for results in all_results) else 0
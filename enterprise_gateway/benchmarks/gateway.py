@@ -0,0 +1,94 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Runs Enterprise Gateway for a benchmark.
+
+The gateway is run as usual (taking the same options), with the addition of an `/api/benchmark/stats`
+endpoint that reports the gateway's resident memory and the lag of its IOLoop - sampled every
+EG_BENCHMARK_LAG_INTERVAL seconds since the previous request of the endpoint.  If
+EG_BENCHMARK_KUBERNETES_HOST is set, the kubernetes client is pointed at the (fake) API server at that
+url in place of the in-cluster configuration - which requires the gateway to run within a pod.
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+
+from tornado import web
+from tornado.ioloop import PeriodicCallback
+
+lag_interval = float(os.getenv('EG_BENCHMARK_LAG_INTERVAL', '0.05'))
+kubernetes_host = os.getenv('EG_BENCHMARK_KUBERNETES_HOST')
+
+
+class LagMonitor(object):
+    """Samples the delay of a periodic callback relative to its expected time, i.e., the IOLoop's lag."""
+    def __init__(self, interval=lag_interval):
+        self.interval = interval
+        self.samples = []
+        self._expected = None
+        self._callback = PeriodicCallback(self._sample, interval * 1000)
+
+    def start(self):
+        self._expected = time.monotonic() + self.interval
+        self._callback.start()
+
+    def _sample(self):
+        now = time.monotonic()
+        self.samples.append(max(now - self._expected, 0.0))
+        self._expected = now + self.interval
+
+    def drain(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def get_rss():
+    """Returns the resident memory (bytes) of this process - its peak if the current value is unavailable."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class StatsHandler(web.RequestHandler):
+    def initialize(self, monitor):
+        self.monitor = monitor
+
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps({'rss': get_rss(), 'lag': self.monitor.drain()}))
+
+
+def configure_kubernetes(host):
+    from kubernetes import client, config
+
+    configuration = client.Configuration()
+    configuration.host = host
+    client.Configuration.set_default(configuration)
+    config.load_incluster_config = lambda *args, **kwargs: None
+
+
+def main(argv=None):
+    if kubernetes_host:
+        configure_kubernetes(kubernetes_host)
+
+    from notebook.utils import url_path_join
+    from enterprise_gateway.enterprisegatewayapp import EnterpriseGatewayApp
+
+    app = EnterpriseGatewayApp.instance()
+    app.initialize(argv)
+    monitor = LagMonitor()
+    app.web_app.add_handlers('.*$', [(url_path_join('/', app.base_url, r'/api/benchmark/stats'), StatsHandler,
+                                      {'monitor': monitor})])
+    monitor.start()
+    app.start()
+
+
+if __name__ == '__main__':
+    main()
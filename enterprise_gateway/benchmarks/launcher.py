@@ -0,0 +1,347 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""A stand-in kernel launcher used to benchmark Enterprise Gateway.
+
+The launcher speaks the same protocol as the python kernel launcher (launch_ipykernel.py) - it returns the
+kernel's connection info to the gateway's response address, serves signal and shutdown requests on its
+communication port and sends heartbeats - but, in place of IPython, runs a minimal kernel that acknowledges
+each request immediately.  Kernel launches are therefore dominated by the gateway's own overhead.
+
+When `--submit <url>` is specified, the launcher instead submits itself to the fake resource manager at
+`url` (see backends.py) and exits once the submission has been accepted - as spark-submit does in cluster
+mode.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import struct
+import sys
+import uuid
+
+from threading import Event, Thread
+from urllib.request import Request, urlopen
+
+import zmq
+
+from Crypto.Cipher import AES
+from jupyter_client.session import Session
+
+heartbeat_interval = float(os.getenv('EG_HEARTBEAT_INTERVAL', '5.0'))
+max_port_range_retries = int(os.getenv('EG_MAX_PORT_RANGE_RETRIES', '5'))
+max_frame_size = 64 * 1024
+handshake_version = 2
+protocol_version = '5.3'
+launch_secret = os.getenv('KERNEL_LAUNCH_SECRET', '')
+
+logging.basicConfig(format='[%(levelname)1.1s %(asctime)s.%(msecs).03d %(name)s] %(message)s')
+
+logger = logging.getLogger('benchmark_launcher')
+logger.setLevel(int(os.getenv('EG_LOG_LEVEL', '30')))
+
+
+def _associated_data(kernel_id, purpose=b''):
+    kernel_id = kernel_id.encode('utf-8')
+    return struct.pack('>BH', handshake_version, len(kernel_id)) + kernel_id + purpose
+
+
+def _seal(payload, kernel_id, purpose=b''):
+    nonce = os.urandom(12)
+    cipher = AES.new(hashlib.sha256(launch_secret.encode('utf-8')).digest(), AES.MODE_GCM, nonce=nonce)
+    cipher.update(_associated_data(kernel_id, purpose))
+    ciphertext, tag = cipher.encrypt_and_digest(payload)
+    return nonce + ciphertext + tag
+
+
+def _connection_info_frame(connection_info, kernel_id):
+    sealed = _seal(json.dumps(connection_info).encode('utf-8'), kernel_id)
+    return _associated_data(kernel_id) + struct.pack('>I', len(sealed)) + sealed
+
+
+def _heartbeat_message(event, kernel_id):
+    event_info = json.dumps({'kernel_id': kernel_id, 'event': event, 'pid': str(os.getpid())}).encode('utf-8')
+    payload = base64.b64encode(_seal(event_info, kernel_id, b'heartbeat')).decode('utf-8')
+    message = {'kernel_id': kernel_id, 'version': handshake_version, 'payload': payload}
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+def _parse_port_range(port_range):
+    lower_port, upper_port = 0, 0
+    if port_range:
+        lower_port, upper_port = [int(port) for port in port_range.split('..')]
+    return lower_port, upper_port
+
+
+def _bind_port(bind, ip, lower_port, upper_port):
+    """Binds via `bind(address)` to a port within the given range (any port if the range is 0..0)."""
+    if lower_port == 0 and upper_port == 0:
+        return bind(ip, 0)
+    candidates = list(range(lower_port, upper_port + 1))
+    random.shuffle(candidates)
+    for port in candidates[:max(max_port_range_retries, 1) * 10]:
+        try:
+            return bind(ip, port)
+        except (socket.error, zmq.ZMQError):
+            continue
+    raise RuntimeError("Unable to bind to a port within range {}..{}".format(lower_port, upper_port))
+
+
+class StubKernel(object):
+    """A kernel that implements the messaging protocol without executing code.
+
+    Each request is acknowledged immediately, with execute requests surrounded by the busy and idle status
+    messages clients wait for.  Interrupts (SIGINT) are counted and shutdown requests stop the kernel.
+    """
+    def __init__(self, ip, lower_port, upper_port):
+        self.key = str(uuid.uuid4())
+        self.session = Session(key=self.key.encode('utf-8'), username='kernel')
+        self.context = zmq.Context()
+        self.sockets = {}
+        self.ports = {}
+        for channel, socket_type in (('shell', zmq.ROUTER), ('control', zmq.ROUTER), ('stdin', zmq.ROUTER),
+                                     ('iopub', zmq.PUB), ('hb', zmq.REP)):
+            sock = self.context.socket(socket_type)
+            sock.linger = 0
+            self.ports[channel + '_port'] = _bind_port(lambda ip, port: self._bind(sock, ip, port),
+                                                       ip, lower_port, upper_port)
+            self.sockets[channel] = sock
+        self.execution_count = 0
+        self.interrupts = 0
+        self.stopped = Event()
+
+    @staticmethod
+    def _bind(sock, ip, port):
+        if port == 0:
+            return sock.bind_to_random_port('tcp://' + ip)
+        sock.bind('tcp://{}:{}'.format(ip, port))
+        return port
+
+    def serve(self):
+        poller = zmq.Poller()
+        for channel in ('shell', 'control', 'hb'):
+            poller.register(self.sockets[channel], zmq.POLLIN)
+        while not self.stopped.is_set():
+            for sock, event in poller.poll(100):
+                if sock is self.sockets['hb']:
+                    sock.send(sock.recv())
+                else:
+                    self._dispatch(sock)
+        self.context.destroy(linger=0)
+
+    def _dispatch(self, sock):
+        idents, msg = self.session.feed_identities(sock.recv_multipart())
+        msg = self.session.deserialize(msg)
+        msg_type = msg['header']['msg_type']
+        self._publish_status('busy', msg)
+        if msg_type == 'kernel_info_request':
+            content = {'status': 'ok', 'protocol_version': protocol_version, 'implementation': 'benchmark',
+                       'implementation_version': '1.0', 'banner': '', 'help_links': [],
+                       'language_info': {'name': 'python', 'version': sys.version.split()[0],
+                                         'mimetype': 'text/x-python', 'file_extension': '.py'}}
+        elif msg_type == 'execute_request':
+            if not msg['content'].get('silent'):
+                self.execution_count += 1
+            self.session.send(self.sockets['iopub'], 'execute_input', parent=msg, ident=self._topic('execute_input'),
+                              content={'code': msg['content'].get('code', ''),
+                                       'execution_count': self.execution_count})
+            content = {'status': 'ok', 'execution_count': self.execution_count, 'user_expressions': {},
+                       'payload': []}
+        elif msg_type == 'shutdown_request':
+            content = {'status': 'ok', 'restart': msg['content'].get('restart', False)}
+            self.stopped.set()
+        elif msg_type == 'comm_info_request':
+            content = {'status': 'ok', 'comms': {}}
+        else:
+            content = {'status': 'ok'}
+        self.session.send(sock, msg_type.replace('_request', '_reply'), content, parent=msg, ident=idents)
+        self._publish_status('idle', msg)
+
+    def _publish_status(self, state, parent):
+        self.session.send(self.sockets['iopub'], 'status', {'execution_state': state}, parent=parent,
+                          ident=self._topic('status'))
+
+    @staticmethod
+    def _topic(topic):
+        return ('kernel.{}.{}'.format(os.getpid(), topic)).encode('utf-8')
+
+    def interrupt(self, signum, frame):
+        self.interrupts += 1
+
+    def terminate(self, signum, frame):
+        self.stopped.set()
+
+
+def _recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        buffer = conn.recv(size - len(data))
+        if not buffer:
+            return None
+        data += buffer
+    return data
+
+
+def _process_request(request):
+    """Performs the given gateway request, returning True if the listener is to shutdown."""
+    if request.get('signum') is not None:
+        os.kill(os.getpid(), int(request.get('signum')))
+    elif request.get('shutdown') is not None:
+        return bool(request.get('shutdown'))
+    return False
+
+
+def _serve_connection(conn, shutdown):
+    # Serves the (framed) control channel, or the single request conveyed by a legacy connection.
+    try:
+        header = _recv_exactly(conn, 4)
+        if header is not None and header.startswith(b'{'):
+            data = header
+            while True:
+                buffer = conn.recv(1024)
+                if not buffer:
+                    break
+                data += buffer
+            if _process_request(json.loads(data.decode('utf-8'))):
+                shutdown.set()
+            return
+
+        while header is not None and not shutdown.is_set():
+            size = struct.unpack('>I', header)[0]
+            if size > max_frame_size:
+                raise RuntimeError("Frame size ({}) exceeds maximum of {}.".format(size, max_frame_size))
+            data = _recv_exactly(conn, size)
+            if data is None:
+                break
+            request = json.loads(data.decode('utf-8'))
+            reply = {'id': request.get('id'), 'status': 'ok'}
+            try:
+                if _process_request(request):
+                    shutdown.set()
+            except Exception as e:
+                reply.update(status='error', message=str(e))
+            reply = json.dumps(reply).encode('utf-8')
+            conn.sendall(struct.pack('>I', len(reply)) + reply)
+            header = _recv_exactly(conn, 4)
+    except Exception as e:
+        logger.warning("Error processing gateway requests: {}".format(e))
+    finally:
+        conn.close()
+
+
+def gateway_listener(sock):
+    shutdown = Event()
+    while not shutdown.is_set():
+        try:
+            conn, addr = sock.accept()
+        except socket.timeout:
+            continue
+        conn.settimeout(None)
+        connection_thread = Thread(target=_serve_connection, args=(conn, shutdown))
+        connection_thread.daemon = True
+        connection_thread.start()
+
+
+def heartbeat_sender(response_addr, kernel_id, exiting):
+    """Sends a heartbeat every EG_HEARTBEAT_INTERVAL seconds until `exiting` is set, then reports the exit."""
+    response_ip, response_port = response_addr.split(':')
+    sock = None
+    while True:
+        event = 'exit' if exiting.is_set() else 'heartbeat'
+        try:
+            if sock is None:
+                sock = socket.create_connection((response_ip, int(response_port)), timeout=heartbeat_interval)
+            sock.sendall(_heartbeat_message(event, kernel_id))
+        except Exception as e:
+            logger.debug("Unable to send {} to gateway at '{}': {}".format(event, response_addr, e))
+            if sock is not None:
+                sock.close()
+                sock = None
+        if event == 'exit':
+            break
+        exiting.wait(heartbeat_interval)
+    if sock is not None:
+        sock.close()
+
+
+def run(kernel_id, response_addr, lower_port, upper_port, ip='127.0.0.1'):
+    """Runs the stub kernel, returning its connection info to the gateway at `response_addr`."""
+    kernel = StubKernel(ip, lower_port, upper_port)
+    signal.signal(signal.SIGINT, kernel.interrupt)
+    signal.signal(signal.SIGTERM, kernel.terminate)
+
+    def bind_listener(ip, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((ip, port))
+        return sock
+
+    listener = _bind_port(bind_listener, ip, lower_port, upper_port)
+    listener.listen(16)
+    listener.settimeout(5)
+
+    connection_info = dict(kernel.ports, ip=ip, key=kernel.key, transport='tcp', signature_scheme='hmac-sha256',
+                           kernel_name='', pid=str(os.getpid()), pgid=str(os.getpgid(0)),
+                           comm_port=listener.getsockname()[1], comm_protocol=1)
+    response_ip, response_port = response_addr.split(':')
+    sock = socket.create_connection((response_ip, int(response_port)))
+    try:
+        sock.sendall(_connection_info_frame(connection_info, kernel_id))
+    finally:
+        sock.close()
+
+    listener_thread = Thread(target=gateway_listener, args=(listener,))
+    listener_thread.daemon = True
+    listener_thread.start()
+
+    exiting = Event()
+    heartbeat_thread = Thread(target=heartbeat_sender, args=(response_addr, kernel_id, exiting))
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+
+    kernel.serve()
+    exiting.set()
+    heartbeat_thread.join(heartbeat_interval)
+    logger.info("Kernel {} stopped after {} interrupt(s).".format(kernel_id, kernel.interrupts))
+
+
+def submit(url, kernel_id, argv):
+    """Submits the launcher (less the `--submit` option) to the fake resource manager at `url`, writing
+    the submission's output to stderr - from which some process proxies obtain the submission's id.
+    """
+    body = {'kernel_id': kernel_id,
+            'argv': [sys.executable, '-m', 'enterprise_gateway.benchmarks.launcher'] + argv,
+            'env': dict(os.environ)}
+    request = Request(url, data=json.dumps(body).encode('utf-8'), headers={'Content-Type': 'application/json'})
+    with urlopen(request, timeout=30) as response:
+        output = json.loads(response.read().decode('utf-8')).get('output', '')
+    sys.stderr.write(output + '\n')
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--RemoteProcessProxy.kernel-id', dest='kernel_id', required=True,
+                        help='Indicates the id associated with the launched kernel.')
+    parser.add_argument('--RemoteProcessProxy.response-address', dest='response_address', required=True,
+                        metavar='<ip>:<port>', help='Connection address (<ip>:<port>) for returning connection info')
+    parser.add_argument('--RemoteProcessProxy.port-range', dest='port_range', nargs='?',
+                        metavar='<lowerPort>..<upperPort>', help='Port range to impose for kernel ports')
+    parser.add_argument('--submit', metavar='<url>',
+                        help='Submit the launcher to the fake resource manager at this url, rather than run it')
+    arguments = parser.parse_args(argv)
+
+    if arguments.submit:
+        index = argv.index('--submit')
+        submit(arguments.submit, arguments.kernel_id, argv[:index] + argv[index + 2:])
+    else:
+        lower_port, upper_port = _parse_port_range(arguments.port_range)
+        run(arguments.kernel_id, arguments.response_address, lower_port, upper_port)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ import os
 import signal
 import getpass
 
+from functools import partial
+
 # Install the pyzmq ioloop. This has to be done before anything else from
 # tornado is imported.
 from zmq.eventloop import ioloop
@@ -13,15 +15,19 @@ ioloop.install()
 from tornado.log import LogFormatter
 
 
-from traitlets import default, List, Set, Unicode, Type, Instance, Bool, Integer
+from traitlets import default, List, Set, Unicode, Type, Instance, Bool, Integer, Float, Dict
 from jupyter_client.kernelspec import KernelSpecManager
 from notebook.services.kernels.kernelmanager import MappingKernelManager
 from kernel_gateway.gatewayapp import KernelGatewayApp
 from kernel_gateway.services.sessions.sessionmanager import SessionManager
+from notebook.utils import url_path_join
 
 from ._version import __version__
 from .services.sessions.kernelsessionmanager import KernelSessionManager
 from .services.kernels.remotemanager import RemoteMappingKernelManager
+from .services.api.handlers import default_handlers as default_api_handlers
+from .services.kernels.handlers import default_handlers as default_kernel_handlers
+from .watchdog import IOLoopWatchdog
 
 
 class EnterpriseGatewayApp(KernelGatewayApp):
@@ -156,6 +162,72 @@ class EnterpriseGatewayApp(KernelGatewayApp):
     def max_kernels_per_user_default(self):
         return int(os.getenv(self.max_kernels_per_user_env, self.max_kernels_per_user_default_value))
 
+    # Warm kernel pools
+    warm_kernel_pools_env = 'EG_WARM_KERNEL_POOLS'
+    warm_kernel_pools = Dict(config=True,
+                             help="""Dictionary of kernelspec names to the number of kernels of that kernelspec
+                             to keep started (e.g., {'spark_python_yarn_cluster': 5}).  Pooled kernels are handed
+                             off to start requests that do not require a specific kernel environment, after which
+                             the pool is replenished in the background.  Authorization is applied when a pooled
+                             kernel is claimed.  Pools are bounded by max_kernels.
+                             (EG_WARM_KERNEL_POOLS env var - comma-separated name:count pairs, e.g.,
+                             spark_python_yarn_cluster:5,python_kubernetes:2)""")
+
+    @default('warm_kernel_pools')
+    def warm_kernel_pools_default(self):
+        warm_kernel_pools = {}
+        for pool in os.getenv(self.warm_kernel_pools_env, '').split(','):
+            if pool.strip():
+                kernel_name, _, count = pool.rpartition(':')
+                warm_kernel_pools[kernel_name.strip()] = int(count)
+        return warm_kernel_pools
+
+    # Launch admission
+    max_concurrent_launches_env = 'EG_MAX_CONCURRENT_LAUNCHES'
+    max_concurrent_launches = Dict(config=True,
+                                   help="""Dictionary of process-proxy class names (either fully-qualified or
+                                   unqualified) and kernelspec names to the maximum number of kernels of that class
+                                   or kernelspec that may be launching at once (e.g., {'YarnClusterProcessProxy': 10,
+                                   'spark_python_yarn_cluster': 4}).  Launches exceeding a limit are queued per
+                                   user, least recently admitted user first.  (EG_MAX_CONCURRENT_LAUNCHES env var -
+                                   comma-separated name:count pairs, e.g., YarnClusterProcessProxy:10)""")
+
+    @default('max_concurrent_launches')
+    def max_concurrent_launches_default(self):
+        max_concurrent_launches = {}
+        for limit in os.getenv(self.max_concurrent_launches_env, '').split(','):
+            if limit.strip():
+                name, _, count = limit.rpartition(':')
+                max_concurrent_launches[name.strip()] = int(count)
+        return max_concurrent_launches
+
+    launch_queue_size_env = 'EG_LAUNCH_QUEUE_SIZE'
+    launch_queue_size_default_value = 100
+    launch_queue_size = Integer(launch_queue_size_default_value, config=True,
+                                help="""The maximum number of kernel launches waiting for admission (see
+                                max_concurrent_launches).  Further start requests are rejected with a 429 status
+                                and a Retry-After header.  -1 indicates no limit.  (EG_LAUNCH_QUEUE_SIZE env var)""")
+
+    @default('launch_queue_size')
+    def launch_queue_size_default(self):
+        return int(os.getenv(self.launch_queue_size_env, self.launch_queue_size_default_value))
+
+    # IOLoop watchdog
+    ioloop_watchdog_threshold_env = 'EG_IOLOOP_WATCHDOG_THRESHOLD'
+    ioloop_watchdog_threshold_default_value = 0.0
+    ioloop_watchdog_threshold = Float(ioloop_watchdog_threshold_default_value, config=True,
+                                      help="""The duration (in seconds) beyond which the IOLoop is considered
+                                      blocked.  When positive, the IOLoop's lag is measured and the stack of each
+                                      callback blocking the IOLoop for longer is sampled, logged and exposed via
+                                      /api/watchdog - attributed to its kernel and process-proxy method.  A value
+                                      of 0 disables the watchdog.  (EG_IOLOOP_WATCHDOG_THRESHOLD env var)""")
+
+    @default('ioloop_watchdog_threshold')
+    def ioloop_watchdog_threshold_default(self):
+        return float(os.getenv(self.ioloop_watchdog_threshold_env, self.ioloop_watchdog_threshold_default_value))
+
+    ioloop_watchdog = Instance(IOLoopWatchdog, allow_none=True)
+
     kernel_spec_manager = Instance(KernelSpecManager, allow_none=True)
 
     kernel_spec_manager_class = Type(
@@ -241,9 +313,6 @@ class EnterpriseGatewayApp(KernelGatewayApp):
             **kwargs
         )
 
-        # Attempt to start persisted sessions
-        self.kernel_session_manager.start_sessions()
-
         self.contents_manager = None  # Gateways don't use contents manager
 
         if self.prespawn_count:
@@ -258,6 +327,11 @@ class EnterpriseGatewayApp(KernelGatewayApp):
 
         self.personality.init_configurables()
 
+        # Begin filling any warm kernel pools - now that the personality (and its whitelists) is available.
+        func = getattr(self.kernel_manager, 'replenish_warm_kernel_pools', None)
+        if func:
+            func()
+
     def init_webapp(self):
         """Initializes Tornado web application (via superclass) with uri handlers and enables remote access. """
         super(EnterpriseGatewayApp, self).init_webapp()
@@ -267,6 +341,19 @@ class EnterpriseGatewayApp(KernelGatewayApp):
         # here.  Because this is a dictionary, we shouldn't have to worry about older versions as this will be ignored.
         self.web_app.settings['allow_remote_access'] = True
 
+        # Add the Enterprise Gateway specific handlers (e.g., /api/metrics) rooted at the base_url.  These are
+        # added ahead of the personality's handlers, the last of which catches all unhandled requests.
+        handlers = [tuple([url_path_join('/', self.base_url, handler[0])] + list(handler[1:]))
+                    for handler in default_api_handlers]
+        self.web_app.add_handlers('.*$', handlers)
+
+        # The Enterprise Gateway kernel handlers take the place of the personality's handlers they extend - should
+        # it provide the kernels API.
+        kernel_handlers = {handler[1].__bases__[0]: handler[1] for handler in default_kernel_handlers}
+        for rule in self.web_app.wildcard_router.rules:
+            if rule.target in kernel_handlers:
+                rule.target = rule.handler_class = kernel_handlers[rule.target]
+
     def start(self):
         """Starts an IO loop for the application. """
 
@@ -287,6 +374,15 @@ class EnterpriseGatewayApp(KernelGatewayApp):
 
         self.io_loop = ioloop.IOLoop.current()
 
+        if self.ioloop_watchdog_threshold > 0:
+            self.ioloop_watchdog = IOLoopWatchdog(self.ioloop_watchdog_threshold, self.log, self.io_loop)
+            self.web_app.settings['ioloop_watchdog'] = self.ioloop_watchdog
+            self.ioloop_watchdog.start()
+
+        # Attempt to start persisted sessions - now that the server is listening, so that clients are able to
+        # observe the sessions being revived.
+        self.io_loop.add_callback(self.kernel_session_manager.start_sessions)
+
         signal.signal(signal.SIGHUP, signal.SIG_IGN)
 
         signal.signal(signal.SIGTERM, self._signal_stop)
@@ -298,8 +394,19 @@ class EnterpriseGatewayApp(KernelGatewayApp):
             # Ignore further interrupts (ctrl-c)
             signal.signal(signal.SIGINT, signal.SIG_IGN)
         finally:
+            if self.ioloop_watchdog is not None:
+                self.ioloop_watchdog.stop()
             self.shutdown()
 
+    def shutdown(self):
+        """Shuts down all kernels, then the personality.
+
+        Since kernels are shutdown by coroutines, the IOLoop (stopped by this point) is run until all
+        shutdowns have completed.
+        """
+        ioloop.IOLoop.current().run_sync(partial(self.kernel_manager.shutdown_all, now=True))
+        super(EnterpriseGatewayApp, self).shutdown()
+
     def stop(self):
         """
         Stops the HTTP server and IO loop associated with the application.
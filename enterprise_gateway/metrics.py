@@ -0,0 +1,65 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Prometheus metrics collected by Enterprise Gateway."""
+
+from prometheus_client import Gauge, Histogram
+
+# Kernel launches range from sub-second local kernels to several minutes for kernels awaiting cluster resources.
+launch_duration_buckets = (.01, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, float('inf'))
+
+KERNEL_LAUNCH_DURATION_SECONDS = Histogram(
+    'kernel_launch_duration_seconds',
+    'Time (seconds) taken to launch a kernel, from its process proxy creation to the receipt of its connection info.',
+    ['process_proxy', 'kernelspec'],
+    buckets=launch_duration_buckets
+)
+
+KERNEL_LAUNCH_PHASE_DURATION_SECONDS = Histogram(
+    'kernel_launch_phase_duration_seconds',
+    'Time (seconds) spent in each phase of a kernel launch.',
+    ['process_proxy', 'kernelspec', 'phase'],
+    buckets=launch_duration_buckets
+)
+
+KERNEL_LAUNCH_POLLS = Histogram(
+    'kernel_launch_polls',
+    'Number of status polls performed while confirming the startup of a remote kernel.',
+    ['process_proxy', 'kernelspec'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, float('inf'))
+)
+
+# The IOLoop's lag is typically well under a millisecond, whereas blocking calls stall it for seconds.
+ioloop_lag_buckets = (.001, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+IOLOOP_LAG_SECONDS = Histogram(
+    'ioloop_lag_seconds',
+    'Delay (seconds) of the IOLoop watchdog\'s periodic callback relative to its scheduled time.',
+    buckets=ioloop_lag_buckets
+)
+
+IOLOOP_STALL_DURATION_SECONDS = Histogram(
+    'ioloop_stall_duration_seconds',
+    'Time (seconds) the IOLoop was blocked beyond the watchdog threshold, by the location blocking it.',
+    ['location'],
+    buckets=ioloop_lag_buckets
+)
+
+BACKEND_CALL_QUEUE_DEPTH = Gauge(
+    'backend_call_queue_depth',
+    'Number of blocking backend calls awaiting a thread of their backend\'s executor.',
+    ['backend']
+)
+
+BACKEND_CALL_QUEUE_SECONDS = Histogram(
+    'backend_call_queue_seconds',
+    'Time (seconds) blocking backend calls waited for a thread of their backend\'s executor.',
+    ['backend'],
+    buckets=ioloop_lag_buckets
+)
+
+BACKEND_CALL_DURATION_SECONDS = Histogram(
+    'backend_call_duration_seconds',
+    'Time (seconds) taken by blocking backend calls (e.g., resource manager requests), by backend and call.',
+    ['backend', 'call'],
+    buckets=ioloop_lag_buckets
+)
@@ -0,0 +1,61 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tornado handlers for the Enterprise Gateway specific portions of the API."""
+
+import json
+
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from tornado import web
+from kernel_gateway.mixins import TokenAuthorizationMixin, CORSMixin, JSONErrorsMixin
+from ..processproxies.processproxy import port_allocator
+
+
+class MetricsHandler(TokenAuthorizationMixin,
+                     CORSMixin,
+                     JSONErrorsMixin,
+                     web.RequestHandler):
+    """Exposes the metrics collected by Enterprise Gateway in the Prometheus text format."""
+    def get(self):
+        self.set_header('Content-Type', CONTENT_TYPE_LATEST)
+        self.write(generate_latest(REGISTRY))
+
+
+class UsageHandler(TokenAuthorizationMixin,
+                   CORSMixin,
+                   JSONErrorsMixin,
+                   web.RequestHandler):
+    """Returns the current number of active and launching kernels of each user and kernelspec, along with
+    the configured limits and the utilization of the ports managed by the gateway.
+    """
+    def get(self):
+        km = self.settings['kernel_manager']
+        usage = km.kernel_usage.get_usage()
+        usage['limits'] = {
+            'max_kernels': km.parent.max_kernels,
+            'max_kernels_per_user': km.parent.max_kernels_per_user,
+        }
+        usage['ports'] = port_allocator.get_stats()
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(usage))
+
+
+class WatchdogHandler(TokenAuthorizationMixin,
+                      CORSMixin,
+                      JSONErrorsMixin,
+                      web.RequestHandler):
+    """Returns the IOLoop's lag and the callbacks that have recently blocked it, as measured by the IOLoop
+    watchdog (see EnterpriseGatewayApp.ioloop_watchdog_threshold).
+    """
+    def get(self):
+        watchdog = self.settings.get('ioloop_watchdog')
+        if watchdog is None:
+            raise web.HTTPError(404, "The IOLoop watchdog is not enabled.  See EG_IOLOOP_WATCHDOG_THRESHOLD.")
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(watchdog.get_stats()))
+
+
+default_handlers = [
+    (r'/api/metrics', MetricsHandler),
+    (r'/api/usage', UsageHandler),
+    (r'/api/watchdog', WatchdogHandler)
+]
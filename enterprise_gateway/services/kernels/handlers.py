@@ -0,0 +1,23 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tornado handlers for kernel CRUD, extending those of the kernel gateway."""
+
+import kernel_gateway.services.kernels.handlers as kernel_gateway_handlers
+
+from .scheduler import LaunchQueueFullError
+
+
+class MainKernelHandler(kernel_gateway_handlers.MainKernelHandler):
+    """Extends the kernel gateway's main kernel handler to advise clients, via the Retry-After header, when
+    to retry a start request rejected due to a full launch queue.
+    """
+    def write_error(self, status_code, **kwargs):
+        exc_info = kwargs.get('exc_info')
+        if exc_info and isinstance(exc_info[1], LaunchQueueFullError):
+            self.set_header('Retry-After', str(exc_info[1].retry_after))
+        super(MainKernelHandler, self).write_error(status_code, **kwargs)
+
+
+default_handlers = [
+    (r'/api/kernels', MainKernelHandler)
+]
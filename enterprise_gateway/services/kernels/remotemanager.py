@@ -2,18 +2,28 @@
 # Distributed under the terms of the Modified BSD License.
 """Kernel managers that operate against a remote process."""
 
+import errno
 import os
 import signal
 import re
 import uuid
 
-from tornado import gen
+from functools import partial
+from tornado import gen, web
+from tornado.ioloop import IOLoop
+from notebook._tz import utcnow
 from ipython_genutils.py3compat import unicode_type
 from ipython_genutils.importstring import import_item
+from jupyter_client.ioloop import IOLoopKernelRestarter
+from jupyter_client.localinterfaces import is_local_ip, local_ips
+from jupyter_client.multikernelmanager import DuplicateKernelError, MultiKernelManager
 from kernel_gateway.services.kernels.manager import SeedingMappingKernelManager, KernelGatewayIOLoopKernelManager
 
-from ..processproxies.processproxy import LocalProcessProxy, RemoteProcessProxy
+from ..processproxies.processproxy import LocalProcessProxy, RemoteProcessProxy, port_allocator, \
+    process_exit_watcher
 from ..sessions.kernelsessionmanager import KernelSessionManager
+from .scheduler import KernelLaunchScheduler
+from .usage import KernelUsage
 
 
 def get_process_proxy_config(kernelspec):
@@ -43,8 +53,22 @@ def get_process_proxy_config(kernelspec):
     return {"class_name": "enterprise_gateway.services.processproxies.processproxy.LocalProcessProxy", "config": {}}
 
 
+warm_kernel_max_retry_interval = float(os.getenv('EG_WARM_KERNEL_MAX_RETRY_INTERVAL', '300'))
+
+
 class RemoteMappingKernelManager(SeedingMappingKernelManager):
     """Extends the SeedingMappingKernelManager with support for managing remote kernels via the process-proxy. """
+    def __init__(self, **kwargs):
+        super(RemoteMappingKernelManager, self).__init__(**kwargs)
+        self._warm_kernels = {}  # kernel_name -> list of started, but unclaimed, kernel_ids
+        self._warm_kernel_launches = {}  # kernel_name -> number of pool launches in flight
+        self._warm_kernel_failures = {}  # kernel_name -> number of consecutive pool launch failures
+        self._pending_kernel_starts = 0  # requested (non-pool) kernel launches in flight
+        self._kernel_shutdowns = {}  # kernel_id -> Future of the kernel's shutdown while in progress
+        self._shutting_down = False  # warm kernel pools aren't replenished once all kernels are being shutdown
+        self.kernel_usage = KernelUsage()
+        self.launch_scheduler = KernelLaunchScheduler(self)
+
     def _kernel_manager_class_default(self):
         return 'enterprise_gateway.services.kernels.remotemanager.RemoteKernelManager'
 
@@ -52,6 +76,10 @@ class RemoteMappingKernelManager(SeedingMappingKernelManager):
     def start_kernel(self, *args, **kwargs):
         """Starts a kernel for a session and return its kernel_id.
 
+        New kernels are started via `_start_kernel_manager()`, which awaits the kernel's (potentially lengthy)
+        startup without blocking the IOLoop.  The resulting kernel_id is then passed to the superclass so that
+        its handling of existing kernels (culler initialization, seeding, etc.) still applies.
+
         Returns
         -------
         kernel_id : str
@@ -61,15 +89,397 @@ class RemoteMappingKernelManager(SeedingMappingKernelManager):
         username = KernelSessionManager.get_kernel_username(**kwargs)
         self.log.debug("RemoteMappingKernelManager.start_kernel: {kernel_name}, kernel_username: {username}".
                        format(kernel_name=kwargs['kernel_name'], username=username))
-        kernel_id = yield gen.maybe_future(super(RemoteMappingKernelManager, self).start_kernel(*args, **kwargs))
-        self.parent.kernel_session_manager.create_session(kernel_id, **kwargs)
+        kernel_name = self._resolve_kernel_name(kwargs.get('kernel_name'))
+        self._enforce_limits(username)
+        # The launch counts against the user's limit until its session exists (and is then counted).
+        self.kernel_usage.start_launch(username, kernel_name)
+        kernel_id = None
+        try:
+            start_kwargs = kwargs.copy()
+            if start_kwargs.get('kernel_id') is None:
+                start_kwargs['kernel_id'] = self._claim_warm_kernel(**kwargs)
+            if start_kwargs.get('kernel_id') is None:
+                start_kwargs['kernel_id'] = yield self._admit_and_start_kernel_manager(username, **kwargs)
+            kernel_id = yield gen.maybe_future(super(RemoteMappingKernelManager, self).start_kernel(*args,
+                                                                                                    **start_kwargs))
+            self.parent.kernel_session_manager.create_session(kernel_id, **kwargs)
+        finally:
+            self.kernel_usage.end_launch(username, kernel_name, kernel_id=kernel_id)
+        raise gen.Return(kernel_id)
+
+    @gen.coroutine
+    def _admit_and_start_kernel_manager(self, username, **kwargs):
+        """Awaits admission of the launch by the launch scheduler, then starts the kernel.
+
+        The kernel's id is determined prior to admission so that queued launches can be reported via the
+        kernels API.
+        """
+        kernel_name = self._resolve_kernel_name(kwargs.get('kernel_name'))
+        kwargs['kernel_id'] = self.new_kernel_id(**kwargs)
+        if kwargs['kernel_id'] in self or self.launch_scheduler.is_pending(kwargs['kernel_id']):
+            raise DuplicateKernelError('Kernel already exists: %s' % kwargs['kernel_id'])
+        yield self.launch_scheduler.admit(kwargs['kernel_id'], username, kernel_name,
+                                          self._get_process_proxy_class_name(kernel_name))
+        self._pending_kernel_starts += 1
+        try:
+            self._make_room_for_kernel()
+            kernel_id = yield self._start_kernel_manager(**kwargs)
+        finally:
+            self._pending_kernel_starts -= 1
+            self.launch_scheduler.release(kwargs['kernel_id'])
         raise gen.Return(kernel_id)
 
+    def _get_process_proxy_class_name(self, kernel_name):
+        """Returns the name of the process-proxy class used by the given kernelspec, None if it can't be found."""
+        try:
+            kernel_spec = self.kernel_spec_manager.get_kernel_spec(kernel_name)
+        except Exception:
+            return None  # the launch will fail in the usual manner
+        return get_process_proxy_config(kernel_spec).get('class_name')
+
+    def _resolve_kernel_name(self, kernel_name):
+        """Returns the name of the kernelspec a start request for the given kernel_name will use."""
+        if self.parent.force_kernel_name:
+            return self.parent.force_kernel_name
+        if kernel_name is None:
+            return self.default_kernel_name
+        return kernel_name
+
+    def _enforce_limits(self, username):
+        """Enforces any limits that may be imposed by the configuration.
+
+        Launches that are in flight are included in the kernel counts, so concurrent start requests
+        cannot collectively exceed the limits.
+        """
+        max_kernels = self.parent.max_kernels
+        if max_kernels is not None:
+            # Warm kernels are shutdown to make room for requested kernels, but pool launches in flight are not.
+            warm_kernel_count = sum(len(kernel_ids) for kernel_ids in self._warm_kernels.values())
+            current_kernel_count = len(self._kernels) - warm_kernel_count + self.kernel_usage.launching() + \
+                sum(self._warm_kernel_launches.values())
+            if current_kernel_count >= max_kernels:
+                error_message = "A max kernels limit has been set to {} and there are currently {} active {}.".\
+                    format(max_kernels, current_kernel_count, "kernel" if max_kernels == 1 else "kernels")
+                self.log.error(error_message)
+                raise web.HTTPError(403, reason=error_message)
+
+        max_kernels_per_user = self.parent.max_kernels_per_user
+        if max_kernels_per_user >= 0:
+            current_kernel_count = self.parent.kernel_session_manager.active_sessions(username) + \
+                self.kernel_usage.launching(username)
+            if current_kernel_count >= max_kernels_per_user:
+                error_message = "A max kernels per user limit has been set to {} and user '{}' currently has {} " \
+                                "active {}.".format(max_kernels_per_user, username, current_kernel_count,
+                                                    "kernel" if max_kernels_per_user == 1 else "kernels")
+                self.log.error(error_message)
+                raise web.HTTPError(403, reason=error_message)
+
+    @gen.coroutine
+    def _start_kernel_manager(self, kernel_name=None, path=None, kernel_id=None, **kwargs):
+        """Starts a kernel via `MultiKernelManager.start_kernel()`, awaits its startup, then registers the kernel.
+
+        Since `MultiKernelManager.start_kernel()` doesn't await the (coroutine) start of the kernel manager it
+        constructs, the kernel manager is withheld from the managed kernels until its `start_future` resolves.
+        This allows any number of kernel launches to be in flight while the gateway continues to service other
+        requests.  If kernel_id is not provided, one is determined via `new_kernel_id()`.
+
+        Returns
+        -------
+        kernel_id : str
+            The uuid associated with the new kernel.
+        """
+        if path is not None:
+            kwargs['cwd'] = self.cwd_for_path(path)
+        if kernel_id is None:
+            kernel_id = self.new_kernel_id(**kwargs)
+
+        MultiKernelManager.start_kernel(self, kernel_name=self._resolve_kernel_name(kernel_name),
+                                        kernel_id=kernel_id, **kwargs)
+        km = self._kernels.pop(kernel_id)  # registered once its kernel has started
+        try:
+            yield km.start_future
+        except Exception:
+            port_allocator.release(kernel_id)  # the failed kernel won't be cleaned up
+            raise
+
+        self._register_kernel(kernel_id, km)
+        self.log.info("Kernel started: %s" % kernel_id)
+        self.log.debug("Kernel args: %r" % kwargs)
+        raise gen.Return(kernel_id)
+
+    def _register_kernel(self, kernel_id, km):
+        """Adds the started kernel manager to the set of managed kernels and begins watching its activity."""
+        self._kernels[kernel_id] = km
+        self._kernel_connections[kernel_id] = 0
+        self.start_watching_activity(kernel_id)
+        self.add_restart_callback(kernel_id,
+                                  lambda: self._handle_kernel_died(kernel_id),
+                                  'dead',)
+
     def remove_kernel(self, kernel_id):
         """ Removes the kernel associated with `kernel_id` from the internal map and deletes the kernel session. """
         super(RemoteMappingKernelManager, self).remove_kernel(kernel_id)
-        self.parent.kernel_session_manager.delete_session(kernel_id)
+        self.kernel_usage.remove_kernel(kernel_id)
+        for kernel_ids in self._warm_kernels.values():
+            if kernel_id in kernel_ids:
+                kernel_ids.remove(kernel_id)  # warm kernels have no session
+                break
+        else:
+            self.parent.kernel_session_manager.delete_session(kernel_id)
+        # Capacity may have been released, top-up the warm kernel pools.
+        self.replenish_warm_kernel_pools()
+
+    @gen.coroutine
+    def relinquish_kernel(self, kernel_id):
+        """ Stops managing the kernel associated with `kernel_id` - without shutting it down or deleting its session.
+
+        Called by the SharedKernelSessionManager once another Enterprise Gateway instance has taken ownership of the
+        kernel's session, after which that instance manages the kernel.  The process proxy's resources are released
+        on the executor of its backend.
+        """
+        kernel = self._kernels.get(kernel_id)
+        if kernel is None:
+            return
+        self.log.warning("Kernel relinquished to another Enterprise Gateway instance: %s" % kernel_id)
+        if kernel._activity_stream:
+            kernel._activity_stream.close()
+            kernel._activity_stream = None
+        self.stop_buffering(kernel_id)
+        self._kernel_connections.pop(kernel_id, None)
+        kernel.stop_restarter()
+        kernel._close_control_socket()
+        super(RemoteMappingKernelManager, self).remove_kernel(kernel_id)
+        self.kernel_usage.remove_kernel(kernel_id)
+        process_proxy = kernel.process_proxy
+        if process_proxy:
+            kernel.process_proxy = None
+            yield process_proxy.run_in_backend(process_proxy.relinquish)
+        port_allocator.release(kernel_id)
+
+    def shutdown_kernel(self, kernel_id, now=False, restart=False):
+        """Shuts down the kernel associated with `kernel_id`, returning a future that resolves once it has exited.
+
+        This mirrors MappingKernelManager.shutdown_kernel(), but the kernel is only removed (deleting its session,
+        releasing its usage and replenishing the warm kernel pools) once the (coroutine) shutdown of its kernel
+        manager has completed.  Concurrent requests to shutdown the same kernel share that shutdown.
+        """
+        self._check_kernel_id(kernel_id)
+        future = self._kernel_shutdowns.get(kernel_id)
+        if future is None:
+            future = self._shutdown_kernel(kernel_id, now=now, restart=restart)
+            if not future.done():
+                self._kernel_shutdowns[kernel_id] = future
+                future.add_done_callback(lambda f: self._kernel_shutdowns.pop(kernel_id, None))
+        return future
+
+    @gen.coroutine
+    def _shutdown_kernel(self, kernel_id, now, restart):
+        kernel = self._kernels[kernel_id]
+        if kernel._activity_stream:
+            kernel._activity_stream.close()
+            kernel._activity_stream = None
+        self.stop_buffering(kernel_id)
+        self._kernel_connections.pop(kernel_id, None)
+        self.last_kernel_activity = utcnow()
+        self.log.info("Kernel shutdown: %s" % kernel_id)
+        yield kernel.shutdown_kernel(now=now, restart=restart)
+        self.remove_kernel(kernel_id)
+
+    @gen.coroutine
+    def shutdown_all(self, now=False):
+        """Shuts down all kernels, resolving once their (concurrent) shutdowns have completed."""
+        self._shutting_down = True
+        shutdowns = [(kernel_id, self.shutdown_kernel(kernel_id, now=now)) for kernel_id in self.list_kernel_ids()]
+        for kernel_id, future in shutdowns:
+            try:
+                yield future
+            except Exception as e:
+                self.log.warning("Failed to shutdown kernel {}: {}".format(kernel_id, e))
+
+    def list_kernels(self):
+        """Returns a list of kernel models, excluding those kernels waiting in a warm kernel pool, and including
+        those kernels whose persisted sessions are awaiting revival.
+        """
+        models = [model for model in super(RemoteMappingKernelManager, self).list_kernels()
+                  if not self._is_warm_kernel(model['id'])]
+        for kernel_session in self.parent.kernel_session_manager.reviving_sessions():
+            models.append(self._reviving_kernel_model(kernel_session))
+        for request in self.launch_scheduler.queued_requests():
+            if request.username is not None:  # launches for warm kernel pools aren't listed
+                models.append(self._queued_kernel_model(request))
+        return models
+
+    def kernel_model(self, kernel_id):
+        """Returns a dictionary describing the kernel.  Kernels awaiting revival are in the 'reviving' state
+        and kernels whose launch is waiting for admission are in the 'queued' state.
+        """
+        if kernel_id not in self and self.parent.kernel_session_manager.is_reviving(kernel_id):
+            for kernel_session in self.parent.kernel_session_manager.reviving_sessions():
+                if kernel_session['kernel_id'] == kernel_id:
+                    return self._reviving_kernel_model(kernel_session)
+        if kernel_id not in self and self.launch_scheduler.is_queued(kernel_id):
+            for request in self.launch_scheduler.queued_requests():
+                if request.kernel_id == kernel_id:
+                    return self._queued_kernel_model(request)
+        return super(RemoteMappingKernelManager, self).kernel_model(kernel_id)
+
+    def _queued_kernel_model(self, request):
+        return {
+            'id': request.kernel_id,
+            'name': request.kernel_name,
+            'last_activity': utcnow(),
+            'execution_state': 'queued',
+            'connections': 0,
+            'queue_position': self.launch_scheduler.queue_position(request.kernel_id),
+        }
+
+    @staticmethod
+    def _reviving_kernel_model(kernel_session):
+        return {
+            'id': kernel_session['kernel_id'],
+            'name': kernel_session['kernel_name'],
+            'last_activity': utcnow(),
+            'execution_state': 'reviving',
+            'connections': 0,
+        }
+
+    def cull_kernel_if_idle(self, kernel_id):
+        """Culls the kernel if idle - unless the kernel is waiting in a warm kernel pool."""
+        if not self._is_warm_kernel(kernel_id):
+            super(RemoteMappingKernelManager, self).cull_kernel_if_idle(kernel_id)
+
+    def replenish_warm_kernel_pools(self):
+        """Schedules the start of kernels for any warm kernel pool that is below its configured size.
+
+        Pool sizes are configured via `EnterpriseGatewayApp.warm_kernel_pools`.  Kernels are started in the
+        background and are only handed off to a start request once they have completed their startup.
+        """
+        if self._shutting_down:
+            return
+        for kernel_name in self.parent.warm_kernel_pools:
+            if self._warm_kernel_launches.get(kernel_name, 0) == 0 and \
+                    self._warm_kernel_failures.get(kernel_name) != -1:  # one replenish cycle per enabled pool
+                IOLoop.current().add_callback(self._replenish_warm_kernel_pool, kernel_name)
+
+    @gen.coroutine
+    def _replenish_warm_kernel_pool(self, kernel_name):
+        """Starts kernels for the given pool until it reaches its configured size or capacity is exhausted.
+
+        Launch failures (for example, due to a lack of cluster resources) are retried using an exponential
+        backoff that is capped by EG_WARM_KERNEL_MAX_RETRY_INTERVAL.
+        """
+        while True:
+            pool_size = self.parent.warm_kernel_pools.get(kernel_name, 0)
+            deficit = pool_size - len(self._warm_kernels.setdefault(kernel_name, [])) - \
+                self._warm_kernel_launches.get(kernel_name, 0)
+            if self.parent.max_kernels is not None:
+                in_flight = sum(self._warm_kernel_launches.values()) + self._pending_kernel_starts
+                deficit = min(deficit, self.parent.max_kernels - len(self._kernels) - in_flight)
+            if deficit <= 0:
+                break
+
+            self._warm_kernel_launches[kernel_name] = self._warm_kernel_launches.get(kernel_name, 0) + deficit
+            try:
+                results = yield [self._start_warm_kernel(kernel_name) for _ in range(deficit)]
+            finally:
+                self._warm_kernel_launches[kernel_name] -= deficit
+
+            if self._warm_kernel_failures.get(kernel_name) == -1:  # pool has been disabled
+                break
+            if all(results):
+                self._warm_kernel_failures[kernel_name] = 0
+            else:
+                failures = self._warm_kernel_failures.get(kernel_name, 0) + 1
+                self._warm_kernel_failures[kernel_name] = failures
+                retry_interval = min(2 ** failures, warm_kernel_max_retry_interval)
+                self.log.warning("Warm kernel pool '{}' failed to start {} kernel(s), retrying in {} seconds.".
+                                 format(kernel_name, len(results) - sum(results), retry_interval))
+                yield gen.sleep(retry_interval)
+
+    @gen.coroutine
+    def _start_warm_kernel(self, kernel_name):
+        """Starts a kernel on behalf of the given pool.  Returns True if the kernel started successfully."""
+        # Pooled kernels are started with the same env a start request not specifying any kernel
+        # variables would be given.
+        env = {'PATH': os.getenv('PATH', '')}
+        env.update({key: value for key, value in os.environ.items() if key in self.parent.env_process_whitelist})
+        try:
+            # Pooled kernels are authorized relative to the user that claims them.
+            kernel_id = yield self._admit_and_start_kernel_manager(None, kernel_name=kernel_name, env=env,
+                                                                   authorization_deferred=True)
+        except Exception as e:
+            if isinstance(e, web.HTTPError) and e.status_code == 403:
+                self.log.error("Warm kernel pool '{}' has been disabled: {}".format(kernel_name, e.reason))
+                self._warm_kernel_failures[kernel_name] = -1
+            else:
+                self.log.warning("Warm kernel pool '{}' failed to start a kernel: {}".format(kernel_name, e))
+            raise gen.Return(False)
+        self._warm_kernels.setdefault(kernel_name, []).append(kernel_id)
+        self.log.info("Warm kernel pool '{}' started kernel: {}".format(kernel_name, kernel_id))
+        raise gen.Return(True)
+
+    def _is_warm_kernel(self, kernel_id):
+        return any(kernel_id in kernel_ids for kernel_ids in self._warm_kernels.values())
+
+    def _claim_warm_kernel(self, kernel_name=None, **kwargs):
+        """Hands off a kernel from the corresponding warm kernel pool, returning its kernel_id.
+
+        Since a kernel's environment cannot be altered once launched, kernels are only claimed by requests
+        whose env consists of nothing more than KERNEL_USERNAME and the values a pooled kernel was started
+        with - and only when impersonation is disabled (the kernel runs as the gateway user).  The claiming
+        request's env is applied to the kernel manager so that subsequent restarts reflect the claimant.
+        None is returned if no kernel could be claimed.
+        """
+        kernel_name = self._resolve_kernel_name(kernel_name)
+        kernel_ids = [kernel_id for kernel_id in self._warm_kernels.get(kernel_name, [])
+                      if kernel_id not in self._kernel_shutdowns]
+        if not kernel_ids or self.parent.impersonation_enabled or kwargs.get('path') is not None:
+            return None
+
+        env = kwargs.get('env', {})
+        for key, value in env.items():
+            if key == 'KERNEL_USERNAME':
+                continue
+            if key == 'PATH' and value == os.getenv('PATH', ''):
+                continue
+            if key in self.parent.env_process_whitelist and value == os.getenv(key):
+                continue
+            return None
+
+        kernel_id = kernel_ids[0]
+        km = self.get_kernel(kernel_id)
+        # Apply authorization relative to the claimant (limits have been applied by start_kernel).  Errors
+        # leave the kernel in the pool.
+        claim_env = dict(km._launch_args.get('env', {}))
+        claim_env.update(env)
+        km.process_proxy.authorize(KernelSessionManager.get_kernel_username(env=claim_env))
+
+        self._warm_kernels[kernel_name].remove(kernel_id)
+        km.authorization_deferred = False
+        km._launch_args['env'] = claim_env
+        km._capture_user_overrides(env=claim_env)
+        self.log.info("Kernel {} claimed from warm kernel pool '{}' by user '{}'.".
+                      format(kernel_id, kernel_name, claim_env.get('KERNEL_USERNAME')))
+        self.replenish_warm_kernel_pools()
+        return kernel_id
+
+    def _make_room_for_kernel(self):
+        """Shuts down a warm kernel if starting another kernel would otherwise exceed the configured maximum.
+
+        Kernels already being shutdown aren't counted, nor are they claimed by start requests.
+        """
+        if self.parent.max_kernels is None or len(self._kernels) - len(self._kernel_shutdowns) + \
+                self._pending_kernel_starts <= self.parent.max_kernels:
+            return
+        pools = [[kernel_id for kernel_id in kernel_ids if kernel_id not in self._kernel_shutdowns]
+                 for kernel_ids in self._warm_kernels.values()]
+        largest_pool = max(pools, key=len, default=None)
+        if largest_pool:
+            kernel_id = largest_pool[0]
+            self.log.info("Shutting down warm kernel {} to make room for a requested kernel.".format(kernel_id))
+            self.shutdown_kernel(kernel_id)
 
+    @gen.coroutine
     def start_kernel_from_session(self, kernel_id, kernel_name, connection_info, process_info, launch_args):
         """ Starts a kernel from a persisted kernel session.
 
@@ -127,37 +537,42 @@ class RemoteMappingKernelManager(SeedingMappingKernelManager):
         process_proxy_class = import_item(process_proxy.get('class_name'))
         km.process_proxy = process_proxy_class(km, proxy_config=process_proxy.get('config'))
         km.process_proxy.load_process_info(process_info)
-
-        # Confirm we can even poll the process.  If not, remove the persisted session.
-        if km.process_proxy.poll() is False:
-            return False
+        if isinstance(km.process_proxy, RemoteProcessProxy):
+            yield km.process_proxy.restore_tunnels()
+
+        # Confirm we can even poll the process.  If not, remove the persisted session.  Since polling may
+        # require requests against the resource manager (or remote hosts), it's performed on the executor
+        # of the process proxy's backend.
+        poll_result = yield km.process_proxy.run_in_backend(km.process_proxy.poll)
+        if poll_result is False:
+            # Release what was re-established for the kernel (e.g., tunnels) - which may also require requests
+            # against the resource manager.
+            yield km.process_proxy.run_in_backend(km.process_proxy.cleanup)
+            raise gen.Return(False)
+        if isinstance(km.process_proxy, LocalProcessProxy):  # ensure the kernel's ports aren't handed out again
+            port_allocator.reserve(kernel_id, km.ports)
 
         km.kernel = km.process_proxy
         km.start_restarter()
         km._connect_control_socket()
-        self._kernels[kernel_id] = km
-        self._kernel_connections[kernel_id] = 0
-        self.start_watching_activity(kernel_id)
-        self.add_restart_callback(kernel_id,
-                                  lambda: self._handle_kernel_died(kernel_id),
-                                  'dead',)
+        self._register_kernel(kernel_id, km)
+        self.kernel_usage.add_kernel(kernel_id, KernelSessionManager.get_kernel_username(**launch_args), kernel_name)
         # Only initialize culling if available.  Warning message will be issued in gatewayapp at startup.
         func = getattr(self, 'initialize_culler', None)
         if func:
             func()
-        return True
+        raise gen.Return(True)
 
     def new_kernel_id(self, **kwargs):
         """Determines the kernel_id to use for a new kernel.
 
         This method provides a mechanism by which clients can specify a kernel's id.  In this case
         that mechanism is via the per-kernel environment variable: KERNEL_ID.  If specified, its value
-        will be validated and returned, otherwise the result from the superclass method is returned.
+        will be validated and returned, otherwise a new uuid is generated.
 
-        NOTE: This method exists in jupyter_client.multikernelmanager.py for releases > 5.2.3.  If you
-        find that this method is not getting invoked, then you likely need to update the version of
-        jupyter_client.  The Enterprise Gateway dependency will be updated once new releases of
-        jupyter_client are more prevalent.
+        NOTE: This method also exists in jupyter_client.multikernelmanager.py for releases > 5.2.3.  Since
+        new kernels are started via `_start_kernel_manager()`, it is invoked regardless of the version of
+        jupyter_client in use.
 
         Returns
         -------
@@ -180,11 +595,100 @@ class RemoteMappingKernelManager(SeedingMappingKernelManager):
             kernel_id = unicode_type(str_kernel_id)
             self.log.debug("Using user-provided kernel_id: {}".format(kernel_id))
         else:
-            kernel_id = super(RemoteMappingKernelManager, self).new_kernel_id(**kwargs)
+            kernel_id = unicode_type(uuid.uuid4())
 
         return kernel_id
 
 
+class RemoteKernelRestarter(IOLoopKernelRestarter):
+    """Monitors and automatically restarts a kernel without blocking the IOLoop.
+
+    Determining whether a kernel is alive may require requests against its resource manager (or remote
+    host), so each poll is performed on the executor of the kernel's process proxy backend.  A poll is
+    skipped while the previous poll remains outstanding, and the result of a poll completing after the
+    restarter has been stopped (or restarted) is disregarded.  The exit of a local kernel process triggers
+    an immediate poll, rather than awaiting the next periodic poll.
+    """
+    _polling = False
+    _exit_watch = None  # (pid, future) of the local process being watched
+
+    def start(self):
+        super(RemoteKernelRestarter, self).start()
+        process_proxy = self.kernel_manager.process_proxy
+        pid = process_proxy.get_local_pid() if process_proxy else None
+        if pid and self._exit_watch is None:
+            self._exit_watch = pid, process_exit_watcher.watch(pid)
+            IOLoop.current().add_future(self._exit_watch[1], self._process_exited)
+
+    def stop(self):
+        if self._exit_watch is not None:
+            process_exit_watcher.unwatch(*self._exit_watch)
+            self._exit_watch = None
+        super(RemoteKernelRestarter, self).stop()
+
+    def _process_exited(self, future):
+        if self._exit_watch is not None and self._exit_watch[1] is future:
+            self._exit_watch = None
+            self.poll()
+
+    def poll(self):
+        process_proxy = self.kernel_manager.process_proxy
+        if self._polling or process_proxy is None:
+            return
+        self._polling = True
+        future = process_proxy.run_in_backend(self.kernel_manager.is_alive)
+        IOLoop.current().add_future(future, partial(self._poll_completed, self._pcallback))
+
+    def _poll_completed(self, pcallback, future):
+        self._polling = False
+        if self._pcallback is None or self._pcallback is not pcallback:
+            return
+        try:
+            alive = future.result()
+        except Exception as e:
+            self.log.warning("KernelRestarter: poll failed with exception: {}".format(e))
+            return
+
+        if not alive:
+            if self._restarting:
+                self._restart_count += 1
+            else:
+                self._restart_count = 1
+
+            if self._restart_count >= self.restart_limit:
+                self.log.warning("KernelRestarter: restart failed")
+                self._fire_callbacks('dead')
+                self._restarting = False
+                self._restart_count = 0
+                self.stop()
+            else:
+                newports = self.random_ports_until_alive and self._initial_startup
+                self.log.info('KernelRestarter: restarting kernel (%i/%i), %s random ports',
+                              self._restart_count, self.restart_limit, 'new' if newports else 'keep')
+                self._fire_callbacks('restart')
+                future = gen.maybe_future(self.kernel_manager.restart_kernel(now=True, newports=newports))
+                IOLoop.current().add_future(future, self._restart_completed)
+                self._restarting = True
+        else:
+            if self._initial_startup:
+                self._initial_startup = False
+            if self._restarting:
+                self.log.debug("KernelRestarter: restart apparently succeeded")
+            self._restarting = False
+
+    def _restart_completed(self, future):
+        """Presumes the kernel dead should its restart have failed, since it's then no longer monitored."""
+        try:
+            future.result()
+        except Exception as e:
+            self.log.error("KernelRestarter: restart failed with exception: {}".format(e))
+            self.kernel_manager.restarting = False
+            self._fire_callbacks('dead')
+            self._restarting = False
+            self._restart_count = 0
+            self.stop()
+
+
 class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
     """Extends the KernelGatewayIOLoopKernelManager used by the RemoteMappingKernelManager.
 
@@ -201,12 +705,21 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
         self.port_range = None
         self.kernel_id = None
         self.user_overrides = {}
+        self.authorization_deferred = False  # True while the kernel waits, without a user, in a warm kernel pool
+        self.start_future = None  # resolves once the kernel has started (see start_kernel())
         self.restarting = False  # need to track whether we're in a restart situation or not
 
+    def _restarter_class_default(self):
+        return RemoteKernelRestarter
+
     def start_kernel(self, **kwargs):
         """Starts a kernel in a separate process.
 
-        Where the started kernel resides depends on the configured process proxy.
+        Where the started kernel resides depends on the configured process proxy.  This method mirrors
+        that of jupyter_client's KernelManager, but returns a future that resolves once the kernel has
+        started, since the process proxy's `launch_process()` (and its confirmation of the kernel's startup)
+        is performed asynchronously.  The future is also retained as `start_future`, since callers such as
+        `MultiKernelManager.start_kernel()` disregard the result of this method.
 
         Parameters
         ----------
@@ -214,7 +727,12 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
              keyword arguments that are passed down to build the kernel_cmd
              and launching the kernel (e.g. Popen kwargs).
         """
+        self.start_future = self._start_kernel(**kwargs)
+        return self.start_future
 
+    @gen.coroutine
+    def _start_kernel(self, **kwargs):
+        self.authorization_deferred = kwargs.pop('authorization_deferred', self.authorization_deferred)
         process_proxy = get_process_proxy_config(self.kernel_spec)
         process_proxy_class_name = process_proxy.get('class_name')
         self.log.debug("Instantiating kernel '{}' with process proxy: {}".
@@ -222,7 +740,33 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
         process_proxy_class = import_item(process_proxy_class_name)
         self.process_proxy = process_proxy_class(kernel_manager=self, proxy_config=process_proxy.get('config'))
         self._capture_user_overrides(**kwargs)
-        super(RemoteKernelManager, self).start_kernel(**kwargs)
+
+        if self.transport == 'tcp' and not is_local_ip(self.ip):
+            raise RuntimeError("Can only launch a kernel on a local interface. "
+                               "This one is not: %s."
+                               "Make sure that the '*_address' attributes are "
+                               "configured properly. "
+                               "Currently valid addresses are: %s" % (self.ip, local_ips()))
+
+        # write connection file / get default ports
+        self.write_connection_file()
+
+        # save kwargs for use in restart
+        self._launch_args = kwargs.copy()
+        # build the Popen cmd
+        extra_arguments = kwargs.pop('extra_arguments', [])
+        kernel_cmd = self.format_kernel_cmd(extra_arguments=extra_arguments)
+        self.process_proxy.record_launch_phase('command_format')
+        env = kwargs.pop('env', os.environ).copy()
+        # Don't allow PYTHONEXECUTABLE to be passed to kernel process.
+        env.pop('PYTHONEXECUTABLE', None)
+        if not self.kernel_cmd:
+            env.update(self.kernel_spec.env or {})
+
+        self.kernel = yield gen.maybe_future(self._launch_kernel(kernel_cmd, env=env, **kwargs))
+        self.process_proxy.record_launch_completion()
+        self.start_restarter()
+        self._connect_control_socket()
 
     def _capture_user_overrides(self, **kwargs):
         """
@@ -277,6 +821,66 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
         self.log.debug("Launching kernel: {} with command: {}".format(self.kernel_spec.display_name, kernel_cmd))
         return self.process_proxy.launch_process(kernel_cmd, **kwargs)
 
+    @gen.coroutine
+    def shutdown_kernel(self, now=False, restart=False):
+        """Attempts to stop the kernel process cleanly.
+
+        This mirrors jupyter_client's KernelManager.shutdown_kernel(), but is a coroutine so that the
+        shutdown request to the launcher's listener, its forced termination (if necessary) and the process
+        proxy's cleanup are performed on the executor of the process proxy's backend, and the kernel's exit
+        is awaited, rather than blocking the IOLoop.
+
+        Parameters
+        ----------
+        now : bool
+            Should the kernel be forcibly killed *now*. This skips the first, nice shutdown attempt.
+        restart: bool
+            Will this kernel be restarted after it is shutdown. When this is True, connection files
+            will not be cleaned up.
+        """
+        # Stop monitoring for restarting while we shutdown.
+        self.stop_restarter()
+
+        process_proxy = self.process_proxy
+        if now:
+            yield self._kill_kernel()
+        else:
+            super(RemoteKernelManager, self).request_shutdown(restart)
+            if isinstance(process_proxy, RemoteProcessProxy):
+                yield process_proxy.run_in_backend(process_proxy.shutdown_listener)
+            yield self._finish_shutdown()
+
+        if process_proxy:
+            yield process_proxy.run_in_backend(process_proxy.cleanup)
+            self.process_proxy = None
+        self.cleanup(connection_file=not restart)
+
+    @gen.coroutine
+    def _finish_shutdown(self, pollinterval=0.1):
+        """Waits up to `shutdown_wait_time` seconds for the kernel to exit, then kills it if it hasn't."""
+        if self.has_kernel:
+            exited = yield self.process_proxy.await_exit(max(self.shutdown_wait_time, 0))
+            if not exited:
+                self.log.debug("Kernel is taking too long to finish, killing")
+                yield self._kill_kernel()
+
+    @gen.coroutine
+    def _kill_kernel(self):
+        """Kills the kernel.
+
+        This mirrors jupyter_client's KernelManager._kill_kernel(), but is a coroutine so that the signal is sent
+        on the executor of the process proxy's backend and the kernel's exit is awaited via the process proxy.
+        """
+        if self.has_kernel:
+            try:
+                yield self.process_proxy.run_in_backend(self.signal_kernel, signal.SIGKILL)
+            except OSError as e:
+                if e.errno != errno.ESRCH:  # the kernel may have already exited
+                    raise
+            if not (yield self.process_proxy.await_exit()):
+                self.log.warning("Timed out waiting for the exit of killed kernel: {}".format(self.kernel_id))
+            self.kernel = None
+
     def request_shutdown(self, restart=False):
         """ Send a shutdown request via control channel and process proxy (if remote). """
         super(RemoteKernelManager, self).request_shutdown(restart)
@@ -286,6 +890,7 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
         if isinstance(self.process_proxy, RemoteProcessProxy):
             self.process_proxy.shutdown_listener()
 
+    @gen.coroutine
     def restart_kernel(self, now=False, **kwargs):
         """Restarts a kernel with the arguments that were used to launch it.
 
@@ -317,9 +922,18 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
                 self.log.warning("Remote kernel ({}) will not be automatically restarted since there are no "
                                  "clients connected at this time.".format(kernel_id))
                 # Use the parent mapping kernel manager so activity monitoring and culling is also shutdown
-                self.parent.shutdown_kernel(kernel_id, now=now)
+                yield self.parent.shutdown_kernel(kernel_id, now=now)
                 return
-        super(RemoteKernelManager, self).restart_kernel(now, **kwargs)
+
+        # We can't use the superclass's implementation since its call to start_kernel() is synchronous.
+        if self._launch_args is None:
+            raise RuntimeError("Cannot restart the kernel. No previous call to 'start_kernel'.")
+        yield self.shutdown_kernel(now=now, restart=True)
+        if kwargs.pop('newports', False):
+            self.cleanup_random_ports()
+        self._launch_args.update(kwargs)
+        yield self.start_kernel(**self._launch_args)
+
         if isinstance(self.process_proxy, RemoteProcessProxy):  # for remote kernels...
             # Re-establish activity watching...
             if self._activity_stream:
@@ -330,6 +944,24 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
         self.parent.parent.kernel_session_manager.refresh_session(kernel_id)
         self.restarting = False
 
+    def interrupt_kernel(self):
+        """Interrupts the kernel.
+
+        Since remote kernels are signalled via their launcher (or a remote shell), signal-based interrupts
+        are sent on the executor of the process proxy's backend and any failure to do so is logged.
+        """
+        if self.has_kernel and self.kernel_spec.interrupt_mode == 'signal':
+            future = self.process_proxy.run_in_backend(self.signal_kernel, signal.SIGINT)
+            IOLoop.current().add_future(future, self._interrupt_completed)
+        else:
+            super(RemoteKernelManager, self).interrupt_kernel()
+
+    def _interrupt_completed(self, future):
+        try:
+            future.result()
+        except Exception as e:
+            self.log.error("Failed to interrupt kernel {}: {}".format(self.kernel_id, e))
+
     def signal_kernel(self, signum):
         """Sends signal `signum` to the kernel process. """
         self.log.debug("RemoteKernelManager.signal_kernel({})".format(signum))
@@ -373,6 +1005,8 @@ class RemoteKernelManager(KernelGatewayIOLoopKernelManager):
         if self.process_proxy:
             self.process_proxy.cleanup()
             self.process_proxy = None
+        if connection_file and getattr(self, 'kernel_id', None):  # not restarting, release the kernel's ports
+            port_allocator.release(self.kernel_id)
         return super(RemoteKernelManager, self).cleanup(connection_file)
 
     def write_connection_file(self):
@@ -0,0 +1,155 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Admission control of kernel launches."""
+
+import os
+
+from collections import deque, Counter
+from tornado import web
+from tornado.concurrent import Future
+
+
+launch_queue_retry_after = int(os.getenv('EG_LAUNCH_QUEUE_RETRY_AFTER', '30'))
+
+
+class LaunchQueueFullError(web.HTTPError):
+    """Raised (as a 429) when a launch cannot be queued.  Clients are advised to retry after `retry_after`
+    seconds via the Retry-After header.
+    """
+    def __init__(self, reason, retry_after=launch_queue_retry_after):
+        super(LaunchQueueFullError, self).__init__(429, reason=reason)
+        self.retry_after = retry_after
+
+
+class LaunchRequest(object):
+    """A kernel launch awaiting (or holding) admission.  Its future is resolved once admitted."""
+    def __init__(self, kernel_id, username, kernel_name, process_proxy):
+        self.kernel_id = kernel_id
+        self.username = username
+        self.kernel_name = kernel_name
+        self.process_proxy = process_proxy  # fully-qualified class name, None if unknown
+        self.future = Future()
+
+
+class KernelLaunchScheduler(object):
+    """Limits the number of concurrent kernel launches per process-proxy class and per kernelspec.
+
+    Limits are configured via `EnterpriseGatewayApp.max_concurrent_launches`.  Launches exceeding a limit
+    wait in a FIFO queue per user, and the user least recently admitted is serviced first so that a user
+    submitting many launches cannot starve the others.  Once `EnterpriseGatewayApp.launch_queue_size`
+    launches are waiting, further launches are rejected with a LaunchQueueFullError.  Like KernelUsage,
+    instances are only accessed from the IOLoop thread.
+    """
+    def __init__(self, kernel_manager):
+        self.kernel_manager = kernel_manager
+        self._queues = dict()  # username -> deque of waiting LaunchRequests
+        self._queued = dict()  # kernel_id -> waiting LaunchRequest
+        self._admitted = dict()  # kernel_id -> admitted LaunchRequest whose launch is in progress
+        self._launching = Counter()  # process-proxy class and kernelspec names -> admitted launches
+        self._admissions = 0  # total number of admitted launches
+        self._last_admission = dict()  # username -> number of the user's most recent admission
+
+    def admit(self, kernel_id, username, kernel_name, process_proxy=None):
+        """Requests admission of the given launch, returning a future that resolves once admitted.
+
+        The launch is admitted immediately if no limit applies to it.  `release()` must be called once an
+        admitted launch completes - successfully or not.
+        """
+        request = LaunchRequest(kernel_id, username, kernel_name, process_proxy)
+        self._queues.setdefault(username, deque()).append(request)
+        self._queued[kernel_id] = request
+        self._dispatch()
+
+        max_queue_size = self.kernel_manager.parent.launch_queue_size
+        if kernel_id in self._queued and 0 <= max_queue_size < len(self._queued):
+            self._dequeue(request)
+            raise LaunchQueueFullError("Kernel launch queue is full ({} launches are waiting).  Try again later.".
+                                       format(max_queue_size))
+        if kernel_id in self._queued:
+            self.kernel_manager.log.info("Kernel launch {} queued at position {}.".
+                                         format(kernel_id, self.queue_position(kernel_id)))
+        return request.future
+
+    def release(self, kernel_id):
+        """Releases the admission of the given launch, admitting any launches waiting on its capacity."""
+        request = self._admitted.pop(kernel_id, None)
+        if request is None:
+            return
+        for key in self._keys(request):
+            self._launching[key] -= 1
+            if self._launching[key] <= 0:
+                del self._launching[key]
+        self._dispatch()
+
+    def is_queued(self, kernel_id):
+        return kernel_id in self._queued
+
+    def is_pending(self, kernel_id):
+        """Returns True if the given launch is waiting for admission or has been admitted."""
+        return kernel_id in self._queued or kernel_id in self._admitted
+
+    def queued_requests(self):
+        """Returns the waiting launch requests."""
+        return list(self._queued.values())
+
+    def queue_position(self, kernel_id):
+        """Returns the 1-based position at which the given launch will be serviced, ignoring the limits
+        that apply to the launches ahead of it.  None is returned if the launch is not waiting.
+        """
+        if kernel_id not in self._queued:
+            return None
+        position = 0
+        queues = [self._queues[username] for username in self._service_order()]
+        for index in range(max(len(queue) for queue in queues)):
+            for queue in queues:
+                if index < len(queue):
+                    position += 1
+                    if queue[index].kernel_id == kernel_id:
+                        return position
+
+    def _service_order(self):
+        """Returns the users with waiting launches, least recently admitted first."""
+        return sorted(self._queues, key=lambda username: self._last_admission.get(username, -1))
+
+    def _dispatch(self):
+        """Admits waiting launches, taking the launch at the head of each user's queue in turn."""
+        while True:
+            for username in self._service_order():
+                request = self._queues[username][0]
+                if self._fits(request):
+                    break
+            else:
+                break
+            self._dequeue(request)
+            self._admitted[request.kernel_id] = request
+            for key in self._keys(request):
+                self._launching[key] += 1
+            self._last_admission[username] = self._admissions
+            self._admissions += 1
+            request.future.set_result(None)
+
+        if not self._queues:  # only the users with launches in progress affect the order of future admissions
+            in_progress = set(request.username for request in self._admitted.values())
+            self._last_admission = {username: admission for username, admission in self._last_admission.items()
+                                    if username in in_progress}
+
+    def _dequeue(self, request):
+        del self._queued[request.kernel_id]
+        queue = self._queues[request.username]
+        queue.remove(request)
+        if not queue:
+            del self._queues[request.username]
+
+    def _fits(self, request):
+        limits = self.kernel_manager.parent.max_concurrent_launches
+        for key in self._keys(request):
+            limit = limits.get(key)
+            if limit is None and key == request.process_proxy:  # also accept the unqualified class name
+                limit = limits.get(key.rpartition('.')[2])
+            if limit is not None and self._launching[key] >= limit:
+                return False
+        return True
+
+    @staticmethod
+    def _keys(request):
+        return [key for key in (request.process_proxy, request.kernel_name) if key]
@@ -0,0 +1,88 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Per-user and per-kernelspec accounting of the kernels managed by Enterprise Gateway."""
+
+from collections import Counter
+
+
+class KernelUsage(object):
+    """Maintains counts of the active and launching kernels of each user and kernelspec.
+
+    Every operation is O(1).  Launches are counted from the time they're admitted until they complete, so
+    limits that consider the launching counts remain accurate while any number of launches are in flight.
+    Instances are only accessed from the IOLoop thread - so a limit check followed by `start_launch()`, with
+    no intervening yield, is atomic relative to other (asynchronous) launches and no locking is necessary.
+    """
+    def __init__(self):
+        self._kernels = dict()  # kernel_id -> (username, kernel_name) of active kernels
+        self._active_by_user = Counter()
+        self._active_by_kernelspec = Counter()
+        self._launching_by_user = Counter()
+        self._launching_by_kernelspec = Counter()
+        self._launching = 0  # total in-flight launches
+
+    def start_launch(self, username, kernel_name):
+        """Counts a kernel launch for the given user and kernelspec as in flight."""
+        self._launching_by_user[username] += 1
+        self._launching_by_kernelspec[kernel_name] += 1
+        self._launching += 1
+
+    def end_launch(self, username, kernel_name, kernel_id=None):
+        """Completes an in-flight launch.  If kernel_id is provided, the launch succeeded and the kernel is
+        counted as active.
+        """
+        self._decrement(self._launching_by_user, username)
+        self._decrement(self._launching_by_kernelspec, kernel_name)
+        self._launching -= 1
+        if kernel_id is not None:
+            self.add_kernel(kernel_id, username, kernel_name)
+
+    def add_kernel(self, kernel_id, username, kernel_name):
+        """Counts the given kernel as active (e.g., when revived from a persisted session)."""
+        if kernel_id in self._kernels:
+            return
+        self._kernels[kernel_id] = (username, kernel_name)
+        self._active_by_user[username] += 1
+        self._active_by_kernelspec[kernel_name] += 1
+
+    def remove_kernel(self, kernel_id):
+        """Removes the given kernel from the active counts.  Kernels that aren't counted are ignored."""
+        username, kernel_name = self._kernels.pop(kernel_id, (None, None))
+        if username is not None:
+            self._decrement(self._active_by_user, username)
+            self._decrement(self._active_by_kernelspec, kernel_name)
+
+    def active(self, username=None, kernel_name=None):
+        """Returns the number of active kernels of the given user or kernelspec."""
+        if kernel_name is not None:
+            return self._active_by_kernelspec[kernel_name]
+        return self._active_by_user[username]
+
+    def launching(self, username=None, kernel_name=None):
+        """Returns the number of in-flight launches of the given user or kernelspec, or the total number of
+        in-flight launches if neither is given.
+        """
+        if kernel_name is not None:
+            return self._launching_by_kernelspec[kernel_name]
+        if username is None:
+            return self._launching
+        return self._launching_by_user[username]
+
+    def get_usage(self):
+        """Returns the current counts, keyed by user and kernelspec."""
+        return {
+            'users': self._usage(self._active_by_user, self._launching_by_user),
+            'kernelspecs': self._usage(self._active_by_kernelspec, self._launching_by_kernelspec),
+        }
+
+    @staticmethod
+    def _usage(active, launching):
+        return {key: {'active': active[key], 'launching': launching[key]} for key in set(active) | set(launching)}
+
+    @staticmethod
+    def _decrement(counter, key):
+        # Drop keys reaching zero so that counts don't accumulate for every user ever seen
+        if counter[key] <= 1:
+            counter.pop(key, None)
+        else:
+            counter[key] -= 1
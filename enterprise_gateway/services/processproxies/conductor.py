@@ -4,13 +4,16 @@
 
 import os
 import signal
-import json
 import time
 import subprocess
 import socket
 import re
+import requests
 
+from http.cookiejar import MozillaCookieJar
+from threading import Lock
 from jupyter_client import launch_kernel, localinterfaces
+from tornado import gen
 
 from .processproxy import RemoteProcessProxy
 
@@ -20,10 +23,97 @@ poll_interval = float(os.getenv('EG_POLL_INTERVAL', '0.5'))
 max_poll_attempts = int(os.getenv('EG_MAX_POLL_ATTEMPTS', '10'))
 
 
+class ConductorClient(object):
+    """Issues requests against the Conductor REST API over a persistent, pooled HTTP session.
+
+    Sessions are shared by all kernels using the same endpoint, security options and cookie jar, so
+    connections (and their TLS handshakes) are reused across requests.  The curl options conveyed in
+    KERNEL_CURL_SECURITY_OPT are translated once into their equivalent session settings, and the cookie
+    jar is (re)loaded only when its file has changed.
+    """
+
+    _instances = {}
+    _instances_lock = Lock()
+
+    def __init__(self, endpoint, security_opts, cookie_jar, log):
+        self.endpoint = endpoint
+        self.cookie_jar = cookie_jar
+        self.log = log
+        self.session = requests.Session()
+        self.session.headers['Accept'] = 'application/json'
+        self._cookie_jar_mtime = None
+        self._lock = Lock()
+        self._apply_security_opts(security_opts)
+
+    @classmethod
+    def instance(cls, endpoint, security_opts, cookie_jar, log):
+        """Returns the client associated with the given endpoint, security options and cookie jar."""
+        key = (endpoint, security_opts, cookie_jar)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(endpoint, security_opts, cookie_jar, log)
+            return cls._instances[key]
+
+    def _apply_security_opts(self, security_opts):
+        # Translates the (curl) TLS options to their session equivalents.
+        cert = None
+        key = None
+        opts = security_opts.split()
+        i = 0
+        while i < len(opts):
+            opt = opts[i]
+            value = opts[i + 1] if i + 1 < len(opts) else None
+            if opt in ('-k', '--insecure'):
+                self.session.verify = False
+            elif opt in ('--cacert', '--capath') and value:
+                self.session.verify = value
+                i += 1
+            elif opt in ('-E', '--cert') and value:
+                cert = value.split(':')[0]  # a password (cert:password) is not supported
+                i += 1
+            elif opt == '--key' and value:
+                key = value
+                i += 1
+            else:
+                self.log.debug("Ignoring unsupported Conductor security option: '{}'".format(opt))
+            i += 1
+        if cert:
+            self.session.cert = (cert, key) if key else cert
+
+    def _load_cookies(self):
+        # Equivalent to curl's '-b <cookie_jar>', but only reads the file when it has changed.
+        try:
+            mtime = os.path.getmtime(self.cookie_jar)
+        except OSError:
+            return
+        if mtime != self._cookie_jar_mtime:
+            jar = MozillaCookieJar(self.cookie_jar)
+            try:
+                jar.load(ignore_discard=True, ignore_expires=True)
+            except Exception as e:
+                self.log.warning("Unable to load Conductor cookie jar '{}': {}".format(self.cookie_jar, e))
+                return
+            for cookie in jar:
+                if cookie.expires == 0:  # curl records session cookies with an expiration of 0
+                    cookie.expires = None
+                self.session.cookies.set_cookie(cookie)
+            self._cookie_jar_mtime = mtime
+
+    def request(self, method, path, credential):
+        """Issues the request and returns its decoded JSON response or None if the response has no content."""
+        with self._lock:
+            self._load_cookies()
+        response = self.session.request(method, self.endpoint + path, headers={'Authorization': credential},
+                                        timeout=30)
+        return response.json() if response.content else None
+
+
 class ConductorClusterProcessProxy(RemoteProcessProxy):
     """Kernel lifecycle management for Conductor clusters."""
     initial_states = {'SUBMITTED', 'WAITING', 'RUNNING'}
     final_states = {'FINISHED', 'KILLED', 'RECLAIMED'}  # Don't include FAILED state
+    pending_states = {'WAITING'}  # waiting for resources
+    backend = 'conductor'
 
     def __init__(self, kernel_manager, proxy_config):
         super(ConductorClusterProcessProxy, self).__init__(kernel_manager, proxy_config)
@@ -33,7 +123,9 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
         self.rest_credential = None
         self.conductor_endpoint = proxy_config.get('conductor_endpoint',
                                                    kernel_manager.parent.parent.conductor_endpoint)
+        self.conductor_client = None
 
+    @gen.coroutine
     def launch_process(self, kernel_cmd, **kwargs):
         """Launches the specified process within a Conductor cluster environment."""
         super(ConductorClusterProcessProxy, self).launch_process(kernel_cmd, **kwargs)
@@ -53,11 +145,12 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
         self.pid = self.local_proc.pid
         self.ip = local_ip
         self.env = kwargs.get('env')
+        self.record_launch_phase('process_spawn')
         self.log.debug("Conductor cluster kernel launched using Conductor endpoint: {}, pid: {}, Kernel ID: {}, "
                        "cmd: '{}'".format(self.conductor_endpoint, self.local_proc.pid, self.kernel_id, kernel_cmd))
-        self.confirm_remote_startup()
+        yield self.confirm_remote_startup()
 
-        return self
+        raise gen.Return(self)
 
     def _update_launch_info(self, kernel_cmd, **kwargs):
         """ Dynamically assemble the spark-submit configuration passed from NB2KG."""
@@ -92,6 +185,10 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
 
         :return: None if the application's ID is available and state is SUBMITTED/WAITING/RUNNING. Otherwise False.
         """
+        alive = self.heartbeat_liveness()
+        if alive is not None:
+            return None if alive else False
+
         result = False
 
         if self._get_application_id():
@@ -173,6 +270,7 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
                     self.driver_id = driver_id[0]
                     self.log.debug("Driver ID: {}".format(driver_id[0]))
 
+    @gen.coroutine
     def confirm_remote_startup(self):
         """ Confirms the application is in a started state before returning.  Should post-RUNNING states be
             unexpectedly encountered ('FINISHED', 'KILLED', 'RECLAIMED') then we must throw, otherwise the rest
@@ -183,15 +281,20 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
         ready_to_connect = False  # we're ready to connect when we have a connection file to use
         while not ready_to_connect:
             if self.local_proc.stderr:
-                # Read stderr after the launch_kernel, and parse the driver id from the REST response
-                output = self.local_proc.stderr.read().decode("utf-8")
-                self._parse_driver_submission_id(output)
+                # Read stderr after the launch_kernel, and parse the driver id from the REST response.  The read
+                # completes once the submission does, so it's performed on the backend's executor.
+                output = yield self.run_in_backend(self.local_proc.stderr.read)
+                self._parse_driver_submission_id(output.decode("utf-8"))
             i += 1
-            self.handle_timeout()
+            yield self.handle_timeout()
 
-            if self._get_application_id(True):
+            # Conductor REST requests are performed on the backend's executor so that the IOLoop isn't blocked.
+            application_id = yield self.run_in_backend(self._get_application_id, True)
+            if application_id:
+                self.record_launch_phase('application_id')
                 # Once we have an application ID, start monitoring state, obtain assigned host and get connection info
-                app_state = self._get_application_state()
+                app_state = yield self.run_in_backend(self._get_application_state)
+                self.set_launch_state(app_state)
 
                 if app_state in ConductorClusterProcessProxy.final_states:
                     error_message = "KernelID: '{}', ApplicationID: '{}' unexpectedly found in state '{}' " \
@@ -203,7 +306,8 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
                                format(i, app_state, self.assigned_host, self.kernel_id, self.application_id))
 
                 if self.assigned_host != '':
-                    ready_to_connect = self.receive_connection_info()
+                    self.record_launch_phase('host_assignment')
+                    ready_to_connect = yield self.receive_connection_info()
             else:
                 self.detect_launch_failure()
 
@@ -223,24 +327,27 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
                     self.assigned_ip = socket.gethostbyname(self.assigned_host)
         return app_state
 
+    @gen.coroutine
     def handle_timeout(self):
         """Checks to see if the kernel launch timeout has been exceeded while awaiting connection info."""
-        time.sleep(poll_interval)
+        yield self.wait_for_status_change(self.next_poll_interval())
         time_interval = RemoteProcessProxy.get_time_diff(self.start_time, RemoteProcessProxy.get_current_time())
 
         if time_interval > self.kernel_launch_timeout:
             reason = "Application failed to start within {} seconds.". \
                 format(self.kernel_launch_timeout)
             error_http_code = 500
-            if self._get_application_id(True):
-                if self._query_app_state_by_driver_id(self.driver_id) != "WAITING":
+            application_id = yield self.run_in_backend(self._get_application_id, True)
+            if application_id:
+                app_state = yield self.run_in_backend(self._query_app_state_by_driver_id, self.driver_id)
+                if app_state != "WAITING":
                     reason = "Kernel unavailable after {} seconds for driver_id {}, app_id {}, launch timeout: {}!". \
                         format(time_interval, self.driver_id, self.application_id, self.kernel_launch_timeout)
                     error_http_code = 503
                 else:
                     reason = "App {} is WAITING, but waited too long ({} secs) to get connection file". \
                         format(self.application_id, self.kernel_launch_timeout)
-            self.kill()
+            yield self.run_in_backend(self.kill)
             timeout_message = "KernelID: '{}' launch timeout due to: {}".format(self.kernel_id, reason)
             self.log_and_raise(http_status_code=error_http_code, reason=timeout_message)
 
@@ -282,6 +389,15 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
         self.application_id = process_info['application_id']
         self.rest_credential = process_info['rest_credential']
 
+    def _get_conductor_client(self):
+        """Returns the (shared) client used to issue requests against the Conductor REST API."""
+        if self.conductor_client is None:
+            env = self.env
+            cookie_jar = pjoin(env['KERNEL_NOTEBOOK_DATA_DIR'], env['KERNEL_NOTEBOOK_COOKIE_JAR'])
+            self.conductor_client = ConductorClient.instance(self.conductor_endpoint, env['KERNEL_CURL_SECURITY_OPT'],
+                                                             cookie_jar, self.log)
+        return self.conductor_client
+
     def _query_app_by_driver_id(self, driver_id):
         """Retrieve application by using driver ID.
 
@@ -291,28 +407,17 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
         response = None
         if not driver_id:
             return response
-        # Assemble REST call
-        env = self.env
-        header = 'Accept: application/json'
-        authorization = 'Authorization: %s' % self.rest_credential
-        cookie_jar = pjoin(env['KERNEL_NOTEBOOK_DATA_DIR'], env['KERNEL_NOTEBOOK_COOKIE_JAR'])
-        sslconf = env['KERNEL_CURL_SECURITY_OPT'].split()
-        url = '%s/v1/applications?driverid=%s' % (self.conductor_endpoint, driver_id)
-        cmd = ['curl', '-v', '-b', cookie_jar, '-X', 'GET', '-H', header, '-H', authorization, url]
-        cmd[2:2] = sslconf
-
         # Perform REST call
+        path = '/v1/applications?driverid=%s' % driver_id
         try:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-            output, stderr = process.communicate()
-            response = json.loads(output) if output else None
+            response = self._get_conductor_client().request('GET', path, self.rest_credential)
             if not response or not response['applist']:
                 response = None
             else:
                 response = response['applist']
         except Exception as e:
-            self.log.warning("Getting application with cmd '{}' failed with exception: '{}'.  Continuing...".
-                             format(cmd, e))
+            self.log.warning("Getting application with request '{}' failed with exception: '{}'.  Continuing...".
+                             format(path, e))
         return response
 
     def _query_app_by_id(self, app_id):
@@ -322,27 +427,17 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
         :return: The JSON object of an application. None if app_id is not found.
         """
         response = None
-        # Assemble REST call
-        env = self.env
-        header = 'Accept: application/json'
-        authorization = 'Authorization: %s' % self.rest_credential
-        cookie_jar = pjoin(env['KERNEL_NOTEBOOK_DATA_DIR'], env['KERNEL_NOTEBOOK_COOKIE_JAR'])
-        sslconf = env['KERNEL_CURL_SECURITY_OPT'].split()
-        url = '%s/v1/applications?applicationid=%s' % (self.conductor_endpoint, app_id)
-        cmd = ['curl', '-v', '-b', cookie_jar, '-X', 'GET', '-H', header, '-H', authorization, url]
-        cmd[2:2] = sslconf
         # Perform REST call
+        path = '/v1/applications?applicationid=%s' % app_id
         try:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-            output, stderr = process.communicate()
-            response = json.loads(output) if output else None
+            response = self._get_conductor_client().request('GET', path, self.rest_credential)
             if response is None or not response['applist']:
                 response = None
             else:
                 response = response['applist']
         except Exception as e:
-            self.log.warning("Getting application with cmd '{}' failed with exception: '{}'.  Continuing...".
-                             format(cmd, e))
+            self.log.warning("Getting application with request '{}' failed with exception: '{}'.  Continuing...".
+                             format(path, e))
         return response
 
     def _query_app_state_by_driver_id(self, driver_id):
@@ -394,24 +489,13 @@ class ConductorClusterProcessProxy(RemoteProcessProxy):
             else:
                 return None
 
-        # Assemble REST call
-        response = None
-        env = self.env
-        header = 'Accept: application/json'
-        authorization = 'Authorization: %s' % self.rest_credential
-        cookie_jar = pjoin(env['KERNEL_NOTEBOOK_DATA_DIR'], env['KERNEL_NOTEBOOK_COOKIE_JAR'])
-        sslconf = env['KERNEL_CURL_SECURITY_OPT'].split()
-        url = '%s/v1/submissions/kill/%s' % (self.conductor_endpoint, self.driver_id)
-        cmd = ['curl', '-v', '-b', cookie_jar, '-X', 'POST', '-H', header, '-H', authorization, url]
-        cmd[2:2] = sslconf
-
         # Perform REST call
+        response = None
+        path = '/v1/submissions/kill/%s' % self.driver_id
         try:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-            output, stderr = process.communicate()
-            response = json.loads(output) if output else None
+            response = self._get_conductor_client().request('POST', path, self.rest_credential)
         except Exception as e:
-            self.log.warning("Termination of application with cmd '{}' failed with exception: '{}'.  Continuing...".
-                             format(cmd, e))
+            self.log.warning("Termination of application with request '{}' failed with exception: '{}'.  "
+                             "Continuing...".format(path, e))
         self.log.debug("Kill response: {}".format(response))
         return response
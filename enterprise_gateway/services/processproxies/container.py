@@ -9,6 +9,7 @@ import abc
 import urllib3  # docker ends up using this and it causes lots of noise, so turn off warnings
 
 from jupyter_client import launch_kernel, localinterfaces
+from tornado import gen
 
 from .processproxy import RemoteProcessProxy
 
@@ -51,6 +52,7 @@ class ContainerProcessProxy(RemoteProcessProxy):
             self.kernel_executor_image = proxy_config.get('executor_image_name')
         self.kernel_executor_image = os.environ.get('KERNEL_EXECUTOR_IMAGE', self.kernel_executor_image)
 
+    @gen.coroutine
     def launch_process(self, kernel_cmd, **kwargs):
         """Launches the specified process within the container environment."""
         # Set env before superclass call so we see these in the debug output
@@ -65,17 +67,19 @@ class ContainerProcessProxy(RemoteProcessProxy):
         self._enforce_uid_gid_blacklists(**kwargs)
 
         super(ContainerProcessProxy, self).launch_process(kernel_cmd, **kwargs)
+        yield self.run_in_backend(self.create_container_resources, **kwargs)
 
         self.local_proc = launch_kernel(kernel_cmd, **kwargs)
         self.pid = self.local_proc.pid
         self.ip = local_ip
+        self.record_launch_phase('process_spawn')
 
         self.log.info("{}: kernel launched. Kernel image: {}, KernelID: {}, cmd: '{}'"
                       .format(self.__class__.__name__, self.kernel_image, self.kernel_id, kernel_cmd))
 
-        self.confirm_remote_startup()
+        yield self.confirm_remote_startup()
 
-        return self
+        raise gen.Return(self)
 
     def _enforce_uid_gid_blacklists(self, **kwargs):
         """Determine UID and GID with which to launch container and ensure they do not appear in blacklist."""
@@ -107,6 +111,10 @@ class ContainerProcessProxy(RemoteProcessProxy):
         -------
         None if the container cannot be found or its in an initial state. Otherwise False.
         """
+        alive = self.heartbeat_liveness()
+        if alive is not None:
+            return None if alive else False
+
         result = False
 
         container_status = self.get_container_status(None)
@@ -153,6 +161,11 @@ class ContainerProcessProxy(RemoteProcessProxy):
         self.kill()
         super(ContainerProcessProxy, self).cleanup()
 
+    def relinquish(self):
+        # The container is now managed by another instance, so only release what's local to this instance.
+        super(ContainerProcessProxy, self).cleanup()
+
+    @gen.coroutine
     def confirm_remote_startup(self):
         """Confirms the container has started and returned necessary connection information."""
         self.start_time = RemoteProcessProxy.get_current_time()
@@ -160,12 +173,14 @@ class ContainerProcessProxy(RemoteProcessProxy):
         ready_to_connect = False  # we're ready to connect when we have a connection file to use
         while not ready_to_connect:
             i += 1
-            self.handle_timeout()
+            yield self.handle_timeout()
 
-            container_status = self.get_container_status(str(i))
+            container_status = yield self.run_in_backend(self.get_container_status, str(i))
+            self.set_launch_state(container_status)
             if container_status:
                 if self.assigned_host != '':
-                    ready_to_connect = self.receive_connection_info()
+                    self.record_launch_phase('host_assignment')
+                    ready_to_connect = yield self.receive_connection_info()
                     self.pid = 0  # We won't send process signals for kubernetes lifecycle management
                     self.pgid = 0
             else:
@@ -192,6 +207,10 @@ class ContainerProcessProxy(RemoteProcessProxy):
         """Return current container state."""
         raise NotImplementedError
 
+    def create_container_resources(self, **kwargs):
+        """Create any artifacts the container requires prior to its launch (e.g., those conveying its secrets)."""
+        pass
+
     @abc.abstractmethod
     def terminate_container_resources(self):
         """Terminate any artifacts created on behalf of the container's lifetime."""
@@ -6,20 +6,161 @@ import os
 import json
 import time
 
+from functools import partial
 from subprocess import STDOUT
 from socket import gethostbyname
 
 from jupyter_client import launch_kernel
+from tornado import gen
+from tornado.concurrent import Future
 
 from .processproxy import RemoteProcessProxy, BaseProcessProxyABC
 
-poll_interval = float(os.getenv('EG_POLL_INTERVAL', '0.5'))
 kernel_log_dir = os.getenv("EG_KERNEL_LOG_DIR", '/tmp')  # would prefer /var/log, but its only writable by root
+host_selection = os.getenv('EG_HOST_SELECTION', 'round-robin')
+host_weights = os.getenv('EG_HOST_WEIGHTS', '')
+host_load_probe_interval = float(os.getenv('EG_HOST_LOAD_PROBE_INTERVAL', '30'))
+host_failure_threshold = int(os.getenv('EG_HOST_FAILURE_THRESHOLD', '3'))
+host_retry_interval = float(os.getenv('EG_HOST_RETRY_INTERVAL', '60'))
+
+host_selection_strategies = ['round-robin', 'least-kernels', 'least-load', 'weighted']
+
+# Outputs the 1-minute load average, the number of processors and the available memory (in KB) of a host
+load_probe_command = "cut -d' ' -f1 /proc/loadavg; getconf _NPROCESSORS_ONLN; " \
+                     "awk '/^MemAvailable:/ {print $2}' /proc/meminfo"
+
+
+class HostState(object):
+    """The kernels placed on a host by this server, along with the host's health and most recent load."""
+
+    def __init__(self):
+        self.kernels = set()
+        self.failures = 0  # consecutive failures to reach the host
+        self.retry_time = 0  # once failures reach the threshold, the (monotonic) time the host may be retried
+        self.load = None  # 1-minute load average per processor, as of the last probe
+        self.processors = 1
+        self.memory_available = 0
+        self.probe_time = None
+        self.placements_since_probe = 0
+
+
+class HostRegistry(object):
+    """Tracks the kernel placements and health of the hosts used by all DistributedProcessProxy instances.
+
+    Hosts are tracked with circuit-breaker semantics: once EG_HOST_FAILURE_THRESHOLD consecutive attempts to
+    reach a host have failed, the host is skipped for EG_HOST_RETRY_INTERVAL seconds, after which a single
+    launch may try the host again.  A successful launch resets the host's failures, whereas another failure
+    skips the host for a further interval.  Like KernelUsage, instances are only accessed from the IOLoop
+    thread.
+    """
+
+    def __init__(self):
+        self._hosts = {}  # host -> HostState
+        self._probes = {}  # host -> future of an ongoing load probe
+
+    def state(self, host):
+        host_state = self._hosts.get(host)
+        if host_state is None:
+            host_state = self._hosts[host] = HostState()
+        return host_state
+
+    def add_kernel(self, host, kernel_id):
+        host_state = self.state(host)
+        host_state.kernels.add(kernel_id)
+        host_state.placements_since_probe += 1
+
+    def remove_kernel(self, host, kernel_id):
+        host_state = self._hosts.get(host)
+        if host_state is not None:
+            host_state.kernels.discard(kernel_id)
+
+    def is_available(self, host):
+        """Returns True if the host is healthy or may be retried."""
+        host_state = self.state(host)
+        return host_state.failures < host_failure_threshold or time.monotonic() >= host_state.retry_time
+
+    def record_attempt(self, host):
+        """Notes an attempt to use the given host.  If the host is being retried, other launches are deferred
+        from using it until the outcome is known (or another interval has passed).
+        """
+        host_state = self.state(host)
+        if host_state.failures >= host_failure_threshold:
+            host_state.retry_time = time.monotonic() + host_retry_interval
+
+    def record_success(self, host):
+        self.state(host).failures = 0
+
+    def record_failure(self, host, log, reason):
+        host_state = self.state(host)
+        host_state.failures += 1
+        if host_state.failures >= host_failure_threshold:
+            host_state.retry_time = time.monotonic() + host_retry_interval
+            log.warning("Host '{}' will not be used for {} seconds following {} consecutive failures.  Last failure: "
+                        "{}".format(host, host_retry_interval, host_state.failures, reason))
+
+    @gen.coroutine
+    def probe(self, host, probe_func, log):
+        """Refreshes the load of the given host if its last probe is older than EG_HOST_LOAD_PROBE_INTERVAL.
+
+        `probe_func(host)` returns a future resolving to the lines of the `load_probe_command` output.
+        Concurrent launches share a single probe of each host.
+        """
+        host_state = self.state(host)
+        if host_state.probe_time is not None and time.monotonic() - host_state.probe_time < host_load_probe_interval:
+            return
+        if host in self._probes:
+            yield self._probes[host]
+            return
+
+        self._probes[host] = future = Future()
+        try:
+            lines = yield probe_func(host)
+            load, processors, memory_available = [line.strip() for line in lines[:3]]
+            host_state.processors = max(int(processors), 1)
+            host_state.load = float(load) / host_state.processors
+            host_state.memory_available = int(memory_available)
+            host_state.placements_since_probe = 0
+            self.record_success(host)
+        except Exception as e:
+            host_state.load = None
+            self.record_failure(host, log, "load probe failed: {}".format(e))
+        finally:
+            host_state.probe_time = time.monotonic()
+            del self._probes[host]
+            future.set_result(None)
+
+    def get_load(self, host):
+        """Returns the host's load per processor, including the kernels placed since its last probe.  Hosts
+        whose load is unknown are considered fully loaded.
+        """
+        host_state = self.state(host)
+        if host_state.load is None:
+            return float('inf')
+        return host_state.load + float(host_state.placements_since_probe) / host_state.processors
+
+
+host_registry = HostRegistry()
 
 
 class DistributedProcessProxy(RemoteProcessProxy):
-    """Manages the lifecycle of kernels distributed across a set of hosts."""
+    """Manages the lifecycle of kernels distributed across a set of hosts.
+
+    The host on which a kernel is launched is selected using the strategy configured via `host_selection` in
+    the process proxy configuration (or EG_HOST_SELECTION):
+
+    - round-robin: the hosts are used in turn.
+    - least-kernels: the host with the fewest kernels launched by this server.
+    - least-load: the host with the lowest load average per processor, as periodically probed over ssh,
+      with kernels placed since the last probe counting towards the load.  Ties favor the host with the
+      most available memory.
+    - weighted: the host with the fewest kernels relative to its weight (`host_weights` or
+      EG_HOST_WEIGHTS, e.g. 'host1:2,host2:1'), hosts default to a weight of 1.
+
+    Hosts that cannot be reached are skipped for a time (see HostRegistry).  Subclasses may override
+    `select_host()` to implement other strategies.
+    """
     host_index = 0
+    backend = 'ssh'
 
     def __init__(self, kernel_manager, proxy_config):
         super(DistributedProcessProxy, self).__init__(kernel_manager, proxy_config)
@@ -29,28 +170,56 @@ class DistributedProcessProxy(RemoteProcessProxy):
         else:
             self.hosts = kernel_manager.parent.parent.remote_hosts  # from command line or env
 
+        self.host_selection = proxy_config.get('host_selection', host_selection)
+        if self.host_selection not in host_selection_strategies:
+            self.log_and_raise(http_status_code=500, reason="Invalid host selection strategy '{}' specified.  "
+                               "Valid strategies are: {}".format(self.host_selection, host_selection_strategies))
+        self.host_weights = {}
+        for host_weight in filter(None, proxy_config.get('host_weights', host_weights).split(',')):
+            host, _, weight = host_weight.rpartition(':')
+            try:
+                self.host_weights[host] = float(weight)
+            except ValueError:
+                self.log_and_raise(http_status_code=500, reason="Invalid host weight '{}' specified.".
+                                   format(host_weight))
+
+    @gen.coroutine
     def launch_process(self, kernel_cmd, **kwargs):
         """Launches a kernel process on a selected host."""
         super(DistributedProcessProxy, self).launch_process(kernel_cmd, **kwargs)
 
-        self.assigned_host = self._determine_next_host()
-        self.ip = gethostbyname(self.assigned_host)  # convert to ip if host is provided
-        self.assigned_ip = self.ip
-
+        self.assigned_host = yield self._determine_next_host()
+        host_registry.add_kernel(self.assigned_host, self.kernel_id)
         try:
-            result_pid = self._launch_remote_process(kernel_cmd, **kwargs)
-            self.pid = int(result_pid)
-        except Exception as e:
-            error_message = "Failure occurred starting kernel on '{}'.  Returned result: {}".\
-                format(self.ip, e)
-            self.log_and_raise(http_status_code=500, reason=error_message)
-
-        self.log.info("Kernel launched on '{}', pid: {}, ID: {}, Log file: {}:{}, Command: '{}'.  ".
-                      format(self.assigned_host, self.pid, self.kernel_id, self.assigned_host,
-                             self.kernel_log, kernel_cmd))
-        self.confirm_remote_startup()
-
-        return self
+            try:
+                self.ip = gethostbyname(self.assigned_host)  # convert to ip if host is provided
+            except Exception as e:
+                error_message = "Failure occurred resolving host '{}': {}".format(self.assigned_host, e)
+                host_registry.record_failure(self.assigned_host, self.log, error_message)
+                self.log_and_raise(http_status_code=500, reason=error_message)
+            self.assigned_ip = self.ip
+            self.record_launch_phase('host_assignment')
+
+            try:
+                result_pid = yield self.run_in_backend(self._launch_remote_process, kernel_cmd, **kwargs)
+                self.pid = int(result_pid)
+                self.record_launch_phase('process_spawn')
+            except Exception as e:
+                error_message = "Failure occurred starting kernel on '{}'.  Returned result: {}".\
+                    format(self.ip, e)
+                host_registry.record_failure(self.assigned_host, self.log, error_message)
+                self.log_and_raise(http_status_code=500, reason=error_message)
+            host_registry.record_success(self.assigned_host)
+
+            self.log.info("Kernel launched on '{}', pid: {}, ID: {}, Log file: {}:{}, Command: '{}'.  ".
+                          format(self.assigned_host, self.pid, self.kernel_id, self.assigned_host,
+                                 self.kernel_log, kernel_cmd))
+            yield self.confirm_remote_startup()
+        except Exception:
+            host_registry.remove_kernel(self.assigned_host, self.kernel_id)  # the kernel manager won't clean up
+            raise
+
+        raise gen.Return(self)
 
     def _launch_remote_process(self, kernel_cmd, **kwargs):
         """
@@ -67,8 +236,9 @@ class DistributedProcessProxy(RemoteProcessProxy):
             self.local_proc = launch_kernel(cmd, stdout=open(self.kernel_log, mode='w'), stderr=STDOUT, **kwargs)
             result_pid = str(self.local_proc.pid)
         else:
-            # launch remote command via ssh
-            result = self.rsh(self.ip, cmd)
+            # launch remote command via ssh, conveying the launch secret (read by the command) via its stdin
+            secret = kwargs['env'].get('KERNEL_LAUNCH_SECRET')
+            result = self.rsh(self.ip, cmd, input=secret + '\n' if secret else None)
             for line in result:
                 result_pid = line.strip()
 
@@ -104,6 +274,9 @@ class DistributedProcessProxy(RemoteProcessProxy):
             if impersonation:
                 cmd += 'export EG_IMPERSONATION_ENABLED="{}";'.format(impersonation)
 
+            if env_dict.get('KERNEL_LAUNCH_SECRET'):  # conveyed via stdin, keeping it off the command line
+                cmd += 'read -r KERNEL_LAUNCH_SECRET; export KERNEL_LAUNCH_SECRET;'
+
             for key, value in self.kernel_manager.kernel_spec.env.items():
                 cmd += "export {}={};".format(key, json.dumps(value).replace("'", "''"))
 
@@ -115,12 +288,60 @@ class DistributedProcessProxy(RemoteProcessProxy):
 
         return cmd
 
+    @gen.coroutine
     def _determine_next_host(self):
-        """Simple round-robin index into list of hosts."""
-        next_host = self.hosts[DistributedProcessProxy.host_index % self.hosts.__len__()]
+        """Selects the host on which to launch the kernel from those that are available."""
+        hosts = [host for host in self.hosts if host_registry.is_available(host)]
+        if not hosts:
+            self.log_and_raise(http_status_code=503, reason="None of the hosts {} are available following repeated "
+                               "failures to reach them.  Try again later.".format(self.hosts))
+
+        # Rotate the hosts so that round-robin selection - and ties under the other strategies - cycle the hosts
+        start = DistributedProcessProxy.host_index % len(hosts)
+        hosts = hosts[start:] + hosts[:start]
         DistributedProcessProxy.host_index += 1
-        return next_host
 
+        if self.host_selection == 'least-load':
+            probe_func = partial(self.run_in_backend, self._probe_host)
+            yield [host_registry.probe(host, probe_func, self.log) for host in hosts]
+            hosts = [host for host in hosts if host_registry.state(host).load is not None] or hosts
+        next_host = self.select_host(hosts)
+        host_registry.record_attempt(next_host)
+        raise gen.Return(next_host)
+
+    def select_host(self, hosts):
+        """Returns the host, from the given available hosts, on which to launch the kernel."""
+        if self.host_selection == 'least-kernels':
+            return min(hosts, key=lambda host: len(host_registry.state(host).kernels))
+        if self.host_selection == 'weighted':
+            return min(hosts, key=self._weighted_kernels)
+        if self.host_selection == 'least-load':
+            return min(hosts, key=lambda host: (host_registry.get_load(host),
+                                                -host_registry.state(host).memory_available))
+        return hosts[0]
+
+    def _weighted_kernels(self, host):
+        # Hosts with a weight of 0 are only used if no other hosts are available
+        weight = self.host_weights.get(host, 1.0)
+        return len(host_registry.state(host).kernels) / weight if weight > 0 else float('inf')
+
+    def _probe_host(self, host):
+        """Returns the output of the load probe command on the given host (run on the backend's executor)."""
+        if BaseProcessProxyABC.ip_is_local(gethostbyname(host)):
+            with open('/proc/meminfo') as meminfo:
+                memory_available = [line.split()[1] for line in meminfo if line.startswith('MemAvailable:')]
+            return [str(os.getloadavg()[0]), str(os.cpu_count()), memory_available[0]]
+        return self.rsh(host, load_probe_command)
+
+    def cleanup(self):
+        host_registry.remove_kernel(self.assigned_host, self.kernel_id)
+        super(DistributedProcessProxy, self).cleanup()
+
+    def load_process_info(self, process_info):
+        super(DistributedProcessProxy, self).load_process_info(process_info)
+        host_registry.add_kernel(self.assigned_host, self.kernel_id)  # restore the revived kernel's placement
+
+    @gen.coroutine
     def confirm_remote_startup(self):
         """ Confirms the remote kernel has started by obtaining connection information from the remote host."""
         self.start_time = RemoteProcessProxy.get_current_time()
@@ -128,17 +349,18 @@ class DistributedProcessProxy(RemoteProcessProxy):
         ready_to_connect = False  # we're ready to connect when we have a connection file to use
         while not ready_to_connect:
             i += 1
-            self.handle_timeout()
+            yield self.handle_timeout()
 
             self.log.debug("{}: Waiting to connect.  Host: '{}', KernelID: '{}'".
                            format(i, self.assigned_host, self.kernel_id))
 
             if self.assigned_host != '':
-                ready_to_connect = self.receive_connection_info()
+                ready_to_connect = yield self.receive_connection_info()
 
+    @gen.coroutine
     def handle_timeout(self):
         """Checks to see if the kernel launch timeout has been exceeded while awaiting connection info."""
-        time.sleep(poll_interval)
+        yield self.wait_for_status_change(self.next_poll_interval())
         time_interval = RemoteProcessProxy.get_time_diff(self.start_time, RemoteProcessProxy.get_current_time())
 
         if time_interval > self.kernel_launch_timeout:
@@ -146,5 +368,5 @@ class DistributedProcessProxy(RemoteProcessProxy):
                      "log ({}:{}) for more information.".\
                 format(self.kernel_launch_timeout, self.assigned_host, self.kernel_log)
             timeout_message = "KernelID: '{}' launch timeout due to: {}".format(self.kernel_id, reason)
-            self.kill()
+            yield self.run_in_backend(self.kill)
             self.log_and_raise(http_status_code=500, reason=timeout_message)
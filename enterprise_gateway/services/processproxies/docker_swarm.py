@@ -20,6 +20,8 @@ client = DockerClient.from_env()
 
 class DockerSwarmProcessProxy(ContainerProcessProxy):
     """Kernel lifecycle management for kernels in Docker Swarm."""
+    backend = 'docker'
+
     def __init__(self, kernel_manager, proxy_config):
         super(DockerSwarmProcessProxy, self).__init__(kernel_manager, proxy_config)
 
@@ -123,6 +125,8 @@ class DockerSwarmProcessProxy(ContainerProcessProxy):
 
 class DockerProcessProxy(ContainerProcessProxy):
     """Kernel lifecycle management for Docker kernels (non-Swarm)."""
+    backend = 'docker'
+
     def __init__(self, kernel_manager, proxy_config):
         super(DockerProcessProxy, self).__init__(kernel_manager, proxy_config)
 
@@ -5,9 +5,14 @@
 import os
 import logging
 import re
+import time
 
 import urllib3
-from kubernetes import client, config
+from datetime import timedelta
+from threading import Lock, Thread
+from kubernetes import client, config, watch
+from tornado import gen
+from tornado.ioloop import IOLoop
 
 from .container import ContainerProcessProxy
 from ..sessions.kernelsessionmanager import KernelSessionManager
@@ -25,15 +30,153 @@ shared_namespace = bool(os.environ.get('EG_SHARED_NAMESPACE', 'False').lower() =
 config.load_incluster_config()
 
 
+class KernelPodWatcher(object):
+    """Maintains an in-memory cache of kernel pods using a single watch.
+
+    Rather than each kernel listing its pod on every status check, the watcher (running in a daemon
+    thread) tracks all pods labeled 'component=kernel' and caches each by namespace and name.  Since the
+    executor pods of Spark kernels bear the same labels as their driver, the pod of a given kernel is
+    selected from the pods bearing its 'kernel_id' label.  Coroutines awaiting a change to a given kernel's
+    pods are woken as watch events arrive.  Should the watch fail, status checks fall back to listing the
+    pod until the cache has been re-synchronized.
+
+    The watch covers all namespaces (requiring the cluster-scoped list and watch of pods granted by the
+    enterprise-gateway-controller ClusterRole) unless EG_SHARED_NAMESPACE is set, in which case only
+    EG_NAMESPACE is watched.
+    """
+
+    label_selector = 'component=kernel'
+    _instance = None
+
+    def __init__(self, log):
+        self.log = log
+        self.io_loop = IOLoop.current()
+        self.namespace = enterprise_gateway_namespace if shared_namespace else None  # None => all namespaces
+        self.synced = False
+        self._lock = Lock()
+        self._pods = {}  # (namespace, name) -> V1Pod
+        self._kernel_pods = {}  # kernel_id -> set of (namespace, name) of the pods labeled with the kernel_id
+        self._waiters = {}  # kernel_id -> list of futures awaiting a change to the kernel's pods
+        self._thread = Thread(target=self._run, name='KernelPodWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @classmethod
+    def instance(cls, log):
+        """Returns the kernel pod watcher, starting it if necessary."""
+        if cls._instance is None:
+            cls._instance = cls(log)
+        return cls._instance
+
+    def get_pod(self, namespace, kernel_id):
+        """Returns the pod of the given kernel within the given namespace or None if the pod does not exist."""
+        if self.synced and (self.namespace is None or self.namespace == namespace):
+            with self._lock:
+                pods = [self._pods[key] for key in self._kernel_pods.get(kernel_id, ()) if key[0] == namespace]
+        else:
+            ret = client.CoreV1Api().list_namespaced_pod(namespace=namespace, label_selector="kernel_id=" + kernel_id)
+            pods = ret.items if ret else []
+        return KernelPodWatcher._select_kernel_pod(pods)
+
+    @staticmethod
+    def _select_kernel_pod(pods):
+        # Spark executor pods bear the labels of their kernel, so only the driver (or kernel) pod is considered.
+        # Should several remain (e.g., during a restart), the most recently created pod is the kernel's.
+        pods = [pod for pod in pods if (pod.metadata.labels or {}).get('spark-role') != 'executor']
+        if not pods:
+            return None
+        return max(pods, key=lambda pod: (pod.metadata.creation_timestamp is not None,
+                                          pod.metadata.creation_timestamp))
+
+    @gen.coroutine
+    def wait_for_update(self, kernel_id, wait_time):
+        """Waits up to `wait_time` seconds for the pods associated with the given kernel to change."""
+        future = gen.Future()
+        self._waiters.setdefault(kernel_id, []).append(future)
+        try:
+            yield gen.with_timeout(timedelta(seconds=wait_time), future)
+        except gen.TimeoutError:
+            pass
+        finally:
+            waiters = self._waiters.get(kernel_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(kernel_id, None)
+
+    def _notify(self, kernel_id):
+        # Called on the IOLoop thread to wake coroutines awaiting a change to the kernel's pods.
+        for future in self._waiters.pop(kernel_id, []):
+            if not future.done():
+                future.set_result(None)
+
+    def _update(self, event_type, pod):
+        kernel_id = (pod.metadata.labels or {}).get('kernel_id')
+        if kernel_id is None:
+            return
+        key = (pod.metadata.namespace, pod.metadata.name)
+        with self._lock:
+            if event_type == 'DELETED':
+                self._pods.pop(key, None)
+                keys = self._kernel_pods.get(kernel_id, set())
+                keys.discard(key)
+                if not keys:
+                    self._kernel_pods.pop(kernel_id, None)
+            else:
+                self._pods[key] = pod
+                self._kernel_pods.setdefault(kernel_id, set()).add(key)
+        self.io_loop.add_callback(self._notify, kernel_id)
+
+    def _list_function(self):
+        # Returns the function (and its positional arguments) listing the pods of the watched namespaces.  The
+        # API function itself is returned since the watch derives the type of its events from the function.
+        if self.namespace is None:
+            return client.CoreV1Api().list_pod_for_all_namespaces, ()
+        return client.CoreV1Api().list_namespaced_pod, (self.namespace,)
+
+    def _run(self):
+        # Lists the kernel pods to (re)populate the cache, then watches for subsequent changes.  Should the
+        # watch fail (or its resource version expire), the cache is re-synchronized after a brief delay.
+        failures = 0
+        while True:
+            try:
+                list_pods, args = self._list_function()
+                pods = list_pods(*args, label_selector=self.label_selector)
+                with self._lock:
+                    self._pods = {}
+                    self._kernel_pods = {}
+                for pod in pods.items:
+                    self._update('ADDED', pod)
+                self.synced = True
+                failures = 0
+                w = watch.Watch()
+                for event in w.stream(list_pods, *args, label_selector=self.label_selector,
+                                      resource_version=pods.metadata.resource_version):
+                    if event['type'] == 'ERROR':
+                        break
+                    self._update(event['type'], event['object'])
+            except Exception as err:
+                failures += 1
+                self.log.warning("Kernel pod watch encountered an exception (will re-synchronize): {}".format(err))
+            self.synced = False
+            if failures:
+                time.sleep(min(2 ** failures, 60))
+
+
 class KubernetesProcessProxy(ContainerProcessProxy):
     """Kernel lifecycle management for Kubernetes kernels."""
+    pending_states = {'Pending'}  # being scheduled or pulling images
+    backend = 'kubernetes'
+
     def __init__(self, kernel_manager, proxy_config):
         super(KubernetesProcessProxy, self).__init__(kernel_manager, proxy_config)
 
         self.kernel_pod_name = None
         self.kernel_namespace = None
         self.delete_kernel_namespace = False
+        self.pod_watcher = KernelPodWatcher.instance(self.log)
 
+    @gen.coroutine
     def launch_process(self, kernel_cmd, **kwargs):
         """Launches the specified process within a Kubernetes environment."""
         # Set env before superclass call so we see these in the debug output
@@ -42,9 +185,11 @@ class KubernetesProcessProxy(ContainerProcessProxy):
         # transfer its env to each launched kernel.
         kwargs['env'] = dict(os.environ, **kwargs['env'])  # FIXME: Should probably use process-whitelist in JKG #280
         self.kernel_pod_name = self._determine_kernel_pod_name(**kwargs)
-        self.kernel_namespace = self._determine_kernel_namespace(**kwargs)  # will create namespace if not provided
+        # will create namespace if not provided
+        self.kernel_namespace = yield self.run_in_backend(self._determine_kernel_namespace, **kwargs)
 
-        return super(KubernetesProcessProxy, self).launch_process(kernel_cmd, **kwargs)
+        result = yield super(KubernetesProcessProxy, self).launch_process(kernel_cmd, **kwargs)
+        raise gen.Return(result)
 
     def get_initial_states(self):
         """Return list of states indicating container is starting (includes running)."""
@@ -55,10 +200,8 @@ class KubernetesProcessProxy(ContainerProcessProxy):
         # Locates the kernel pod using the kernel_id selector.  If the phase indicates Running, the pod's IP
         # is used for the assigned_ip.
         pod_status = None
-        ret = client.CoreV1Api().list_namespaced_pod(namespace=self.kernel_namespace,
-                                                     label_selector="kernel_id=" + self.kernel_id)
-        if ret and ret.items:
-            pod_info = ret.items[0]
+        pod_info = self.pod_watcher.get_pod(self.kernel_namespace, self.kernel_id)
+        if pod_info:
             self.container_name = pod_info.metadata.name
             if pod_info.status:
                 pod_status = pod_info.status.phase
@@ -76,6 +219,33 @@ class KubernetesProcessProxy(ContainerProcessProxy):
 
         return pod_status
 
+    @gen.coroutine
+    def wait_for_status_change(self, wait_time):
+        """Waits up to `wait_time` seconds for the kernel pod to change - as reported by the pod watcher - or
+        for the kernel's connection info to be received.
+        """
+        yield gen.WaitIterator(self.pod_watcher.wait_for_update(self.kernel_id, wait_time),
+                               super(KubernetesProcessProxy, self).wait_for_status_change(wait_time)).next()
+
+    def create_container_resources(self, **kwargs):
+        """Creates the secret through which the kernel pod obtains the launch secret, so that it doesn't appear
+        in the pod's specification or the spark-submit command line.
+        """
+        secret_name = self.kernel_pod_name + '-launch-secret'
+        labels = {'app': 'enterprise-gateway', 'component': 'kernel', 'kernel_id': self.kernel_id}
+        body = client.V1Secret(metadata=client.V1ObjectMeta(name=secret_name, labels=labels),
+                               string_data={'launch-secret': self.launch_secret})
+        try:
+            client.CoreV1Api().create_namespaced_secret(namespace=self.kernel_namespace, body=body)
+        except Exception as err:
+            if isinstance(err, client.rest.ApiException) and err.status == 409:  # restarting, replace its secret
+                client.CoreV1Api().replace_namespaced_secret(name=secret_name, namespace=self.kernel_namespace,
+                                                             body=body)
+            else:
+                self.log_and_raise(http_status_code=500, reason="Error occurred creating secret '{}' in namespace "
+                                   "'{}': {}".format(secret_name, self.kernel_namespace, err))
+        kwargs['env']['KERNEL_LAUNCH_SECRET_NAME'] = secret_name
+
     def terminate_container_resources(self):
         """Terminate any artifacts created on behalf of the container's lifetime."""
         # Kubernetes objects don't go away on their own - so we need to tear down the namespace
@@ -100,6 +270,7 @@ class KubernetesProcessProxy(ContainerProcessProxy):
             if self.delete_kernel_namespace and not self.kernel_manager.restarting:
                 v1_status = client.CoreV1Api().delete_namespace(name=self.kernel_namespace, body=body)
             else:
+                self._delete_launch_secret(body)
                 v1_status = client.CoreV1Api().delete_namespaced_pod(namespace=self.kernel_namespace,
                                                                      body=body, name=self.container_name)
             if v1_status and v1_status.status:
@@ -125,6 +296,17 @@ class KubernetesProcessProxy(ContainerProcessProxy):
                              "not been terminated.".format(self.kernel_namespace, self.container_name, self.kernel_id))
         return result
 
+    def _delete_launch_secret(self, body):
+        # The launch secret goes with the kernel namespace, but must be deleted when only the pod is.
+        if self.kernel_pod_name is None:  # loaded from a session persisted prior to the use of launch secrets
+            return
+        try:
+            client.CoreV1Api().delete_namespaced_secret(name=self.kernel_pod_name + '-launch-secret',
+                                                        namespace=self.kernel_namespace, body=body)
+        except Exception as err:
+            if not isinstance(err, client.rest.ApiException) or err.status != 404:
+                self.log.warning("Error occurred deleting launch secret of kernel {}: {}".format(self.kernel_id, err))
+
     def _determine_kernel_pod_name(self, **kwargs):
         pod_name = kwargs['env'].get('KERNEL_POD_NAME')
         if pod_name is None:
@@ -239,7 +421,8 @@ class KubernetesProcessProxy(ContainerProcessProxy):
     def get_process_info(self):
         """Captures the base information necessary for kernel persistence relative to kubernetes."""
         process_info = super(KubernetesProcessProxy, self).get_process_info()
-        process_info.update({'kernel_ns': self.kernel_namespace, 'delete_ns': self.delete_kernel_namespace})
+        process_info.update({'kernel_ns': self.kernel_namespace, 'delete_ns': self.delete_kernel_namespace,
+                             'kernel_pod_name': self.kernel_pod_name})
         return process_info
 
     def load_process_info(self, process_info):
@@ -247,3 +430,4 @@ class KubernetesProcessProxy(ContainerProcessProxy):
         super(KubernetesProcessProxy, self).load_process_info(process_info)
         self.kernel_namespace = process_info['kernel_ns']
         self.delete_kernel_namespace = process_info['delete_ns']
+        self.kernel_pod_name = process_info.get('kernel_pod_name')
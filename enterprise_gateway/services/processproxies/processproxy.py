@@ -14,12 +14,24 @@ import logging
 import time
 import pexpect
 import getpass
-import subprocess
 import base64
+import hashlib
 import random
-
-from socket import timeout, socket, gethostbyname, gethostname, AF_INET, SOCK_STREAM, SHUT_RDWR, SHUT_WR
-from tornado import web
+import select
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from socket import socket, socketpair, gethostbyname, gethostname, create_connection, AF_INET, SOCK_STREAM, \
+    SOL_SOCKET, SO_REUSEADDR, MSG_PEEK
+from collections import OrderedDict, deque, namedtuple
+from datetime import timedelta
+from threading import Lock, Thread
+from tornado import web, gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError, UnsatisfiableReadError
+from tornado.netutil import bind_sockets
+from tornado.tcpserver import TCPServer
 from calendar import timegm
 from ipython_genutils.py3compat import with_metaclass
 from jupyter_client import launch_kernel, localinterfaces
@@ -29,6 +41,8 @@ from enum import Enum
 from Crypto.Cipher import AES
 
 from ..sessions.kernelsessionmanager import KernelSessionManager
+from ...metrics import KERNEL_LAUNCH_DURATION_SECONDS, KERNEL_LAUNCH_PHASE_DURATION_SECONDS, KERNEL_LAUNCH_POLLS, \
+    BACKEND_CALL_QUEUE_DEPTH, BACKEND_CALL_QUEUE_SECONDS, BACKEND_CALL_DURATION_SECONDS
 
 # Default logging level of paramiko produces too much noise - raise to warning only.
 logging.getLogger('paramiko').setLevel(os.getenv('EG_SSH_LOG_LEVEL', logging.WARNING))
@@ -39,10 +53,26 @@ env_pop_list = ['EG_REMOTE_PWD', 'LS_COLORS']
 default_kernel_launch_timeout = float(os.getenv('EG_KERNEL_LAUNCH_TIMEOUT', '30'))
 max_poll_attempts = int(os.getenv('EG_MAX_POLL_ATTEMPTS', '10'))
 poll_interval = float(os.getenv('EG_POLL_INTERVAL', '0.5'))
+min_poll_interval = float(os.getenv('EG_MIN_POLL_INTERVAL', '0.1'))
+max_poll_interval = float(os.getenv('EG_MAX_POLL_INTERVAL', '5.0'))
+poll_backoff_factor = 1.5
 socket_timeout = float(os.getenv('EG_SOCKET_TIMEOUT', '5.0'))
+heartbeat_interval = float(os.getenv('EG_HEARTBEAT_INTERVAL', '5.0'))
+max_missed_heartbeats = 3
+max_heartbeat_size = 64 * 1024
+max_frame_size = 64 * 1024
+handshake_version = 2
+legacy_payloads_enabled = bool(os.getenv('EG_ALLOW_LEGACY_PAYLOADS', 'True').lower() == 'true')
 tunneling_enabled = bool(os.getenv('EG_ENABLE_TUNNELING', 'False').lower() == 'true')
+tunnel_multiplexing_enabled = bool(os.getenv('EG_ENABLE_TUNNEL_MULTIPLEXING', 'False').lower() == 'true')
 ssh_port = int(os.getenv('EG_SSH_PORT', '22'))
+ssh_max_connections = int(os.getenv('EG_SSH_MAX_CONNECTIONS', '50'))
+ssh_idle_timeout = float(os.getenv('EG_SSH_IDLE_TIMEOUT', '300'))
 response_ip = os.getenv('EG_RESPONSE_IP', None)
+response_port = int(os.getenv('EG_RESPONSE_PORT', '8877'))
+response_port_retries = int(os.getenv('EG_RESPONSE_PORT_RETRIES', '10'))
+backend_pool_size = int(os.getenv('EG_BACKEND_POOL_SIZE', '8'))
+backend_pool_sizes = os.getenv('EG_BACKEND_POOL_SIZES', '')  # e.g., 'yarn:16,kubernetes:4'
 
 # Minimum port range size and max retries
 min_port_range_size = int(os.getenv('EG_MIN_PORT_RANGE_SIZE', '1000'))
@@ -94,6 +124,1018 @@ class KernelChannel(Enum):
     COMMUNICATION = "EG_COMM"  # Optional channel for remote launcher to issue interrupts - NOT a ZMQ channel
 
 
+# The state of a kernel launcher's heartbeats - `time` is None once the launcher has reported its exit.
+LauncherHeartbeat = namedtuple('LauncherHeartbeat', ['pid', 'time', 'stream'])
+
+
+class PayloadCipher(object):
+    """Decrypts the payloads sent by the launcher of a kernel.
+
+    Version 2 payloads are sealed using AES-GCM (as nonce + ciphertext + tag) with a 256-bit key derived from the
+    SHA-256 digest of the secret generated for the kernel's launch (see generate_launch_secret()), authenticating
+    associated data that binds the payload to the kernel and its purpose.  Since the secret is only known to the
+    gateway and the launcher, such payloads can't be forged by others.  Legacy payloads are base64-encoded,
+    '%'-padded and encrypted using AES-ECB with the first 16 characters of the kernel id - so they are not
+    authenticated.  Instances are cached per kernel so that keys are derived only once.
+    """
+    nonce_size = 12
+    tag_size = 16
+
+    def __init__(self, kernel_id, secret=None):
+        self.kernel_id = kernel_id
+        self._key = hashlib.sha256(secret.encode('utf-8')).digest() if secret else None
+        self._legacy_cipher = AES.new(kernel_id[0:16].encode('utf-8'), AES.MODE_ECB)
+
+    @staticmethod
+    def generate_launch_secret():
+        """Returns a random secret, conveyed to the kernel's launcher via KERNEL_LAUNCH_SECRET, from which the
+        key of its version 2 payloads is derived.
+        """
+        return os.urandom(32).hex()
+
+    @staticmethod
+    def associated_data(kernel_id, purpose=b''):
+        """Returns the associated data authenticated with a version 2 payload of the given kernel - which is
+        also the header of a version 2 connection info frame.
+        """
+        kernel_id = kernel_id.encode('utf-8')
+        return struct.pack('>BH', handshake_version, len(kernel_id)) + kernel_id + purpose
+
+    def decrypt(self, sealed, purpose=b''):
+        """Decrypts and authenticates a version 2 payload, raising ValueError if that's not possible."""
+        if self._key is None:
+            raise ValueError("No launch secret is known for KernelID '{}'.".format(self.kernel_id))
+        if len(sealed) < self.nonce_size + self.tag_size:
+            raise ValueError("Payload is too short.")
+        sealed = memoryview(sealed)
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=sealed[:self.nonce_size])
+        cipher.update(self.associated_data(self.kernel_id, purpose))
+        return cipher.decrypt_and_verify(sealed[self.nonce_size:-self.tag_size], sealed[-self.tag_size:])
+
+    def decrypt_legacy(self, data):
+        """Decrypts a legacy payload, raising ValueError if that's not possible."""
+        payload = self._legacy_cipher.decrypt(base64.b64decode(data))
+        return "".join([payload.decode("utf-8").rsplit("}", 1)[0], "}"])  # Get rid of padding after the '}'.
+
+
+class ResponseManager(TCPServer):
+    """Gateway-wide listener on which remote kernel launchers return their connection information.
+
+    A single listener, bound to the response address, services all pending kernel launches.  Each kernel
+    is registered along with the secret generated for its launch, from which the key used to authenticate
+    its launcher's payloads is derived - the kernel id only serving to locate the kernel.
+
+    Current launchers send their connection info in a version 2 frame: the version (1 byte), the length of
+    the kernel id (2 bytes), the kernel id, the length of the sealed payload (4 bytes) and the payload (see
+    PayloadCipher), all lengths being big-endian.  The frame is dispatched directly to the kernel's pending
+    launch.  Legacy launchers send a base64-encoded payload, which is tried against each pending launch
+    unless EG_ALLOW_LEGACY_PAYLOADS is false.
+
+    Launchers may also hold a connection to the listener on which they send a heartbeat every
+    EG_HEARTBEAT_INTERVAL seconds and a notification when the kernel exits.  Such connections are
+    distinguished by their first byte, that of newline-delimited JSON objects, from the connection info payloads.
+    Since they determine the kernel's liveness, only heartbeats sealed with the kernel's launch secret count.
+    """
+
+    _instance = None
+
+    def __init__(self, log):
+        super(ResponseManager, self).__init__()
+        self.log = log
+        self.io_loop = IOLoop.current()
+        self.response_address = None
+        self._pending_responses = {}  # kernel_id -> Future resolved with the kernel's connection info
+        self._heartbeats = {}  # kernel_id -> LauncherHeartbeat of monitored kernels, None until one is received
+        self._ciphers = {}  # kernel_id -> PayloadCipher of registered or monitored kernels
+        self._start_listening()
+
+    @classmethod
+    def instance(cls, log):
+        """Returns the response manager associated with the current IOLoop, creating it if necessary."""
+        if cls._instance is None or cls._instance.io_loop is not IOLoop.current():
+            if cls._instance is not None:
+                cls._instance.stop()
+            cls._instance = cls(log)
+        return cls._instance
+
+    def _start_listening(self):
+        """Binds the listener to the response port, trying subsequent ports if that port is in use."""
+        for port in range(response_port, response_port + response_port_retries + 1):
+            try:
+                sockets = bind_sockets(port, address=local_ip)
+            except OSError as e:
+                if e.errno != errno.EADDRINUSE:
+                    raise
+                self.log.debug("Response port {} is in use - trying next port...".format(port))
+                continue
+            self.add_sockets(sockets)
+            port = sockets[0].getsockname()[1]  # in case port 0 was specified
+            self.response_address = (local_ip if response_ip is None else response_ip) + ':' + str(port)
+            self.log.info("Listening for remote kernel responses on '{}'".format(self.response_address))
+            return
+        raise RuntimeError("Unable to bind response address - ports {} through {} are in use!".
+                           format(response_port, response_port + response_port_retries))
+
+    def register_kernel(self, kernel_id, secret=None):
+        """Indicates a response is expected from the launcher of the kernel with the given id, whose
+        payloads are sealed using `secret`.
+        """
+        self._pending_responses[kernel_id] = gen.Future()
+        self.monitor_kernel(kernel_id, secret)
+
+    def unregister_kernel(self, kernel_id):
+        """Indicates a response is no longer expected from the launcher of the kernel with the given id."""
+        self._pending_responses.pop(kernel_id, None)
+        if kernel_id not in self._heartbeats:
+            self._ciphers.pop(kernel_id, None)
+
+    def is_registered(self, kernel_id):
+        return kernel_id in self._pending_responses
+
+    def monitor_kernel(self, kernel_id, secret=None):
+        """Indicates heartbeats sealed using `secret` are to be accepted from the launcher of the kernel
+        with the given id.
+        """
+        self._heartbeats[kernel_id] = None
+        self._ciphers[kernel_id] = PayloadCipher(kernel_id, secret)
+
+    def forget_kernel(self, kernel_id):
+        """Indicates heartbeats from the launcher of the kernel with the given id are no longer of interest."""
+        self._heartbeats.pop(kernel_id, None)
+        if kernel_id not in self._pending_responses:
+            self._ciphers.pop(kernel_id, None)
+
+    def kernel_liveness(self, kernel_id, pid=0):
+        """Returns the liveness of the given kernel as conveyed by its launcher's heartbeats.
+
+        Returns
+        -------
+        bool : True if the launcher has sent a heartbeat within the last EG_HEARTBEAT_INTERVAL * 3 seconds,
+            False if it has reported the kernel's exit and None if the kernel's liveness is unknown - e.g.,
+            because the launcher doesn't send heartbeats, its heartbeats are late or its connection was lost.
+            Heartbeats are only considered if they're from the launcher with the given pid (when non-zero).
+        """
+        heartbeat = self._heartbeats.get(kernel_id)
+        if heartbeat is None or (pid and heartbeat.pid != pid):
+            return None
+        if heartbeat.time is None:
+            return False
+        if time.monotonic() - heartbeat.time > heartbeat_interval * max_missed_heartbeats:
+            return None
+        return True
+
+    @gen.coroutine
+    def wait_for_response(self, kernel_id, wait_time):
+        """Waits up to `wait_time` seconds for the connection info of the given kernel to be received.
+
+        Unlike `get_connection_info()`, the connection info is left in place for its subsequent retrieval.
+        """
+        future = self._pending_responses.get(kernel_id)
+        if future is None or future.done():
+            return
+        try:
+            yield gen.with_timeout(timedelta(seconds=wait_time), future)
+        except gen.TimeoutError:
+            pass
+
+    @gen.coroutine
+    def get_connection_info(self, kernel_id, wait_time):
+        """Waits up to `wait_time` seconds for the connection info of the given kernel.
+
+        Returns
+        -------
+        dict : the connection info sent by the kernel's launcher or None if it has not yet been received.
+        """
+        try:
+            connect_info = yield gen.with_timeout(timedelta(seconds=wait_time), self._pending_responses[kernel_id])
+        except gen.TimeoutError:
+            raise gen.Return(None)
+        self.unregister_kernel(kernel_id)
+        raise gen.Return(connect_info)
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        """Reads the payload sent by a kernel launcher and dispatches it to the corresponding pending launch."""
+        try:
+            data = yield stream.read_bytes(1)
+            if data == b'{':
+                yield self._read_heartbeats(stream, data, address)
+                return
+            if data[0] == handshake_version:
+                yield self._read_connection_info_frame(stream, address)
+                return
+            if not legacy_payloads_enabled:
+                raise ValueError("Legacy payloads are not allowed.")
+            data += yield self._read_legacy_payload(stream)
+            data = data.decode(encoding='utf-8')
+        except (StreamClosedError, ValueError) as e:
+            if not isinstance(e, StreamClosedError):
+                self.log.warning("Invalid payload received from '{}' - ignoring: {}".format(address[0], e))
+            return
+        finally:
+            stream.close()
+        self.log.debug("Received Payload '{}' from '{}'".format(data, address[0]))
+
+        for kernel_id, future in list(self._pending_responses.items()):
+            if future.done():
+                continue
+            try:
+                payload = self._cipher(kernel_id).decrypt_legacy(data)
+                connect_info = json.loads(payload)
+            except ValueError:  # not encrypted for this kernel
+                continue
+            if isinstance(connect_info, dict):
+                self.log.debug("Decrypted Payload '{}' for KernelID '{}'".format(payload, kernel_id))
+                future.set_result(connect_info)
+                return
+
+        self.log.warning("Payload received from '{}' does not correspond to any pending kernel launch - ignoring."
+                         .format(address[0]))
+
+    @gen.coroutine
+    def _read_legacy_payload(self, stream):
+        """Reads what we receive until the launcher closes its connection, bounded by max_frame_size."""
+        data = b''
+        while True:
+            try:
+                data += yield stream.read_bytes(max_frame_size, partial=True)
+            except StreamClosedError:
+                raise gen.Return(data)
+            if len(data) > max_frame_size:
+                raise ValueError("Payload size exceeds maximum of {}.".format(max_frame_size))
+
+    @gen.coroutine
+    def _read_connection_info_frame(self, stream, address):
+        """Reads the remainder of a version 2 connection info frame, following its version byte."""
+        buffer = bytearray(2)
+        yield stream.read_into(buffer)
+        kernel_id = bytearray(struct.unpack('>H', buffer)[0])
+        yield stream.read_into(kernel_id)
+        kernel_id = kernel_id.decode('utf-8')
+        buffer = bytearray(4)
+        yield stream.read_into(buffer)
+        size = struct.unpack('>I', buffer)[0]
+        if size > max_frame_size:
+            raise ValueError("Payload size ({}) exceeds maximum of {}.".format(size, max_frame_size))
+        sealed = bytearray(size)
+        yield stream.read_into(sealed)
+
+        future = self._pending_responses.get(kernel_id)
+        if future is None or future.done():
+            self.log.warning("Payload received from '{}' does not correspond to any pending kernel launch - "
+                             "ignoring.".format(address[0]))
+            return
+        payload = self._cipher(kernel_id).decrypt(sealed)
+        connect_info = json.loads(payload.decode('utf-8'))
+        if not isinstance(connect_info, dict):
+            raise ValueError("Connection info is not an object.")
+        self.log.debug("Decrypted Payload '{}' for KernelID '{}'".format(connect_info, kernel_id))
+        future.set_result(connect_info)
+
+    def _cipher(self, kernel_id):
+        cipher = self._ciphers.get(kernel_id)
+        if cipher is None:
+            cipher = self._ciphers[kernel_id] = PayloadCipher(kernel_id)
+        return cipher
+
+    @gen.coroutine
+    def _read_heartbeats(self, stream, data, address):
+        """Reads the heartbeats sent by a kernel launcher until the launcher closes its connection."""
+        try:
+            while True:
+                data += yield stream.read_until(b'\n', max_bytes=max_heartbeat_size)
+                self._record_heartbeat(data, stream, address)
+                data = b''
+        except (StreamClosedError, UnsatisfiableReadError):
+            pass
+        finally:
+            stream.close()
+            # Without an exit notification, the liveness of the kernels is unknown once the connection is lost
+            for kernel_id, heartbeat in list(self._heartbeats.items()):
+                if heartbeat is not None and heartbeat.stream is stream and heartbeat.time is not None:
+                    self._heartbeats[kernel_id] = None
+
+    def _record_heartbeat(self, data, stream, address):
+        """Records a heartbeat (or exit notification) of a monitored kernel, ignoring those that can't be
+        authenticated using the kernel's launch secret.
+        """
+        try:
+            message = json.loads(data.decode(encoding='utf-8'))
+            kernel_id = message['kernel_id']
+            if kernel_id not in self._heartbeats:
+                return
+            if message.get('version') != handshake_version:
+                raise ValueError("Heartbeats must be sealed with the kernel's launch secret.")
+            payload = base64.b64decode(message['payload'])
+            event = json.loads(self._cipher(kernel_id).decrypt(payload, b'heartbeat').decode('utf-8'))
+            if event.get('kernel_id') != kernel_id:
+                raise ValueError("kernel_id mismatch")
+            pid = int(event.get('pid') or 0)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            self.log.warning("Invalid heartbeat received from '{}' - ignoring.".format(address[0]))
+            return
+
+        if event.get('event') == 'exit':
+            self.log.debug("Launcher of KernelID '{}' (pid {}) reported the kernel's exit.".format(kernel_id, pid))
+            self._heartbeats[kernel_id] = LauncherHeartbeat(pid, None, stream)
+        else:
+            self._heartbeats[kernel_id] = LauncherHeartbeat(pid, time.monotonic(), stream)
+
+
+class SSHClientPool(object):
+    """Maintains authenticated SSH connections, keyed by host, on behalf of all process proxies.
+
+    Commands are executed over channels multiplexed on a host's connection, so only the first command
+    issued against a host incurs the cost of establishing the connection.  Connections found to be inactive
+    are replaced, while those idle for more than EG_SSH_IDLE_TIMEOUT seconds are closed.  No more than
+    EG_SSH_MAX_CONNECTIONS idle connections are retained - the least recently used being closed first.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._connections = OrderedDict()  # host -> [ssh client, number of active users, time last used]
+
+    def acquire(self, host, connect):
+        """Returns an active ssh client for `host`, using `connect(host)` to establish one if necessary.
+
+        Each call must be followed by a corresponding call to `release()`.
+        """
+        with self._lock:
+            self._evict_idle()
+            connection = self._connections.get(host)
+            if connection and not SSHClientPool._is_active(connection[0]):
+                if connection[1] == 0:  # otherwise, its last user will close it upon release
+                    connection[0].close()
+                del self._connections[host]
+                connection = None
+            if connection:
+                connection[1] += 1
+                connection[2] = time.time()
+                self._connections.move_to_end(host)
+                return connection[0]
+
+        ssh = connect(host)  # establish connection outside of lock so other hosts are not held up
+        with self._lock:
+            connection = self._connections.get(host)
+            if connection:  # another thread established a connection in the meantime, use it instead
+                ssh.close()
+                connection[1] += 1
+                connection[2] = time.time()
+                return connection[0]
+            self._connections[host] = [ssh, 1, time.time()]
+            self._evict_lru()
+        return ssh
+
+    def release(self, host, ssh, discard=False):
+        """Returns the use of `ssh` to the pool.  If `discard` is True, its connection will not be reused."""
+        with self._lock:
+            connection = self._connections.get(host)
+            if connection is None or connection[0] is not ssh:  # no longer pooled (replaced or evicted)
+                ssh.close()
+                return
+            connection[1] -= 1
+            connection[2] = time.time()
+            if discard:
+                del self._connections[host]
+                if connection[1] == 0:
+                    ssh.close()
+            else:
+                self._evict_lru()
+
+    def _evict_idle(self):
+        now = time.time()
+        for host, connection in list(self._connections.items()):
+            if connection[1] == 0 and now - connection[2] > ssh_idle_timeout:
+                connection[0].close()
+                del self._connections[host]
+
+    def _evict_lru(self):
+        idle_hosts = [host for host, connection in self._connections.items() if connection[1] == 0]
+        while len(idle_hosts) > ssh_max_connections:
+            self._connections.pop(idle_hosts.pop(0))[0].close()
+
+    @staticmethod
+    def _is_active(ssh):
+        transport = ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+
+ssh_client_pool = SSHClientPool()
+
+
+class SSHTunnel(object):
+    """A local port forwarded to a remote port via the SSHTunnelRegistry.
+
+    Each tunnel has a thread that accepts connections on the tunnel's listener and forwards them over channels
+    of its server's SSH connection.  Since only that thread uses the listener and the connections, opening a
+    channel or sending to a slow peer stalls nothing but the tunnel involved.
+    """
+
+    def __init__(self, server, client, listener, remote_ip, remote_port, log):
+        self.server = server
+        self.client = client
+        self.listener = listener
+        self.remote_ip = remote_ip
+        self.remote_port = remote_port
+        self.log = log
+        self.closed = False
+        self._peers = {}  # socket or channel -> peer socket or channel, for each connection accepted on the listener
+        self._wakeup_reader, self._wakeup_writer = socketpair()
+        self._thread = Thread(target=self._run, name='SSHTunnel-{}'.format(listener.getsockname()[1]))
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def terminate(self):
+        """Closes the tunnel, along with any of its connections."""
+        ssh_tunnel_registry.close_tunnel(self)
+
+    def close(self):
+        # Has the tunnel's thread close the listener and connections, then exit.
+        self.closed = True
+        try:
+            self._wakeup_writer.send(b'x')
+        except OSError:
+            pass
+
+    def _run(self):
+        try:
+            while not self.closed:
+                readers = [self._wakeup_reader, self.listener] + list(self._peers.keys())
+                readable, _, _ = select.select(readers, [], [])
+                for r in readable:
+                    if r is self._wakeup_reader:
+                        r.recv(1024)
+                    elif r is self.listener:
+                        self._accept()
+                    elif r in self._peers:
+                        self._forward(r)
+        except Exception as e:
+            if not self.closed:
+                self.log.warning("Tunnel to '{}:{}' via '{}' failed: {}".
+                                 format(self.remote_ip, self.remote_port, self.server, e))
+        finally:
+            self.listener.close()
+            for sock in list(self._peers.keys()):
+                self._close_connection(sock)
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
+
+    def _accept(self):
+        # Accepts a connection on the listener and opens the channel to which it is forwarded.
+        sock, address = self.listener.accept()
+        try:
+            channel = self.client.get_transport().open_channel('direct-tcpip', (self.remote_ip, self.remote_port),
+                                                               address)
+        except Exception as e:
+            self.log.warning("Unable to open tunneled connection to '{}:{}' via '{}': {}".
+                             format(self.remote_ip, self.remote_port, self.server, e))
+            sock.close()
+            return
+        self._peers[sock] = channel
+        self._peers[channel] = sock
+
+    def _forward(self, r):
+        try:
+            data = r.recv(32768)
+            if data:
+                self._peers[r].sendall(data)
+        except OSError:
+            data = None
+        if not data:
+            self._close_connection(r)
+
+    def _close_connection(self, sock):
+        # Closes the local socket and the channel comprising one of the tunnel's connections.
+        peer = self._peers.pop(sock, None)
+        if peer is not None:
+            self._peers.pop(peer, None)
+            sock.close()
+            peer.close()
+
+
+class SSHTunnelRegistry(object):
+    """Forwards the tunneled ports of all kernels over a single SSH connection per remote host.
+
+    Rather than spawning an ssh process for each tunneled port, each tunnel listens on its local port and
+    forwards accepted connections over channels of the SSH connection to the tunnel's server (see SSHTunnel).
+    Connections are established without holding the registry's lock, so a slow handshake with one server
+    doesn't delay tunnels to others.  The SSH connection to a server is closed once its last tunnel has been
+    closed.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._clients = {}  # server -> current ssh client
+        self._users = {}  # ssh client -> number of tunnels using the client
+        self._tunnels = set()
+
+    def open_tunnel(self, local_port, remote_ip, remote_port, server, connect, log):
+        """Opens a tunnel from 127.0.0.1:`local_port` to `remote_ip`:`remote_port` via `server`.
+
+        If no connection to `server` exists, `connect(server)` is used to obtain an ssh client.
+        """
+        listener = socket(AF_INET, SOCK_STREAM)
+        try:
+            listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            listener.bind(('127.0.0.1', local_port))  # prior to connecting, so a failure doesn't leak a client
+            listener.listen(5)
+            client = self._acquire_client(server, connect)
+        except Exception:
+            listener.close()
+            raise
+        try:
+            tunnel = SSHTunnel(server, client, listener, remote_ip, remote_port, log)
+            with self._lock:
+                self._tunnels.add(tunnel)
+            tunnel.start()
+        except Exception:
+            listener.close()
+            self._release_client(server, client)
+            raise
+        return tunnel
+
+    def close_tunnel(self, tunnel):
+        """Closes the given tunnel and, if it's the last tunnel to its server, the connection to the server."""
+        with self._lock:
+            if tunnel not in self._tunnels:
+                return  # already closed
+            self._tunnels.discard(tunnel)
+        tunnel.close()
+        self._release_client(tunnel.server, tunnel.client)
+
+    def _acquire_client(self, server, connect):
+        # Returns an active ssh client for the server, counting the caller as one of its users.
+        with self._lock:
+            client = self._clients.get(server)
+            if client is not None and SSHClientPool._is_active(client):
+                self._users[client] += 1
+                return client
+
+        client = connect(server)
+        surplus = None
+        with self._lock:
+            current = self._clients.get(server)
+            if current is not None and SSHClientPool._is_active(current):  # connected concurrently - use that
+                surplus, client = client, current
+            else:
+                self._clients[server] = client  # a replaced client is closed once its tunnels are closed
+            self._users[client] = self._users.get(client, 0) + 1
+        if surplus is not None:
+            surplus.close()
+        return client
+
+    def _release_client(self, server, client):
+        with self._lock:
+            self._users[client] -= 1
+            if self._users[client] > 0:
+                return
+            del self._users[client]
+            if self._clients.get(server) is client:
+                del self._clients[server]
+        client.close()
+
+
+ssh_tunnel_registry = SSHTunnelRegistry()
+
+
+class PortAllocator(object):
+    """Allocates the local ports used by kernels (and their tunnels) on behalf of all process proxies.
+
+    Ports handed out remain reserved by their owning kernel until released - typically when the kernel is
+    cleaned up - so the ports of a kernel are never handed to another kernel in the interim, even though
+    the socket used to select a port is closed before the kernel binds it.  Reservations are tracked in a
+    bitmap covering all ports, while each port range maintains a queue of candidate ports, so allocation
+    doesn't depend on the number of ports already reserved.  Released ports are queued behind the other
+    candidates of their range(s), delaying their reuse for as long as possible.  When no port range is
+    configured (0..0), the system selects the port and only the reservation is tracked.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._reserved = bytearray(65536 // 8)  # bitmap of reserved ports
+        self._ranges = {}  # (lower, upper) -> PortRange
+        self._owners = {}  # owner (kernel_id) -> set of reserved ports
+
+    def allocate(self, owner, lower_port=0, upper_port=0, ip=''):
+        """Returns a socket bound to a port within `lower_port`..`upper_port` that is reserved by `owner`.
+
+        RuntimeError is raised if all ports in the range are reserved or in use by other processes.
+        """
+        with self._lock:
+            if upper_port - lower_port == 0:
+                sock = self._allocate_unranged(ip)
+            else:
+                sock = self._range(lower_port, upper_port).allocate(self, ip)
+            self._reserve(owner, sock.getsockname()[1])
+        return sock
+
+    def reserve(self, owner, ports):
+        """Reserves the given ports on behalf of `owner` (e.g., those of a revived kernel)."""
+        with self._lock:
+            for port in ports:
+                if port and not self.is_reserved(port):
+                    self._reserve(owner, port)
+
+    def release(self, owner, ports=None):
+        """Releases the given ports reserved by `owner` or, if no ports are given, all of its ports."""
+        with self._lock:
+            owned = self._owners.get(owner)
+            if not owned:
+                return
+            for port in list(owned if ports is None else ports):
+                if port not in owned:
+                    continue
+                owned.discard(port)
+                self._reserved[port >> 3] &= ~(1 << (port & 7))
+                for port_range in self._ranges.values():
+                    if port_range.lower_port <= port <= port_range.upper_port:
+                        port_range.release(port)
+            if not owned:
+                del self._owners[owner]
+
+    def is_reserved(self, port):
+        return bool(self._reserved[port >> 3] & (1 << (port & 7)))
+
+    def get_stats(self):
+        """Returns the number of reserved ports and the utilization of each port range."""
+        with self._lock:
+            return {
+                'reserved': sum(len(ports) for ports in self._owners.values()),
+                'kernels': len(self._owners),
+                'ranges': {'{}..{}'.format(*key): port_range.get_stats() for key, port_range in self._ranges.items()},
+            }
+
+    def _range(self, lower_port, upper_port):
+        port_range = self._ranges.get((lower_port, upper_port))
+        if port_range is None:
+            port_range = self._ranges[(lower_port, upper_port)] = PortRange(lower_port, upper_port)
+            for port in range(lower_port, upper_port + 1):  # account for reservations made via other ranges
+                if self.is_reserved(port):
+                    port_range.reserved += 1
+        return port_range
+
+    def _reserve(self, owner, port):
+        self._reserved[port >> 3] |= 1 << (port & 7)
+        self._owners.setdefault(owner, set()).add(port)
+        for port_range in self._ranges.values():
+            if port_range.lower_port <= port <= port_range.upper_port:
+                port_range.reserved += 1
+
+    def _allocate_unranged(self, ip):
+        # Let the system select the port, holding on to any (recently released) port that's still reserved
+        # so that it isn't selected again.
+        held = []
+        try:
+            for attempt in range(max_port_range_retries + 1):
+                sock = socket(AF_INET, SOCK_STREAM)
+                try:
+                    sock.bind((ip, 0))
+                except Exception:
+                    sock.close()
+                    raise
+                if not self.is_reserved(sock.getsockname()[1]):
+                    return sock
+                held.append(sock)
+        finally:
+            for sock in held:
+                sock.close()
+        raise RuntimeError("No unreserved port was selected after {} retries.".format(max_port_range_retries))
+
+
+class PortRange(object):
+    """The candidate ports of a port range managed by the PortAllocator.
+
+    Candidates are queued in random order.  A candidate that's found to be reserved (via an overlapping
+    range or a revived kernel) is dropped, while one that's in use by another process is moved to the back
+    of the queue.
+    """
+
+    def __init__(self, lower_port, upper_port):
+        self.lower_port = lower_port
+        self.upper_port = upper_port
+        self.reserved = 0
+        self.bind_failures = 0
+        ports = list(range(lower_port, upper_port + 1))
+        random.shuffle(ports)
+        self._candidates = deque(ports)
+
+    def allocate(self, allocator, ip):
+        sock = socket(AF_INET, SOCK_STREAM)
+        try:
+            for attempt in range(len(self._candidates)):
+                port = self._candidates.popleft()
+                if allocator.is_reserved(port):
+                    continue
+                try:
+                    sock.bind((ip, port))
+                    return sock
+                except OSError:
+                    self.bind_failures += 1
+                    self._candidates.append(port)
+        except Exception:
+            sock.close()
+            raise
+        sock.close()
+        raise RuntimeError("{} of its {} ports are reserved and the remainder are in use.".
+                           format(self.reserved, self.size))
+
+    def release(self, port):
+        self.reserved -= 1
+        self._candidates.append(port)
+
+    @property
+    def size(self):
+        return self.upper_port - self.lower_port + 1
+
+    def get_stats(self):
+        return {
+            'size': self.size,
+            'reserved': self.reserved,
+            'utilization': round(float(self.reserved) / self.size, 4),
+            'bind_failures': self.bind_failures,
+        }
+
+
+port_allocator = PortAllocator()
+
+
+class BackendExecutor(object):
+    """A bounded thread pool on which the blocking calls against a single backend are run.
+
+    Calls waiting for one of the pool's threads are reflected in the `backend_call_queue_depth` gauge, while
+    the time they waited and the duration of each call are captured in the `backend_call_queue_seconds` and
+    `backend_call_duration_seconds` histograms.
+    """
+
+    def __init__(self, backend, max_workers):
+        self.backend = backend
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='EG-' + backend)
+
+    def submit(self, func, *args, **kwargs):
+        """Runs `func(*args, **kwargs)` on the pool, returning a future that resolves to its result."""
+        BACKEND_CALL_QUEUE_DEPTH.labels(self.backend).inc()
+        return IOLoop.current().run_in_executor(self._executor, partial(self._run, time.monotonic(), func,
+                                                                        args, kwargs))
+
+    def _run(self, submit_time, func, args, kwargs):
+        start_time = time.monotonic()
+        BACKEND_CALL_QUEUE_DEPTH.labels(self.backend).dec()
+        BACKEND_CALL_QUEUE_SECONDS.labels(self.backend).observe(start_time - submit_time)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            call = getattr(getattr(func, 'func', func), '__name__', 'unknown')  # unwrap partials
+            BACKEND_CALL_DURATION_SECONDS.labels(self.backend, call).observe(time.monotonic() - start_time)
+
+
+class BackendExecutors(object):
+    """The executors of the backends against which process proxies issue blocking calls.
+
+    Each backend (e.g., 'yarn', 'kubernetes', 'ssh') is serviced by its own pool of EG_BACKEND_POOL_SIZE
+    threads - or the size specified for the backend via EG_BACKEND_POOL_SIZES - so that an unresponsive
+    backend cannot starve the calls against others.
+    """
+
+    def __init__(self, default_size, sizes=''):
+        self.default_size = default_size
+        self.sizes = {}
+        for entry in sizes.split(','):
+            if entry.strip():
+                backend, size = entry.split(':')
+                self.sizes[backend.strip()] = int(size)
+        self._lock = Lock()
+        self._executors = {}  # backend -> BackendExecutor
+
+    def get(self, backend):
+        """Returns the executor of the given backend, creating it if necessary."""
+        with self._lock:
+            if backend not in self._executors:
+                self._executors[backend] = BackendExecutor(backend, self.sizes.get(backend, self.default_size))
+            return self._executors[backend]
+
+    def submit(self, backend, func, *args, **kwargs):
+        """Runs `func(*args, **kwargs)` on the executor of the given backend."""
+        return self.get(backend).submit(func, *args, **kwargs)
+
+
+backend_executors = BackendExecutors(backend_pool_size, backend_pool_sizes)
+
+
+def open_pidfd(pid):
+    """Returns a pidfd referencing the given process, or None if pidfds are not supported (prior to Linux 5.3).
+
+    ProcessLookupError is raised if the process does not exist.
+    """
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except ProcessLookupError:
+        raise
+    except OSError:
+        return None
+
+
+def has_exited(pid):
+    """Returns True if the given process has exited - including terminated children yet to be reaped."""
+    try:
+        return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None  # doesn't reap
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:  # exists, but belongs to another user
+        pass
+    return False
+
+
+class ProcessExitWatcher(object):
+    """Detects the exit of local processes as it occurs, rather than by periodically polling them.
+
+    Where supported, each watched process is referenced by a pidfd - which becomes readable once the process
+    exits - registered with the IOLoop, so the futures awaiting the exit are resolved immediately.  Blocking
+    waits select on a pidfd of their own.  Without pidfd support, the processes are checked every
+    EG_MIN_POLL_INTERVAL seconds.  The watcher neither reaps processes nor handles SIGCHLD, so it doesn't
+    interfere with the Popen instances of child processes.
+    """
+
+    def __init__(self):
+        self._watches = {}  # pid -> (pidfd or None, list of futures awaiting the exit)
+
+    def watch(self, pid):
+        """Returns a future resolved once the given process exits.  Must be called from the IOLoop's thread."""
+        future = gen.Future()
+        if pid in self._watches:
+            self._watches[pid][1].append(future)
+            return future
+        try:
+            fd = open_pidfd(pid)
+        except ProcessLookupError:
+            future.set_result(None)
+            return future
+        self._watches[pid] = (fd, [future])
+        if fd is not None:
+            IOLoop.current().add_handler(fd, lambda fd, events: self._exited(pid), IOLoop.READ)
+        else:
+            IOLoop.current().call_later(min_poll_interval, self._check, pid)
+        return future
+
+    def unwatch(self, pid, future):
+        """Discards the given future (returned by `watch()`), no longer watching the process if it was the last."""
+        fd, futures = self._watches.get(pid, (None, []))
+        if future in futures:
+            futures.remove(future)
+            if not futures:
+                self._remove(pid)
+
+    def wait(self, pid, timeout):
+        """Blocks until the given process exits or `timeout` seconds have elapsed, returning True if it exited."""
+        try:
+            fd = open_pidfd(pid)
+        except ProcessLookupError:
+            return True
+        if fd is None:
+            deadline = time.monotonic() + timeout
+            while not has_exited(pid):
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(min_poll_interval)
+            return True
+        try:
+            readable, _, _ = select.select([fd], [], [], timeout)
+            return bool(readable)
+        finally:
+            os.close(fd)
+
+    def _check(self, pid):
+        if pid in self._watches:
+            if has_exited(pid):
+                self._exited(pid)
+            else:
+                IOLoop.current().call_later(min_poll_interval, self._check, pid)
+
+    def _exited(self, pid):
+        for future in self._remove(pid):
+            if not future.done():
+                future.set_result(None)
+
+    def _remove(self, pid):
+        fd, futures = self._watches.pop(pid, (None, []))
+        if fd is not None:
+            IOLoop.current().remove_handler(fd)
+            os.close(fd)
+        return futures
+
+
+process_exit_watcher = ProcessExitWatcher()
+
+
+class LauncherRequestError(Exception):
+    """Raised when a kernel launcher reports the failure of a request sent over its control channel."""
+    pass
+
+
+class LauncherChannel(object):
+    """A persistent connection (control channel) to the communication port of a kernel launcher.
+
+    Requests are sent as frames consisting of a 4-byte (big-endian) length followed by a JSON object.  Each
+    request bears an id, which the launcher echoes in the frame acknowledging the request once performed.
+    Launchers advertise their support for the control channel via `comm_protocol` in their connection info.
+    """
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self._sock = None
+        self._last_request_id = 0
+        self._lock = Lock()
+
+    def request(self, request, timeout=socket_timeout):
+        """Sends `request` to the launcher, returning the launcher's acknowledgement.
+
+        Should the connection have been lost since the previous request, it is re-established before the
+        request is sent.  A request is sent again only if its frame could not be written - once written, the
+        launcher may have performed it (e.g., delivered a signal), so a lost acknowledgement is raised instead.
+        LauncherRequestError is raised if the launcher reports a failure.
+        """
+        with self._lock:
+            self._last_request_id += 1
+            request = dict(request, id=self._last_request_id)
+            if self._sock is not None and not self._is_connected():
+                self._close()
+            retry = self._sock is not None
+            while True:
+                try:
+                    if self._sock is None:
+                        self._sock = create_connection((self.ip, self.port), timeout=timeout)
+                    self._sock.settimeout(timeout)
+                    self._send_frame(request)
+                except OSError:
+                    self._close()
+                    if not retry:
+                        raise
+                    retry = False
+                    continue
+                try:
+                    reply = self._receive_reply(request['id'])
+                    break
+                except (OSError, ValueError):
+                    self._close()
+                    raise
+
+        if reply.get('status') != 'ok':
+            raise LauncherRequestError(reply.get('message', "Request failed: {}".format(request)))
+        return reply
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _is_connected(self):
+        """Returns False if the launcher has closed the connection since the previous request."""
+        self._sock.settimeout(0)  # otherwise the socket waits (up to its timeout) for data to peek at
+        try:
+            return self._sock.recv(1, MSG_PEEK) != b''
+        except BlockingIOError:
+            return True  # nothing pending, the connection is idle
+        except OSError:
+            return False
+
+    def _send_frame(self, message):
+        data = json.dumps(message).encode(encoding='utf-8')
+        self._sock.sendall(struct.pack('>I', len(data)) + data)
+
+    def _receive_reply(self, request_id):
+        """Receives the acknowledgement of the given request, skipping those of requests that timed out."""
+        while True:
+            size = struct.unpack('>I', self._receive(4))[0]
+            if size > max_frame_size:
+                raise ValueError("Frame size ({}) exceeds maximum of {}.".format(size, max_frame_size))
+            reply = json.loads(self._receive(size).decode(encoding='utf-8'))
+            if reply.get('id') == request_id:
+                return reply
+
+    def _receive(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            count = self._sock.recv_into(view[received:], size - received)
+            if count == 0:
+                raise ConnectionError("Connection closed by kernel launcher.")
+            received += count
+        return data
+
+
 class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
     """Process Proxy Abstract Base Class.
 
@@ -101,6 +1143,9 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
     by these methods - common to all subclasses.
     """
 
+    # The backend against which the process proxy issues blocking calls (see run_in_backend()).
+    backend = 'local'
+
     def __init__(self, kernel_manager, proxy_config):
         """Initialize the process proxy instance.
 
@@ -148,6 +1193,12 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         self.ip = None
         self.pid = 0
         self.pgid = 0
+        self._pidfd = None  # (pid, fd) of the pidfd used to signal a local process in the absence of local_proc
+        self._pidfd_lock = Lock()
+
+        # Launch phase timings (see record_launch_phase()) are relative to the creation of the process proxy.
+        self.launch_start_time = self.launch_phase_time = time.time()
+        self.launch_phases = OrderedDict()
 
     @abc.abstractmethod
     def launch_process(self, kernel_cmd, **kwargs):
@@ -155,7 +1206,8 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
 
         All overrides should call this method via `super()` so that basic/common operations can be
         performed.  Leaf class implementations are required to perform the actual process launch
-        depending on the type of process proxy.
+        depending on the type of process proxy and must be coroutines (resolving to the process proxy
+        instance) so that awaiting the kernel's startup does not block the IOLoop.
 
         Parameters
         ----------
@@ -189,13 +1241,19 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
             env_dict.pop(k, None)
 
         self._enforce_authorization(**kwargs)
-        self._enforce_limits(**kwargs)
 
         self.log.debug("BaseProcessProxy.launch_process() env: {}".format(kwargs.get('env')))
 
     def cleanup(self):
         """Performs optional cleanup after kernel is shutdown.  Child classes are responsible for implementations."""
-        pass
+        with self._pidfd_lock:
+            self._close_pidfd()
+
+    def relinquish(self):
+        """Releases the local resources of the process proxy - without terminating the kernel - once another
+        Enterprise Gateway instance has taken ownership of the kernel.  By default, this performs cleanup().
+        """
+        self.cleanup()
 
     def poll(self):
         """Determines if process proxy is still alive.
@@ -211,11 +1269,17 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
     def wait(self):
         """Wait for the process to become inactive."""
         # If we have a local_proc, call its wait method.  This will cleanup any defunct processes when the kernel
-        # is shutdown (when using waitAppCompletion = false).  Otherwise (if no local_proc) we'll use polling to
-        # determine if a (remote or revived) process is still active.
+        # is shutdown (when using waitAppCompletion = false).  The exit of other local processes is awaited via the
+        # process exit watcher, while polling is used to determine if a remote process is still active.
         if self.local_proc:
             return self.local_proc.wait()
 
+        if self.get_local_pid():
+            if not self.wait_for_exit(max_poll_attempts * poll_interval):
+                self.log.warning("Wait timeout of {} seconds exhausted. Continuing...".
+                                 format(max_poll_attempts * poll_interval))
+            return
+
         for i in range(max_poll_attempts):
             if self.poll():
                 time.sleep(poll_interval)
@@ -261,11 +1325,7 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         """
         # If we have a local process, use its method, else signal soft kill first before hard kill.
         result = self.terminate()  # Send -15 signal first
-        i = 1
-        while self.poll() is None and i <= max_poll_attempts:
-            time.sleep(poll_interval)
-            i = i + 1
-        if i > max_poll_attempts:  # Send -9 signal if process is still alive
+        if not self.wait_for_exit(max_poll_attempts * poll_interval):  # Send -9 signal if process is still alive
             if self.local_proc:
                 result = self.local_proc.kill()
                 self.log.debug("BaseProcessProxy.kill(): {}".format(result))
@@ -298,6 +1358,83 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
                 self.log.debug("SIGTERM signal sent to pid: {}".format(self.pid))
         return result
 
+    def get_local_pid(self):
+        """Returns the pid of the kernel's process if it's local to this server, None otherwise."""
+        if self.local_proc:
+            return self.local_proc.pid
+        if self.ip and self.pid > 0 and BaseProcessProxyABC.ip_is_local(self.ip):
+            return self.pid
+        return None
+
+    def wait_for_exit(self, timeout):
+        """Waits up to `timeout` seconds for the kernel's process to exit, returning True if it has exited.
+
+        The exit of a local process is detected as it occurs (see ProcessExitWatcher) and the process is reaped
+        if it's a child of this server.  Remote processes are polled every EG_POLL_INTERVAL seconds.
+        """
+        if self.local_proc and self.local_proc.poll() is not None:  # already reaped, its pid may have been reused
+            return True
+        pid = self.get_local_pid()
+        if pid is None:
+            deadline = time.monotonic() + timeout
+            while self.poll() is None:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(poll_interval)
+            return True
+
+        exited = process_exit_watcher.wait(pid, timeout)
+        if exited:
+            self._reap_exited()
+        return exited
+
+    @gen.coroutine
+    def await_exit(self, timeout=max_poll_attempts * poll_interval):
+        """Waits up to `timeout` seconds for the kernel's process to exit without blocking the IOLoop, resolving
+        to True if it has exited.
+
+        This is the coroutine form of wait_for_exit().  The exit of a local process is awaited via the process
+        exit watcher, while remote processes are polled, on the executor of the process proxy's backend, every
+        EG_POLL_INTERVAL seconds.
+        """
+        if self.local_proc and self.local_proc.poll() is not None:  # already reaped, its pid may have been reused
+            raise gen.Return(True)
+        pid = self.get_local_pid()
+        if pid is None:
+            deadline = IOLoop.current().time() + timeout
+            while True:
+                result = yield self.run_in_backend(self.poll)
+                if result is not None:
+                    raise gen.Return(True)
+                if IOLoop.current().time() >= deadline:
+                    raise gen.Return(False)
+                yield gen.sleep(poll_interval)
+
+        exit_future = process_exit_watcher.watch(pid)
+        try:
+            yield gen.with_timeout(timedelta(seconds=timeout), exit_future)
+        except gen.TimeoutError:
+            process_exit_watcher.unwatch(pid, exit_future)
+            raise gen.Return(False)
+        self._reap_exited()
+        raise gen.Return(True)
+
+    def _reap_exited(self):
+        # Reaps the exited process if it's a child of this server.
+        if self.local_proc:
+            self.local_proc.poll()
+        else:
+            with self._pidfd_lock:
+                self._reap()
+
+    def run_in_backend(self, func, *args, **kwargs):
+        """Runs the blocking call `func(*args, **kwargs)` on the executor of the process proxy's backend.
+
+        Coroutines yield the returned future so that requests against resource managers, remote shells
+        and signals do not block the IOLoop.
+        """
+        return backend_executors.submit(self.backend, func, *args, **kwargs)
+
     @staticmethod
     def ip_is_local(ip):
         """Returns True if `ip` is considered local to this server, False otherwise."""
@@ -307,6 +1444,7 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         """
         Create a SSH Client based on host, username and password if provided.
         If there is any AuthenticationException/SSHException, raise HTTP Error 403 as permission denied.
+        Note that clients used by `rsh()` are obtained from (and retained by) the SSH client pool.
 
         :param host:
         :return: ssh client instance
@@ -335,7 +1473,7 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
             self.log_and_raise(http_status_code=http_status_code, reason=error_message)
         return ssh
 
-    def rsh(self, host, command):
+    def rsh(self, host, command, input=None):
         """Executes a command on a remote host using ssh.
 
         Parameters
@@ -344,25 +1482,32 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
             The host on which the command is executed.
         command : str
             The command to execute.
+        input : str, optional
+            Written to the command's stdin, which is then closed.  Used to convey values (e.g., secrets) that
+            must not appear on the remote command line.
 
         Returns
         -------
         lines : List
             The command's output.  If stdout is zero length, the stderr output is returned.
         """
-        ssh = self._get_ssh_client(host)
+        ssh = ssh_client_pool.acquire(host, self._get_ssh_client)
+        discard = False
         try:
             stdin, stdout, stderr = ssh.exec_command(command, timeout=30)
+            if input is not None:
+                stdin.write(input)
+                stdin.channel.shutdown_write()
             lines = stdout.readlines()
             if len(lines) == 0:  # if nothing in stdout, return stderr
                 lines = stderr.readlines()
         except Exception as e:
-            # Let caller decide if exception should be logged
+            # Let caller decide if exception should be logged, but don't reuse a possibly broken connection
+            discard = True
             raise e
 
         finally:
-            if ssh:
-                ssh.close()
+            ssh_client_pool.release(host, ssh, discard=discard)
 
         return lines
 
@@ -390,20 +1535,78 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         return False
 
     def local_signal(self, signum):
-        """Sends signal `signum` to local process."""
+        """Sends signal `signum` to local process.
+
+        Signals are sent in-process.  Where supported (Linux 5.3+), the process is referenced via a pidfd,
+        so the signal cannot reach another process that has since been assigned the pid, and liveness (signal 0)
+        is determined from the pidfd's readability.  Should the process be a terminated child of this server,
+        it's reaped.  A process that exists but cannot be signaled by this server (EPERM) - e.g., one running as
+        another user - is considered alive.
+        """
         # if we have a process group, use that, else use the pid...
         target = '-' + str(self.pgid) if self.pgid > 0 and signum > 0 else str(self.pid)
         if signum > 0:  # only log if meaningful signal (not for poll)
             self.log.debug("Sending signal: {} to target: {}".format(signum, target))
 
-        cmd = ['kill', '-' + str(signum), target]
+        with self._pidfd_lock:
+            if self._reap():
+                return False
+            pidfd = self._get_pidfd()
+            try:
+                if signum == 0 and pidfd is not None:
+                    readable, _, _ = select.select([pidfd], [], [], 0)  # readable once the process has exited
+                    return False if readable else None
+                if self.pgid > 0 and signum > 0:
+                    os.killpg(self.pgid, signum)
+                elif pidfd is not None:
+                    signal.pidfd_send_signal(pidfd, signum)
+                else:
+                    os.kill(self.pid, signum)
+            except OSError as e:
+                if e.errno == errno.EPERM:
+                    if signum == 0:  # the process exists, but belongs to another user
+                        return None
+                    self.log.warning("Signal ({}) to target: {} is not permitted for user '{}'.".
+                                     format(signum, target, getpass.getuser()))
+                elif e.errno == errno.ESRCH:
+                    if signum > 0:
+                        self.log.debug("Signal ({}) target: {} no longer exists.".format(signum, target))
+                else:
+                    self.log.warning("Signal ({}) to target: {} failed with exception '{}'.".format(signum, target, e))
+                return False
+        return None
 
-        with open(os.devnull, 'w') as devnull:
-            result = subprocess.call(cmd, stderr=devnull)
+    def _reap(self):
+        """Reaps the (local) process if it's a terminated child of this server, returning True if reaped."""
+        if self.pid <= 0:  # waitpid() would otherwise reap any child
+            return False
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+        except OSError:  # not a child (ECHILD)
+            return False
+        if pid == 0:
+            return False
+        self.log.debug("Reaped local process {} (status: {}).".format(pid, status))
+        self._close_pidfd()
+        return True
+
+    def _get_pidfd(self):
+        """Returns a pidfd referencing the process with the current pid, or None if pidfds are not supported."""
+        if self._pidfd is not None and self._pidfd[0] != self.pid:
+            self._close_pidfd()
+        if self._pidfd is None and self.pid > 0:
+            try:
+                fd = open_pidfd(self.pid)
+            except ProcessLookupError:  # will be reflected by the signal
+                return None
+            if fd is not None:
+                self._pidfd = (self.pid, fd)
+        return self._pidfd[1] if self._pidfd else None
 
-        if result == 0:
-            return None
-        return False
+    def _close_pidfd(self):
+        if self._pidfd is not None:
+            os.close(self._pidfd[1])
+            self._pidfd = None
 
     def _enforce_authorization(self, **kwargs):
         """Applies any authorization configuration using the kernel user.
@@ -420,6 +1623,9 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
 
         It is assumed that the kernelspec logic will take the appropriate steps to impersonate the user identified
         by KERNEL_USERNAME when impersonation_enabled is True.
+
+        Kernels started on behalf of a warm kernel pool have no user yet, so their authorization is deferred
+        until they're claimed (see `authorize()`).
         """
         # Get the env
         env_dict = kwargs.get('env')
@@ -431,7 +1637,11 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         # Ensure KERNEL_USERNAME is set
         kernel_username = KernelSessionManager.get_kernel_username(**kwargs)
 
-        # Now perform authorization checks
+        if not self.kernel_manager.authorization_deferred:
+            self.authorize(kernel_username)
+
+    def authorize(self, kernel_username):
+        """Raises HTTP error 403 (Forbidden) if the given user is not authorized to use this kernel."""
         if kernel_username in self.unauthorized_users:
             self._raise_authorization_error(kernel_username, "not authorized")
 
@@ -449,21 +1659,30 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
             format(kernel_username, differentiator_clause, kernel_clause)
         self.log_and_raise(http_status_code=403, reason=error_message)
 
-    def _enforce_limits(self, **kwargs):
-        """Enforces any limits that may be imposed by the configuration."""
-
-        # if kernels-per-user is configured, ensure that this next kernel is still within the limit.  If this
-        # is due to a restart, skip enforcement since we're re-using that id.
-        max_kernels_per_user = self.kernel_manager.parent.parent.max_kernels_per_user
-        if max_kernels_per_user >= 0 and not self.kernel_manager.restarting:
-            env_dict = kwargs.get('env')
-            username = env_dict['KERNEL_USERNAME']
-            current_kernel_count = self.kernel_manager.parent.parent.kernel_session_manager.active_sessions(username)
-            if current_kernel_count >= max_kernels_per_user:
-                error_message = "A max kernels per user limit has been set to {} and user '{}' currently has {} " \
-                                "active {}.".format(max_kernels_per_user, username, current_kernel_count,
-                                                    "kernel" if max_kernels_per_user == 1 else "kernels")
-                self.log_and_raise(http_status_code=403, reason=error_message)
+    def record_launch_phase(self, phase):
+        """Records the duration of the given launch phase - the time since the previous phase completed.
+
+        Only the first completion of a phase is recorded, so this can be called from the polling loops of
+        `confirm_remote_startup()`.  Durations are exported as Prometheus histograms labeled by process
+        proxy class, kernelspec and phase.
+        """
+        if phase in self.launch_phases:
+            return
+        now = time.time()
+        self.launch_phases[phase] = now - self.launch_phase_time
+        self.launch_phase_time = now
+        KERNEL_LAUNCH_PHASE_DURATION_SECONDS.labels(process_proxy=self.__class__.__name__,
+                                                    kernelspec=self.kernel_manager.kernel_name,
+                                                    phase=phase).observe(self.launch_phases[phase])
+
+    def record_launch_completion(self):
+        """Records the total duration of the kernel's launch and logs the duration of each of its phases."""
+        duration = time.time() - self.launch_start_time
+        KERNEL_LAUNCH_DURATION_SECONDS.labels(process_proxy=self.__class__.__name__,
+                                              kernelspec=self.kernel_manager.kernel_name).observe(duration)
+        phases = ', '.join("{}: {:.3f}".format(phase, phase_duration)
+                           for phase, phase_duration in self.launch_phases.items())
+        self.log.info("Kernel launch of KernelID '{}' took {:.3f} secs ({}).".format(self.kernel_id, duration, phases))
 
     def get_process_info(self):
         """Captures the base information necessary for kernel persistence relative to process proxies.
@@ -542,7 +1761,9 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         self.kernel_manager.port_range = port_range
 
     def select_ports(self, count):
-        """Selects and returns n random ports that adhere to the configured port range, if applicable.
+        """Selects and returns n ports that adhere to the configured port range, if applicable.
+
+        The ports remain reserved by the kernel (see PortAllocator) until released via `release_ports()`.
 
         Parameters
         ----------
@@ -575,29 +1796,15 @@ class BaseProcessProxyABC(with_metaclass(abc.ABCMeta, object)):
         -------
         socket - Bound socket that is available and adheres to configured port range
         """
-        sock = socket(AF_INET, SOCK_STREAM)
-        found_port = False
-        retries = 0
-        while not found_port:
-            try:
-                sock.bind((ip, self._get_candidate_port()))
-                found_port = True
-            except Exception:
-                retries = retries + 1
-                if retries > max_port_range_retries:
-                    self.log_and_raise(http_status_code=500, reason="Failed to locate port within range {} after {} "
-                                       "retries!".format(self.kernel_manager.port_range, max_port_range_retries))
-        return sock
+        try:
+            return port_allocator.allocate(self.kernel_id, self.lower_port, self.upper_port, ip)
+        except Exception as e:
+            self.log_and_raise(http_status_code=500, reason="Failed to locate port within range {}.  {}".
+                               format(self.kernel_manager.port_range, e))
 
-    def _get_candidate_port(self):
-        """Randomly selects a port number within the configured range.
-
-        If no range is configured, the 0 port is used - allowing the server to choose from the full range.
-        """
-        range_size = self.upper_port - self.lower_port
-        if range_size == 0:
-            return 0
-        return random.randint(self.lower_port, self.upper_port)
+    def release_ports(self, ports=None):
+        """Releases the given ports reserved by the kernel or, if no ports are given, all of its ports."""
+        port_allocator.release(self.kernel_id, ports)
 
     def log_and_raise(self, http_status_code=None, reason=None):
         """Helper method that combines the logging and raising of exceptions.
@@ -632,6 +1839,7 @@ class LocalProcessProxy(BaseProcessProxyABC):
         super(LocalProcessProxy, self).__init__(kernel_manager, proxy_config)
         kernel_manager.ip = localinterfaces.LOCALHOST
 
+    @gen.coroutine
     def launch_process(self, kernel_cmd, **kwargs):
         super(LocalProcessProxy, self).launch_process(kernel_cmd, **kwargs)
 
@@ -644,32 +1852,49 @@ class LocalProcessProxy(BaseProcessProxyABC):
             except OSError:
                 pass
         self.ip = local_ip
+        self.record_launch_phase('process_spawn')
         self.log.info("Local kernel launched on '{}', pid: {}, pgid: {}, KernelID: {}, cmd: '{}'"
                       .format(self.ip, self.pid, self.pgid, self.kernel_id, kernel_cmd))
-        return self
+        raise gen.Return(self)
 
 
 class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
     """Abstract Base Class implementation associated with remote process proxies."""
 
+    # States in which the launch is waiting on the resource manager (e.g., for resources), during which
+    # status polls are less frequent.  See set_launch_state().
+    pending_states = set()
+
     def __init__(self, kernel_manager, proxy_config):
         super(RemoteProcessProxy, self).__init__(kernel_manager, proxy_config)
-        self.response_socket = None
+        self.response_manager = ResponseManager.instance(self.log)
         self.start_time = None
         self.assigned_ip = None
         self.assigned_host = ''
         self.comm_ip = None
         self.comm_port = 0
+        self.comm_protocol = 0  # 1 if the launcher's communication port supports the control channel
+        self.control_channel = None
+        self.launch_secret = None  # the secret from which the key of the launcher's payloads is derived
         self.tunneled_connect_info = None    # Contains the destination connection info when tunneling in use
         self.tunnel_processes = {}
-        self._prepare_response_socket()
+        self.kernel_manager.response_address = self.response_manager.response_address
+        self.launch_polls = 0  # number of status polls performed while confirming startup
+        self.launch_pending = False
+        self.launch_poll_interval = None
+        self.terminating = False  # heartbeats are disregarded once termination of the kernel has been requested
 
     def launch_process(self, kernel_cmd, **kwargs):
         # Pass along port-range info to kernels...
         kwargs['env']['EG_MIN_PORT_RANGE_SIZE'] = str(min_port_range_size)
         kwargs['env']['EG_MAX_PORT_RANGE_RETRIES'] = str(max_port_range_retries)
+        kwargs['env']['EG_HEARTBEAT_INTERVAL'] = str(heartbeat_interval)
 
+        self.launch_secret = PayloadCipher.generate_launch_secret()
+        self.response_manager.register_kernel(self.kernel_id, self.launch_secret)
         super(RemoteProcessProxy, self).launch_process(kernel_cmd, **kwargs)
+        # Set following the superclass so the secret isn't logged with the rest of the env
+        kwargs['env']['KERNEL_LAUNCH_SECRET'] = self.launch_secret
         # remove connection file because a) its not necessary any longer since launchers will return
         # the connection information which will (sufficiently) remain in memory and b) launchers
         # landing on this node may want to write to this file and be denied access.
@@ -677,7 +1902,11 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
 
     @abc.abstractmethod
     def confirm_remote_startup(self):
-        """Confirms the remote process has started and returned necessary connection information."""
+        """Confirms the remote process has started and returned necessary connection information.
+
+        Implementations are coroutines and must only wait via `handle_timeout()` (or other non-blocking
+        means) so that pending launches do not block the IOLoop.
+        """
         pass
 
     def detect_launch_failure(self):
@@ -705,17 +1934,6 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
                 self.local_proc = None
                 self.log_and_raise(http_status_code=500, reason=error_message)
 
-    def _prepare_response_socket(self):
-        """Prepares the response socket on which connection info arrives from remote kernel launcher."""
-        s = self.select_socket(local_ip)
-        port = s.getsockname()[1]
-        s.listen(1)
-        s.settimeout(socket_timeout)
-        self.kernel_manager.response_address = (local_ip if response_ip is None else response_ip) + ':' + str(port)
-        self.log.debug("Response socket launched on '{}' using {}s timeout".
-                       format(self.kernel_manager.response_address, socket_timeout))
-        self.response_socket = s
-
     def _tunnel_to_kernel(self, connection_info, server, port=ssh_port, key=None):
         """Tunnel connections to a kernel over SSH
 
@@ -779,8 +1997,15 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
             specifically for password-less SSH login WITHOUT the '-f' command-line option thereby allowing
             the spawned process to be owned by the parent process. This allows the parent process to control
             the lifecycle of it's child processes and do appropriate cleanup during termination.
+
+            When tunnel multiplexing is enabled (EG_ENABLE_TUNNEL_MULTIPLEXING), no process is spawned.  Instead,
+            the tunnel is forwarded over the SSH connection to `server` shared by all tunnels to that server.  The
+            returned tunnel instance, like the process handle, supports terminate() to end the tunnel.
         """
-        if sys.platform == 'win32':
+        if tunnel_multiplexing_enabled:
+            return ssh_tunnel_registry.open_tunnel(local_port, remote_ip, remote_port, server,
+                                                   self._get_ssh_client, self.log)
+        elif sys.platform == 'win32':
             ssh_server = server + ":" + str(port)
             return tunnel.paramiko_tunnel(local_port, remote_port, ssh_server, remote_ip, key)
         else:
@@ -810,63 +2035,49 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
         # `max_keep_alive_interval`.
         return cull_idle_timeout + 60 if cull_idle_timeout > 0 else max_keep_alive_interval
 
-    def _decrypt(self, data):
-        """Decrypts `data` using the kernel_id as the key."""
-        key = self.kernel_id[0:16]
-        cipher = AES.new(key)
-        payload = cipher.decrypt(base64.b64decode(data))
-        payload = "".join([payload.decode("utf-8").rsplit("}", 1)[0], "}"])  # Get rid of padding after the '}'.
-        return payload
-
+    @gen.coroutine
     def receive_connection_info(self):
         """Monitors the response address for connection info sent by the remote kernel launcher."""
-        # Polls the socket using accept.  When data is found, returns ready indicator and encrypted data.
+        # Waits (up to the poll interval) for the response manager to receive this kernel's connection
+        # info.  Should it arrive, the connection is setup and the ready indicator is returned.
         ready_to_connect = False
-        if self.response_socket:
-            conn = None
-            data = ''
+        if self.response_manager.is_registered(self.kernel_id):
             try:
-                conn, address = self.response_socket.accept()
-                while 1:
-                    buffer = conn.recv(1024)
-                    if not buffer:  # send is complete, process payload
-                        self.log.debug("Received Payload '{}'".format(data))
-                        payload = self._decrypt(data)
-                        self.log.debug("Decrypted Payload '{}'".format(payload))
-                        connect_info = json.loads(payload)
-                        self.log.debug("Connect Info received from the launcher is as follows '{}'".
-                                       format(connect_info))
-                        self.log.debug("Host assigned to the Kernel is: '{}' '{}'".
-                                       format(self.assigned_host, self.assigned_ip))
-
-                        self._setup_connection_info(connect_info)
-                        ready_to_connect = True
-                        break
-                    data = data + buffer.decode(encoding='utf-8')  # append what we received until we get no more...
-            except Exception as e:
-                if type(e) is timeout:
+                connect_info = yield self.response_manager.get_connection_info(self.kernel_id, poll_interval)
+                if connect_info:
+                    self.record_launch_phase('connection_info')
+                    self.log.debug("Connect Info received from the launcher is as follows '{}'".
+                                   format(connect_info))
+                    self.log.debug("Host assigned to the Kernel is: '{}' '{}'".
+                                   format(self.assigned_host, self.assigned_ip))
+
+                    yield self._setup_connection_info(connect_info)
+                    if tunneling_enabled is True:
+                        self.record_launch_phase('tunnel_setup')
+                    ready_to_connect = True
+                else:
                     self.log.debug("Waiting for KernelID '{}' to send connection info from host '{}' - retrying..."
                                    .format(self.kernel_id, self.assigned_host))
-                else:
-                    error_message = "Exception occurred waiting for connection file response for KernelId '{}' "\
-                        "on host '{}': {}".format(self.kernel_id, self.assigned_host, str(e))
-                    self.kill()
-                    self.log_and_raise(http_status_code=500, reason=error_message)
-            finally:
-                if conn:
-                    conn.close()
+            except Exception as e:
+                error_message = "Exception occurred waiting for connection file response for KernelId '{}' "\
+                    "on host '{}': {}".format(self.kernel_id, self.assigned_host, str(e))
+                yield self.run_in_backend(self.kill)
+                self.log_and_raise(http_status_code=500, reason=error_message)
         else:
-            error_message = "Unexpected runtime encountered for Kernel ID '{}' - no response socket exists!".\
+            error_message = "Unexpected runtime encountered for Kernel ID '{}' - no response is expected!".\
                 format(self.kernel_id)
             self.log_and_raise(http_status_code=500, reason=error_message)
 
-        return ready_to_connect
+        raise gen.Return(ready_to_connect)
 
+    @gen.coroutine
     def _setup_connection_info(self, connect_info):
         """
         Take connection info (returned from launcher or loaded from session persistence) and properly
         configure port variables for the 5 kernel and (possibly) the launcher communication port.  If
         tunneling is enabled, these ports will be tunneled with the original port information recorded.
+        Since establishing the tunnels requires SSH connections to the kernel's host, the tunnels are
+        opened on the executor of the 'ssh' backend.
         """
 
         connect_info['ip'] = self.assigned_ip  # Set connection to IP address of system where the kernel was launched
@@ -875,29 +2086,7 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
             # Capture the current(tunneled) connect_info relative to the IP and ports (including the
             # communication port - if present).
             self.tunneled_connect_info = dict(connect_info)
-
-            # Open tunnels to the 5 ZMQ kernel ports
-            tunnel_ports = self._tunnel_to_kernel(connect_info, self.assigned_ip)
-            self.log.debug("Local ports used to create SSH tunnels: '{}'".format(tunnel_ports))
-
-            # Replace the remote connection ports with the local ports used to create SSH tunnels.
-            connect_info['ip'] = '127.0.0.1'
-            connect_info['shell_port'] = tunnel_ports[0]
-            connect_info['iopub_port'] = tunnel_ports[1]
-            connect_info['stdin_port'] = tunnel_ports[2]
-            connect_info['hb_port'] = tunnel_ports[3]
-            connect_info['control_port'] = tunnel_ports[4]
-
-            # If a communication port was provided, tunnel it
-            if 'comm_port' in connect_info:
-                self.comm_ip = connect_info['ip']
-                tunneled_comm_port = int(connect_info['comm_port'])
-                self.comm_port = self._tunnel_to_port(KernelChannel.COMMUNICATION, self.assigned_ip,
-                                                      tunneled_comm_port, self.assigned_ip)
-                connect_info['comm_port'] = self.comm_port
-                self.log.debug("Established gateway communication to: {}:{} for KernelID '{}' via tunneled port "
-                               "127.0.0.1:{}".format(self.assigned_ip, tunneled_comm_port,
-                                                     self.kernel_id, self.comm_port))
+            yield backend_executors.submit('ssh', self._tunnel_connection_info, connect_info)
 
         else:  # tunneling not enabled, still check for and record communication port
             if 'comm_port' in connect_info:
@@ -906,6 +2095,8 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
                 self.log.debug("Established gateway communication to: {}:{} for KernelID '{}'".
                                format(self.assigned_ip, self.comm_port, self.kernel_id))
 
+        self.comm_protocol = int(connect_info.pop('comm_protocol', 0))
+
         # If no communication port was provided, record that fact as well since this is useful to know
         if 'comm_port' not in connect_info:
             self.log.debug("Gateway communication port has NOT been established for KernelID '{}' (optional).".
@@ -913,6 +2104,31 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
 
         self._update_connection(connect_info)
 
+    def _tunnel_connection_info(self, connect_info):
+        """Opens tunnels to the kernel's ports, replacing those of `connect_info` with the local ports."""
+        # Open tunnels to the 5 ZMQ kernel ports
+        tunnel_ports = self._tunnel_to_kernel(connect_info, self.assigned_ip)
+        self.log.debug("Local ports used to create SSH tunnels: '{}'".format(tunnel_ports))
+
+        # Replace the remote connection ports with the local ports used to create SSH tunnels.
+        connect_info['ip'] = '127.0.0.1'
+        connect_info['shell_port'] = tunnel_ports[0]
+        connect_info['iopub_port'] = tunnel_ports[1]
+        connect_info['stdin_port'] = tunnel_ports[2]
+        connect_info['hb_port'] = tunnel_ports[3]
+        connect_info['control_port'] = tunnel_ports[4]
+
+        # If a communication port was provided, tunnel it
+        if 'comm_port' in connect_info:
+            self.comm_ip = connect_info['ip']
+            tunneled_comm_port = int(connect_info['comm_port'])
+            self.comm_port = self._tunnel_to_port(KernelChannel.COMMUNICATION, self.assigned_ip,
+                                                  tunneled_comm_port, self.assigned_ip)
+            connect_info['comm_port'] = self.comm_port
+            self.log.debug("Established gateway communication to: {}:{} for KernelID '{}' via tunneled port "
+                           "127.0.0.1:{}".format(self.assigned_ip, tunneled_comm_port,
+                                                 self.kernel_id, self.comm_port))
+
     def _update_connection(self, connect_info):
         """
         Updates the connection info member variables of the kernel manager.  Also pulls the PID and PGID
@@ -935,14 +2151,8 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
                             "connection information is null!".format(self.kernel_id)
             self.log_and_raise(http_status_code=500, reason=error_message)
 
-        # If there's a response-socket, close it since its no longer needed.
-        if self.response_socket:
-            try:
-                self.response_socket.shutdown(SHUT_RDWR)
-                self.response_socket.close()
-            except OSError:
-                pass  # tolerate exceptions here since we don't need this socket and would like ot continue
-            self.response_socket = None
+        # The connection info is no longer expected, so stop tracking this kernel's response.
+        self.response_manager.unregister_kernel(self.kernel_id)
 
         self.kernel_manager._connection_file_written = True  # allows for cleanup of local files (as necessary)
 
@@ -968,18 +2178,83 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
             self.ip = self.assigned_ip
             self.local_proc = None
 
+    def next_poll_interval(self):
+        """Returns the time to wait prior to the next poll of the launch's status.
+
+        Polling starts at EG_MIN_POLL_INTERVAL following the submission of the kernel and backs off
+        exponentially up to EG_POLL_INTERVAL - or EG_MAX_POLL_INTERVAL while the launch is pending on the
+        resource manager.  Leaving a pending state resumes the faster polling.
+        """
+        self.launch_polls += 1
+        if self.launch_poll_interval is None:
+            self.launch_poll_interval = min_poll_interval
+        else:
+            self.launch_poll_interval = min(self.launch_poll_interval * poll_backoff_factor,
+                                            max_poll_interval if self.launch_pending else poll_interval)
+        return self.launch_poll_interval
+
+    def set_launch_state(self, state):
+        """Records the launch's current state (as reported by the resource manager) for use in pacing polls."""
+        pending = state in self.pending_states
+        if self.launch_pending and not pending:
+            self.launch_poll_interval = None
+        self.launch_pending = pending
+
+    def wait_for_status_change(self, wait_time):
+        """Waits up to `wait_time` seconds for the status of the kernel's launch to change.
+
+        By default, this returns as soon as the kernel's connection info is received.  Subclasses that are
+        notified of other status changes can override this method to return as soon as those occur as well.
+        """
+        return self.response_manager.wait_for_response(self.kernel_id, wait_time)
+
+    def record_launch_completion(self):
+        """Also records the number of status polls the launch required."""
+        super(RemoteProcessProxy, self).record_launch_completion()
+        KERNEL_LAUNCH_POLLS.labels(process_proxy=self.__class__.__name__,
+                                   kernelspec=self.kernel_manager.kernel_name).observe(self.launch_polls)
+
+    @gen.coroutine
     def handle_timeout(self):
         """Checks to see if the kernel launch timeout has been exceeded while awaiting connection info."""
-        time.sleep(poll_interval)
+        yield self.wait_for_status_change(self.next_poll_interval())
         time_interval = RemoteProcessProxy.get_time_diff(self.start_time, RemoteProcessProxy.get_current_time())
 
         if time_interval > self.kernel_launch_timeout:
             error_http_code = 500
             reason = "Waited too long ({}s) to get connection file".format(self.kernel_launch_timeout)
             timeout_message = "KernelID: '{}' launch timeout due to: {}".format(self.kernel_id, reason)
-            self.kill()
+            yield self.run_in_backend(self.kill)
             self.log_and_raise(http_status_code=error_http_code, reason=timeout_message)
 
+    def poll(self):
+        """Determines if the kernel is still alive from its launcher's heartbeats, if possible.
+
+        Otherwise (or if this corresponds to a local process), the superclass is used.
+        """
+        if self.local_proc is None:
+            alive = self.heartbeat_liveness()
+            if alive is not None:
+                return None if alive else False
+        return super(RemoteProcessProxy, self).poll()
+
+    def heartbeat_liveness(self):
+        """Returns True if the kernel is alive per its launcher's heartbeats, False if the launcher has
+        reported the kernel's exit and None if unknown.  Subclasses that override poll() should consult this
+        method prior to querying their resource manager.
+        """
+        if self.terminating:  # termination waits block the IOLoop, so recent heartbeats don't reflect the outcome
+            return None
+        return self.response_manager.kernel_liveness(self.kernel_id, self.pid)
+
+    def kill(self):
+        self.terminating = True
+        return super(RemoteProcessProxy, self).kill()
+
+    def terminate(self):
+        self.terminating = True
+        return super(RemoteProcessProxy, self).terminate()
+
     def cleanup(self):
         """Terminates tunnel processes, if applicable."""
         self.assigned_ip = None
@@ -989,6 +2264,10 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
             process.terminate()
 
         self.tunnel_processes.clear()
+        self.release_ports()  # the local ports of the tunnels
+        self._close_control_channel()
+        self.response_manager.unregister_kernel(self.kernel_id)
+        self.response_manager.forget_kernel(self.kernel_id)
         super(RemoteProcessProxy, self).cleanup()
 
     def send_signal(self, signum):
@@ -1003,24 +2282,17 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
         # using anything other than the socket-based signal (via signal_addr) will not work.
 
         if self.comm_port > 0:
-            signal_request = dict()
-            signal_request['signum'] = signum
-
-            sock = socket(AF_INET, SOCK_STREAM)
             try:
-                sock.settimeout(socket_timeout)
-                sock.connect((self.comm_ip, self.comm_port))
-                sock.send(json.dumps(signal_request).encode(encoding='utf-8'))
+                self._send_listener_request({'signum': signum})
                 if signum > 0:  # Polling (signum == 0) is too frequent
                     self.log.debug("Signal ({}) sent via gateway communication port.".format(signum))
                 return None
             except Exception as e:
-                if isinstance(e, OSError):
-                    if e.errno == errno.ECONNREFUSED and signum == 0:  # Return False since there's no process.
+                if signum == 0:  # Return False since there's no process.
+                    if isinstance(e, LauncherRequestError) or \
+                            (isinstance(e, OSError) and e.errno == errno.ECONNREFUSED):
                         return False
                 return super(RemoteProcessProxy, self).send_signal(signum)
-            finally:
-                sock.close()
         else:
             return super(RemoteProcessProxy, self).send_signal(signum)
 
@@ -1029,29 +2301,17 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
         # If a comm port has been established, instruct the listener to shutdown so that proper
         # kernel termination can occur.  If not done, the listener keeps the launcher process
         # active, even after the kernel has terminated, leading to less than graceful terminations.
+        self.terminating = True
 
         if self.comm_port > 0:
-            shutdown_request = dict()
-            shutdown_request['shutdown'] = 1
-
-            sock = socket(AF_INET, SOCK_STREAM)
             try:
-                sock.settimeout(socket_timeout)
-                sock.connect((self.comm_ip, self.comm_port))
-                sock.send(json.dumps(shutdown_request).encode(encoding='utf-8'))
+                self._send_listener_request({'shutdown': 1})
                 self.log.debug("Shutdown request sent to listener via gateway communication port.")
             except Exception as e:
                 self.log.warning("Exception occurred sending listener shutdown to {}:{} for KernelID '{}' "
                                  "(using alternate shutdown): {}"
                                  .format(self.comm_ip, self.comm_port, self.kernel_id, str(e)))
-            finally:
-                try:
-                    sock.shutdown(SHUT_WR)
-                except Exception as e2:
-                    self.log.warning("Exception occurred attempting to shutdown communication socket to {}:{} "
-                                     "for KernelID '{}' (ignored): {}".format(self.comm_ip, self.comm_port,
-                                                                              self.kernel_id, str(e2)))
-                sock.close()
+            self._close_control_channel()
 
             # Also terminate the tunnel process for the communication port - if in play.  Failure to terminate
             # this process results in the kernel (launcher) appearing to remain alive following the shutdown
@@ -1064,6 +2324,30 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
                 comm_port_tunnel.terminate()
                 del self.tunnel_processes[comm_port_name]
 
+    def _send_listener_request(self, request):
+        """Sends `request` to the kernel launcher's listener.
+
+        If the launcher supports it, the request is sent over the (persistent) control channel and
+        acknowledged.  Otherwise, a connection is made to convey the request, then closed.
+        """
+        if self.comm_protocol >= 1:
+            if self.control_channel is None:
+                self.control_channel = LauncherChannel(self.comm_ip, self.comm_port)
+            return self.control_channel.request(request)
+
+        sock = socket(AF_INET, SOCK_STREAM)
+        try:
+            sock.settimeout(socket_timeout)
+            sock.connect((self.comm_ip, self.comm_port))
+            sock.send(json.dumps(request).encode(encoding='utf-8'))
+        finally:
+            sock.close()
+
+    def _close_control_channel(self):
+        if self.control_channel is not None:
+            self.control_channel.close()
+            self.control_channel = None
+
     def get_process_info(self):
         """Captures the base information necessary for kernel persistence relative to remote processes."""
         process_info = super(RemoteProcessProxy, self).get_process_info()
@@ -1071,6 +2355,8 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
                              'assigned_host': self.assigned_host,
                              'comm_ip': self.comm_ip,
                              'comm_port': self.comm_port,
+                             'comm_protocol': self.comm_protocol,
+                             'launch_secret': self.launch_secret,
                              'tunneled_connect_info': self.tunneled_connect_info})
         return process_info
 
@@ -1081,10 +2367,21 @@ class RemoteProcessProxy(with_metaclass(abc.ABCMeta, BaseProcessProxyABC)):
         self.assigned_host = process_info['assigned_host']
         self.comm_ip = process_info['comm_ip']
         self.comm_port = process_info['comm_port']
-        if 'tunneled_connect_info' in process_info and process_info['tunneled_connect_info'] is not None:
-            # If this was a tunneled connection, re-establish tunnels.  Note, this will reset the
-            # communication socket (comm_ip, comm_port) members as well.
-            self._setup_connection_info(process_info['tunneled_connect_info'])
+        self.comm_protocol = process_info.get('comm_protocol', 0)
+        self.launch_secret = process_info.get('launch_secret')
+        # revived launchers reconnect to send heartbeats
+        self.response_manager.monitor_kernel(self.kernel_id, self.launch_secret)
+        # If this was a tunneled connection, its tunnels are re-established by restore_tunnels().
+        self.tunneled_connect_info = process_info.get('tunneled_connect_info')
+
+    @gen.coroutine
+    def restore_tunnels(self):
+        """Re-establishes the tunnels of a revived kernel whose connection was tunneled.
+
+        Note, this will reset the communication socket (comm_ip, comm_port) members as well.
+        """
+        if self.tunneled_connect_info is not None:
+            yield self._setup_connection_info(dict(self.tunneled_connect_info))
 
     @staticmethod
     def get_current_time():
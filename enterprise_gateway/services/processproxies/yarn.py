@@ -3,13 +3,18 @@
 """Code related to managing kernels running in YARN clusters."""
 
 import os
+import re
 import signal
 import time
 import logging
 import errno
 import socket
+import tempfile
 
+from threading import Lock
 from jupyter_client import launch_kernel, localinterfaces
+from tornado import gen
+from yarn_api_client.errors import APIError
 from yarn_api_client.resource_manager import ResourceManager
 
 from .processproxy import RemoteProcessProxy
@@ -27,12 +32,120 @@ local_ip = localinterfaces.public_ips()[0]
 poll_interval = float(os.getenv('EG_POLL_INTERVAL', '0.5'))
 max_poll_attempts = int(os.getenv('EG_MAX_POLL_ATTEMPTS', '10'))
 yarn_shutdown_wait_time = float(os.getenv('EG_YARN_SHUTDOWN_WAIT_TIME', '15.0'))
+yarn_state_refresh_interval = float(os.getenv('EG_YARN_STATE_REFRESH_INTERVAL', '0.5'))
+
+# Applications are named using the kernel's id, so a uuid pattern is used to associate applications with kernels.
+kernel_id_pattern = re.compile('[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+
+
+class YarnApplicationCache(object):
+    """Caches the YARN applications of the kernels whose launch is pending on this gateway.
+
+    Rather than each launching kernel querying the resource manager for its application (by name) and the
+    application's state, the applications of all pending launches are retrieved via a single
+    `cluster_applications` request - issued at most once per EG_YARN_STATE_REFRESH_INTERVAL seconds.  The
+    request covers the period since the earliest start time of the pending launches, so it remains narrow
+    regardless of how long established kernels have been running.  Should a refresh fail, the previous
+    contents are retained.  One cache exists per resource manager (endpoint and security configuration).
+    """
+
+    _instances = {}
+    _instances_lock = Lock()
+
+    def __init__(self, yarn_endpoint, resource_mgr, log):
+        self.yarn_endpoint = yarn_endpoint
+        self.resource_mgr = resource_mgr
+        self.log = log
+        self._lock = Lock()
+        self._start_times = {}  # kernel_id -> time (ms) after which the kernel's application was started
+        self._apps_by_kernel = {}  # kernel_id -> list of applications whose name contains the kernel_id
+        self._apps_by_id = {}  # application_id -> application
+        self._last_refresh = 0
+        self._refreshing = False
+
+    @classmethod
+    def instance(cls, yarn_endpoint, security_enabled, resource_mgr, log):
+        """Returns the application cache associated with the given YARN endpoint and security configuration,
+        creating it if necessary."""
+        key = (yarn_endpoint, security_enabled)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(yarn_endpoint, resource_mgr, log)
+            return cls._instances[key]
+
+    def track(self, kernel_id, start_time):
+        """Includes the applications of the given kernel started at or after `start_time` in subsequent refreshes."""
+        with self._lock:
+            if not self._start_times or start_time < min(self._start_times.values()):
+                self._last_refresh = 0  # the current contents do not cover this kernel, force a refresh
+            self._start_times[kernel_id] = start_time
+
+    def untrack(self, kernel_id):
+        """Excludes the applications of the given kernel from subsequent refreshes."""
+        with self._lock:
+            self._start_times.pop(kernel_id, None)
+
+    def get_app_by_kernel(self, kernel_id):
+        """Returns the most recent application associated with the (tracked) kernel, or None if not found."""
+        self._refresh()
+        start_time = self._start_times.get(kernel_id, 0)
+        target_app = None
+        for app in self._apps_by_kernel.get(kernel_id, []):
+            if app.get('startedTime', 0) >= start_time and (target_app is None or app.get('id') > target_app.get('id')):
+                target_app = app
+        return target_app
+
+    def get_app_by_id(self, app_id):
+        """Returns the application with the given id, or None if not found."""
+        self._refresh()
+        return self._apps_by_id.get(app_id)
+
+    def _refresh(self):
+        # The resource manager is queried outside of the lock, callers arriving in the meantime are served the
+        # current contents.
+        with self._lock:
+            now = time.time()
+            if self._refreshing or not self._start_times or now - self._last_refresh < yarn_state_refresh_interval:
+                return
+            self._refreshing = True
+            self._last_refresh = now
+            started_time_begin = min(self._start_times.values())
+
+        data = None
+        try:
+            data = self.resource_mgr.cluster_applications(started_time_begin=str(started_time_begin)).data
+        except socket.error as sock_err:
+            if sock_err.errno == errno.ECONNREFUSED:
+                self.log.warning("YARN end-point: '{}' refused the connection.  Is the resource manager running?".
+                                 format(self.yarn_endpoint))
+            else:
+                self.log.warning("Query for YARN applications failed with exception: {} - '{}'.  Continuing...".
+                                 format(type(sock_err), sock_err))
+        except Exception as e:
+            self.log.warning("Query for YARN applications failed with exception: {} - '{}'.  Continuing...".
+                             format(type(e), e))
+
+        with self._lock:
+            self._refreshing = False
+            if type(data) is not dict or type(data.get("apps")) not in (dict, type(None)):
+                return  # the query failed, retain the previous contents
+            apps_by_kernel = {}
+            apps_by_id = {}
+            for app in (data.get('apps') or {}).get('app', []):
+                for kernel_id in kernel_id_pattern.findall(app.get('name', '')):
+                    if kernel_id in self._start_times:
+                        apps_by_kernel.setdefault(kernel_id, []).append(app)
+                        apps_by_id[app.get('id')] = app
+            self._apps_by_kernel = apps_by_kernel
+            self._apps_by_id = apps_by_id
 
 
 class YarnClusterProcessProxy(RemoteProcessProxy):
     """Kernel lifecycle management for YARN clusters."""
     initial_states = {'NEW', 'SUBMITTED', 'ACCEPTED', 'RUNNING'}
     final_states = {'FINISHED', 'KILLED'}  # Don't include FAILED state
+    pending_states = {'ACCEPTED'}  # waiting for resources
+    backend = 'yarn'
 
     def __init__(self, kernel_manager, proxy_config):
         super(YarnClusterProcessProxy, self).__init__(kernel_manager, proxy_config)
@@ -53,6 +166,8 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
         else:
             self.resource_mgr = ResourceManager(address=yarn_master,
                                                 port=yarn_port)
+        self.app_cache = YarnApplicationCache.instance(self.yarn_endpoint, self.yarn_endpoint_security_enabled,
+                                                       self.resource_mgr, self.log)
 
         # YARN applications tend to take longer than the default 5 second wait time.  Rather than
         # require a command-line option for those using YARN, we'll adjust based on a local env that
@@ -63,20 +178,35 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
             self.log.debug("{class_name} shutdown wait time adjusted to {wait_time} seconds.".
                            format(class_name=type(self).__name__, wait_time=kernel_manager.shutdown_wait_time))
 
+    @gen.coroutine
     def launch_process(self, kernel_cmd, **kwargs):
         """Launches the specified process within a YARN cluster environment."""
         super(YarnClusterProcessProxy, self).launch_process(kernel_cmd, **kwargs)
 
-        # launch the local run.sh - which is configured for yarn-cluster...
-        self.local_proc = launch_kernel(kernel_cmd, **kwargs)
-        self.pid = self.local_proc.pid
-        self.ip = local_ip
-
-        self.log.debug("Yarn cluster kernel launched using YARN endpoint: {}, pid: {}, Kernel ID: {}, cmd: '{}'"
-                       .format(self.yarn_endpoint, self.local_proc.pid, self.kernel_id, kernel_cmd))
-        self.confirm_remote_startup()
-
-        return self
+        # The launch secret is conveyed to the application master as a (private) file shipped with the
+        # application, rather than via the spark-submit command line.  It's no longer needed once launched.
+        kwargs['env']['KERNEL_LAUNCH_SECRET_FILE'] = secret_file = self._write_launch_secret_file()
+        try:
+            # launch the local run.sh - which is configured for yarn-cluster...
+            self.local_proc = launch_kernel(kernel_cmd, **kwargs)
+            self.pid = self.local_proc.pid
+            self.ip = local_ip
+            self.record_launch_phase('process_spawn')
+
+            self.log.debug("Yarn cluster kernel launched using YARN endpoint: {}, pid: {}, Kernel ID: {}, cmd: '{}'"
+                           .format(self.yarn_endpoint, self.local_proc.pid, self.kernel_id, kernel_cmd))
+            yield self.confirm_remote_startup()
+        finally:
+            os.remove(secret_file)
+
+        raise gen.Return(self)
+
+    def _write_launch_secret_file(self):
+        # Writes the launch secret to a file only accessible by the gateway's user, returning its path.
+        fd, path = tempfile.mkstemp(prefix='kernel-{}-'.format(self.kernel_id), suffix='.secret')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.launch_secret)
+        return path
 
     def poll(self):
         """Submitting a new kernel/app to YARN will take a while to be ACCEPTED.
@@ -85,11 +215,18 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
 
         :return: None if the application's ID is available and state is ACCEPTED/SUBMITTED/RUNNING. Otherwise False.
         """
+        alive = self.heartbeat_liveness()
+        if alive is not None:
+            return None if alive else False
+
         result = False
 
         if self._get_application_id():
-            state = self._query_app_state_by_id(self.application_id)
-            if state in YarnClusterProcessProxy.initial_states:
+            try:
+                app = self._query_app_by_id(self.application_id)
+            except Exception:
+                return None  # the resource manager could not be queried, the application's state is unknown
+            if app and app.get('state') in YarnClusterProcessProxy.initial_states:
                 result = None
 
         # The following produces too much output (every 3 seconds by default), so commented-out at this time.
@@ -156,25 +293,38 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
 
         # reset application id to force new query - handles kernel restarts/interrupts
         self.application_id = None
+        self.app_cache.untrack(self.kernel_id)
 
         # for cleanup, we should call the superclass last
         super(YarnClusterProcessProxy, self).cleanup()
 
+    @gen.coroutine
     def confirm_remote_startup(self):
         """ Confirms the yarn application is in a started state before returning.  Should post-RUNNING states be
             unexpectedly encountered (FINISHED, KILLED) then we must throw, otherwise the rest of the gateway will
             believe its talking to a valid kernel.
         """
         self.start_time = RemoteProcessProxy.get_current_time()
+        self.app_cache.track(self.kernel_id, self.start_time)
+        try:
+            yield self._await_remote_startup()
+        finally:
+            self.app_cache.untrack(self.kernel_id)  # only pending launches are served by the application cache
+
+    @gen.coroutine
+    def _await_remote_startup(self):
         i = 0
         ready_to_connect = False  # we're ready to connect when we have a connection file to use
         while not ready_to_connect:
             i += 1
-            self.handle_timeout()
+            yield self.handle_timeout()
 
-            if self._get_application_id(True):
+            application_id = yield self.run_in_backend(self._get_application_id, True)
+            if application_id:
+                self.record_launch_phase('application_id')
                 # Once we have an application ID, start monitoring state, obtain assigned host and get connection info
-                app_state = self._get_application_state()
+                app_state = yield self.run_in_backend(self._get_application_state)
+                self.set_launch_state(app_state)
 
                 if app_state in YarnClusterProcessProxy.final_states:
                     error_message = "KernelID: '{}', ApplicationID: '{}' unexpectedly found in state '{}'" \
@@ -185,7 +335,8 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
                                format(i, app_state, self.assigned_host, self.kernel_id, self.application_id))
 
                 if self.assigned_host != '':
-                    ready_to_connect = self.receive_connection_info()
+                    self.record_launch_phase('host_assignment')
+                    ready_to_connect = yield self.receive_connection_info()
             else:
                 self.detect_launch_failure()
 
@@ -193,7 +344,10 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
         # Gets the current application state using the application_id already obtained.  Once the assigned host
         # has been identified, it is nolonger accessed.
         app_state = None
-        app = self._query_app_by_id(self.application_id)
+        try:
+            app = self._query_app_by_id(self.application_id)
+        except Exception:
+            return None
 
         if app:
             if app.get('state'):
@@ -204,9 +358,10 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
                 self.assigned_ip = socket.gethostbyname(self.assigned_host)
         return app_state
 
+    @gen.coroutine
     def handle_timeout(self):
         """Checks to see if the kernel launch timeout has been exceeded while awaiting connection info."""
-        time.sleep(poll_interval)
+        yield self.wait_for_status_change(self.next_poll_interval())
         time_interval = RemoteProcessProxy.get_time_diff(self.start_time, RemoteProcessProxy.get_current_time())
 
         if time_interval > self.kernel_launch_timeout:
@@ -214,8 +369,10 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
                      "Check Enterprise Gateway log for more information.". \
                 format(self.kernel_launch_timeout)
             error_http_code = 500
-            if self._get_application_id(True):
-                if self._query_app_state_by_id(self.application_id) != "RUNNING":
+            application_id = yield self.run_in_backend(self._get_application_id, True)
+            if application_id:
+                app_state = yield self.run_in_backend(self._query_app_state_by_id, application_id)
+                if app_state != "RUNNING":
                     reason = "YARN resources unavailable after {} seconds for app {}, launch timeout: {}!  "\
                         "Check YARN configuration.".format(time_interval, self.application_id,
                                                            self.kernel_launch_timeout)
@@ -223,7 +380,7 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
                 else:
                     reason = "App {} is RUNNING, but waited too long ({} secs) to get connection file.  " \
                         "Check YARN logs for more information.".format(self.application_id, self.kernel_launch_timeout)
-            self.kill()
+            yield self.run_in_backend(self.kill)
             timeout_message = "KernelID: '{}' launch timeout due to: {}".format(self.kernel_id, reason)
             self.log_and_raise(http_status_code=error_http_code, reason=timeout_message)
 
@@ -258,7 +415,8 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
 
     def _query_app_by_name(self, kernel_id):
         """Retrieve application by using kernel_id as the unique app name.
-        With the started_time_begin as a parameter to filter applications started earlier than the target one from YARN.
+        Only applications started after the kernel's start_time are considered.  These are served from the
+        application cache which is shared by all kernels using the same YARN endpoint.
         When submit a new app, it may take a while for YARN to accept and run and generate the application ID.
         Note: if a kernel restarts with the same kernel id as app name, multiple applications will be returned.
         For now, the app/kernel with the top most application ID will be returned as the target app, assuming the app
@@ -267,41 +425,34 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
         :param kernel_id: as the unique app name for query
         :return: The JSON object of an application.
         """
-        top_most_app_id = ''
-        target_app = None
-        data = None
-        try:
-            data = self.resource_mgr.cluster_applications(started_time_begin=str(self.start_time)).data
-        except socket.error as sock_err:
-            if sock_err.errno == errno.ECONNREFUSED:
-                self.log.warning("YARN end-point: '{}' refused the connection.  Is the resource manager running?".
-                                 format(self.yarn_endpoint))
-            else:
-                self.log.warning("Query for kernel ID '{}' failed with exception: {} - '{}'.  Continuing...".
-                                 format(kernel_id, type(sock_err), sock_err))
-        except Exception as e:
-            self.log.warning("Query for kernel ID '{}' failed with exception: {} - '{}'.  Continuing...".
-                             format(kernel_id, type(e), e))
-
-        if type(data) is dict and type(data.get("apps")) is dict and 'app' in data.get("apps"):
-            for app in data['apps']['app']:
-                if app.get('name', '').find(kernel_id) >= 0 and app.get('id') > top_most_app_id:
-                    target_app = app
-                    top_most_app_id = app.get('id')
-        return target_app
+        return self.app_cache.get_app_by_kernel(kernel_id)
 
     def _query_app_by_id(self, app_id):
         """Retrieve an application by application ID.
 
+        The application is served from the application cache when present (i.e., during the kernel's
+        launch).  Otherwise, the resource manager is queried.
+
         :param app_id
         :return: The JSON object of an application.
+        :raises: Exception if the resource manager could not be queried.
         """
-        data = None
+        app = self.app_cache.get_app_by_id(app_id)
+        if app:
+            return app
+
         try:
             data = self.resource_mgr.cluster_application(application_id=app_id).data
+        except APIError as e:
+            if 'status: 404' in str(e):  # the resource manager no longer knows of the application
+                return None
+            self.log.warning("Query for application ID '{}' failed with exception: '{}'.  Continuing...".
+                             format(app_id, e))
+            raise
         except Exception as e:
             self.log.warning("Query for application ID '{}' failed with exception: '{}'.  Continuing...".
                              format(app_id, e))
+            raise
         if type(data) is dict and 'app' in data:
             return data['app']
         return None
@@ -310,16 +461,15 @@ class YarnClusterProcessProxy(RemoteProcessProxy):
         """Return the state of an application.
 
         :param app_id:
-        :return:
+        :return: The application's state, None if not found or the resource manager could not be queried.
         """
-        response = None
         try:
-            response = self.resource_mgr.cluster_application_state(application_id=app_id)
-        except Exception as e:
-            self.log.warning("Query for application '{}' state failed with exception: '{}'.  Continuing...".
-                             format(app_id, e))
-
-        return response.data['state']
+            app = self._query_app_by_id(app_id)
+        except Exception:
+            return None
+        if app:
+            return app.get('state')
+        return None
 
     def _kill_app_by_id(self, app_id):
         """Kill an application. If the app's state is FINISHED or FAILED, it won't be changed to KILLED.
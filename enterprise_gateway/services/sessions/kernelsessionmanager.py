@@ -7,14 +7,28 @@ import getpass
 import json
 import os
 import threading
+import time
 
 from ipython_genutils.py3compat import (bytes_to_str, str_to_bytes)
 from jupyter_core.paths import jupyter_data_dir
-from traitlets import Bool, default
+from tornado import gen
+from tornado.locks import Semaphore
+from traitlets import Bool, Integer, default
 from traitlets.config.configurable import LoggingConfigurable
 
 kernels_lock = threading.Lock()
 kernel_session_location = os.getenv('EG_KERNEL_SESSION_LOCATION', jupyter_data_dir())
+journal_sync_interval = float(os.getenv('EG_KERNEL_SESSION_JOURNAL_SYNC_INTERVAL', '0.5'))
+journal_compaction_threshold = int(os.getenv('EG_KERNEL_SESSION_JOURNAL_COMPACTION_THRESHOLD', '1000'))
+
+
+def _open_private(path, mode):
+    """Opens the file for writing ('w') or appending ('a'), restricting its access to the gateway's user since
+    persisted sessions include the launch secrets of their kernels.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_APPEND if mode == 'a' else os.O_TRUNC), 0o600)
+    os.fchmod(fd, 0o600)  # should the file predate this restriction
+    return os.fdopen(fd, mode)
 
 
 class KernelSessionManager(LoggingConfigurable):
@@ -23,11 +37,16 @@ class KernelSessionManager(LoggingConfigurable):
         KernelSessionManager provides the basis for an HA solution.  It loads the complete set of persisted kernel
         sessions during construction.  Following construction the parent object calls start_sessions to allow
         Enterprise Gateway to validate that all loaded sessions are still valid.  Those that it cannot 'revive'
-        are marked for deletion and the in-memory dictionary is updated - and the entire collection is written
-        to store (file or database).
+        are marked for deletion and the in-memory dictionary is updated.
 
         As kernels are created and destroyed, the KernelSessionManager is called upon to keep kernel session
-        state consistent.
+        state consistent.  Each change is appended as a single record to a journal (kernels.journal) whose
+        writes are synced to disk in batches.  Once the journal grows beyond its compaction threshold, the
+        complete collection is written as a snapshot (kernels.json) and the journal is truncated.  Loading
+        replays the journal on top of the snapshot.
+
+        Subclasses provide alternate persistence backends by overriding `_load_sessions()`,
+        `_persist_session()` and `_persist_deletion()` (see sharedsessionmanager.py).
     """
 
     # Session Persistence
@@ -42,13 +61,30 @@ class KernelSessionManager(LoggingConfigurable):
         return bool(os.getenv(self.session_persistence_env,
                               str(self.session_persistence_default_value)).lower() == 'true')
 
+    # Session Revival Concurrency
+    revival_concurrency_env = 'EG_KERNEL_SESSION_REVIVAL_CONCURRENCY'
+    revival_concurrency_default_value = 10
+    revival_concurrency = Integer(revival_concurrency_default_value, config=True,
+                                  help="""The maximum number of persisted kernel sessions revived concurrently.
+                                  (EG_KERNEL_SESSION_REVIVAL_CONCURRENCY env var)""")
+
+    @default('revival_concurrency')
+    def revival_concurrency_default(self):
+        return int(os.getenv(self.revival_concurrency_env, self.revival_concurrency_default_value))
+
     def __init__(self, kernel_manager, **kwargs):
         super(KernelSessionManager, self).__init__(**kwargs)
         self.kernel_manager = kernel_manager
         self._sessions = dict()
-        self._sessionsByUser = dict()
+        self._sessionsByUser = dict()  # username -> set of kernel_ids
+        self._reviving = set()  # kernel_ids of persisted sessions awaiting revival
+        self._journal = None  # file object of the open journal
+        self._journal_records = 0  # number of records in the journal since the last compaction
+        self._journal_sync_timer = None  # pending (batched) sync of the journal
         if self.enable_persistence:
-            self.kernel_session_file = os.path.join(self._get_sessions_loc(), 'kernels.json')
+            sessions_loc = self._get_sessions_loc()
+            self.kernel_session_file = os.path.join(sessions_loc, 'kernels.json')
+            self.kernel_session_journal = os.path.join(sessions_loc, 'kernels.journal')
             self._load_sessions()
 
     def create_session(self, kernel_id, **kwargs):
@@ -98,14 +134,10 @@ class KernelSessionManager(LoggingConfigurable):
         try:
             self._sessions[kernel_id] = kernel_session
             username = kernel_session['username']
-            if username not in self._sessionsByUser:
-                self._sessionsByUser[username] = []
-                self._sessionsByUser[username].append(kernel_id)
-            else:
-                # Only append if not there yet (e.g. restarts will be there already)
-                if kernel_id not in self._sessionsByUser[username]:
-                    self._sessionsByUser[username].append(kernel_id)
-            self._commit_sessions()  # persist changes
+            # Sets, so that restarts (already present) don't add duplicates
+            self._sessionsByUser.setdefault(username, set()).add(kernel_id)
+            if self.enable_persistence:
+                self._persist_session(kernel_id, kernel_session)
         finally:
             kernels_lock.release()
 
@@ -118,40 +150,106 @@ class KernelSessionManager(LoggingConfigurable):
                     self._sessions = self._post_load_transformation(json.load(fp))
                     fp.close()
 
+            # Replay the journal on top of the snapshot.  Each record either replaces or deletes (session
+            # is None) the kernel's session.  A partially written final record (e.g., due to a crash) is ignored.
+            if os.path.exists(self.kernel_session_journal):
+                self.log.debug("Replaying saved session changes from {}".format(self.kernel_session_journal))
+                with open(self.kernel_session_journal) as fp:
+                    for line in fp:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            self.log.warning("Ignoring incomplete kernel session journal record: {}".format(line))
+                            continue
+                        if record.get('session') is None:
+                            self._sessions.pop(record['kernel_id'], None)
+                        else:
+                            self._sessions[record['kernel_id']] = \
+                                self._post_load_session_transformation(record['session'])
+
+            for kernel_id, kernel_session in self._sessions.items():
+                self._sessionsByUser.setdefault(kernel_session['username'], set()).add(kernel_id)
+
+            # Start the journal from the current set of sessions.
+            kernels_lock.acquire()
+            try:
+                self._compact_sessions()
+            finally:
+                kernels_lock.release()
+
+    @gen.coroutine
     def start_sessions(self):
         """ Attempt to start persisted sessions.
 
+        Sessions are revived concurrently - up to `revival_concurrency` at a time.  This is called once
+        the server is listening, so sessions awaiting revival are reported in the 'reviving' state.
         Determines if session startup was successful.  If unsuccessful, the session is removed
         from persistent storage.
         """
         if self.enable_persistence:
-            sessions_to_remove = []
-            for kernel_id, kernel_session in self._sessions.items():
-                self.log.info("Attempting startup of persisted kernel session for id: %s..." % kernel_id)
-                if self._start_session(kernel_session):
-                    self.log.info("Startup of persisted kernel session for id '{}' was successful.  Client should "
-                                  "reconnect kernel.".format(kernel_id))
-                else:
-                    sessions_to_remove.append(kernel_id)
-                    self.log.warn("Startup of persisted kernel session for id '{}' was not successful.  Check if "
-                                  "client is still active and restart kernel.".format(kernel_id))
-
-            self._delete_sessions(sessions_to_remove)
+            yield self._revive_sessions(list(self._sessions.keys()))
+
+    @gen.coroutine
+    def _revive_sessions(self, kernel_ids):
+        # Revives the sessions of the given kernels, removing those that could not be started, then reports the
+        # outcome and duration of each.
+        if not kernel_ids:
+            return
+        self._reviving.update(kernel_ids)
+        semaphore = Semaphore(max(self.revival_concurrency, 1))
+        start_time = time.time()
+        results = yield [self._revive_session(kernel_id, semaphore) for kernel_id in kernel_ids]
+
+        self._delete_sessions([kernel_id for kernel_id, (started, duration) in zip(kernel_ids, results)
+                               if not started])
+        revived = sum(1 for started, duration in results if started)
+        self.log.info("Revived {} of {} persisted kernel sessions in {:.3f} secs: {}".format(
+            revived, len(kernel_ids), time.time() - start_time,
+            ', '.join("{} ({}, {:.3f} secs)".format(kernel_id, 'revived' if started else 'failed', duration)
+                      for kernel_id, (started, duration) in zip(kernel_ids, results))))
+
+    @gen.coroutine
+    def _revive_session(self, kernel_id, semaphore):
+        # Revives a single session once the semaphore permits.  Returns a tuple of whether the kernel was
+        # started and the duration of its revival.
+        with (yield semaphore.acquire()):
+            self.log.info("Attempting startup of persisted kernel session for id: %s..." % kernel_id)
+            start_time = time.time()
+            try:
+                started = yield self._start_session(self._sessions[kernel_id])
+            except Exception as e:
+                self.log.warning("Exception occurred starting persisted kernel session for id '{}': {}".
+                                 format(kernel_id, e))
+                started = False
+            finally:
+                self._reviving.discard(kernel_id)
+            if started:
+                self.log.info("Startup of persisted kernel session for id '{}' was successful.  Client should "
+                              "reconnect kernel.".format(kernel_id))
+            else:
+                self.log.warning("Startup of persisted kernel session for id '{}' was not successful.  Check if "
+                                 "client is still active and restart kernel.".format(kernel_id))
+            raise gen.Return((started, time.time() - start_time))
 
+    @gen.coroutine
     def _start_session(self, kernel_session):
-        # Attempt to start kernel from persisted state.  if started, record kernel_session in dictionary
-        # else delete session
+        # Attempt to start kernel from persisted state.  Returns True if started.
         kernel_id = kernel_session['kernel_id']
-        kernel_started = self.kernel_manager.start_kernel_from_session(
+        kernel_started = yield gen.maybe_future(self.kernel_manager.start_kernel_from_session(
             kernel_id=kernel_id,
             kernel_name=kernel_session['kernel_name'],
             connection_info=kernel_session['connection_info'],
             process_info=kernel_session['process_info'],
-            launch_args=kernel_session['launch_args'])
-        if not kernel_started:
-            return False
+            launch_args=kernel_session['launch_args']))
+        raise gen.Return(bool(kernel_started))
+
+    def reviving_sessions(self):
+        """Returns the sessions of the persisted kernels that have yet to be revived."""
+        return [self._sessions[kernel_id] for kernel_id in list(self._reviving) if kernel_id in self._sessions]
 
-        return True
+    def is_reviving(self, kernel_id):
+        """Returns True if the given kernel's persisted session has yet to be revived."""
+        return kernel_id in self._reviving
 
     def delete_session(self, kernel_id):
         """Removes saved session associated with kernel_id from dictionary and persisted storage."""
@@ -165,47 +263,114 @@ class KernelSessionManager(LoggingConfigurable):
         kernels_lock.acquire()
         try:
             for kernel_id in kernel_ids:
-                # Prior to removing session, update the per User list
-                kernel_session = self._sessions[kernel_id]
+                # Kernels without a session (e.g., those whose revival is failing) have nothing to remove
+                kernel_session = self._sessions.pop(kernel_id, None)
+                if kernel_session is None:
+                    continue
+                # Update the per User list
                 username = kernel_session['username']
-                if username in self._sessionsByUser and kernel_id in self._sessionsByUser[username]:
-                    self._sessionsByUser[username].remove(kernel_id)
-                self._sessions.pop(kernel_id, None)
+                if username in self._sessionsByUser:
+                    self._sessionsByUser[username].discard(kernel_id)
+                if self.enable_persistence:
+                    self._persist_deletion(kernel_id, username)
+        finally:
+            kernels_lock.release()
 
-            self._commit_sessions()  # persist changes
+    def _persist_session(self, kernel_id, kernel_session):
+        """Persists the (created or updated) session of the given kernel.
+
+        Called with kernels_lock held.
+        """
+        self._journal_record({'kernel_id': kernel_id,
+                              'session': self._pre_save_session_transformation(kernel_session)})
+
+    def _persist_deletion(self, kernel_id, username):
+        """Removes the session of the given kernel, owned by username, from persistent storage.
+
+        Called with kernels_lock held.
+        """
+        self._journal_record({'kernel_id': kernel_id, 'session': None})
+
+    def _journal_record(self, record):
+        # Appends the record to the journal.  Caller is responsible for single-threading call.
+        if self._journal is None:
+            self._journal = _open_private(self.kernel_session_journal, 'a')
+        self._journal.write(json.dumps(record) + '\n')
+        self._journal.flush()
+        self._journal_records += 1
+
+        # Compact once the journal is larger than both the threshold and the set of sessions so that
+        # the cost of compaction is amortized across the records it eliminates.
+        if self._journal_records > max(journal_compaction_threshold, len(self._sessions)):
+            self._compact_sessions()
+        elif self._journal_sync_timer is None:
+            self._journal_sync_timer = threading.Timer(journal_sync_interval, self._sync_journal)
+            self._journal_sync_timer.daemon = True
+            self._journal_sync_timer.start()
+
+    def _sync_journal(self):
+        # Syncs the journal records written since the previous sync to disk.
+        kernels_lock.acquire()
+        try:
+            self._journal_sync_timer = None
+            if self._journal is not None:
+                os.fsync(self._journal.fileno())
         finally:
             kernels_lock.release()
 
-    def _commit_sessions(self):
-        if self.enable_persistence:
-            # Commits the sessions dictionary to persistent store.  Caller is responsible for single-threading call.
-            with open(self.kernel_session_file, 'w') as fp:
-                json.dump(self._pre_save_transformation(self._sessions), fp)
-                fp.close()
+    def _compact_sessions(self):
+        # Writes the sessions dictionary as a snapshot, then truncates the journal.  The snapshot is written to
+        # a temporary file and renamed so that a crash cannot leave a partial snapshot.  Caller is responsible
+        # for single-threading call.
+        if self._journal_sync_timer is not None:
+            self._journal_sync_timer.cancel()
+            self._journal_sync_timer = None
+        start_time = time.time()
+        snapshot_file = self.kernel_session_file + '.tmp'
+        with _open_private(snapshot_file, 'w') as fp:
+            json.dump(self._pre_save_transformation(self._sessions), fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(snapshot_file, self.kernel_session_file)
+
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = _open_private(self.kernel_session_journal, 'w')
+        self._journal_records = 0
+        self.log.debug("Compacted {} kernel sessions into {} in {:.3f} secs.".
+                       format(len(self._sessions), self.kernel_session_file, time.time() - start_time))
 
     @staticmethod
     def _pre_save_transformation(sessions):
-        sessions_copy = copy.deepcopy(sessions)
-        for kernel_id, session in sessions_copy.items():
-            if session.get('connection_info'):
-                info = session['connection_info']
-                key = info.get('key')
-                if key:
-                    info['key'] = bytes_to_str(key)
+        return {kernel_id: KernelSessionManager._pre_save_session_transformation(session)
+                for kernel_id, session in sessions.items()}
 
-        return sessions_copy
+    @staticmethod
+    def _pre_save_session_transformation(session):
+        session_copy = copy.deepcopy(session)
+        if session_copy.get('connection_info'):
+            info = session_copy['connection_info']
+            key = info.get('key')
+            if key:
+                info['key'] = bytes_to_str(key)
+
+        return session_copy
 
     @staticmethod
     def _post_load_transformation(sessions):
-        sessions_copy = copy.deepcopy(sessions)
-        for kernel_id, session in sessions_copy.items():
-            if session.get('connection_info'):
-                info = session['connection_info']
-                key = info.get('key')
-                if key:
-                    info['key'] = str_to_bytes(key)
-
-        return sessions_copy
+        return {kernel_id: KernelSessionManager._post_load_session_transformation(session)
+                for kernel_id, session in sessions.items()}
+
+    @staticmethod
+    def _post_load_session_transformation(session):
+        session_copy = copy.deepcopy(session)
+        if session_copy.get('connection_info'):
+            info = session_copy['connection_info']
+            key = info.get('key')
+            if key:
+                info['key'] = str_to_bytes(key)
+
+        return session_copy
 
     def _get_sessions_loc(self):
         path = os.path.join(kernel_session_location, 'sessions')
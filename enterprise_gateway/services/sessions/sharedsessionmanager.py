@@ -0,0 +1,432 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Kernel session managers that persist sessions to a store shared by multiple Enterprise Gateway instances."""
+
+import abc
+import base64
+import json
+import os
+import socket
+import sqlite3
+import time
+
+from functools import partial
+
+import requests
+from ipython_genutils.py3compat import with_metaclass
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from traitlets import Float, Unicode, default
+from traitlets.config.configurable import LoggingConfigurable
+
+from .kernelsessionmanager import KernelSessionManager, kernels_lock
+from ..processproxies.processproxy import BackendExecutor
+
+
+class SharedKernelSessionManagerMeta(abc.ABCMeta, type(LoggingConfigurable)):
+    """Metaclass permitting abstract methods on (traitlets-based) kernel session managers."""
+
+
+class SharedKernelSessionManager(with_metaclass(SharedKernelSessionManagerMeta, KernelSessionManager)):
+    """Base class for kernel session managers that persist sessions to a shared store.
+
+    Sessions are stored individually - keyed by kernel_id and indexed by username - along with the
+    identifier of the Enterprise Gateway instance that owns the kernel.  Each instance periodically renews
+    a lease on its ownership.  Should an instance fail to renew its lease within the lease duration, its
+    sessions are considered orphaned and are adopted by the first instance to claim them, after which they
+    are revived via `start_kernel_from_session()`.  Since lease expirations are compared across instances,
+    their clocks are expected to be synchronized.
+
+    An instance whose lease has lapsed withholds its session changes from the store.  Once its lease is
+    renewed, it relinquishes the kernels whose sessions were adopted in the meantime, then persists the
+    withheld changes.  Sessions are also only updated or removed while owned by this instance, so a kernel
+    whose session is found to be owned by another instance is relinquished.
+
+    Calls against the store are made, in order, on a single-threaded executor so that they never block the
+    IOLoop.  For that reason, the number of sessions other instances hold for each user (see
+    `active_sessions()`) is refreshed each time the lease is renewed.
+
+    Subclasses implement the store-specific methods: `_store_session()`, `_remove_session()`,
+    `_list_sessions()`, `_foreign_sessions()`, `_renew_lease()` and `_acquire_orphaned_sessions()`.
+    """
+
+    owner_id_env = 'EG_KERNEL_SESSION_OWNER_ID'
+    owner_id = Unicode(config=True,
+                       help="""The identifier of this Enterprise Gateway instance relative to the owners of
+                       kernel sessions in the shared store.  Must be unique across instances.  An instance
+                       restarted with the same identifier immediately resumes ownership of its sessions.
+                       (EG_KERNEL_SESSION_OWNER_ID env var)""")
+
+    @default('owner_id')
+    def owner_id_default(self):
+        return os.getenv(self.owner_id_env, socket.gethostname())
+
+    lease_duration_env = 'EG_KERNEL_SESSION_LEASE_DURATION'
+    lease_duration_default_value = 30.0
+    lease_duration = Float(lease_duration_default_value, config=True,
+                           help="""The number of seconds an instance's ownership of its kernel sessions
+                           remains valid without being renewed.  Leases are renewed at a third of this
+                           interval.  (EG_KERNEL_SESSION_LEASE_DURATION env var)""")
+
+    @default('lease_duration')
+    def lease_duration_default(self):
+        return float(os.getenv(self.lease_duration_env, self.lease_duration_default_value))
+
+    def __init__(self, kernel_manager, **kwargs):
+        self._lease_callback = None
+        self._lease_expiry = 0  # time until which this instance's lease is known to be valid
+        self._withheld = {}  # kernel_id -> (username, session or None) of changes withheld while the lease lapsed
+        self._remote_sessions = {}  # username -> number of sessions owned by other instances
+        self._store_executor = BackendExecutor('sessions', 1)
+        super(SharedKernelSessionManager, self).__init__(kernel_manager, **kwargs)
+
+    def _load_sessions(self):
+        # Establish this instance's lease, then take ownership of any orphaned sessions (including those
+        # previously owned by this instance) so they can be revived by start_sessions().  Since this is called
+        # from the constructor, the store is called directly.
+        renewal_time = time.time()
+        self._renew_lease(renewal_time + self.lease_duration)
+        self._lease_expiry = renewal_time + self.lease_duration
+        self._add_sessions(self._acquire_orphaned_sessions(time.time(), include_own=True))
+
+    @gen.coroutine
+    def start_sessions(self):
+        """Begins maintaining this instance's lease, then starts the sessions loaded at construction."""
+        if self.enable_persistence and self._lease_callback is None:
+            self._lease_callback = PeriodicCallback(self._maintain_lease, self.lease_duration * 1000 / 3)
+            self._lease_callback.start()
+        yield super(SharedKernelSessionManager, self).start_sessions()
+
+    @gen.coroutine
+    def _maintain_lease(self):
+        # Renews this instance's lease - resuming ownership if it had lapsed - and refreshes the sessions of other
+        # instances, then adopts and revives the sessions of any instance whose lease expired.
+        renewal_time = time.time()
+        try:
+            yield self._store_executor.submit(self._renew_lease, renewal_time + self.lease_duration)
+            if renewal_time > self._lease_expiry:
+                yield self._resume_ownership(renewal_time + self.lease_duration)
+            else:
+                self._lease_expiry = renewal_time + self.lease_duration
+
+            sessions_by_user = yield self._store_executor.submit(self._list_sessions)
+            self._remote_sessions = {username: len(kernel_ids.difference(self._sessions))
+                                     for username, kernel_ids in sessions_by_user.items()}
+
+            sessions = yield self._store_executor.submit(self._acquire_orphaned_sessions, time.time())
+        except Exception as e:
+            self.log.warning("Failure occurred maintaining kernel session lease of '{}': {}".format(self.owner_id, e))
+            return
+
+        sessions = {kernel_id: kernel_session for kernel_id, kernel_session in sessions.items()
+                    if kernel_id not in self._sessions}
+        self._add_sessions(sessions)
+        if sessions:
+            self.log.info("Adopting orphaned kernel sessions for ids: {}".format(', '.join(sessions)))
+            yield self._revive_sessions(list(sessions))
+
+    @gen.coroutine
+    def _resume_ownership(self, lease_expiry):
+        # The lease had lapsed, so other instances may have adopted this instance's sessions.  Relinquish those
+        # kernels, then persist the changes withheld in the meantime.
+        self.log.warning("Kernel session lease of '{}' had expired, resuming ownership of its sessions.".
+                         format(self.owner_id))
+        foreign_sessions = yield self._store_executor.submit(self._foreign_sessions, list(self._sessions))
+        yield [self._relinquish_session(kernel_id) for kernel_id in foreign_sessions]
+
+        kernels_lock.acquire()
+        try:
+            self._lease_expiry = lease_expiry
+            withheld, self._withheld = self._withheld, {}
+            for kernel_id, (username, kernel_session) in withheld.items():
+                if kernel_session is None:
+                    self._persist_deletion(kernel_id, username)
+                elif kernel_id in self._sessions:
+                    self._persist_session(kernel_id, kernel_session)
+        finally:
+            kernels_lock.release()
+
+    @gen.coroutine
+    def _relinquish_session(self, kernel_id):
+        # Another instance owns the kernel's session, so remove it from memory - without persisting its deletion -
+        # and let the kernel manager stop managing the kernel.
+        kernels_lock.acquire()
+        try:
+            kernel_session = self._sessions.pop(kernel_id, None)
+            self._withheld.pop(kernel_id, None)
+            if kernel_session is not None:
+                self._sessionsByUser.get(kernel_session['username'], set()).discard(kernel_id)
+        finally:
+            kernels_lock.release()
+        if kernel_session is not None:
+            self.log.warning("Kernel session for id '{}' is owned by another instance, relinquishing its kernel.".
+                             format(kernel_id))
+            yield gen.maybe_future(self.kernel_manager.relinquish_kernel(kernel_id))
+
+    def _add_sessions(self, sessions):
+        # Adds the newly-owned (persisted form) sessions to the in-memory dictionaries.
+        for kernel_id, kernel_session in sessions.items():
+            kernel_session = self._post_load_session_transformation(kernel_session)
+            self._sessions[kernel_id] = kernel_session
+            self._sessionsByUser.setdefault(kernel_session['username'], set()).add(kernel_id)
+
+    def _persist_session(self, kernel_id, kernel_session):
+        if time.time() > self._lease_expiry:  # fenced until the lease is renewed
+            self._withheld[kernel_id] = (kernel_session['username'], kernel_session)
+            return
+        self._submit_store_call(kernel_id, self._store_session, kernel_id, kernel_session['username'],
+                                self._pre_save_session_transformation(kernel_session))
+
+    def _persist_deletion(self, kernel_id, username):
+        if time.time() > self._lease_expiry:  # fenced until the lease is renewed
+            self._withheld[kernel_id] = (username, None)
+            return
+        self._submit_store_call(kernel_id, self._remove_session, kernel_id, username)
+
+    def _submit_store_call(self, kernel_id, func, *args):
+        # Makes the (ordered) store call without waiting for its completion.
+        future = self._store_executor.submit(func, *args)
+        IOLoop.current().add_future(future, partial(self._store_call_completed, kernel_id))
+
+    def _store_call_completed(self, kernel_id, future):
+        try:
+            owned = future.result()
+        except Exception as e:
+            self.log.warning("Failure occurred persisting kernel session for id '{}': {}".format(kernel_id, e))
+            return
+        if owned is False:
+            return self._relinquish_session(kernel_id)  # the IOLoop reports its failure
+
+    def active_sessions(self, username):
+        """Returns the number of active sessions for the given username across all instances.
+
+        The sessions of other instances are those found when this instance's lease was last renewed.
+        """
+        count = super(SharedKernelSessionManager, self).active_sessions(username)
+        if self.enable_persistence:
+            count += self._remote_sessions.get(username, 0)
+        return count
+
+    @abc.abstractmethod
+    def _store_session(self, kernel_id, username, kernel_session):
+        """Inserts or updates the session of the given kernel as owned by this instance.  Returns False, without
+        updating the session, if it's owned by another instance.
+        """
+        pass
+
+    @abc.abstractmethod
+    def _remove_session(self, kernel_id, username):
+        """Removes the session of the given kernel, unless it's owned by another instance."""
+        pass
+
+    @abc.abstractmethod
+    def _list_sessions(self):
+        """Returns a dictionary of username to the set of kernel_ids of their sessions across all instances."""
+        pass
+
+    @abc.abstractmethod
+    def _foreign_sessions(self, kernel_ids):
+        """Returns those of the given kernel_ids whose sessions are owned by other instances."""
+        pass
+
+    @abc.abstractmethod
+    def _renew_lease(self, lease_expiry):
+        """Records that this instance's sessions are owned by it until the given expiry."""
+        pass
+
+    @abc.abstractmethod
+    def _acquire_orphaned_sessions(self, now, include_own=False):
+        """Takes ownership of the sessions whose owner's lease has expired relative to now - or, if include_own
+        is True, that are owned by this instance - and returns them as a dictionary of kernel_id to (persisted
+        form) session.  Ownership must be changed atomically so that only one instance adopts a given session.
+        """
+        pass
+
+
+class SQLiteKernelSessionManager(SharedKernelSessionManager):
+    """Persists kernel sessions to an (embedded) SQLite database.
+
+    Multiple Enterprise Gateway instances may share the database when it is located on a shared file system.
+    """
+
+    database_file_env = 'EG_KERNEL_SESSION_DATABASE'
+    database_file = Unicode(config=True,
+                            help="""The SQLite database file in which kernel sessions are persisted.  Defaults
+                            to kernels.db within the kernel session location.
+                            (EG_KERNEL_SESSION_DATABASE env var)""")
+
+    @default('database_file')
+    def database_file_default(self):
+        return os.getenv(self.database_file_env, os.path.join(self._get_sessions_loc(), 'kernels.db'))
+
+    def _load_sessions(self):
+        self._db = sqlite3.connect(self.database_file, timeout=self.lease_duration, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS kernel_sessions (
+                kernel_id TEXT PRIMARY KEY, username TEXT NOT NULL, owner TEXT NOT NULL, session TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS kernel_sessions_username ON kernel_sessions (username);
+            CREATE INDEX IF NOT EXISTS kernel_sessions_owner ON kernel_sessions (owner);
+            CREATE TABLE IF NOT EXISTS kernel_session_owners (owner TEXT PRIMARY KEY, lease_expiry REAL NOT NULL);
+        """)
+        super(SQLiteKernelSessionManager, self)._load_sessions()
+
+    def _store_session(self, kernel_id, username, kernel_session):
+        cursor = self._db.execute("INSERT INTO kernel_sessions (kernel_id, username, owner, session) "
+                                  "VALUES (?, ?, ?, ?) ON CONFLICT (kernel_id) DO UPDATE "
+                                  "SET username = excluded.username, session = excluded.session "
+                                  "WHERE owner = excluded.owner",
+                                  (kernel_id, username, self.owner_id, json.dumps(kernel_session)))
+        return cursor.rowcount == 1
+
+    def _remove_session(self, kernel_id, username):
+        self._db.execute("DELETE FROM kernel_sessions WHERE kernel_id = ? AND owner = ?", (kernel_id, self.owner_id))
+
+    def _list_sessions(self):
+        sessions_by_user = {}
+        for username, kernel_id in self._db.execute("SELECT username, kernel_id FROM kernel_sessions"):
+            sessions_by_user.setdefault(username, set()).add(kernel_id)
+        return sessions_by_user
+
+    def _foreign_sessions(self, kernel_ids):
+        foreign_sessions = self._db.execute("SELECT kernel_id FROM kernel_sessions WHERE owner != ?",
+                                            (self.owner_id,)).fetchall()
+        return set(kernel_ids).intersection(kernel_id for kernel_id, in foreign_sessions)
+
+    def _renew_lease(self, lease_expiry):
+        self._db.execute("INSERT OR REPLACE INTO kernel_session_owners (owner, lease_expiry) VALUES (?, ?)",
+                         (self.owner_id, lease_expiry))
+
+    def _acquire_orphaned_sessions(self, now, include_own=False):
+        sessions = {}
+        candidates = self._db.execute(
+            "SELECT s.kernel_id, s.owner, s.session FROM kernel_sessions s "
+            "LEFT JOIN kernel_session_owners o ON s.owner = o.owner "
+            "WHERE s.owner != ? AND (o.lease_expiry IS NULL OR o.lease_expiry < ?) OR s.owner = ? AND ?",
+            (self.owner_id, now, self.owner_id, include_own)).fetchall()
+        for kernel_id, owner, session in candidates:
+            # Only take ownership if no other instance has done so since the query.
+            cursor = self._db.execute("UPDATE kernel_sessions SET owner = ? WHERE kernel_id = ? AND owner = ?",
+                                      (self.owner_id, kernel_id, owner))
+            if cursor.rowcount == 1:
+                sessions[kernel_id] = json.loads(session)
+        return sessions
+
+
+class ConsulKernelSessionManager(SharedKernelSessionManager):
+    """Persists kernel sessions to the key-value store of a Consul agent via its HTTP API.
+
+    Sessions are stored at `<prefix>/kernels/<kernel_id>`, indexed by username via empty entries at
+    `<prefix>/users/<username>/<kernel_id>` and by owner via empty entries at `<prefix>/owned/<owner_id>/<kernel_id>`,
+    so that only the sessions of owners whose lease has expired are read.  Leases are stored at
+    `<prefix>/owners/<owner_id>`.  Changes to sessions use check-and-set against the entry's ModifyIndex.
+    """
+
+    consul_endpoint_env = 'EG_KERNEL_SESSION_CONSUL_ENDPOINT'
+    consul_endpoint_default_value = 'http://localhost:8500'
+    consul_endpoint = Unicode(consul_endpoint_default_value, config=True,
+                              help="""The http url of the Consul agent whose key-value store persists kernel
+                              sessions.  (EG_KERNEL_SESSION_CONSUL_ENDPOINT env var)""")
+
+    @default('consul_endpoint')
+    def consul_endpoint_default(self):
+        return os.getenv(self.consul_endpoint_env, self.consul_endpoint_default_value)
+
+    consul_prefix_env = 'EG_KERNEL_SESSION_CONSUL_PREFIX'
+    consul_prefix_default_value = 'enterprise-gateway/kernel-sessions'
+    consul_prefix = Unicode(consul_prefix_default_value, config=True,
+                            help="""The key prefix under which kernel sessions are stored.
+                            (EG_KERNEL_SESSION_CONSUL_PREFIX env var)""")
+
+    @default('consul_prefix')
+    def consul_prefix_default(self):
+        return os.getenv(self.consul_prefix_env, self.consul_prefix_default_value)
+
+    def _load_sessions(self):
+        self._consul = requests.Session()
+        super(ConsulKernelSessionManager, self)._load_sessions()
+
+    def _kv_request(self, method, key, **kwargs):
+        response = self._consul.request(method, '{}/v1/kv/{}/{}'.format(self.consul_endpoint, self.consul_prefix, key),
+                                        timeout=self.lease_duration / 3, **kwargs)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def _get_session_entry(self, kernel_id):
+        # Returns the ModifyIndex and (decoded) value of the kernel's session entry, (0, None) if there's none.
+        entries = self._kv_request('GET', 'kernels/' + kernel_id)
+        if not entries:
+            return 0, None
+        return entries[0]['ModifyIndex'], json.loads(base64.b64decode(entries[0]['Value']))
+
+    def _store_session(self, kernel_id, username, kernel_session):
+        modify_index, value = self._get_session_entry(kernel_id)
+        if value is not None and value['owner'] != self.owner_id:
+            return False
+        value = json.dumps({'owner': self.owner_id, 'session': kernel_session})
+        if not self._kv_request('PUT', 'kernels/' + kernel_id, data=value, params={'cas': modify_index}):
+            return False  # modified (i.e., adopted) since it was read
+        self._kv_request('PUT', 'users/{}/{}'.format(username, kernel_id))
+        self._kv_request('PUT', 'owned/{}/{}'.format(self.owner_id, kernel_id))
+        return True
+
+    def _remove_session(self, kernel_id, username):
+        modify_index, value = self._get_session_entry(kernel_id)
+        if value is not None and (value['owner'] != self.owner_id or
+                                  not self._kv_request('DELETE', 'kernels/' + kernel_id, params={'cas': modify_index})):
+            return
+        self._kv_request('DELETE', 'users/{}/{}'.format(username, kernel_id))
+        self._kv_request('DELETE', 'owned/{}/{}'.format(self.owner_id, kernel_id))
+
+    def _list_keys(self, prefix):
+        # Returns the final components of the keys under the given prefix, keyed by the components in between.
+        keys = {}
+        root = '{}/{}'.format(self.consul_prefix, prefix)
+        for key in self._kv_request('GET', prefix, params={'keys': True}) or []:
+            parent, _, name = key[len(root):].rpartition('/')
+            keys.setdefault(parent, set()).add(name)
+        return keys
+
+    def _list_sessions(self):
+        return self._list_keys('users/')
+
+    def _foreign_sessions(self, kernel_ids):
+        foreign_sessions = set()
+        for kernel_id in kernel_ids:
+            modify_index, value = self._get_session_entry(kernel_id)
+            if value is not None and value['owner'] != self.owner_id:
+                foreign_sessions.add(kernel_id)
+        return foreign_sessions
+
+    def _renew_lease(self, lease_expiry):
+        self._kv_request('PUT', 'owners/' + self.owner_id, data=json.dumps({'lease_expiry': lease_expiry}))
+
+    def _acquire_orphaned_sessions(self, now, include_own=False):
+        owners = []
+        for entry in self._kv_request('GET', 'owners/', params={'recurse': True}) or []:
+            owner = entry['Key'].rsplit('/', 1)[-1]
+            lease_expiry = json.loads(base64.b64decode(entry['Value']))['lease_expiry']
+            if owner == self.owner_id and include_own or owner != self.owner_id and lease_expiry < now:
+                owners.append(owner)
+
+        sessions = {}
+        for owner in owners:
+            for kernel_id in self._list_keys('owned/{}/'.format(owner)).get('', set()):
+                modify_index, value = self._get_session_entry(kernel_id)
+                if value is None or value['owner'] != owner:  # stale index entry
+                    self._kv_request('DELETE', 'owned/{}/{}'.format(owner, kernel_id))
+                    continue
+                # Index the session under this instance first so that it remains discoverable should this
+                # instance fail, then only take ownership if the entry hasn't been modified since it was read.
+                self._kv_request('PUT', 'owned/{}/{}'.format(self.owner_id, kernel_id))
+                value['owner'] = self.owner_id
+                if self._kv_request('PUT', 'kernels/' + kernel_id, data=json.dumps(value),
+                                    params={'cas': modify_index}):
+                    sessions[kernel_id] = value['session']
+                    if owner != self.owner_id:
+                        self._kv_request('DELETE', 'owned/{}/{}'.format(owner, kernel_id))
+                elif owner != self.owner_id:
+                    self._kv_request('DELETE', 'owned/{}/{}'.format(self.owner_id, kernel_id))
+        return sessions
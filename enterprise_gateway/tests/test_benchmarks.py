@@ -0,0 +1,36 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests that the kernel launch benchmark runs against each of its fake backends."""
+
+import unittest
+
+from enterprise_gateway.benchmarks.benchmark import run_benchmark, percentile
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def run_backend(self, backend_name):
+        results = run_benchmark(backend_name, kernels=2, concurrency=2)
+        self.assertEqual(results['errors'], {})
+        for operation in ('start', 'execute', 'interrupt', 'shutdown'):
+            self.assertEqual(results['latency'][operation]['count'], 2)
+        self.assertGreater(results['ioloop_lag']['count'], 0)
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_distributed(self):
+        self.run_backend('distributed')
+
+    def test_yarn(self):
+        self.run_backend('yarn')
+
+    def test_conductor(self):
+        self.run_backend('conductor')
+
+    def test_kubernetes(self):
+        self.run_backend('kubernetes')
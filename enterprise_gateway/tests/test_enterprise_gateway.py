@@ -2,8 +2,18 @@
 # Distributed under the terms of the Modified BSD License.
 """Tests for jupyter-enterprise-gateway."""
 
+import getpass
+import logging
+import sys
+import unittest
+
+from concurrent.futures import Future
+from jupyter_client import KernelManager
+from tornado import gen
 from tornado.testing import gen_test
 from tornado.escape import json_decode, url_escape
+from enterprise_gateway.services.kernels.remotemanager import RemoteKernelRestarter
+from enterprise_gateway.watchdog import IOLoopWatchdog
 from .test_jupyter_websocket import TestJupyterWebsocket
 
 
@@ -139,3 +149,219 @@ class TestEnterpriseGateway(TestJupyterWebsocket):
 
         for port in port_list:
             self.assertTrue(30000 <= port <= 31000)
+
+    @gen_test
+    def test_metrics(self):
+        """Kernel launch durations should be exposed via /api/metrics."""
+        response = yield self.http_client.fetch(
+            self.get_url('/api/kernels'),
+            method='POST',
+            body='{"env": {"KERNEL_USERNAME": "alice"} }'
+        )
+        self.assertEqual(response.code, 201)
+
+        response = yield self.http_client.fetch(self.get_url('/api/metrics'))
+        self.assertEqual(response.code, 200)
+        metrics = response.body.decode('utf-8')
+        self.assertIn('kernel_launch_duration_seconds_count{{kernelspec="python{}",process_proxy="LocalProcessProxy"}}'.
+                      format(sys.version_info.major), metrics)
+        self.assertIn('phase="process_spawn"', metrics)
+
+    @gen_test
+    def test_usage(self):
+        """Kernel counts per user and kernelspec should be exposed via /api/usage."""
+        app = self.get_app()
+        app.settings['kernel_manager'].parent.max_kernels_per_user = 1
+
+        # Concurrent requests for alice - only one may be admitted
+        responses = yield [self.http_client.fetch(self.get_url('/api/kernels'), method='POST',
+                                                  body='{"env": {"KERNEL_USERNAME": "alice"} }',
+                                                  raise_error=False) for _ in range(2)]
+        self.assertEqual(sorted(response.code for response in responses), [201, 403])
+
+        response = yield self.http_client.fetch(self.get_url('/api/usage'))
+        self.assertEqual(response.code, 200)
+        usage = json_decode(response.body)
+        self.assertEqual(usage['users'], {'alice': {'active': 1, 'launching': 0}})
+        self.assertEqual(usage['kernelspecs'], {'python{}'.format(sys.version_info.major):
+                                                {'active': 1, 'launching': 0}})
+        self.assertEqual(usage['limits']['max_kernels_per_user'], 1)
+        self.assertEqual(usage['ports']['kernels'], 1)  # the connection ports of the local kernel are reserved
+        self.assertEqual(usage['ports']['reserved'], 5)
+
+        kernel = json_decode([response for response in responses if response.code == 201][0].body)
+        yield self.http_client.fetch(self.get_url('/api/kernels/' + url_escape(kernel['id'])), method='DELETE')
+        response = yield self.http_client.fetch(self.get_url('/api/usage'))
+        usage = json_decode(response.body)
+        self.assertEqual(usage['users'], {})
+        self.assertEqual(usage['ports']['reserved'], 0)
+
+    @gen_test
+    def test_max_kernels(self):
+        """Concurrent start requests should collectively be limited to max_kernels."""
+        app = self.get_app()
+        app.settings['kernel_manager'].parent.max_kernels = 2
+
+        responses = yield [self.http_client.fetch(self.get_url('/api/kernels'), method='POST',
+                                                  body='{"env": {"KERNEL_USERNAME": "alice"} }',
+                                                  raise_error=False) for _ in range(3)]
+        self.assertEqual(sorted(response.code for response in responses), [201, 201, 403])
+
+    @gen_test
+    def test_shutdown(self):
+        """A kernel's session and usage should remain until its shutdown has completed."""
+        app = self.get_app()
+        km = app.settings['kernel_manager']
+        response = yield self.http_client.fetch(self.get_url('/api/kernels'), method='POST',
+                                                body='{"env": {"KERNEL_USERNAME": "alice"} }')
+        kernel_id = json_decode(response.body)['id']
+
+        future = km.shutdown_kernel(kernel_id)
+        self.assertIs(km.shutdown_kernel(kernel_id), future)  # concurrent requests share the shutdown
+        self.assertIn(kernel_id, km)
+        self.assertEqual(km.kernel_usage.active(username='alice'), 1)
+        self.assertEqual(km.parent.kernel_session_manager.active_sessions('alice'), 1)
+
+        yield future
+        self.assertNotIn(kernel_id, km)
+        self.assertEqual(km.kernel_usage.active(username='alice'), 0)
+        self.assertEqual(km.parent.kernel_session_manager.active_sessions('alice'), 0)
+
+    @gen_test
+    def test_watchdog(self):
+        """The IOLoop's lag should be exposed via /api/watchdog once the watchdog is enabled."""
+        response = yield self.http_client.fetch(self.get_url('/api/watchdog'), raise_error=False)
+        self.assertEqual(response.code, 404)
+
+        app = self.get_app()
+        watchdog = IOLoopWatchdog(0.05, logging.getLogger('test'), self.io_loop)
+        app.settings['ioloop_watchdog'] = watchdog
+        watchdog.start()
+        try:
+            yield gen.sleep(0.1)
+            response = yield self.http_client.fetch(self.get_url('/api/watchdog'))
+            stats = json_decode(response.body)
+            self.assertEqual(stats['threshold'], 0.05)
+            self.assertIsNotNone(stats['lag']['p99'])
+            self.assertEqual(stats['stalls'], [])
+        finally:
+            watchdog.stop()
+            del app.settings['ioloop_watchdog']
+
+    @gen_test
+    def test_launch_queue(self):
+        """Launches beyond the concurrency limit should be queued, and rejected once the queue is full."""
+        app = self.get_app()
+        app.settings['kg_list_kernels'] = True
+        km = app.settings['kernel_manager']
+        kernel_name = 'python{}'.format(sys.version_info.major)
+        km.parent.max_concurrent_launches = {kernel_name: 0}
+        km.parent.launch_queue_size = 1
+
+        queued_future = self.http_client.fetch(self.get_url('/api/kernels'), method='POST',
+                                               body='{"env": {"KERNEL_USERNAME": "alice"} }')
+
+        # The queued launch is reported by the kernels API
+        while not km.launch_scheduler.queued_requests():
+            yield gen.sleep(0.05)
+        response = yield self.http_client.fetch(self.get_url('/api/kernels'))
+        models = json_decode(response.body)
+        self.assertEqual(len(models), 1)
+        self.assertEqual(models[0]['execution_state'], 'queued')
+        self.assertEqual(models[0]['queue_position'], 1)
+
+        # The queue is full
+        response = yield self.http_client.fetch(self.get_url('/api/kernels'), method='POST',
+                                                body='{"env": {"KERNEL_USERNAME": "bob"} }', raise_error=False)
+        self.assertEqual(response.code, 429)
+        self.assertEqual(response.headers['Retry-After'], '30')
+
+        # Once capacity is available the queued launch proceeds
+        km.parent.max_concurrent_launches = {kernel_name: 1}
+        km.launch_scheduler._dispatch()
+        response = yield queued_future
+        self.assertEqual(response.code, 201)
+        self.assertEqual(json_decode(response.body)['id'], models[0]['id'])
+
+
+class TestWarmKernelPool(TestJupyterWebsocket):
+
+    def setup_app(self):
+        """Keep one python kernel warm, though the gateway user (the user of unclaimed kernels) is not authorized."""
+        super(TestWarmKernelPool, self).setup_app()
+        self.app.warm_kernel_pools = {'python{}'.format(sys.version_info.major): 1}
+        self.app.unauthorized_users = {getpass.getuser(), 'mallory'}
+
+    @gen.coroutine
+    def wait_for_warm_kernel(self, kernel_name):
+        km = self.get_app().settings['kernel_manager']
+        while not km._warm_kernels.get(kernel_name):
+            yield gen.sleep(0.1)
+        raise gen.Return(km._warm_kernels[kernel_name][0])
+
+    @gen_test(timeout=20)
+    def test_warm_kernel_handoff(self):
+        """Start requests should claim the warm kernel, after which the pool is replenished."""
+        kernel_name = 'python{}'.format(sys.version_info.major)
+        app = self.get_app()
+        app.settings['kg_list_kernels'] = True
+
+        warm_kernel_id = yield self.wait_for_warm_kernel(kernel_name)
+
+        # Warm kernels are not listed
+        response = yield self.http_client.fetch(self.get_url('/api/kernels'))
+        self.assertEqual(len(json_decode(response.body)), 0)
+
+        # Unauthorized users cannot claim the warm kernel, which remains in the pool
+        mallory_response = yield self.http_client.fetch(
+            self.get_url('/api/kernels'),
+            method='POST',
+            body='{"name": "%s", "env": {"KERNEL_USERNAME": "mallory"} }' % kernel_name,
+            raise_error=False
+        )
+        self.assertEqual(mallory_response.code, 403)
+        self.assertEqual(app.settings['kernel_manager']._warm_kernels[kernel_name], [warm_kernel_id])
+
+        # Request a kernel for bob - expect the warm kernel
+        bob_response = yield self.http_client.fetch(
+            self.get_url('/api/kernels'),
+            method='POST',
+            body='{"name": "%s", "env": {"KERNEL_USERNAME": "bob"} }' % kernel_name
+        )
+        self.assertEqual(bob_response.code, 201)
+        self.assertEqual(json_decode(bob_response.body)['id'], warm_kernel_id)
+        self.assertEqual(app.settings['kernel_manager'].parent.kernel_session_manager.active_sessions('bob'), 1)
+
+        # The pool is replenished with a different kernel
+        replenished_kernel_id = yield self.wait_for_warm_kernel(kernel_name)
+        self.assertNotEqual(replenished_kernel_id, warm_kernel_id)
+
+        # Requests with kernel variables cannot be satisfied by the warm kernel
+        alice_response = yield self.http_client.fetch(
+            self.get_url('/api/kernels'),
+            method='POST',
+            body='{"name": "%s", "env": {"KERNEL_USERNAME": "alice", "KERNEL_VAR1": "x"} }' % kernel_name
+        )
+        self.assertEqual(alice_response.code, 201)
+        self.assertNotEqual(json_decode(alice_response.body)['id'], replenished_kernel_id)
+
+
+class TestRemoteKernelRestarter(unittest.TestCase):
+
+    def test_restart_failure(self):
+        """A failed automatic restart should be logged and the kernel presumed dead."""
+        km = KernelManager()
+        km.restarting = True
+        restarter = RemoteKernelRestarter(kernel_manager=km)
+        dead = []
+        restarter.add_callback(lambda: dead.append(True), 'dead')
+        restarter._restarting = True
+        restarter._restart_count = 1
+
+        future = Future()
+        future.set_exception(RuntimeError("Kernel launch failed"))
+        restarter._restart_completed(future)
+        self.assertEqual(dead, [True])
+        self.assertFalse(restarter._restarting)
+        self.assertEqual(restarter._restart_count, 0)
+        self.assertFalse(km.restarting)
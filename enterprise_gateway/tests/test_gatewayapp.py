@@ -44,6 +44,7 @@ class TestGatewayAppConfig(unittest.TestCase):
         os.environ['KG_KEYFILE'] = '/test/fake.key'
         os.environ['KG_CERTFILE'] = '/test/fake.crt'
         os.environ['KG_CLIENT_CA'] = '/test/fake_ca.crt'
+        os.environ['EG_WARM_KERNEL_POOLS'] = 'fake_kernel:2, fake_kernel_forced:1'
 
         app = EnterpriseGatewayApp()
 
@@ -66,6 +67,7 @@ class TestGatewayAppConfig(unittest.TestCase):
         self.assertEqual(app.keyfile, '/test/fake.key')
         self.assertEqual(app.certfile, '/test/fake.crt')
         self.assertEqual(app.client_ca, '/test/fake_ca.crt')
+        self.assertEqual(app.warm_kernel_pools, {'fake_kernel': 2, 'fake_kernel_forced': 1})
 
 
 class TestGatewayAppBase(AsyncHTTPTestCase, ExpectLog):
@@ -0,0 +1,974 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the services shared by process proxies."""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+import uuid
+
+from collections import namedtuple
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Event, Lock, Thread, current_thread
+from Crypto.Cipher import AES
+from tornado import gen
+from tornado.tcpclient import TCPClient
+from tornado.testing import AsyncTestCase, gen_test
+
+from enterprise_gateway.services.processproxies import distributed, processproxy
+from enterprise_gateway.services.processproxies.conductor import ConductorClient, ConductorClusterProcessProxy
+from enterprise_gateway.services.processproxies.distributed import DistributedProcessProxy, HostRegistry
+from enterprise_gateway.services.processproxies.processproxy import ResponseManager, PayloadCipher, PortAllocator, \
+    BackendExecutors, LauncherChannel, LauncherRequestError, LocalProcessProxy, ProcessExitWatcher, SSHTunnelRegistry, \
+    has_exited, process_exit_watcher
+from enterprise_gateway.services.processproxies.yarn import YarnApplicationCache
+from enterprise_gateway.metrics import BACKEND_CALL_QUEUE_DEPTH
+
+
+def seal(payload, kernel_id, secret, purpose=b''):
+    """Seals `payload` as a (version 2) kernel launcher given the launch secret would."""
+    nonce = os.urandom(12)
+    cipher = AES.new(hashlib.sha256(secret.encode('utf-8')).digest(), AES.MODE_GCM, nonce=nonce)
+    cipher.update(PayloadCipher.associated_data(kernel_id, purpose))
+    ciphertext, tag = cipher.encrypt_and_digest(payload)
+    return nonce + ciphertext + tag
+
+
+def connection_info_frame(connection_info, kernel_id, secret):
+    sealed = seal(json.dumps(connection_info).encode('utf-8'), kernel_id, secret)
+    return PayloadCipher.associated_data(kernel_id) + struct.pack('>I', len(sealed)) + sealed
+
+
+def frame(message):
+    data = json.dumps(message).encode('utf-8')
+    return struct.pack('>I', len(data)) + data
+
+
+def recv_exactly(conn, size):
+    """Receives size bytes from conn, fewer should it be closed."""
+    data = b''
+    while len(data) < size:
+        buffer = conn.recv(size - len(data))
+        if not buffer:
+            break
+        data += buffer
+    return data
+
+
+def legacy_payload(connection_info, kernel_id):
+    payload = json.dumps(connection_info).encode('utf-8')
+    payload += (16 - len(payload) % 16) * b'%'
+    return base64.b64encode(AES.new(kernel_id[0:16].encode('utf-8'), AES.MODE_ECB).encrypt(payload))
+
+
+def heartbeat(kernel_id, secret, event='heartbeat', pid=1234):
+    event_info = json.dumps({'kernel_id': kernel_id, 'event': event, 'pid': str(pid)}).encode('utf-8')
+    payload = base64.b64encode(seal(event_info, kernel_id, secret, b'heartbeat')).decode('utf-8')
+    return (json.dumps({'kernel_id': kernel_id, 'version': 2, 'payload': payload}) + '\n').encode('utf-8')
+
+
+class TestResponseManager(AsyncTestCase):
+
+    def setUp(self):
+        super(TestResponseManager, self).setUp()
+        self.response_manager = ResponseManager.instance(logging.getLogger('test'))
+        self.kernel_id = str(uuid.uuid4())
+        self.secret = PayloadCipher.generate_launch_secret()
+        self.response_manager.register_kernel(self.kernel_id, self.secret)
+
+    def tearDown(self):
+        self.response_manager.stop()  # prior to the closure of its IOLoop
+        ResponseManager._instance = None
+        super(TestResponseManager, self).tearDown()
+
+    @gen.coroutine
+    def send(self, data):
+        ip, port = self.response_manager.response_address.split(':')
+        stream = yield TCPClient().connect(ip, int(port))
+        yield stream.write(data)
+        stream.close()
+
+    @gen_test
+    def test_connection_info_frame(self):
+        yield self.send(connection_info_frame({'shell_port': 1234}, self.kernel_id, self.secret))
+        connect_info = yield self.response_manager.get_connection_info(self.kernel_id, 2.0)
+        self.assertEqual(connect_info, {'shell_port': 1234})
+        self.assertFalse(self.response_manager.is_registered(self.kernel_id))
+
+    @gen_test
+    def test_legacy_payload(self):
+        other_kernel_id = str(uuid.uuid4())
+        self.response_manager.register_kernel(other_kernel_id, PayloadCipher.generate_launch_secret())
+        yield self.send(legacy_payload({'shell_port': 1234}, self.kernel_id))
+        connect_info = yield self.response_manager.get_connection_info(self.kernel_id, 2.0)
+        self.assertEqual(connect_info, {'shell_port': 1234})
+        self.assertTrue(self.response_manager.is_registered(other_kernel_id))
+
+    @gen_test
+    def test_invalid_legacy_payload(self):
+        with self.assertLogs('test', level='WARNING') as logs:
+            yield self.send(b'\xff' * 64)  # not utf-8
+            yield self.send(b'A' * (processproxy.max_frame_size + 2))
+            yield gen.sleep(0.2)
+        self.assertEqual(len(logs.output), 2)
+        self.assertTrue(all('Invalid payload' in line for line in logs.output))
+        self.assertTrue(self.response_manager.is_registered(self.kernel_id))
+
+    @gen_test
+    def test_wait_for_response(self):
+        """Waits for status changes end as soon as the kernel's connection info is received."""
+        start = time.monotonic()
+        yield [self.response_manager.wait_for_response(self.kernel_id, 5.0),
+               self.send(connection_info_frame({'shell_port': 1234}, self.kernel_id, self.secret))]
+        self.assertLess(time.monotonic() - start, 2.0)
+        connect_info = yield self.response_manager.get_connection_info(self.kernel_id, 0.1)
+        self.assertEqual(connect_info, {'shell_port': 1234})  # left in place for its retrieval
+
+    @gen_test
+    def test_tampered_frame(self):
+        frame = bytearray(connection_info_frame({'shell_port': 1234}, self.kernel_id, self.secret))
+        frame[-20] ^= 1
+        yield self.send(bytes(frame))
+        connect_info = yield self.response_manager.get_connection_info(self.kernel_id, 0.5)
+        self.assertIsNone(connect_info)
+
+    @gen_test
+    def test_wrong_secret(self):
+        # Though the kernel id (conveyed in the frame's header) is public, the launch secret is not
+        yield self.send(connection_info_frame({'shell_port': 1234}, self.kernel_id, self.kernel_id))
+        yield self.send(connection_info_frame({'shell_port': 1234}, self.kernel_id,
+                                              PayloadCipher.generate_launch_secret()))
+        connect_info = yield self.response_manager.get_connection_info(self.kernel_id, 0.5)
+        self.assertIsNone(connect_info)
+        self.assertTrue(self.response_manager.is_registered(self.kernel_id))
+
+        yield self.send(connection_info_frame({'shell_port': 1234}, self.kernel_id, self.secret))
+        connect_info = yield self.response_manager.get_connection_info(self.kernel_id, 2.0)
+        self.assertEqual(connect_info, {'shell_port': 1234})
+
+    @gen_test
+    def test_heartbeats(self):
+        ip, port = self.response_manager.response_address.split(':')
+        stream = yield TCPClient().connect(ip, int(port))
+        yield stream.write(heartbeat(self.kernel_id, self.secret))
+        yield gen.sleep(0.1)
+        self.assertTrue(self.response_manager.kernel_liveness(self.kernel_id, 1234))
+        self.assertIsNone(self.response_manager.kernel_liveness(self.kernel_id, 5678))  # other launcher
+
+        yield stream.write(heartbeat(self.kernel_id, self.secret, event='exit'))
+        yield gen.sleep(0.1)
+        self.assertFalse(self.response_manager.kernel_liveness(self.kernel_id, 1234))
+
+        self.response_manager.register_kernel(self.kernel_id, self.secret)  # restarted
+        yield stream.write(heartbeat(self.kernel_id, self.secret, pid=5678))
+        yield gen.sleep(0.1)
+        self.assertTrue(self.response_manager.kernel_liveness(self.kernel_id, 5678))
+        stream.close()
+        yield gen.sleep(0.1)
+        self.assertIsNone(self.response_manager.kernel_liveness(self.kernel_id, 5678))
+
+
+class TestHeartbeatLiveness(AsyncTestCase):
+
+    def setUp(self):
+        super(TestHeartbeatLiveness, self).setUp()
+        self.response_manager = ResponseManager.instance(logging.getLogger('test'))
+        self.proxy = DistributedProcessProxy.__new__(DistributedProcessProxy)  # only polling is exercised
+        self.proxy.log = logging.getLogger('test')
+        self.proxy.response_manager = self.response_manager
+        self.proxy.kernel_id = str(uuid.uuid4())
+        self.proxy.launch_secret = PayloadCipher.generate_launch_secret()
+        self.proxy.pid = 1234
+        self.proxy.local_proc = None
+        self.proxy.terminating = False
+        self.signals = []
+        self.proxy.send_signal = self.send_signal  # the fallback when liveness is unknown
+        self.response_manager.register_kernel(self.proxy.kernel_id, self.proxy.launch_secret)
+
+    def tearDown(self):
+        self.response_manager.stop()
+        ResponseManager._instance = None
+        super(TestHeartbeatLiveness, self).tearDown()
+
+    def send_signal(self, signum):
+        self.signals.append(signum)
+        return None
+
+    @gen.coroutine
+    def connect(self):
+        ip, port = self.response_manager.response_address.split(':')
+        stream = yield TCPClient().connect(ip, int(port))
+        raise gen.Return(stream)
+
+    @gen.coroutine
+    def send(self, stream, data):
+        yield stream.write(data)
+        yield gen.sleep(0.1)
+
+    @gen_test
+    def test_heartbeats(self):
+        stream = yield self.connect()
+        yield self.send(stream, heartbeat(self.proxy.kernel_id, self.proxy.launch_secret))
+        self.assertTrue(self.proxy.heartbeat_liveness())
+        self.assertIsNone(self.proxy.poll())
+        self.assertEqual(self.signals, [])  # the resource manager (or communication port) wasn't consulted
+
+        heartbeat_time = self.response_manager._heartbeats[self.proxy.kernel_id].time
+        self.response_manager._heartbeats[self.proxy.kernel_id] = \
+            self.response_manager._heartbeats[self.proxy.kernel_id]._replace(time=heartbeat_time - 60)
+        self.assertIsNone(self.proxy.heartbeat_liveness())  # late heartbeats
+        self.assertIsNone(self.proxy.poll())
+        self.assertEqual(self.signals, [0])
+        stream.close()
+
+    @gen_test
+    def test_exit_notification(self):
+        stream = yield self.connect()
+        yield self.send(stream, heartbeat(self.proxy.kernel_id, self.proxy.launch_secret))
+        yield self.send(stream, heartbeat(self.proxy.kernel_id, self.proxy.launch_secret, event='exit'))
+        self.assertFalse(self.proxy.heartbeat_liveness())
+        self.assertFalse(self.proxy.poll())
+
+        self.proxy.terminating = True  # the outcome of a termination isn't determined from heartbeats
+        self.assertIsNone(self.proxy.heartbeat_liveness())
+        self.assertIsNone(self.proxy.poll())
+        self.assertEqual(self.signals, [0])
+        stream.close()
+
+    @gen_test
+    def test_lost_connection(self):
+        stream = yield self.connect()
+        yield self.send(stream, heartbeat(self.proxy.kernel_id, self.proxy.launch_secret))
+        stream.close()
+        yield gen.sleep(0.1)
+        self.assertIsNone(self.proxy.heartbeat_liveness())
+        self.assertIsNone(self.proxy.poll())
+        self.assertEqual(self.signals, [0])
+
+    @gen_test
+    def test_forged_heartbeats(self):
+        kernel_id = self.proxy.kernel_id
+        stream = yield self.connect()
+        # neither heartbeats sealed with another secret (e.g., the public kernel id) nor legacy heartbeats count
+        yield self.send(stream, heartbeat(kernel_id, kernel_id, event='exit'))
+        yield self.send(stream, heartbeat(kernel_id, PayloadCipher.generate_launch_secret()))
+        event_info = json.dumps({'kernel_id': kernel_id, 'event': 'exit', 'pid': '1234'}).encode('utf-8')
+        event_info += (16 - len(event_info) % 16) * b'%'
+        legacy = base64.b64encode(AES.new(kernel_id[0:16].encode('utf-8'), AES.MODE_ECB).encrypt(event_info))
+        yield self.send(stream, (json.dumps({'kernel_id': kernel_id, 'payload': legacy.decode('utf-8')}) +
+                                 '\n').encode('utf-8'))
+        self.assertIsNone(self.proxy.heartbeat_liveness())
+        self.assertIsNone(self.proxy.poll())
+        self.assertEqual(self.signals, [0])
+
+        yield self.send(stream, heartbeat(kernel_id, self.proxy.launch_secret))  # the connection remains usable
+        self.assertTrue(self.proxy.heartbeat_liveness())
+        stream.close()
+
+
+class TestPortAllocator(unittest.TestCase):
+
+    def allocate(self, allocator, owner, lower_port, upper_port):
+        sock = allocator.allocate(owner, lower_port, upper_port)
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    def bind_free_range(self, size):
+        """Binds the upper port of a range whose other ports are free, so stray sockets can't skew the test."""
+        while True:
+            in_use = socket.socket()
+            in_use.bind(('', 0))
+            upper_port = in_use.getsockname()[1]
+            probes = []
+            try:
+                for port in range(upper_port - size + 1, upper_port):
+                    probe = socket.socket()
+                    probes.append(probe)
+                    probe.bind(('', port))
+                return in_use, upper_port - size + 1, upper_port
+            except OSError:
+                in_use.close()
+            finally:
+                for probe in probes:
+                    probe.close()
+
+    def test_reservations(self):
+        allocator = PortAllocator()
+        in_use, lower_port, upper_port = self.bind_free_range(10)
+        try:
+            ports = set(self.allocate(allocator, 'k1', lower_port, upper_port) for _ in range(9))
+            self.assertNotIn(in_use.getsockname()[1], ports)
+            self.assertEqual(len(ports), 9)
+            with self.assertRaises(RuntimeError):  # the remaining port is in use
+                allocator.allocate('k2', lower_port, upper_port)
+        finally:
+            in_use.close()
+
+        port = self.allocate(allocator, 'k2', lower_port, upper_port)  # the port that was in use
+        self.assertNotIn(port, ports)
+        stats = allocator.get_stats()
+        self.assertEqual(stats['reserved'], 10)
+        self.assertEqual(stats['ranges']['{}..{}'.format(lower_port, upper_port)]['utilization'], 1.0)
+
+        released = ports.pop()
+        allocator.release('k1', [released])
+        self.assertEqual(self.allocate(allocator, 'k2', lower_port, upper_port), released)
+        allocator.release('k1')
+        allocator.release('k2')
+        self.assertEqual(allocator.get_stats()['reserved'], 0)
+        self.assertFalse(allocator.is_reserved(released))
+
+    def test_unranged(self):
+        allocator = PortAllocator()
+        port = self.allocate(allocator, 'k1', 0, 0)
+        self.assertTrue(allocator.is_reserved(port))
+        allocator.reserve('k2', [port])  # already reserved by k1
+        allocator.release('k2')
+        self.assertTrue(allocator.is_reserved(port))
+        allocator.release('k1')
+        self.assertFalse(allocator.is_reserved(port))
+
+
+class FakeSSHClient(object):
+    """Stands in for an ssh client whose channels are connected directly to the destination."""
+
+    def __init__(self):
+        self.active = True
+
+    def get_transport(self):
+        return self
+
+    def is_active(self):
+        return self.active
+
+    def open_channel(self, kind, destination, source):
+        return socket.create_connection(destination)
+
+    def close(self):
+        self.active = False
+
+
+class TestSSHTunnelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = SSHTunnelRegistry()
+        self.log = logging.getLogger('test')
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.clients = []
+
+    def tearDown(self):
+        self.server.close()
+
+    def connect(self, server):
+        client = FakeSSHClient()
+        self.clients.append(client)
+        return client
+
+    def open_tunnel(self, server, connect=None):
+        local_port = PortAllocator().allocate('test', 0, 0).getsockname()[1]
+        return self.registry.open_tunnel(local_port, '127.0.0.1', self.server.getsockname()[1], server,
+                                         connect or self.connect, self.log)
+
+    def echo(self, tunnel, data):
+        conn = socket.create_connection(('127.0.0.1', tunnel.listener.getsockname()[1]), timeout=5)
+        try:
+            peer, _ = self.server.accept()
+            conn.sendall(data)
+            peer.sendall(peer.recv(1024))
+            peer.close()
+            return conn.recv(1024)
+        finally:
+            conn.close()
+
+    def test_tunnels(self):
+        tunnel1 = self.open_tunnel('host1')
+        tunnel2 = self.open_tunnel('host1')
+        self.assertEqual(len(self.clients), 1)  # the connection to the server is shared
+        self.assertEqual(self.echo(tunnel1, b'one'), b'one')
+        self.assertEqual(self.echo(tunnel2, b'two'), b'two')
+
+        self.registry.close_tunnel(tunnel1)
+        self.assertTrue(self.clients[0].active)
+        self.registry.close_tunnel(tunnel2)
+        self.assertFalse(self.clients[0].active)  # closed with its last tunnel
+        tunnel2._thread.join(5)
+        self.assertEqual(tunnel2.listener.fileno(), -1)
+
+    def test_slow_connect(self):
+        tunnel = self.open_tunnel('host1')
+        connecting, connected = Event(), Event()
+
+        def slow_connect(server):
+            connecting.set()
+            connected.wait(5)
+            return self.connect(server)
+
+        tunnels = []
+        thread = Thread(target=lambda: tunnels.append(self.open_tunnel('host2', slow_connect)))
+        thread.start()
+        try:
+            self.assertTrue(connecting.wait(5))
+            self.assertEqual(self.echo(tunnel, b'data'), b'data')  # not held up by the handshake with host2
+            self.registry.close_tunnel(self.open_tunnel('host1'))
+        finally:
+            connected.set()
+            thread.join(5)
+        for tunnel in [tunnel] + tunnels:
+            self.registry.close_tunnel(tunnel)
+        self.assertEqual(self.registry._users, {})
+
+    def test_bind_failure(self):
+        in_use = self.server.getsockname()[1]
+        with self.assertRaises(OSError):
+            self.registry.open_tunnel(in_use, '127.0.0.1', in_use, 'host1', self.connect, self.log)
+        self.assertEqual(self.clients, [])  # no connection was established
+        self.assertEqual(self.registry._users, {})
+
+
+class TestTunnelSetup(AsyncTestCase):
+
+    def setUp(self):
+        super(TestTunnelSetup, self).setUp()
+        self.tunneling_enabled = processproxy.tunneling_enabled
+        processproxy.tunneling_enabled = True
+        self.proxy = DistributedProcessProxy.__new__(DistributedProcessProxy)  # only connection setup is exercised
+        self.proxy.log = logging.getLogger('test')
+        self.proxy.kernel_id = str(uuid.uuid4())
+        self.proxy.assigned_ip = '10.0.0.1'
+        self.proxy.tunneled_connect_info = None
+        self.proxy._tunnel_to_kernel = self.tunnel_to_kernel
+        self.proxy._tunnel_to_port = lambda kernel_channel, remote_ip, remote_port, server: 50006
+        self.tunnel_threads = []
+        self.connections = []
+        self.proxy._update_connection = self.connections.append
+
+    def tearDown(self):
+        processproxy.tunneling_enabled = self.tunneling_enabled
+        super(TestTunnelSetup, self).tearDown()
+
+    def tunnel_to_kernel(self, connection_info, server):
+        self.tunnel_threads.append(current_thread().name)
+        return [50001, 50002, 50003, 50004, 50005]
+
+    @gen_test
+    def test_tunnels(self):
+        """Tunnels should be opened on the ssh backend's executor, then restored from the persisted info."""
+        connect_info = {'shell_port': 1, 'iopub_port': 2, 'stdin_port': 3, 'hb_port': 4, 'control_port': 5,
+                        'comm_port': 6}
+        yield self.proxy._setup_connection_info(connect_info)
+        self.assertTrue(self.tunnel_threads[0].startswith('EG-ssh'))
+        self.assertEqual(self.connections[0]['ip'], '127.0.0.1')
+        self.assertEqual(self.connections[0]['shell_port'], 50001)
+        self.assertEqual(self.proxy.comm_port, 50006)
+        self.assertEqual(self.proxy.tunneled_connect_info['shell_port'], 1)
+
+        yield self.proxy.restore_tunnels()
+        self.assertEqual(len(self.tunnel_threads), 2)
+        self.assertEqual(self.connections[1]['control_port'], 50005)
+        self.assertEqual(self.proxy.tunneled_connect_info['control_port'], 5)
+
+
+class TestLauncherChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.server.settimeout(0.1)
+        self.requests = []
+        self.reply = lambda request: frame({'id': request['id'], 'status': 'ok'})
+        self.keep_open = True
+        self.stopped = Event()
+        self.thread = Thread(target=self.serve)
+        self.thread.start()
+        self.channel = LauncherChannel('127.0.0.1', self.server.getsockname()[1])
+
+    def tearDown(self):
+        self.channel.close()
+        self.stopped.set()
+        self.thread.join(5)
+        self.server.close()
+
+    def serve(self):
+        """Mimics the launcher's listener, replying to each request with self.reply(request)."""
+        while not self.stopped.is_set():
+            try:
+                conn, addr = self.server.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                conn.settimeout(5)
+                header = recv_exactly(conn, 4)
+                if header.startswith(b'{'):  # single request, read until the gateway closes
+                    self.requests.append(json.loads((header + recv_exactly(conn, 1024)).decode('utf-8')))
+                    continue
+                while header:
+                    request = json.loads(recv_exactly(conn, struct.unpack('>I', header)[0]).decode('utf-8'))
+                    self.requests.append(request)
+                    reply = self.reply(request)
+                    if not reply:  # drop the connection without acknowledging the request
+                        break
+                    conn.sendall(reply)
+                    if not self.keep_open:
+                        break
+                    header = recv_exactly(conn, 4)
+
+    def test_request(self):
+        self.assertEqual(self.channel.request({'signum': 0}), {'id': 1, 'status': 'ok'})
+        self.assertEqual(self.channel.request({'signum': 2}), {'id': 2, 'status': 'ok'})
+        self.reply = lambda request: frame({'id': request['id'], 'status': 'error', 'message': 'No such process'})
+        with self.assertRaisesRegex(LauncherRequestError, 'No such process'):
+            self.channel.request({'signum': 9})
+        self.assertEqual(self.requests, [{'signum': 0, 'id': 1}, {'signum': 2, 'id': 2}, {'signum': 9, 'id': 3}])
+
+    def test_reconnect(self):
+        """A request following the launcher's closure of the connection is sent, once, over a new connection."""
+        self.keep_open = False
+        self.channel.request({'signum': 0})
+        time.sleep(0.2)
+        self.assertEqual(self.channel.request({'signum': 2})['id'], 2)
+        self.assertEqual(self.requests, [{'signum': 0, 'id': 1}, {'signum': 2, 'id': 2}])
+
+    def test_lost_acknowledgement(self):
+        """A request whose frame was written is not sent again, the launcher may have performed it."""
+        self.reply = lambda request: None
+        with self.assertRaises(OSError):
+            self.channel.request({'signum': 2})
+        self.assertEqual(self.requests, [{'signum': 2, 'id': 1}])
+
+    def test_oversize_frame(self):
+        self.reply = lambda request: struct.pack('>I', processproxy.max_frame_size + 1)
+        with self.assertRaises(ValueError):
+            self.channel.request({'signum': 0})
+        self.assertIsNone(self.channel._sock)
+
+    def test_legacy_request(self):
+        """Launchers lacking the control channel receive each request over its own connection."""
+        proxy = DistributedProcessProxy.__new__(DistributedProcessProxy)  # only listener requests are exercised
+        proxy.comm_protocol = 0
+        proxy.comm_ip, proxy.comm_port = self.server.getsockname()
+        proxy.control_channel = None
+        proxy._send_listener_request({'signum': 0})
+        deadline = time.time() + 5
+        while not self.requests and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.requests, [{'signum': 0}])
+        self.assertIsNone(proxy.control_channel)
+
+
+class TestRemoteLaunch(unittest.TestCase):
+
+    def test_launch_secret(self):
+        """The launch secret is conveyed to remote launches via stdin, rather than on the command line."""
+        proxy = DistributedProcessProxy.__new__(DistributedProcessProxy)  # only the remote launch is exercised
+        proxy.log = logging.getLogger('test')
+        proxy.ip = proxy.assigned_host = '10.0.0.1'
+        proxy.kernel_manager = namedtuple('KernelManager', 'kernel_spec')(namedtuple('KernelSpec', 'env')({}))
+        commands = []
+        proxy.rsh = lambda host, cmd, input=None: commands.append((cmd, input)) or ['1234\n']
+        secret = PayloadCipher.generate_launch_secret()
+        env = {'KERNEL_ID': str(uuid.uuid4()), 'KERNEL_LAUNCH_SECRET': secret}
+        self.assertEqual(proxy._launch_remote_process(['python', 'launch_ipykernel.py'], env=env), '1234')
+        cmd, stdin = commands[0]
+        self.assertNotIn(secret, cmd)
+        self.assertIn('read -r KERNEL_LAUNCH_SECRET; export KERNEL_LAUNCH_SECRET;', cmd)
+        self.assertEqual(stdin, secret + '\n')
+
+
+class TestPollBackoff(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = DistributedProcessProxy.__new__(DistributedProcessProxy)  # only poll pacing is exercised
+        self.proxy.pending_states = {'ACCEPTED'}
+        self.proxy.launch_polls = 0
+        self.proxy.launch_pending = False
+        self.proxy.launch_poll_interval = None
+
+    def intervals(self, count):
+        return [self.proxy.next_poll_interval() for i in range(count)]
+
+    def test_backoff(self):
+        intervals = self.intervals(12)
+        self.assertEqual(intervals[0], processproxy.min_poll_interval)
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], processproxy.poll_interval)
+
+        self.proxy.set_launch_state('ACCEPTED')  # pending on the resource manager, back off further
+        intervals = self.intervals(20)
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], processproxy.max_poll_interval)
+
+        self.proxy.set_launch_state('RUNNING')  # no longer pending, resume fast polling
+        self.assertEqual(self.intervals(1), [processproxy.min_poll_interval])
+        self.assertEqual(self.proxy.launch_polls, 33)
+
+
+class TestYarnApplicationCache(unittest.TestCase):
+
+    class ResourceManager(object):
+        def __init__(self):
+            self.queries = []
+            self.apps = []
+
+        def cluster_applications(self, started_time_begin=None):
+            self.queries.append(started_time_begin)
+            if self.apps is None:
+                raise ConnectionError("Resource manager unavailable.")
+            return namedtuple('Response', 'data')({'apps': {'app': self.apps}})
+
+    def setUp(self):
+        self.resource_mgr = self.ResourceManager()
+        self.log = logging.getLogger('test')
+        self.cache = YarnApplicationCache.instance('http://rm:8088', False, self.resource_mgr, self.log)
+
+    def tearDown(self):
+        YarnApplicationCache._instances = {}
+
+    def test_instance(self):
+        self.assertIs(YarnApplicationCache.instance('http://rm:8088', False, None, None), self.cache)
+        self.assertIsNot(YarnApplicationCache.instance('http://rm:8088', True, None, None), self.cache)
+
+    def test_refresh(self):
+        kernel_id, other_kernel_id = str(uuid.uuid4()), str(uuid.uuid4())
+        app = {'id': 'application_1_0001', 'name': kernel_id, 'startedTime': 2000, 'state': 'ACCEPTED'}
+        self.resource_mgr.apps = [app, {'id': 'application_1_0002', 'name': 'other', 'startedTime': 3000}]
+        self.cache.track(kernel_id, 2000)
+        self.cache.track(other_kernel_id, 1000)
+        self.assertEqual(self.cache.get_app_by_kernel(kernel_id), app)
+        self.assertEqual(self.resource_mgr.queries, ['1000'])  # covers the earliest pending launch
+        self.assertEqual(self.cache.get_app_by_id('application_1_0001'), app)
+        self.assertIsNone(self.cache.get_app_by_id('application_1_0002'))  # not a kernel of this gateway
+        self.assertEqual(len(self.resource_mgr.queries), 1)  # served from the cache until the refresh interval
+
+        self.cache.untrack(other_kernel_id)  # launched, no longer covered
+        self.cache._last_refresh = 0
+        self.resource_mgr.apps = None  # the failed refresh retains the previous contents
+        self.assertEqual(self.cache.get_app_by_kernel(kernel_id), app)
+        self.assertEqual(self.resource_mgr.queries, ['1000', '2000'])
+
+
+class ConductorHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the subset of the Conductor REST API used by ConductorClusterProcessProxy."""
+    requests = []  # (method, path, authorization, cookie) of each request
+    states = {}  # driver_id -> application state
+
+    def _reply(self, body):
+        self.requests.append((self.command, self.path, self.headers.get('Authorization'), self.headers.get('Cookie')))
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        driver_id = self.path.rsplit('=', 1)[-1].replace('app-', '')  # by driverid or applicationid
+        apps = [{'applicationid': 'app-' + driver_id, 'state': self.states[driver_id],
+                 'driver': {'id': driver_id, 'host': 'localhost'}}] if driver_id in self.states else []
+        self._reply({'applist': apps})
+
+    def do_POST(self):
+        driver_id = self.path.rsplit('/', 1)[-1]
+        self.states[driver_id] = 'KILLED'
+        self._reply({'success': True})
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConductorClient(AsyncTestCase):
+
+    def setUp(self):
+        super(TestConductorClient, self).setUp()
+        ConductorHandler.requests = []
+        ConductorHandler.states = {'driver-1': 'RUNNING'}
+        self.server = HTTPServer(('127.0.0.1', 0), ConductorHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.data_dir = tempfile.mkdtemp()
+        self.cookie_jar = os.path.join(self.data_dir, 'cookie.jar')
+        self.write_cookie_jar('first')
+        self.log = logging.getLogger('test')
+        self.response_manager = ResponseManager.instance(self.log)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.data_dir)
+        ConductorClient._instances = {}
+        self.response_manager.stop()
+        ResponseManager._instance = None
+        super(TestConductorClient, self).tearDown()
+
+    def write_cookie_jar(self, value, mtime=None):
+        # Written as curl would, with an expiration of 0 denoting a session cookie.
+        with open(self.cookie_jar, 'w') as fp:
+            fp.write('# Netscape HTTP Cookie File\n127.0.0.1\tFALSE\t/\tFALSE\t0\tplatform.sid\t{}\n'.format(value))
+        if mtime:
+            os.utime(self.cookie_jar, (mtime, mtime))
+
+    def proxy(self):
+        proxy = ConductorClusterProcessProxy.__new__(ConductorClusterProcessProxy)  # only REST requests are exercised
+        proxy.log = self.log
+        proxy.kernel_id = str(uuid.uuid4())
+        proxy.driver_id = 'driver-1'
+        proxy.application_id = None
+        proxy.rest_credential = 'Basic credential'
+        proxy.start_time = time.time()
+        proxy.local_proc = None
+        proxy.ip = None
+        proxy.pid = 0
+        proxy.terminating = False
+        proxy.response_manager = self.response_manager
+        proxy.conductor_client = ConductorClient.instance(self.endpoint, '', self.cookie_jar, self.log)
+        proxy._pidfd_lock = Lock()
+        return proxy
+
+    def test_security_opts(self):
+        client = ConductorClient(self.endpoint, '-k --cert client.pem:password --key client.key --verbose',
+                                 self.cookie_jar, self.log)
+        self.assertFalse(client.session.verify)
+        self.assertEqual(client.session.cert, ('client.pem', 'client.key'))
+        client = ConductorClient(self.endpoint, '--cacert ca.pem', self.cookie_jar, self.log)
+        self.assertEqual(client.session.verify, 'ca.pem')
+        self.assertIsNone(client.session.cert)
+
+    def test_request(self):
+        client = ConductorClient.instance(self.endpoint, '', self.cookie_jar, self.log)
+        self.assertIs(ConductorClient.instance(self.endpoint, '', self.cookie_jar, self.log), client)
+        self.assertIsNot(ConductorClient.instance(self.endpoint, '-k', self.cookie_jar, self.log), client)
+
+        response = client.request('GET', '/v1/applications?driverid=driver-1', 'Basic credential')
+        self.assertEqual(response['applist'][0]['state'], 'RUNNING')
+        self.assertEqual(ConductorHandler.requests[-1][2:], ('Basic credential', 'platform.sid=first'))
+
+        # The cookie jar is only reloaded once it changes
+        self.write_cookie_jar('second', mtime=os.path.getmtime(self.cookie_jar) + 10)
+        client.request('GET', '/v1/applications?driverid=driver-1', 'Basic credential')
+        self.assertEqual(ConductorHandler.requests[-1][3], 'platform.sid=second')
+
+    @gen_test
+    def test_poll_and_kill(self):
+        proxy = self.proxy()
+        self.assertIsNone((yield proxy.run_in_backend(proxy.poll)))
+        self.assertEqual(proxy.application_id, 'app-driver-1')
+
+        self.assertIsNone((yield proxy.run_in_backend(proxy.kill)))  # the application reached a final state
+        self.assertIn(('POST', '/v1/submissions/kill/driver-1'), [request[:2] for request in ConductorHandler.requests])
+        self.assertFalse((yield proxy.run_in_backend(proxy.poll)))
+
+        # Without a driver id, the application's driver is looked up prior to the kill
+        ConductorHandler.states['driver-1'] = 'RUNNING'
+        proxy.driver_id = None
+        self.assertEqual((yield proxy.run_in_backend(proxy._kill_app_by_driver_id, None)), {'success': True})
+        self.assertEqual(proxy.driver_id, 'driver-1')
+        self.assertEqual(ConductorHandler.states['driver-1'], 'KILLED')
+
+
+class TestBackendExecutors(AsyncTestCase):
+
+    @gen_test
+    def test_isolation(self):
+        executors = BackendExecutors(2, 'test-yarn:1')
+        self.assertEqual(executors.get('test-yarn').max_workers, 1)
+        self.assertEqual(executors.get('test-ssh').max_workers, 2)
+
+        started, hung = Event(), Event()
+
+        def hang():
+            started.set()
+            return hung.wait(10)
+
+        hung_call = executors.submit('test-yarn', hang)
+        while not started.is_set():
+            yield gen.sleep(0.01)
+        queued_call = executors.submit('test-yarn', lambda: 'queued')
+        result = yield executors.submit('test-ssh', lambda host: host, 'host1')  # unaffected by the hung backend
+        self.assertEqual(result, 'host1')
+        self.assertEqual(BACKEND_CALL_QUEUE_DEPTH.labels('test-yarn')._value.get(), 1)
+
+        hung.set()
+        results = yield [hung_call, queued_call]
+        self.assertEqual(results, [True, 'queued'])
+        self.assertEqual(BACKEND_CALL_QUEUE_DEPTH.labels('test-yarn')._value.get(), 0)
+
+
+class TestLocalSignal(unittest.TestCase):
+
+    def proxy(self, pid):
+        proxy = LocalProcessProxy.__new__(LocalProcessProxy)  # only signaling is exercised
+        proxy.log = logging.getLogger('test')
+        proxy.pid = pid
+        proxy.pgid = 0
+        proxy._pidfd = None
+        proxy._pidfd_lock = Lock()
+        return proxy
+
+    def test_signals(self):
+        process = subprocess.Popen(['sleep', '30'])
+        proxy = self.proxy(process.pid)
+        self.assertIsNone(proxy.local_signal(0))
+        self.assertIsNone(proxy.local_signal(signal.SIGTERM))
+
+        deadline = time.monotonic() + 10
+        while proxy.local_signal(0) is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(proxy.local_signal(0))
+        with self.assertRaises(ChildProcessError):  # the terminated child was reaped
+            os.waitpid(process.pid, os.WNOHANG)
+        self.assertFalse(proxy.local_signal(signal.SIGTERM))  # ESRCH
+        process.returncode = -signal.SIGTERM
+        proxy.cleanup()
+        self.assertIsNone(proxy._pidfd)
+
+    def test_kill(self):
+        proxy = self.proxy(0)
+        proxy.local_proc = subprocess.Popen(['sleep', '30'])
+        start_time = time.monotonic()
+        proxy.kill()
+        self.assertLess(time.monotonic() - start_time, 0.4)  # the exit is detected without sleeping between polls
+        self.assertEqual(proxy.local_proc.returncode, -signal.SIGTERM)
+
+    @unittest.skipIf(os.getuid() == 0, "all processes can be signaled by root")
+    def test_not_permitted(self):
+        proxy = self.proxy(1)
+        self.assertIsNone(proxy.local_signal(0))  # the process exists, but belongs to another user
+        self.assertFalse(proxy.local_signal(signal.SIGTERM))
+
+
+class TestProcessExitWatcher(AsyncTestCase):
+
+    def setUp(self):
+        super(TestProcessExitWatcher, self).setUp()
+        self.watcher = ProcessExitWatcher()
+        self.process = subprocess.Popen(['sleep', '30'])
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        super(TestProcessExitWatcher, self).tearDown()
+
+    @gen_test
+    def test_watch(self):
+        unwatched = self.watcher.watch(self.process.pid)
+        future = self.watcher.watch(self.process.pid)
+        self.watcher.unwatch(self.process.pid, unwatched)
+        self.io_loop.call_later(0.1, self.process.terminate)
+        yield gen.with_timeout(timedelta(seconds=1), future)
+        self.assertFalse(unwatched.done())
+        self.assertTrue(has_exited(self.process.pid))  # not yet reaped
+        self.assertEqual(self.process.wait(), -signal.SIGTERM)
+        self.assertEqual(self.watcher._watches, {})
+
+    def test_wait(self):
+        self.assertFalse(self.watcher.wait(self.process.pid, 0.1))
+        self.assertFalse(has_exited(self.process.pid))
+        self.process.terminate()
+        self.assertTrue(self.watcher.wait(self.process.pid, 5))
+        self.process.wait()
+        self.assertTrue(self.watcher.wait(self.process.pid, 5))  # no longer exists
+
+    @gen_test
+    def test_await_exit(self):
+        proxy = LocalProcessProxy.__new__(LocalProcessProxy)  # only the wait for exit is exercised
+        proxy.log = logging.getLogger('test')
+        proxy.local_proc = self.process
+        proxy._pidfd_lock = Lock()
+        exited = yield proxy.await_exit(0.1)
+        self.assertFalse(exited)
+        self.assertEqual(process_exit_watcher._watches, {})
+
+        self.io_loop.call_later(0.1, self.process.terminate)
+        start_time = time.monotonic()
+        exited = yield proxy.await_exit(5)
+        self.assertTrue(exited)
+        self.assertLess(time.monotonic() - start_time, 1)
+        self.assertEqual(self.process.returncode, -signal.SIGTERM)  # reaped
+
+
+class TestHostSelection(AsyncTestCase):
+
+    def setUp(self):
+        super(TestHostSelection, self).setUp()
+        self.host_registry = distributed.host_registry = HostRegistry()
+        self.loads = {'host1': '4.0', 'host2': '1.0', 'host3': '6.0'}
+
+    def tearDown(self):
+        distributed.host_registry = HostRegistry()
+        super(TestHostSelection, self).tearDown()
+
+    def proxy(self, host_selection, host_weights=None):
+        proxy = DistributedProcessProxy.__new__(DistributedProcessProxy)  # only host selection is exercised
+        proxy.log = logging.getLogger('test')
+        proxy.hosts = ['host1', 'host2', 'host3']
+        proxy.host_selection = host_selection
+        proxy.host_weights = host_weights or {}
+        proxy._probe_host = self.probe_host
+        return proxy
+
+    def probe_host(self, host):
+        if self.loads.get(host) is None:
+            raise IOError("unreachable")
+        return [self.loads[host] + '\n', '2\n', '1024\n']
+
+    @gen.coroutine
+    def place(self, proxy, count):
+        hosts = []
+        for i in range(count):
+            host = yield proxy._determine_next_host()
+            self.host_registry.add_kernel(host, str(uuid.uuid4()))
+            hosts.append(host)
+        raise gen.Return(hosts)
+
+    @gen_test
+    def test_least_kernels(self):
+        self.host_registry.add_kernel('host1', 'k1')
+        self.host_registry.add_kernel('host1', 'k2')
+        hosts = yield self.place(self.proxy('least-kernels'), 4)
+        self.assertEqual(sorted(hosts), ['host2', 'host2', 'host3', 'host3'])
+
+    @gen_test
+    def test_weighted(self):
+        hosts = yield self.place(self.proxy('weighted', {'host1': 2.0, 'host3': 0.0}), 6)
+        self.assertEqual(hosts.count('host1'), 4)
+        self.assertEqual(hosts.count('host2'), 2)
+
+    @gen_test
+    def test_least_load(self):
+        hosts = yield self.place(self.proxy('least-load'), 4)
+        self.assertEqual(hosts[:2], ['host2', 'host2'])  # placements count towards the probed load
+        self.assertEqual(hosts.count('host3'), 0)
+
+    @gen_test
+    def test_unreachable_hosts(self):
+        self.loads['host2'] = None
+        proxy = self.proxy('least-load')
+        for i in range(distributed.host_failure_threshold):
+            self.host_registry.state('host2').probe_time = None
+            yield self.place(proxy, 1)
+        self.assertFalse(self.host_registry.is_available('host2'))
+
+        hosts = yield self.place(self.proxy('round-robin'), 4)
+        self.assertNotIn('host2', hosts)
+
+        self.host_registry.state('host2').retry_time = time.monotonic()  # the retry interval has elapsed
+        self.assertTrue(self.host_registry.is_available('host2'))
+        self.host_registry.record_attempt('host2')  # only a single launch may retry the host
+        self.assertFalse(self.host_registry.is_available('host2'))
+        self.host_registry.record_success('host2')
+        self.assertTrue(self.host_registry.is_available('host2'))
@@ -0,0 +1,398 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the kernel session managers."""
+
+import abc
+import base64
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from ipython_genutils.py3compat import with_metaclass
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from enterprise_gateway.services.sessions import kernelsessionmanager
+from enterprise_gateway.services.sessions.kernelsessionmanager import KernelSessionManager
+from enterprise_gateway.services.sessions.sharedsessionmanager import SQLiteKernelSessionManager, \
+    ConsulKernelSessionManager
+
+
+class FakeKernelManager(object):
+    """Records the kernels revived from persisted sessions, and those relinquished to other instances."""
+    def __init__(self):
+        self.revived = []
+        self.relinquished = []
+
+    def start_kernel_from_session(self, kernel_id, kernel_name, connection_info, process_info, launch_args):
+        self.revived.append(kernel_id)
+        return True
+
+    def relinquish_kernel(self, kernel_id):
+        self.relinquished.append(kernel_id)
+
+
+class SlowKernelManager(FakeKernelManager):
+    """Revives kernels asynchronously, recording the number of concurrent revivals."""
+    def __init__(self, failed_kernel_id):
+        super(SlowKernelManager, self).__init__()
+        self.failed_kernel_id = failed_kernel_id
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.reviving_at_start = None
+        self.session_manager = None
+
+    @gen.coroutine
+    def start_kernel_from_session(self, kernel_id, kernel_name, connection_info, process_info, launch_args):
+        if self.reviving_at_start is None:
+            self.reviving_at_start = self.session_manager.reviving_sessions()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        yield gen.sleep(0.05)
+        self.in_flight -= 1
+        if kernel_id == self.failed_kernel_id:
+            raise gen.Return(False)
+        self.revived.append(kernel_id)
+        raise gen.Return(True)
+
+
+class ConsulKVHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the subset of the Consul KV HTTP API used by ConsulKernelSessionManager."""
+    store = {}  # key -> (value, modify_index)
+    index = [0]
+
+    def _reply(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode('utf-8'))
+
+    def _parse(self):
+        url = urlparse(self.path)
+        return url.path[len('/v1/kv/'):], parse_qs(url.query, keep_blank_values=True)
+
+    def do_GET(self):
+        key, query = self._parse()
+        if 'keys' in query or 'recurse' in query:
+            matches = sorted(k for k in self.store if k.startswith(key))
+        else:
+            matches = [key] if key in self.store else []
+        if not matches:
+            return self._reply(404, None)
+        if 'keys' in query:
+            return self._reply(200, matches)
+        return self._reply(200, [{'Key': k, 'ModifyIndex': self.store[k][1],
+                                  'Value': base64.b64encode(self.store[k][0]).decode('utf-8')} for k in matches])
+
+    def do_PUT(self):
+        key, query = self._parse()
+        value = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if 'cas' in query and self.store.get(key, (None, 0))[1] != int(query['cas'][0]):
+            return self._reply(200, False)
+        self.index[0] += 1
+        self.store[key] = (value, self.index[0])
+        self._reply(200, True)
+
+    def do_DELETE(self):
+        key, query = self._parse()
+        if 'cas' in query and self.store.get(key, (None, 0))[1] != int(query['cas'][0]):
+            return self._reply(200, False)
+        self.store.pop(key, None)
+        self._reply(200, True)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestKernelSessionManager(unittest.TestCase):
+    """Tests of the journal-based persistence of the (file-based) kernel session manager."""
+
+    def setUp(self):
+        # Equivalent to a temporary EG_KERNEL_SESSION_LOCATION, which is read on import.
+        self.session_dir = tempfile.mkdtemp()
+        self.saved_settings = (kernelsessionmanager.kernel_session_location,
+                               kernelsessionmanager.journal_sync_interval,
+                               kernelsessionmanager.journal_compaction_threshold)
+        kernelsessionmanager.kernel_session_location = self.session_dir
+        kernelsessionmanager.journal_sync_interval = 0.1
+        kernelsessionmanager.journal_compaction_threshold = 5
+        self.journal_file = os.path.join(self.session_dir, 'sessions', 'kernels.journal')
+        self.snapshot_file = os.path.join(self.session_dir, 'sessions', 'kernels.json')
+
+    def tearDown(self):
+        kernelsessionmanager.kernel_session_location, kernelsessionmanager.journal_sync_interval, \
+            kernelsessionmanager.journal_compaction_threshold = self.saved_settings
+        shutil.rmtree(self.session_dir)
+
+    def create_session_manager(self):
+        return KernelSessionManager(FakeKernelManager(), enable_persistence=True, log=logging.getLogger('test'))
+
+    def save_session(self, session_manager, kernel_id, key='secret'):
+        session_manager._save_session(kernel_id, {
+            'kernel_id': kernel_id, 'username': 'alice', 'kernel_name': 'python3',
+            'connection_info': {'key': key.encode('utf-8')}, 'launch_args': {}, 'process_info': {}})
+
+    def read_journal(self):
+        with open(self.journal_file) as fp:
+            return [json.loads(line) for line in fp]
+
+    def test_replay(self):
+        session_manager = self.create_session_manager()
+        self.save_session(session_manager, 'kernel-1')
+        self.save_session(session_manager, 'kernel-2')
+
+        # Loading compacts the sessions into a snapshot, on top of which further changes are journaled
+        session_manager = self.create_session_manager()
+        with open(self.snapshot_file) as fp:
+            self.assertEqual(sorted(json.load(fp)), ['kernel-1', 'kernel-2'])
+        self.assertEqual(self.read_journal(), [])
+        session_manager.delete_session('kernel-1')
+        self.save_session(session_manager, 'kernel-2', key='updated')
+        self.save_session(session_manager, 'kernel-3')
+        self.assertEqual([(record['kernel_id'], record['session'] is None) for record in self.read_journal()],
+                         [('kernel-1', True), ('kernel-2', False), ('kernel-3', False)])
+
+        session_manager = self.create_session_manager()
+        self.assertEqual(sorted(session_manager._sessions), ['kernel-2', 'kernel-3'])
+        self.assertEqual(session_manager._sessions['kernel-2']['connection_info']['key'], b'updated')
+        self.assertEqual(session_manager.active_sessions('alice'), 2)
+
+    def test_truncated_record(self):
+        session_manager = self.create_session_manager()
+        self.save_session(session_manager, 'kernel-1')
+        with open(self.journal_file, 'a') as fp:  # as if the gateway crashed while writing the record
+            fp.write('{"kernel_id": "kernel-2", "session": {"kernel_')
+
+        with self.assertLogs('test', 'WARNING'):
+            session_manager = self.create_session_manager()
+        self.assertEqual(list(session_manager._sessions), ['kernel-1'])
+
+    def test_compaction(self):
+        session_manager = self.create_session_manager()
+        for i in range(5):
+            self.save_session(session_manager, 'kernel-1', key='key-{}'.format(i))
+        self.assertEqual(len(self.read_journal()), 5)
+
+        # Once the threshold is crossed, the sessions are written to the snapshot and the journal is truncated
+        self.save_session(session_manager, 'kernel-1', key='key-5')
+        self.assertEqual(self.read_journal(), [])
+        with open(self.snapshot_file) as fp:
+            self.assertEqual(json.load(fp)['kernel-1']['connection_info']['key'], 'key-5')
+        self.assertEqual(os.stat(self.snapshot_file).st_mode & 0o777, 0o600)
+        self.assertEqual(os.stat(self.journal_file).st_mode & 0o777, 0o600)
+
+    def test_batched_sync(self):
+        session_manager = self.create_session_manager()
+        self.save_session(session_manager, 'kernel-1')
+        sync_timer = session_manager._journal_sync_timer
+        self.assertIsNotNone(sync_timer)
+        self.save_session(session_manager, 'kernel-2')
+        self.assertIs(session_manager._journal_sync_timer, sync_timer)  # synced with the first record
+
+        sync_timer.join(5)
+        self.assertIsNone(session_manager._journal_sync_timer)
+        self.save_session(session_manager, 'kernel-3')
+        self.assertIsNot(session_manager._journal_sync_timer, sync_timer)
+        session_manager._journal_sync_timer.cancel()
+
+    def test_delete_missing_session(self):
+        session_manager = self.create_session_manager()
+        self.save_session(session_manager, 'kernel-1')
+        session_manager._delete_sessions(['kernel-2', 'kernel-1'])  # e.g., a warm kernel has no session
+        self.assertEqual(session_manager._sessions, {})
+        self.assertEqual([record['kernel_id'] for record in self.read_journal()], ['kernel-1', 'kernel-1'])
+        session_manager._journal_sync_timer.cancel()
+
+
+class SharedSessionManagerTests(with_metaclass(abc.ABCMeta, object)):
+    """Tests common to the shared session managers - mixed into a TestCase per backend."""
+
+    @abc.abstractmethod
+    def create_session_manager(self, owner_id, lease_duration=30.0, kernel_manager=None):
+        """Returns a session manager, of the backend under test, for the given owner."""
+        pass
+
+    def save_session(self, session_manager, kernel_id, username, key=b'secret'):
+        session_manager._save_session(kernel_id, {
+            'kernel_id': kernel_id, 'username': username, 'kernel_name': 'python3',
+            'connection_info': {'key': key, 'shell_port': 1234}, 'launch_args': {}, 'process_info': {}})
+
+    @staticmethod
+    def flush(session_manager):
+        # Waits for the session manager's pending store calls, and their completion callbacks.
+        @gen.coroutine
+        def flushed():
+            yield session_manager._store_executor.submit(lambda: None)
+            yield gen.sleep(0.01)
+        IOLoop.current().run_sync(flushed)
+
+    def test_sessions_by_user(self):
+        gateway_a = self.create_session_manager('gateway-a')
+        gateway_b = self.create_session_manager('gateway-b')
+        self.save_session(gateway_a, 'kernel-1', 'alice')
+        self.save_session(gateway_b, 'kernel-2', 'alice')
+        self.save_session(gateway_b, 'kernel-3', 'bob')
+        self.flush(gateway_b)
+
+        # Counts span instances, as of the last lease renewal
+        self.assertEqual(gateway_a.active_sessions('alice'), 1)
+        IOLoop.current().run_sync(gateway_a._maintain_lease)
+        self.assertEqual(gateway_a.active_sessions('alice'), 2)
+        self.assertEqual(gateway_a.active_sessions('bob'), 1)
+
+        gateway_b.delete_session('kernel-2')
+        self.flush(gateway_b)
+        IOLoop.current().run_sync(gateway_a._maintain_lease)
+        self.assertEqual(gateway_a.active_sessions('alice'), 1)
+        self.assertEqual(gateway_a.active_sessions('carol'), 0)
+
+    def test_orphaned_session_adoption(self):
+        gateway_a = self.create_session_manager('gateway-a', lease_duration=0.5)
+        self.save_session(gateway_a, 'kernel-1', 'alice')
+        self.flush(gateway_a)
+
+        # gateway-a's lease is current, so its session is not adopted
+        gateway_b = self.create_session_manager('gateway-b')
+        IOLoop.current().run_sync(gateway_b._maintain_lease)
+        self.assertEqual(gateway_b.kernel_manager.revived, [])
+
+        # Once the lease expires, gateway-b adopts and revives the session
+        time.sleep(0.6)
+        IOLoop.current().run_sync(gateway_b._maintain_lease)
+        self.assertEqual(gateway_b.kernel_manager.revived, ['kernel-1'])
+        self.assertEqual(gateway_b._sessions['kernel-1']['connection_info']['key'], b'secret')
+
+        # Ownership has moved, so another instance doesn't adopt it again
+        gateway_c = self.create_session_manager('gateway-c')
+        IOLoop.current().run_sync(gateway_c._maintain_lease)
+        self.assertEqual(gateway_c.kernel_manager.revived, [])
+
+    def test_restart_with_same_owner(self):
+        gateway_a = self.create_session_manager('gateway-a')
+        self.save_session(gateway_a, 'kernel-1', 'alice')
+        self.flush(gateway_a)
+
+        # A restarted instance immediately loads its own sessions
+        restarted = self.create_session_manager('gateway-a')
+        self.assertIn('kernel-1', restarted._sessions)
+        IOLoop.current().run_sync(restarted.start_sessions)
+        self.assertEqual(restarted.kernel_manager.revived, ['kernel-1'])
+        restarted._lease_callback.stop()
+
+    def test_bounded_revival(self):
+        gateway_a = self.create_session_manager('gateway-a')
+        for i in range(6):
+            self.save_session(gateway_a, 'kernel-{}'.format(i), 'alice')
+        gateway_a.delete_session('kernel-5')
+        self.flush(gateway_a)
+
+        kernel_manager = SlowKernelManager(failed_kernel_id='kernel-0')
+        restarted = self.create_session_manager('gateway-a', kernel_manager=kernel_manager)
+        restarted.revival_concurrency = 2
+        self.assertFalse(restarted.is_reviving('kernel-1'))
+        IOLoop.current().run_sync(restarted.start_sessions)
+        restarted._lease_callback.stop()
+        self.flush(restarted)
+
+        # All sessions were reviving while the first revivals were in flight, no more than 2 at a time
+        self.assertEqual(len(kernel_manager.reviving_at_start), 5)
+        self.assertEqual(kernel_manager.max_in_flight, 2)
+        self.assertEqual(sorted(kernel_manager.revived), ['kernel-1', 'kernel-2', 'kernel-3', 'kernel-4'])
+
+        # The failed session was removed
+        self.assertEqual(restarted.reviving_sessions(), [])
+        self.assertNotIn('kernel-0', restarted._sessions)
+        self.assertEqual(restarted.active_sessions('alice'), 4)
+
+    def test_lost_lease(self):
+        gateway_a = self.create_session_manager('gateway-a', lease_duration=0.5)
+        self.save_session(gateway_a, 'kernel-1', 'alice')
+        self.save_session(gateway_a, 'kernel-2', 'alice')
+        self.flush(gateway_a)
+
+        # Once gateway-a's lease expires, its sessions are adopted and its changes are withheld
+        gateway_b = self.create_session_manager('gateway-b')
+        time.sleep(0.6)
+        IOLoop.current().run_sync(gateway_b._maintain_lease)
+        self.assertEqual(sorted(gateway_b.kernel_manager.revived), ['kernel-1', 'kernel-2'])
+        self.save_session(gateway_a, 'kernel-1', 'alice', key=b'stale')
+        self.save_session(gateway_a, 'kernel-3', 'alice')
+        gateway_a.delete_session('kernel-2')
+        self.flush(gateway_a)
+        self.assertEqual(sorted(gateway_a._withheld), ['kernel-1', 'kernel-2', 'kernel-3'])
+
+        # On renewal, gateway-a relinquishes the adopted kernels, then persists its remaining changes - other than
+        # the deletion of the adopted session
+        IOLoop.current().run_sync(gateway_a._maintain_lease)
+        self.flush(gateway_a)
+        self.assertEqual(gateway_a.kernel_manager.relinquished, ['kernel-1'])
+        self.assertEqual(list(gateway_a._sessions), ['kernel-3'])
+        self.assertEqual(gateway_a._withheld, {})
+
+        gateway_c = self.create_session_manager('gateway-c')
+        IOLoop.current().run_sync(gateway_c._maintain_lease)
+        self.assertEqual(gateway_c.active_sessions('alice'), 3)
+        self.assertEqual(gateway_b._store_session('kernel-1', 'alice', {'connection_info': {}}), True)
+        self.assertEqual(gateway_a._store_session('kernel-1', 'alice', {'connection_info': {}}), False)
+
+    def test_session_owned_by_another_instance(self):
+        gateway_a = self.create_session_manager('gateway-a', lease_duration=0.5)
+        self.save_session(gateway_a, 'kernel-1', 'alice')
+        self.flush(gateway_a)
+        gateway_b = self.create_session_manager('gateway-b')
+        time.sleep(0.6)
+        IOLoop.current().run_sync(gateway_b._maintain_lease)
+
+        # Should gateway-a not have noticed its lease lapsed, its update is refused and its kernel relinquished
+        gateway_a._lease_expiry = time.time() + 30
+        self.save_session(gateway_a, 'kernel-1', 'alice', key=b'stale')
+        self.flush(gateway_a)
+        self.assertEqual(gateway_a.kernel_manager.relinquished, ['kernel-1'])
+        self.assertNotIn('kernel-1', gateway_a._sessions)
+
+        restarted = self.create_session_manager('gateway-b')
+        self.assertEqual(restarted._sessions['kernel-1']['connection_info']['key'], b'secret')
+
+
+class TestSQLiteKernelSessionManager(SharedSessionManagerTests, unittest.TestCase):
+
+    def setUp(self):
+        self.session_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.session_dir)
+
+    def create_session_manager(self, owner_id, lease_duration=30.0, kernel_manager=None):
+        session_manager = SQLiteKernelSessionManager(kernel_manager or FakeKernelManager(), enable_persistence=True,
+                                                     owner_id=owner_id, lease_duration=lease_duration,
+                                                     database_file=os.path.join(self.session_dir, 'kernels.db'))
+        session_manager.kernel_manager.session_manager = session_manager
+        return session_manager
+
+
+class TestConsulKernelSessionManager(SharedSessionManagerTests, unittest.TestCase):
+
+    def setUp(self):
+        ConsulKVHandler.store.clear()
+        self.server = HTTPServer(('127.0.0.1', 0), ConsulKVHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_session_manager(self, owner_id, lease_duration=30.0, kernel_manager=None):
+        session_manager = ConsulKernelSessionManager(kernel_manager or FakeKernelManager(), enable_persistence=True,
+                                                     owner_id=owner_id, lease_duration=lease_duration,
+                                                     consul_endpoint='http://127.0.0.1:{}'.
+                                                     format(self.server.server_port))
+        session_manager.kernel_manager.session_manager = session_manager
+        return session_manager
@@ -0,0 +1,54 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the IOLoop watchdog."""
+
+import logging
+import time
+
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from enterprise_gateway.services.processproxies.processproxy import LocalProcessProxy
+from enterprise_gateway.watchdog import IOLoopWatchdog
+
+
+class BlockingProcessProxy(LocalProcessProxy):
+    def block(self, duration):
+        time.sleep(duration)
+
+
+class TestIOLoopWatchdog(AsyncTestCase):
+
+    def setUp(self):
+        super(TestIOLoopWatchdog, self).setUp()
+        self.watchdog = IOLoopWatchdog(0.05, logging.getLogger('test'), self.io_loop)
+        self.watchdog.start()
+
+    def tearDown(self):
+        self.watchdog.stop()
+        super(TestIOLoopWatchdog, self).tearDown()
+
+    @gen_test
+    def test_lag(self):
+        yield gen.sleep(0.2)
+        stats = self.watchdog.get_stats()
+        self.assertLess(stats['lag']['p50'], 0.05)
+        self.assertEqual(stats['stalls'], [])
+
+    @gen_test
+    def test_stall_attribution(self):
+        proxy = BlockingProcessProxy.__new__(BlockingProcessProxy)  # only its identity is of interest
+        proxy.kernel_id = 'k1'
+        yield gen.sleep(0.05)
+        proxy.block(0.3)
+        yield gen.sleep(0.05)
+
+        stats = self.watchdog.get_stats()
+        stall = stats['stalls'][0]
+        self.assertEqual(stall['location'], 'BlockingProcessProxy.block')
+        self.assertEqual(stall['kernel_id'], 'k1')
+        self.assertGreater(stall['duration'], 0.2)
+        self.assertGreater(stall['samples'], 1)
+        self.assertIn('in block', stall['stack'][-1])
+        self.assertEqual(stats['locations'][0]['location'], 'BlockingProcessProxy.block')
+        self.assertEqual(stats['locations'][0]['count'], 1)
@@ -0,0 +1,160 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Detection of the callbacks that block Enterprise Gateway's IOLoop."""
+
+import math
+import os
+import sys
+import time
+import traceback
+
+from collections import Counter, deque
+from datetime import datetime
+from threading import Event, Lock, Thread, get_ident
+from tornado.ioloop import IOLoop
+
+from .metrics import IOLOOP_LAG_SECONDS, IOLOOP_STALL_DURATION_SECONDS
+from .services.processproxies.processproxy import BaseProcessProxyABC
+
+watchdog_sample_interval = float(os.getenv('EG_IOLOOP_WATCHDOG_SAMPLE_INTERVAL', '0.01'))
+watchdog_history = int(os.getenv('EG_IOLOOP_WATCHDOG_HISTORY', '100'))
+max_stack_depth = 40
+max_lag_samples = 1000
+
+
+class Stall(object):
+    """The stack samples captured while the IOLoop was blocked, along with their attributions."""
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.stacks = Counter()  # stack (tuple of 'file:line in function') -> number of samples
+        self.attributions = Counter()  # (location, kernel_id) -> number of samples
+
+    def add_sample(self, frame):
+        stack = traceback.StackSummary.extract(traceback.walk_stack(frame), limit=max_stack_depth,
+                                               lookup_lines=False)
+        self.stacks[tuple("{}:{} in {}".format(entry.filename, entry.lineno, entry.name)
+                          for entry in reversed(stack))] += 1
+        self.attributions[self.attribute(frame)] += 1
+
+    @staticmethod
+    def attribute(frame):
+        """Returns the location (Class.method) and kernel id to which the given stack is attributed.
+
+        The innermost process-proxy method is preferred, then the innermost method of an object bearing a
+        kernel id (e.g., a kernel manager or handler), and lastly the innermost function.
+        """
+        innermost = "{} ({}:{})".format(frame.f_code.co_name, frame.f_code.co_filename, frame.f_lineno)
+        candidate = None
+        while frame is not None:
+            if frame.f_code.co_varnames[:1] == ('self',):
+                obj = frame.f_locals.get('self')
+                location = "{}.{}".format(type(obj).__name__, frame.f_code.co_name)
+                if isinstance(obj, BaseProcessProxyABC):
+                    return location, getattr(obj, 'kernel_id', None)
+                kernel_id = getattr(obj, 'kernel_id', None)
+                if candidate is None and isinstance(kernel_id, str):
+                    candidate = location, kernel_id
+            frame = frame.f_back
+        return candidate or (innermost, None)
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+
+class IOLoopWatchdog(object):
+    """Measures the lag of the IOLoop and captures what is blocking it.
+
+    A callback on the IOLoop ticks every `threshold / 2` seconds, its delay being the loop's lag.  A
+    thread checks the loop every EG_IOLOOP_WATCHDOG_SAMPLE_INTERVAL seconds and, once the next tick is
+    more than `threshold` seconds late, samples the stack of the IOLoop's thread until the loop ticks
+    again.  The stall is then logged and recorded - attributed to the process-proxy method (and kernel)
+    found on most samples.  The most recent EG_IOLOOP_WATCHDOG_HISTORY stalls are retained, along with
+    totals per location.
+    """
+    def __init__(self, threshold, log, io_loop=None):
+        self.threshold = threshold
+        self.tick_interval = threshold / 2.0
+        self.log = log
+        self.io_loop = io_loop or IOLoop.current()
+        self.lag = deque(maxlen=max_lag_samples)
+        self.stalls = deque(maxlen=watchdog_history)
+        self.locations = {}  # location -> {'count', 'total', 'max'} of the stalls attributed to it
+        self._lock = Lock()
+        self._expected = None  # time at which the next tick is due
+        self._stall = None  # the stall being sampled, if any
+        self._timeout = None
+        self._thread_id = None
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name='IOLoopWatchdog')
+        self._thread.daemon = True
+
+    def start(self):
+        """Starts the watchdog.  Must be called from the IOLoop's thread."""
+        self._thread_id = get_ident()
+        self._schedule(time.monotonic())
+        self._thread.start()
+        self.log.info("IOLoop watchdog started with a threshold of {}s.".format(self.threshold))
+
+    def stop(self):
+        self._stopped.set()
+        if self._timeout is not None:
+            self.io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _schedule(self, now):
+        self._expected = now + self.tick_interval
+        self._timeout = self.io_loop.call_later(self.tick_interval, self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        lag = max(now - self._expected, 0.0)
+        IOLOOP_LAG_SECONDS.observe(lag)
+        with self._lock:
+            stall, self._stall = self._stall, None
+            self.lag.append(lag)
+            self._schedule(now)
+        if stall is not None and stall.samples:
+            self._record(stall, lag)
+
+    def _run(self):
+        while not self._stopped.wait(watchdog_sample_interval):
+            with self._lock:
+                if time.monotonic() - self._expected <= self.threshold:
+                    continue
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is None:
+                    continue
+                if self._stall is None:
+                    self._stall = Stall(time.time() - (time.monotonic() - self._expected))
+                self._stall.add_sample(frame)
+                del frame
+
+    def _record(self, stall, duration):
+        (location, kernel_id), _ = stall.attributions.most_common(1)[0]
+        stack, stack_samples = stall.stacks.most_common(1)[0]
+        IOLOOP_STALL_DURATION_SECONDS.labels(location).observe(duration)
+        self.stalls.append({'start_time': datetime.utcfromtimestamp(stall.start_time).isoformat() + 'Z',
+                            'duration': duration, 'location': location, 'kernel_id': kernel_id,
+                            'samples': stall.samples, 'stack': list(stack)})
+        totals = self.locations.setdefault(location, {'count': 0, 'total': 0.0, 'max': 0.0})
+        totals['count'] += 1
+        totals['total'] += duration
+        totals['max'] = max(totals['max'], duration)
+        self.log.warning("IOLoop blocked for {:.3f}s by {}{}.  Most frequent stack ({} of {} samples):\n  {}".
+                         format(duration, location, " (KernelID: '{}')".format(kernel_id) if kernel_id else '',
+                                stack_samples, stall.samples, '\n  '.join(stack)))
+
+    def get_stats(self):
+        """Returns the IOLoop's lag, the recent stalls (most recent first) and the totals per location."""
+        with self._lock:
+            lag = sorted(self.lag)
+
+        def percentile(percent):
+            return lag[max(int(math.ceil(len(lag) * percent / 100.0)) - 1, 0)] if lag else None
+
+        locations = [dict(totals, location=location) for location, totals in self.locations.items()]
+        return {'threshold': self.threshold,
+                'lag': {'p50': percentile(50), 'p99': percentile(99), 'max': lag[-1] if lag else None},
+                'stalls': list(reversed(self.stalls)),
+                'locations': sorted(locations, key=lambda totals: totals['total'], reverse=True)}
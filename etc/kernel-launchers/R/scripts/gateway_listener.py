@@ -5,13 +5,28 @@ import uuid
 import signal
 import random
 import logging
+import base64
+import hashlib
+import struct
 from socket import *
 from ipython_genutils.py3compat import str_to_bytes
 from jupyter_client.connect import write_connection_file
-from threading import Thread
+from threading import Event, Thread
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None  # heartbeats are not sent
 
 max_port_range_retries = int(os.getenv('EG_MAX_PORT_RANGE_RETRIES', '5'))
+heartbeat_interval = float(os.getenv('EG_HEARTBEAT_INTERVAL', '5.0'))
+max_frame_size = 64 * 1024
+handshake_version = 2
 log_level = int(os.getenv('EG_LOG_LEVEL', '10'))
+launch_secret = os.getenv('KERNEL_LAUNCH_SECRET')  # from which the key of version 2 payloads is derived
+if launch_secret is None and os.getenv('KERNEL_LAUNCH_SECRET_FILE'):  # shipped as a file (YARN cluster mode)
+    with open(os.getenv('KERNEL_LAUNCH_SECRET_FILE')) as f:
+        launch_secret = f.read().strip()
 
 logging.basicConfig(format='[%(levelname)1.1s %(asctime)s.%(msecs).03d %(name)s] %(message)s')
 
@@ -65,62 +80,167 @@ def prepare_gateway_socket(lower_port, upper_port):
     return sock
 
 
-def get_gateway_request(sock):
-    conn = None
-    data = ''
-    request_info = None
+def _recv_exactly(conn, size):
+    """Receives exactly `size` bytes, returning None if the connection is closed first."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = conn.recv_into(view[received:], size - received)
+        if count == 0:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+def _send_frame(conn, message):
+    data = json.dumps(message).encode('utf-8')
+    conn.sendall(struct.pack('>I', len(data)) + data)
+
+
+def process_gateway_request(request, parent_pid):
+    """Performs the given request, returning True if the listener is to shutdown."""
+    shutdown = False
+    signum = -1  # prevent logging poll requests since that occurs every 3 seconds
+    if request.get('signum') is not None:
+        signum = int(request.get('signum'))
+        os.kill(int(parent_pid), signum)
+    elif request.get('shutdown') is not None:
+        shutdown = bool(request.get('shutdown'))
+    if signum != 0:
+        logger.debug("gateway_listener got request: {}".format(request))
+    return shutdown
+
+
+def serve_gateway_connection(conn, parent_pid, stopped):
+    """Performs the requests received on a connection from the gateway.
+
+    On the control channel, requests are framed by a 4-byte (big-endian) length and each is acknowledged
+    with a frame bearing the request's id.  Otherwise, the connection conveys a single JSON request.
+    """
     try:
-        conn, addr = sock.accept()
-        while True:
-            buffer = conn.recv(1024).decode('utf-8')
-            if not buffer:  # send is complete
-                request_info = json.loads(data)
+        header = _recv_exactly(conn, 4)
+        if header is not None and header.startswith(b'{'):  # single request, read until the gateway closes
+            data = header
+            while True:
+                buffer = conn.recv(1024)
+                if not buffer:
+                    break
+                data += buffer
+            if process_gateway_request(json.loads(data.decode('utf-8')), parent_pid):
+                stopped.set()
+            return
+
+        while header is not None and not stopped.is_set():
+            size = struct.unpack('>I', header)[0]
+            if size > max_frame_size:
+                raise RuntimeError("Frame size ({}) exceeds maximum of {}.".format(size, max_frame_size))
+            data = _recv_exactly(conn, size)
+            if data is None:
                 break
-            data = data + buffer  # append what we received until we get no more...
+            request = json.loads(data.decode('utf-8'))
+            reply = {'id': request.get('id'), 'status': 'ok'}
+            try:
+                if process_gateway_request(request, parent_pid):
+                    stopped.set()
+            except Exception as e:
+                reply.update(status='error', message=str(e))
+            _send_frame(conn, reply)
+            header = _recv_exactly(conn, 4)
     except Exception as e:
-        if type(e) is not timeout:
-            # fabricate shutdown.
-            logger.error("Listener encountered error '{}', shutting down...".format(e))
-            shutdown = dict() 
-            shutdown['shutdown'] = 1
-            request_info = shutdown
+        logger.warning("Listener encountered error '{}' processing requests.".format(e))
     finally:
-        if conn:
-            conn.close()
+        conn.close()
 
-    return request_info
 
-
-def gateway_listener(sock, parent_pid):
-    shutdown = False
-    while not shutdown:
-        request = get_gateway_request(sock)
-        if request:
-            signum = -1  # prevent logging poll requests since that occurs every 3 seconds
-            if request.get('signum') is not None:
-                signum = int(request.get('signum'))
-                os.kill(int(parent_pid), signum)
-            elif request.get('shutdown') is not None:
-                    shutdown = bool(request.get('shutdown'))
-            if signum != 0:
-                logger.debug("gateway_listener got request: {}".format(request))
-        else:  # check parent
+def gateway_listener(sock, parent_pid, stopped):
+    while not stopped.is_set():
+        try:
+            conn, addr = sock.accept()
+        except timeout:  # check parent
             try:
                 os.kill(int(parent_pid), 0)
             except OSError as e:
-                shutdown = True
+                stopped.set()
                 logger.info("Listener detected parent has been shutdown.")
+            continue
+        except Exception as e:
+            logger.error("Listener encountered error '{}', shutting down...".format(e))
+            break
+        conn.settimeout(None)
+        connection_thread = Thread(target=serve_gateway_connection, args=(conn, parent_pid, stopped,))
+        connection_thread.daemon = True
+        connection_thread.start()
+    stopped.set()
+
+
+def _seal(payload, kernel_id, purpose):
+    """Encrypts `payload` using AES-GCM with a key derived from the launch secret, returning the nonce,
+    ciphertext and tag.  The associated data binds the payload to the kernel and its purpose.
+    """
+    kid = kernel_id.encode('utf-8')
+    nonce = os.urandom(12)
+    cipher = AES.new(hashlib.sha256(launch_secret.encode('utf-8')).digest(), AES.MODE_GCM, nonce=nonce)
+    cipher.update(struct.pack('>BH', handshake_version, len(kid)) + kid + purpose)
+    ciphertext, tag = cipher.encrypt_and_digest(payload)
+    return nonce + ciphertext + tag
+
+
+def _heartbeat_message(event, kernel_id, parent_pid):
+    """Returns a heartbeat message line, whose event is sealed using the launch secret."""
+    event_info = json.dumps({'kernel_id': kernel_id, 'event': event, 'pid': str(parent_pid)}).encode('utf-8')
+    message = {'kernel_id': kernel_id, 'version': handshake_version,
+               'payload': base64.b64encode(_seal(event_info, kernel_id, b'heartbeat')).decode('utf-8')}
+    return (json.dumps(message) + '\n').encode('utf-8')
+
 
+def heartbeat_sender(response_addr, kernel_id, parent_pid, stopped):
+    """Holds a connection to the gateway's response address on which a heartbeat is sent every
+    EG_HEARTBEAT_INTERVAL seconds while the parent (R kernel) process is alive, reconnecting as
+    necessary.  Once the parent has exited, its exit is reported.  Heartbeats cease if `stopped` is set.
+    """
+    response_ip, response_port = response_addr.split(":")
+    sock = None
+    while True:
+        event = 'heartbeat'
+        try:
+            os.kill(int(parent_pid), 0)
+        except OSError:
+            event = 'exit'
+        if event == 'heartbeat' and stopped.is_set():
+            break
+        try:
+            if sock is None:
+                sock = create_connection((response_ip, int(response_port)), timeout=heartbeat_interval)
+            sock.sendall(_heartbeat_message(event, kernel_id, parent_pid))
+        except Exception as e:
+            logger.debug("Unable to send {} to gateway at '{}': {}".format(event, response_addr, e))
+            if sock is not None:
+                sock.close()
+                sock = None
+        if event == 'exit':
+            break
+        stopped.wait(heartbeat_interval)
 
-def setup_gateway_listener(fname, parent_pid, lower_port, upper_port):
+    if sock is not None:
+        sock.close()
+
+
+def setup_gateway_listener(fname, parent_pid, lower_port, upper_port, response_addr=None, kernel_id=None):
     ip = "0.0.0.0"
     key = str_to_bytes(str(uuid.uuid4()))
 
     gateway_socket = prepare_gateway_socket(lower_port, upper_port)
 
-    gateway_listener_thread = Thread(target=gateway_listener, args=(gateway_socket,parent_pid,))
+    stopped = Event()
+    gateway_listener_thread = Thread(target=gateway_listener, args=(gateway_socket,parent_pid,stopped,))
     gateway_listener_thread.start()
 
+    # The gateway only considers heartbeats sealed with the launch secret, which pycrypto doesn't support (GCM)
+    if response_addr and kernel_id and launch_secret and hasattr(AES, 'MODE_GCM'):
+        heartbeat_thread = Thread(target=heartbeat_sender, args=(response_addr, kernel_id, parent_pid, stopped,))
+        heartbeat_thread.start()
+
     basename = os.path.splitext(os.path.basename(fname))[0]
     fd, conn_file = tempfile.mkstemp(suffix=".json", prefix=basename + "_")
     os.close(fd)
@@ -136,6 +256,7 @@ def setup_gateway_listener(fname, parent_pid, lower_port, upper_port):
 
     # Add in the gateway_socket and parent_pid fields...
     config['comm_port'] = gateway_socket.getsockname()[1]
+    config['comm_protocol'] = 1  # the listener supports the (framed) control channel
     config['pid'] = parent_pid
     
     with open(fname, 'w') as f:
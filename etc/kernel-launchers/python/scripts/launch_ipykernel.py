@@ -1,14 +1,16 @@
 import argparse
 import atexit
 import base64
+import hashlib
 import json
 import logging
 import os
 import socket
+import struct
 import tempfile
 import uuid
-from random import random
-from threading import Thread
+import random
+from threading import Event, Thread
 
 from Crypto.Cipher import AES
 from IPython import embed_kernel
@@ -19,7 +21,15 @@ from jupyter_client.connect import write_connection_file
 # Minimum port range size and max retries
 min_port_range_size = int(os.getenv('EG_MIN_PORT_RANGE_SIZE', '1000'))
 max_port_range_retries = int(os.getenv('EG_MAX_PORT_RANGE_RETRIES', '5'))
+heartbeat_interval = float(os.getenv('EG_HEARTBEAT_INTERVAL', '5.0'))
+max_frame_size = 64 * 1024
+handshake_version = 2
 log_level = int(os.getenv('EG_LOG_LEVEL', '10'))
+# The secret from which the key of version 2 payloads is derived, removed so that it's not inherited by the kernel
+launch_secret = os.environ.pop('KERNEL_LAUNCH_SECRET', None)
+if launch_secret is None and 'KERNEL_LAUNCH_SECRET_FILE' in os.environ:  # shipped as a file (YARN cluster mode)
+    with open(os.environ.pop('KERNEL_LAUNCH_SECRET_FILE')) as f:
+        launch_secret = f.read().strip()
 
 logging.basicConfig(format='[%(levelname)1.1s %(asctime)s.%(msecs).03d %(name)s] %(message)s')
 
@@ -137,8 +147,8 @@ def _encrypt(connection_info, conn_file):
 
     # Ensure that the length of the data that will be encrypted is a
     # multiple of BLOCK_SIZE by padding with '%' on the right.
-    PADDING = '%'
-    pad = lambda s: s.decode("utf-8") + (BLOCK_SIZE - len(s) % BLOCK_SIZE) * PADDING
+    PADDING = b'%'
+    pad = lambda s: s + (BLOCK_SIZE - len(s) % BLOCK_SIZE) * PADDING
 
     # Encrypt connection_info whose length is a multiple of BLOCK_SIZE using
     # AES cipher and then encode the resulting byte array using Base64.
@@ -157,13 +167,41 @@ def _encrypt(connection_info, conn_file):
     # print("AES Encryption Key '{}'".format(key))
 
     # Creates the cipher obj using the key.
-    cipher = AES.new(key)
+    cipher = AES.new(key.encode('utf-8'), AES.MODE_ECB)
 
     payload = encryptAES(cipher, connection_info)
     return payload
 
 
-def return_connection_info(connection_file, response_addr, lower_port, upper_port):
+def _associated_data(kernel_id, purpose=b''):
+    kernel_id = kernel_id.encode('utf-8')
+    return struct.pack('>BH', handshake_version, len(kernel_id)) + kernel_id + purpose
+
+
+def _seal(payload, kernel_id, purpose=b''):
+    """Encrypts `payload` using AES-GCM with a key derived from the launch secret, returning the nonce,
+    ciphertext and tag.  The associated data binds the payload to the kernel and its purpose.
+    """
+    nonce = os.urandom(12)
+    cipher = AES.new(hashlib.sha256(launch_secret.encode('utf-8')).digest(), AES.MODE_GCM, nonce=nonce)
+    cipher.update(_associated_data(kernel_id, purpose))
+    ciphertext, tag = cipher.encrypt_and_digest(payload)
+    return nonce + ciphertext + tag
+
+
+def _use_handshake(kernel_id):
+    """Returns True if the (version 2) handshake can be used, else the legacy payload format is used."""
+    # pycrypto doesn't support GCM
+    return kernel_id is not None and launch_secret is not None and hasattr(AES, 'MODE_GCM')
+
+
+def _connection_info_frame(connection_info, kernel_id):
+    """Returns the version 2 frame conveying the given connection info."""
+    sealed = _seal(connection_info, kernel_id)
+    return _associated_data(kernel_id) + struct.pack('>I', len(sealed)) + sealed
+
+
+def return_connection_info(connection_file, response_addr, lower_port, upper_port, kernel_id=None):
     response_parts = response_addr.split(":")
     if len(response_parts) != 2:
         logger.error("Invalid format for response address '{}'. "
@@ -190,21 +228,73 @@ def return_connection_info(connection_file, response_addr, lower_port, upper_por
     # prepare socket address for handling signals
     gateway_sock = prepare_gateway_socket(lower_port, upper_port)
     cf_json['comm_port'] = gateway_sock.getsockname()[1]
+    cf_json['comm_protocol'] = 1  # the listener supports the (framed) control channel
 
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
         s.connect((response_ip, response_port))
         json_content = json.dumps(cf_json).encode(encoding='utf-8')
         logger.debug("JSON Payload '{}".format(json_content))
-        payload = _encrypt(json_content, connection_file)
-        logger.debug("Encrypted Payload '{}".format(payload))
-        s.send(payload)
+        if _use_handshake(kernel_id):
+            payload = _connection_info_frame(json_content, kernel_id)
+        else:
+            payload = _encrypt(json_content, connection_file)
+            logger.debug("Encrypted Payload '{}".format(payload))
+        s.sendall(payload)
     finally:
         s.close()
 
     return gateway_sock
 
 
+def _heartbeat_message(event, kernel_id):
+    """Returns a heartbeat message line, whose event is sealed using the launch secret."""
+    event_info = json.dumps({'kernel_id': kernel_id, 'event': event, 'pid': str(os.getpid())}).encode('utf-8')
+    message = {'kernel_id': kernel_id, 'version': handshake_version,
+               'payload': base64.b64encode(_seal(event_info, kernel_id, b'heartbeat')).decode('utf-8')}
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+def heartbeat_sender(response_addr, kernel_id, exiting):
+    """Holds a connection to the gateway's response address on which a heartbeat is sent every
+    EG_HEARTBEAT_INTERVAL seconds, reconnecting as necessary.  Once `exiting` is set, the kernel's
+    exit is reported and the connection closed.
+    """
+    response_ip, response_port = response_addr.split(":")
+    sock = None
+    while True:
+        event = 'exit' if exiting.is_set() else 'heartbeat'
+        try:
+            if sock is None:
+                sock = socket.create_connection((response_ip, int(response_port)), timeout=heartbeat_interval)
+            sock.sendall(_heartbeat_message(event, kernel_id))
+        except Exception as e:
+            logger.debug("Unable to send {} to gateway at '{}': {}".format(event, response_addr, e))
+            if sock is not None:
+                sock.close()
+                sock = None
+        if event == 'exit':
+            break
+        exiting.wait(heartbeat_interval)
+
+    if sock is not None:
+        sock.close()
+
+
+def start_heartbeats(response_addr, kernel_id):
+    """Starts the heartbeat sender, arranging for the kernel's exit to be reported."""
+    exiting = Event()
+    heartbeat_thread = Thread(target=heartbeat_sender, args=(response_addr, kernel_id, exiting))
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+
+    def report_exit():
+        exiting.set()
+        heartbeat_thread.join(heartbeat_interval)
+
+    atexit.register(report_exit)
+
+
 def determine_connection_file(conn_file, kid):
     # If the directory exists, use the original file, else create a temporary file.
     if conn_file is None or not os.path.exists(os.path.dirname(conn_file)):
@@ -281,41 +371,90 @@ def _validate_port_range(port_range):
     return lower_port, upper_port
 
 
-def get_gateway_request(sock):
-    conn = None
-    data = ''
-    request_info = None
+def _recv_exactly(conn, size):
+    """Receives exactly `size` bytes, returning None if the connection is closed first."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = conn.recv_into(view[received:], size - received)
+        if count == 0:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+def _send_frame(conn, message):
+    data = json.dumps(message).encode('utf-8')
+    conn.sendall(struct.pack('>I', len(data)) + data)
+
+
+def process_gateway_request(request):
+    """Performs the given request, returning True if the listener is to shutdown."""
+    shutdown = False
+    signum = -1  # prevent logging poll requests since that occurs every 3 seconds
+    if request.get('signum') is not None:
+        signum = int(request.get('signum'))
+        os.kill(os.getpid(), signum)
+    elif request.get('shutdown') is not None:
+        shutdown = bool(request.get('shutdown'))
+    if signum != 0:
+        logger.info("gateway_listener got request: {}".format(request))
+    return shutdown
+
+
+def serve_gateway_connection(conn, shutdown):
+    """Performs the requests received on a connection from the gateway.
+
+    On the control channel, requests are framed by a 4-byte (big-endian) length and each is acknowledged
+    with a frame bearing the request's id.  Otherwise, the connection conveys a single JSON request.
+    """
     try:
-        conn, addr = sock.accept()
-        while True:
-            buffer = conn.recv(1024).decode('utf-8')
-            if not buffer:  # send is complete
-                request_info = json.loads(data)
+        header = _recv_exactly(conn, 4)
+        if header is not None and header.startswith(b'{'):  # single request, read until the gateway closes
+            data = header
+            while True:
+                buffer = conn.recv(1024)
+                if not buffer:
+                    break
+                data += buffer
+            if process_gateway_request(json.loads(data.decode('utf-8'))):
+                shutdown.set()
+            return
+
+        while header is not None and not shutdown.is_set():
+            size = struct.unpack('>I', header)[0]
+            if size > max_frame_size:
+                raise RuntimeError("Frame size ({}) exceeds maximum of {}.".format(size, max_frame_size))
+            data = _recv_exactly(conn, size)
+            if data is None:
                 break
-            data = data + buffer  # append what we received until we get no more...
+            request = json.loads(data.decode('utf-8'))
+            reply = {'id': request.get('id'), 'status': 'ok'}
+            try:
+                if process_gateway_request(request):
+                    shutdown.set()
+            except Exception as e:
+                reply.update(status='error', message=str(e))
+            _send_frame(conn, reply)
+            header = _recv_exactly(conn, 4)
     except Exception as e:
-        if type(e) is not socket.timeout:
-            raise e
+        logger.warning("gateway_listener encountered error processing requests: {}".format(e))
     finally:
-        if conn:
-            conn.close()
-
-    return request_info
+        conn.close()
 
 
 def gateway_listener(sock):
-    shutdown = False
-    while not shutdown:
-        request = get_gateway_request(sock)
-        if request:
-            signum = -1  # prevent logging poll requests since that occurs every 3 seconds
-            if request.get('signum') is not None:
-                signum = int(request.get('signum'))
-                os.kill(os.getpid(), signum)
-            elif request.get('shutdown') is not None:
-                    shutdown = bool(request.get('shutdown'))
-            if signum != 0:
-                logger.info("gateway_listener got request: {}".format(request))
+    shutdown = Event()
+    while not shutdown.is_set():
+        try:
+            conn, addr = sock.accept()
+        except socket.timeout:
+            continue
+        conn.settimeout(None)
+        connection_thread = Thread(target=serve_gateway_connection, args=(conn, shutdown))
+        connection_thread.daemon = True
+        connection_thread.start()
 
 
 if __name__ == "__main__":
@@ -355,10 +494,12 @@ if __name__ == "__main__":
         write_connection_file(fname=connection_file, ip=ip, key=key, shell_port=ports[0], iopub_port=ports[1],
                               stdin_port=ports[2], hb_port=ports[3], control_port=ports[4])
         if response_addr:
-            gateway_socket = return_connection_info(connection_file, response_addr, lower_port, upper_port)
+            gateway_socket = return_connection_info(connection_file, response_addr, lower_port, upper_port, kernel_id)
             if gateway_socket:  # socket in use, start gateway listener thread
                 gateway_listener_thread = Thread(target=gateway_listener, args=(gateway_socket,))
                 gateway_listener_thread.start()
+                if _use_handshake(kernel_id):  # the gateway only considers heartbeats sealed with the secret
+                    start_heartbeats(response_addr, kernel_id)
 
     # Initialize the kernel namespace for the given cluster type
     if cluster_type == 'spark' and spark_init_mode == 'none':
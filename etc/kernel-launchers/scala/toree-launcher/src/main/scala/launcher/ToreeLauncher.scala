@@ -5,7 +5,9 @@
 
 package launcher
 
-import java.io.{BufferedWriter, File, FileWriter, PrintStream}
+import java.io.{BufferedInputStream, BufferedWriter, DataInputStream, DataOutputStream, EOFException, File,
+  FileWriter, PrintStream}
+import java.nio.charset.StandardCharsets
 import java.nio.file.{Files, Paths}
 import java.net.{InetAddress, ServerSocket, Socket}
 
@@ -18,7 +20,7 @@ import scala.collection.mutable.ArrayBuffer
 
 import sun.misc.Signal
 
-import launcher.utils.{SecurityUtils, SocketUtils}
+import launcher.utils.{HeartbeatSender, SecurityUtils, SocketUtils}
 
 import org.apache.toree.utils.LogLike
 
@@ -26,6 +28,7 @@ import org.apache.toree.utils.LogLike
 object ToreeLauncher extends LogLike {
 
   val minPortRangeSize = sys.env.getOrElse("EG_MIN_PORT_RANGE_SIZE", "1000").toInt
+  val maxFrameSize : Int = 64 * 1024
   val kernelTempDir : String = "eg-kernel"
   var profilePath : String = _
   var kernelId : String = _
@@ -35,6 +38,7 @@ object ToreeLauncher extends LogLike {
   var alternateSigint : String = _
   var initMode : String = "lazy"
   var toreeArgs = ArrayBuffer[String]()
+  @volatile var listenerStopped : Boolean = false
 
   private def pathExists(filePath : String) : Boolean =
     if (filePath == null) false
@@ -212,26 +216,24 @@ object ToreeLauncher extends LogLike {
       // Enterprise Gateway wants to establish socket communication. Create socket and
       // convey port number back to gateway.
       gatewaySocket = SocketUtils.findSocket(this.portLowerBound, this.portUpperBound)
-      val gsJson = pidJson ++ Json.obj("comm_port" -> gatewaySocket.getLocalPort)
+      // comm_protocol conveys that the listener supports the (framed) control channel
+      val gsJson = pidJson ++ Json.obj("comm_port" -> gatewaySocket.getLocalPort, "comm_protocol" -> 1)
       val jsonContent = Json.toJson(gsJson).toString()
 
       if (responseAddress != null){
         logger.info("JSON Payload: '%s'".format(jsonContent))
-        val payload = SecurityUtils.encrypt(profilePath, jsonContent)
-        logger.info("Encrypted Payload: '%s'".format(payload))
-        SocketUtils.writeToSocket(responseAddress, payload)
+        if (kernelId != null && SecurityUtils.launchSecret.isDefined) {
+          SocketUtils.writeToSocket(responseAddress, SecurityUtils.connectionInfoFrame(kernelId, jsonContent))
+        } else {  // legacy payload, keyed by the profile's file name
+          val payload = SecurityUtils.encrypt(profilePath, jsonContent)
+          logger.info("Encrypted Payload: '%s'".format(payload))
+          SocketUtils.writeToSocket(responseAddress, payload)
+        }
       }
     }
     gatewaySocket
   }
 
-  private def getGatewayRequest(gatewaySocket : ServerSocket): String = {
-    val s = gatewaySocket.accept()
-    val data = new BufferedSource(s.getInputStream).getLines.mkString
-    s.close()
-    data
-  }
-
   private def getReconciledSignalName(sigNum: Int): String = {
     // To raise the signal, we must map the signal number back to the appropriate
     // name as follows:  Take the common case and assume interrupt and check if an
@@ -256,39 +258,94 @@ object ToreeLauncher extends LogLike {
     }
   }
 
-  private def gatewayListener(gatewaySocket : ServerSocket): Unit = {
-    var stop = false
-    while (!stop) {
-      val requestData = getGatewayRequest(gatewaySocket)
-
-      // Handle each of the requests.  Note that we do not make an assumption that these are
-      // mutually exclusive - although that will probably be the case for now.  Over time,
-      // this should probably get refactored into a) better scala and b) token/classes for
-      // each request.
-
-      val requestJson = Json.parse(requestData).as[JsObject].value
-
-      // Signal the kernel...
-      if ( requestJson.contains("signum")) {
-        val sigNum = requestJson("signum").asInstanceOf[JsNumber].value.toInt
-        if ( sigNum > 0 ) {
-          // If sigNum anything but 0 (for poll), use Signal.raise(signal) to signal the kernel.
-          val sigName = getReconciledSignalName(sigNum)
-          val sigToRaise = new Signal(sigName)
-          logger.info("Gateway listener raising signal: '%s' (%d) for signum: %d".
-                   format(sigToRaise.getName, sigToRaise.getNumber, sigNum))
-          Signal.raise(sigToRaise)
+  private def processGatewayRequest(requestJson : collection.Map[String, JsValue]): Unit = {
+    // Handle each of the requests.  Note that we do not make an assumption that these are
+    // mutually exclusive - although that will probably be the case for now.
+
+    // Signal the kernel...
+    if ( requestJson.contains("signum")) {
+      val sigNum = requestJson("signum").asInstanceOf[JsNumber].value.toInt
+      if ( sigNum > 0 ) {
+        // If sigNum anything but 0 (for poll), use Signal.raise(signal) to signal the kernel.
+        val sigName = getReconciledSignalName(sigNum)
+        val sigToRaise = new Signal(sigName)
+        logger.info("Gateway listener raising signal: '%s' (%d) for signum: %d".
+                 format(sigToRaise.getName, sigToRaise.getNumber, sigNum))
+        Signal.raise(sigToRaise)
+      }
+    }
+    // Stop the listener...
+    if ( requestJson.contains("shutdown")) {
+      val shutdown = requestJson("shutdown").asInstanceOf[JsNumber].value.toInt
+      if ( shutdown == 1 ) {
+        // Enterprise gateway has been instructed to shutdown the kernel, so let's stop
+        // the listener so that it doesn't interfere with poll() calls.
+        logger.info("Stopping gateway listener.")
+        listenerStopped = true
+      }
+    }
+  }
+
+  private def serveGatewayConnection(s : Socket, gatewaySocket : ServerSocket): Unit = {
+    // On the control channel, requests are framed by a 4-byte (big-endian) length and each is
+    // acknowledged with a frame bearing the request's id.  Otherwise, the connection conveys a
+    // single JSON request.
+    try {
+      val in = new DataInputStream(new BufferedInputStream(s.getInputStream))
+      in.mark(1)
+      val first = in.read()
+      in.reset()
+      if (first == '{') {
+        processGatewayRequest(Json.parse(new BufferedSource(in).getLines.mkString).as[JsObject].value)
+      }
+      else if (first != -1) {
+        val out = new DataOutputStream(s.getOutputStream)
+        var open = true
+        while (open && !listenerStopped) {
+          val size = try in.readInt() catch { case _: EOFException => -1 }
+          if (size < 0 || size > maxFrameSize) open = false
+          else {
+            val body = new Array[Byte](size)
+            in.readFully(body)
+            val request = Json.parse(body).as[JsObject].value
+            val ack = Json.obj("id" -> request.getOrElse("id", JsNull))
+            val reply = try {
+              processGatewayRequest(request)
+              ack ++ Json.obj("status" -> "ok")
+            } catch {
+              case e: Exception => ack ++ Json.obj("status" -> "error", "message" -> String.valueOf(e.getMessage))
+            }
+            val data = reply.toString().getBytes(StandardCharsets.UTF_8)
+            out.writeInt(data.length)
+            out.write(data)
+            out.flush()
+          }
         }
       }
-      // Stop the listener...
-      if ( requestJson.contains("shutdown")) {
-        val shutdown = requestJson("shutdown").asInstanceOf[JsNumber].value.toInt
-        if ( shutdown == 1 ) {
-          // Enterprise gateway has been instructed to shutdown the kernel, so let's stop
-          // the listener so that it doesn't interfere with poll() calls.
-          logger.info("Stopping gateway listener.")
-          stop = true
+    } catch {
+      case e: Exception => logger.warn("Gateway listener encountered error processing requests: %s".
+                                        format(e.getMessage))
+    } finally {
+      s.close()
+      if (listenerStopped) gatewaySocket.close()  // unblocks the listener's accept()
+    }
+  }
+
+  private def gatewayListener(gatewaySocket : ServerSocket): Unit = {
+    while (!listenerStopped) {
+      try {
+        val s = gatewaySocket.accept()
+        val connectionThread = new Thread {
+          override def run() {
+            serveGatewayConnection(s, gatewaySocket)
+          }
         }
+        connectionThread.setDaemon(true)
+        connectionThread.start()
+      } catch {
+        case e: Exception =>
+          if (!listenerStopped) logger.error("Gateway listener encountered error: %s".format(e.getMessage))
+          listenerStopped = true
       }
     }
   }
@@ -305,6 +362,16 @@ object ToreeLauncher extends LogLike {
       }
       logger.info("Starting gateway listener...")
       gatewayListenerThread.start()
+
+      // Let the gateway know we're alive, and when we're not, via heartbeats on the response address
+      // Heartbeats are only considered by the gateway if sealed using the launch secret.
+      if (responseAddress != null && kernelId != null && SecurityUtils.launchSecret.isDefined) {
+        val heartbeatSender = new HeartbeatSender(responseAddress, kernelId, getPID)
+        sys.addShutdownHook {
+          heartbeatSender.reportExit()
+        }
+        heartbeatSender.start()
+      }
     }
 
     logger.info("Toree kernel arguments (final):")
@@ -0,0 +1,82 @@
+/**
+  * Copyright (c) Jupyter Development Team.
+  * Distributed under the terms of the Modified BSD License.
+  */
+
+package launcher.utils
+
+import java.io.OutputStream
+import java.net.{InetSocketAddress, Socket}
+import java.nio.charset.StandardCharsets
+import java.util.Base64
+
+import play.api.libs.json._
+
+import org.apache.toree.utils.LogLike
+
+
+/**
+  * Holds a connection to the gateway's response address on which a heartbeat is sent every
+  * EG_HEARTBEAT_INTERVAL seconds, reconnecting as necessary.  Once stopped, the kernel's exit
+  * is reported and the connection closed.
+  */
+class HeartbeatSender(responseAddress: String, kernelId: String, pid: String)
+  extends Thread with LogLike {
+
+  val heartbeatInterval: Long = (sys.env.getOrElse("EG_HEARTBEAT_INTERVAL", "5.0").toDouble * 1000).toLong
+  private val lock = new Object
+  @volatile private var exiting = false
+  private var socket: Socket = _
+
+  setDaemon(true)
+
+  override def run(): Unit = {
+    var stop = false
+    while (!stop) {
+      stop = exiting
+      send(if (stop) "exit" else "heartbeat")
+      if (!stop) {
+        lock.synchronized {
+          if (!exiting) lock.wait(heartbeatInterval)
+        }
+      }
+    }
+    closeSocket()
+  }
+
+  def reportExit(): Unit = {
+    lock.synchronized {
+      exiting = true
+      lock.notifyAll()
+    }
+    join(heartbeatInterval)
+  }
+
+  private def send(event: String): Unit = {
+    try {
+      if (socket == null) {
+        val ipPort = responseAddress.split(":")
+        socket = new Socket()
+        socket.connect(new InetSocketAddress(ipPort(0), ipPort(1).toInt), heartbeatInterval.toInt)
+      }
+      val eventJson = Json.obj("kernel_id" -> kernelId, "event" -> event, "pid" -> pid).toString()
+      val payload = Base64.getEncoder.encodeToString(SecurityUtils.seal(kernelId, eventJson, "heartbeat"))
+      val message = Json.obj("kernel_id" -> kernelId, "version" -> SecurityUtils.handshakeVersion,
+        "payload" -> payload).toString() + "\n"
+      val out: OutputStream = socket.getOutputStream
+      out.write(message.getBytes(StandardCharsets.UTF_8))
+      out.flush()
+    } catch {
+      case e: Exception =>
+        logger.debug("Unable to send %s to gateway at %s: %s".format(event, responseAddress, e.getMessage))
+        closeSocket()
+    }
+  }
+
+  private def closeSocket(): Unit = {
+    if (socket != null) {
+      try socket.close() catch { case _: Exception => }
+      socket = null
+    }
+  }
+}
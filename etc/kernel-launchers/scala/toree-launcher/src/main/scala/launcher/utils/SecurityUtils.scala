@@ -5,17 +5,55 @@
 
 package launcher.utils
 
+import java.nio.ByteBuffer
 import java.nio.charset.StandardCharsets
-import java.security.Key
+import java.security.{Key, MessageDigest, SecureRandom}
 import java.util.Base64
 
 import javax.crypto.Cipher
-import javax.crypto.spec.SecretKeySpec
+import javax.crypto.spec.{GCMParameterSpec, SecretKeySpec}
 
 import org.apache.toree.utils.LogLike
 
 object SecurityUtils extends LogLike {
 
+  val handshakeVersion: Int = 2
+  private val secureRandom = new SecureRandom()
+  // The secret generated by the gateway for this launch, from which the key of version 2 payloads is derived.
+  // In YARN cluster mode, the secret is shipped as a file rather than conveyed via the environment.
+  val launchSecret: Option[String] = sys.env.get("KERNEL_LAUNCH_SECRET").orElse(
+    sys.env.get("KERNEL_LAUNCH_SECRET_FILE").map { file =>
+      val source = scala.io.Source.fromFile(file, "UTF-8")
+      try source.mkString.trim finally source.close()
+    })
+
+  def associatedData(kernelId: String, purpose: String = ""): Array[Byte] = {
+    // The version, length of the kernel id and the kernel id - which also form the header of a
+    // version 2 connection info frame - followed by the payload's purpose.
+    val kid = kernelId.getBytes(StandardCharsets.UTF_8)
+    val buffer = ByteBuffer.allocate(3 + kid.length)
+    buffer.put(handshakeVersion.toByte).putShort(kid.length.toShort).put(kid)
+    buffer.array() ++ purpose.getBytes(StandardCharsets.UTF_8)
+  }
+
+  def seal(kernelId: String, value: String, purpose: String = ""): Array[Byte] = {
+    // Encrypts value using AES-GCM with a key derived (SHA-256) from the launch secret, returning the
+    // nonce, ciphertext and tag.
+    val key = MessageDigest.getInstance("SHA-256").digest(launchSecret.get.getBytes(StandardCharsets.UTF_8))
+    val nonce = new Array[Byte](12)
+    secureRandom.nextBytes(nonce)
+    val cipher: Cipher = Cipher.getInstance("AES/GCM/NoPadding")
+    cipher.init(Cipher.ENCRYPT_MODE, new SecretKeySpec(key, "AES"), new GCMParameterSpec(128, nonce))
+    cipher.updateAAD(associatedData(kernelId, purpose))
+    nonce ++ cipher.doFinal(value.getBytes(StandardCharsets.UTF_8))
+  }
+
+  def connectionInfoFrame(kernelId: String, value: String): Array[Byte] = {
+    val sealedPayload = seal(kernelId, value)
+    val length = ByteBuffer.allocate(4).putInt(sealedPayload.length).array()
+    associatedData(kernelId) ++ length ++ sealedPayload
+  }
+
   def encrypt(profilePath: String, value: String): String = {
     if (profilePath.indexOf("kernel-") == -1) {
       logger.error("Invalid connection file name '%s', now exit.".format(profilePath)) // scalastyle:off
@@ -36,6 +36,23 @@ object SocketUtils extends LogLike {
     }
   }
 
+  def writeToSocket(socketAddress : String, content : Array[Byte]): Unit = {
+    val ipPort = socketAddress.split(":")
+    if (ipPort.length == 2) {
+      logger.info("Sending connection info to gateway at %s".format(socketAddress)) // scalastyle:off
+      val s = new Socket(InetAddress.getByName(ipPort(0)), ipPort(1).toInt)
+      try {
+        val out = s.getOutputStream
+        out.write(content)
+        out.flush()
+      } finally {
+        s.close()
+      }
+    } else {
+      logger.error("Invalid format for response address '%s'!".format(socketAddress)) // scalastyle:off
+    }
+  }
+
   def findPort(portLowerBound: Int, portUpperBound: Int): Int = {
 
     val socket = findSocket(portLowerBound, portUpperBound)
@@ -34,8 +34,10 @@ Apache Spark, Kubernetes and others..
     keywords=['Interactive', 'Interpreter', 'Kernel', 'Web', 'Cloud'],
     packages=[
         'enterprise_gateway',
+        'enterprise_gateway.benchmarks',
         'enterprise_gateway.client',
         'enterprise_gateway.services',
+        'enterprise_gateway.services.api',
         'enterprise_gateway.services.kernels',
         'enterprise_gateway.services.processproxies',
         'enterprise_gateway.services.sessions'
@@ -52,10 +54,11 @@ Apache Spark, Kubernetes and others..
         'notebook>=5.7.6,<6.0',
         'paramiko>=2.1.2',
         'pexpect>=4.2.0',
-        'pycrypto>=2.6.1',
+        'prometheus_client>=0.6.0',
+        'pycryptodome>=3.4.0',
         'pyzmq>=17.0.0',
         'requests>=2.7,<3.0',
-        'tornado>=4.2.0',
+        'tornado>=5.0',
         'traitlets>=4.2.0',
         'yarn-api-client>=0.3.3',
     ],